@@ -0,0 +1,81 @@
+"""
+Teste de carga do pipeline assíncrono contra um modelo simulado.
+
+Compara a vazão (requisições/s) do caminho síncrono chamado dentro do event loop,
+como faziam os endpoints antes, com o caminho assíncrono (aquery) para diferentes
+níveis de concorrência. Cada requisição é uma pergunta diferente e o cache de
+respostas e a coalescência ficam desligados, para que todas passem pelo pipeline.
+
+Uso:
+    python -m benchmarks.async_load --delay 0.1 --requests 32
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.fake_llm import FakeLLM
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTION = "Mostre o faturamento diário dos últimos 7 dias"
+
+
+def questions(total: int, label: str):
+    """Perguntas distintas (após normalização) para uma rodada"""
+    return [f"{QUESTION} ({label} {i})" for i in range(total)]
+
+
+async def run_blocking(agent: SQLQueryAgent, total: int, concurrency: int) -> float:
+    """Executa o caminho síncrono dentro de corrotinas (bloqueia o event loop)"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(question: str):
+        async with semaphore:
+            agent.query(question)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions(total, f"síncrono c{concurrency}")))
+    return time.perf_counter() - start
+
+
+async def run_async(agent: SQLQueryAgent, total: int, concurrency: int) -> float:
+    """Executa o caminho assíncrono com a concorrência informada"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(question: str):
+        async with semaphore:
+            await agent.aquery(question)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions(total, f"assíncrono c{concurrency}")))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do pipeline assíncrono")
+    parser.add_argument("--delay", type=float, default=0.1, help="Latência simulada por chamada ao modelo (s)")
+    parser.add_argument("--requests", type=int, default=32, help="Total de perguntas por rodada")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32], help="Níveis de concorrência")
+    args = parser.parse_args()
+
+    # A memória de aprendizado é gravada no diretório atual; isola em um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-load-"))
+    agent = SQLQueryAgent(api_key="", llm=FakeLLM(delay=args.delay), metric_templates=False,
+                          query_cache=QueryCache(max_entries=0), coalesce_requests=False)
+
+    print(f"{'concorrência':>12} {'síncrono (req/s)':>18} {'assíncrono (req/s)':>20}")
+    for concurrency in args.concurrency:
+        # Silencia os logs [AGENT] impressos a cada estágio
+        with contextlib.redirect_stdout(io.StringIO()):
+            blocking = asyncio.run(run_blocking(agent, args.requests, concurrency))
+            non_blocking = asyncio.run(run_async(agent, args.requests, concurrency))
+        print(f"{concurrency:>12} {args.requests / blocking:>18.2f} {args.requests / non_blocking:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Microbenchmark da formatação do contexto de negócio para os prompts.
+
+Compara a montagem original (concatenação com += a cada chamada) com o texto
+compilado uma vez por versão do contexts.yaml, em que cada requisição faz
+apenas uma consulta ao cache.
+
+Uso:
+    python -m benchmarks.context_prompt --iterations 10000
+"""
+
+import argparse
+import time
+
+from src.config.business_context import BusinessContext
+
+
+def legacy_format(contexts) -> str:
+    """Cópia da implementação original de BusinessContext.format_for_prompt"""
+    prompt = "CONTEXTO DE NEGÓCIOS:\n\n"
+    for name, context in contexts.items():
+        prompt += f"=== {name} ===\n"
+        prompt += f"Descrição: {context['description']}\n"
+        prompt += "\nTabelas Relevantes:\n"
+        for table_name, table_info in context['tables'].items():
+            prompt += f"- {table_name}\n"
+            prompt += f"  Descrição: {table_info['description']}\n"
+            if 'primary_key' in table_info:
+                prompt += f"  Chave Primária: {table_info['primary_key']}\n"
+            prompt += "  Colunas:\n"
+            for col, desc in table_info['columns'].items():
+                prompt += f"    * {col}: {desc}\n"
+        prompt += "\nRelacionamentos Importantes:\n"
+        for rel in context['relationships']:
+            prompt += f"- {rel}\n"
+        prompt += "\nMétricas Disponíveis:\n"
+        for metric_key, metric_info in context['aggregation_fields'].items():
+            if isinstance(metric_info, dict):
+                prompt += f"- {metric_info.get('display_name', metric_key)}: {metric_info.get('description', '')}\n"
+            else:
+                prompt += f"- {metric_key}: {metric_info}\n"
+        prompt += "\n"
+    return prompt
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark do texto de contexto dos prompts")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    context = BusinessContext()
+    assert legacy_format(context.contexts) == context.format_for_prompt()
+
+    results = {
+        "original (+= por chamada)": per_call_us(lambda: legacy_format(context.contexts), args.iterations),
+        "compilação sem cache": per_call_us(lambda: context._compile_prompt(context.contexts), args.iterations),
+        "format_for_prompt (cache)": per_call_us(context.format_for_prompt, args.iterations),
+        "format_for_prompt('Vendas') (cache)": per_call_us(lambda: context.format_for_prompt("Vendas"), args.iterations),
+    }
+    for name, micros in results.items():
+        print(f"{name:<38} {micros:>10.2f} µs/chamada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Teste de resistência do armazenamento de conversas.
+
+Cria conversas continuamente (com um refinamento a cada poucas) e mede a memória
+alocada pelo processo com tracemalloc, comparando o dicionário sem limite usado
+antes com os armazenamentos em memória (LRU + TTL + limite de bytes) e em SQLite.
+Com limites, a memória deve estabilizar após atingir max_conversations.
+
+Uso:
+    python -m benchmarks.conversation_soak --conversations 200000 --max-conversations 5000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from src.agent.conversation_store import InMemoryConversationStore, SQLiteConversationStore
+
+SQL = """with pedidos_base as (
+  select o.CREATED_AT::DATE as data, o.TOTAL_PRICE, o.REGION
+  from SCHEMA.DATABASE.ORDERS o
+  where 1=1 and o.REGION = 'LATAM'
+)
+select data, sum(TOTAL_PRICE) as faturamento from pedidos_base group by all"""
+
+
+class DictStore:
+    """Comportamento anterior: dicionário que cresce sem limite"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, conversation_id):
+        return self._entries.get(conversation_id)
+
+    def set(self, conversation_id, conversation):
+        self._entries[conversation_id] = conversation
+
+
+def make_conversation(i: int) -> dict:
+    return {
+        "original_question": f"Qual o faturamento por região no último mês? #{i}",
+        "metadata": {"domain": "vendas", "metrics": ["faturamento_total"], "filters": [], "groupby": ["REGION"]},
+        "iterations": [{"explanation": "Soma o faturamento por região. " * 5, "sql_query": SQL}]
+    }
+
+
+def soak(store, total: int, checkpoints: int):
+    samples = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(1, total + 1):
+        conversation_id = str(uuid.uuid4())
+        store.set(conversation_id, make_conversation(i))
+        if i % 4 == 0:
+            conversation = store.get(conversation_id)
+            conversation["iterations"].append({"feedback": "agrupe por mês", "explanation": "", "sql_query": SQL})
+            store.set(conversation_id, conversation)
+        if i % (total // checkpoints) == 0:
+            samples.append((i, tracemalloc.get_traced_memory()[0] / (1024 * 1024)))
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return samples, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do armazenamento de conversas sob carga contínua")
+    parser.add_argument("--conversations", type=int, default=200000)
+    parser.add_argument("--max-conversations", type=int, default=5000)
+    parser.add_argument("--checkpoints", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sql-agent-soak-"), "conversations.db")
+    stores = {
+        "dict": DictStore(),
+        "memória": InMemoryConversationStore(max_conversations=args.max_conversations),
+        "sqlite": SQLiteConversationStore(path, max_conversations=args.max_conversations),
+    }
+
+    for name, store in stores.items():
+        samples, elapsed = soak(store, args.conversations, args.checkpoints)
+        series = "  ".join(f"{count // 1000}k:{mb:6.1f}MB" for count, mb in samples)
+        print(f"{name:>8} {series}  ({args.conversations / elapsed:,.0f} conversas/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Banco DuckDB em memória com as tabelas do catálogo, usado para validar as queries geradas.
+
+Sem linhas, as tabelas ficam vazias e servem para conferir nomes, tipos e funções;
+com linhas, são preenchidas com dados sintéticos e reprodutíveis (chaves primárias
+únicas, chaves *_ID entre 1 e 50, regiões LATAM/NA/EMEA/APAC, alguns nulos e
+datas nos últimos 120 dias, parte delas exatamente à meia-noite), para comparar
+o resultado de duas versões da mesma query.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+# Tipos do contexts.yaml -> tipos do DuckDB
+DUCKDB_TYPES = {
+    "NUMBER": "BIGINT",
+    "FLOAT": "DOUBLE",
+    "TEXT": "VARCHAR",
+    "DATE": "DATE",
+    "TIMESTAMP_NTZ": "TIMESTAMP",
+    "BOOLEAN": "BOOLEAN",
+}
+
+REGIONS = ["LATAM", "NA", "EMEA", "APAC"]
+
+# Valores distintos das chaves *_ID que não são chave primária da tabela
+FOREIGN_KEYS = 50
+
+
+def duckdb_connection(catalog, rows: int = 0, seed: int = 42, today: date = None):
+    """Conexão DuckDB em memória com as tabelas do catálogo, ou None sem o duckdb
+
+    Args:
+        catalog: Catálogo do contexts.yaml (SchemaCatalog)
+        rows: Linhas por tabela; 0 cria as tabelas vazias
+        seed: Semente dos dados sintéticos
+        today: Data de referência das colunas de data (padrão: hoje)
+    """
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    connection = duckdb.connect()
+    generator = random.Random(seed)
+    today = today or date.today()
+    for name, entry in catalog.tables.items():
+        database, schema, table = name.split(".")
+        connection.execute(f"attach if not exists ':memory:' as {database}")
+        connection.execute(f"create schema if not exists {database}.{schema}")
+        columns = ", ".join(f"{col} {DUCKDB_TYPES.get(str(kind).upper(), 'VARCHAR')}"
+                            for col, kind in entry["columns"].items())
+        connection.execute(f"create table {name} ({columns})")
+        if rows:
+            # Um único insert com os valores literais (executemany no DuckDB é lento)
+            values = ",\n".join(
+                "(" + ", ".join(_literal(_value(generator, column, str(kind).upper(), entry.get("primary_key"),
+                                                row, today))
+                                for column, kind in entry["columns"].items()) + ")"
+                for row in range(1, max(rows, FOREIGN_KEYS) + 1)
+            )
+            connection.execute(f"insert into {name} values {values}")
+    return connection
+
+
+def _literal(value) -> str:
+    """Valor como literal SQL do DuckDB"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return f"timestamp '{value.isoformat(sep=' ')}'"
+    if isinstance(value, date):
+        return f"date '{value.isoformat()}'"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def _value(generator: random.Random, column: str, kind: str, primary_key: str, row: int, today: date):
+    """Valor sintético de uma coluna na linha"""
+    if column == primary_key:
+        return row
+    if generator.random() < 0.03:
+        return None
+    if column.endswith("_ID"):
+        return generator.randint(1, FOREIGN_KEYS)
+    if column == "REGION":
+        return generator.choice(REGIONS)
+    if kind == "NUMBER":
+        return generator.randint(0, 1000)
+    if kind == "FLOAT":
+        return round(generator.uniform(0, 1000), 2)
+    if kind == "BOOLEAN":
+        return generator.random() < 0.5
+    if kind == "DATE":
+        return today - timedelta(days=generator.randint(0, 120))
+    if kind.startswith("TIMESTAMP"):
+        day = datetime.combine(today, datetime.min.time()) - timedelta(days=generator.randint(0, 120))
+        # Parte dos registros exatamente à meia-noite, o limite dos intervalos de data
+        return day if generator.random() < 0.2 else day + timedelta(seconds=generator.randint(1, 86399))
+    return f"{column.lower()}_{generator.randint(1, 5)}"
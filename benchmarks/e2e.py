@@ -0,0 +1,207 @@
+"""
+Benchmark ponta a ponta do serviço com o modelo simulado determinístico.
+
+Exercita o agente diretamente e os endpoints /query e /refine (via ASGI, no
+mesmo processo) com níveis de concorrência configuráveis. Para cada combinação
+reporta requisições/s, latência p50/p95/p99 e a divisão por estágio a partir do
+campo timings das respostas, em JSON para acompanhamento de regressões.
+
+Uso:
+    python -m benchmarks.e2e --targets agent api --scenarios query refine \\
+        --concurrency 1 8 32 --requests 64 --delay 0.05 --output resultados.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.report import summarize
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTIONS = [
+    "Qual o faturamento total por região nos últimos 7 dias?",
+    "Mostre o ticket médio por categoria no último mês",
+    "Quantos pedidos tivemos por dia na última semana?",
+    "Qual é o valor total em estoque por armazém?",
+]
+
+
+def build_agent(args) -> SQLQueryAgent:
+    llm = FakeLLM(delay=args.delay, stage_delays=args.stage_delays, jitter=args.jitter, seed=args.seed)
+    return SQLQueryAgent(
+        api_key="benchmark",
+        llm=llm,
+        # Sem cache e sem atalho local, cada pergunta percorre o pipeline completo
+        query_cache=QueryCache(max_entries=0 if args.no_cache else 512),
+        local_classifier_threshold=None if args.no_local_classifier else 0.8,
+        pipeline_mode=args.pipeline_mode,
+        metric_templates=not args.no_templates
+    )
+
+
+class AgentTarget:
+    """Chama o agente diretamente (aquery / arefine_query)"""
+
+    def __init__(self, agent: SQLQueryAgent):
+        self.agent = agent
+
+    async def query(self, question: str):
+        return await self.agent.aquery(question)
+
+    async def refine(self, feedback: str, conversation_id: str):
+        return await self.agent.arefine_query(feedback, conversation_id)
+
+
+class ApiTarget:
+    """Chama os endpoints da API pelo transporte ASGI, incluindo validação e serialização"""
+
+    def __init__(self, agent: SQLQueryAgent):
+        from src.api import main as api
+
+        logging.getLogger("sql-ai-chatbot").setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        api.app.state.sql_agent = agent
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://benchmark")
+
+    async def query(self, question: str):
+        response = await self.client.post("/query", json={"question": question})
+        response.raise_for_status()
+        return response.json()
+
+    async def refine(self, feedback: str, conversation_id: str):
+        response = await self.client.post("/refine", json={"feedback": feedback, "conversation_id": conversation_id})
+        response.raise_for_status()
+        return response.json()
+
+
+async def run(target, scenario: str, total: int, concurrency: int, run_id: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    stages = defaultdict(list)
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        # Sufixo por rodada e requisição: perguntas inéditas, como em produção
+        question = f"{QUESTIONS[i % len(QUESTIONS)]} ({run_id}-{i})"
+        async with semaphore:
+            try:
+                if scenario == "refine":
+                    created = await target.query(question)
+                    start = time.perf_counter()
+                    response = await target.refine("agrupe também por mês", created["conversation_id"])
+                else:
+                    start = time.perf_counter()
+                    response = await target.query(question)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+                return
+        if response.get("status") != "success":
+            errors += 1
+        for stage, entry in response.get("timings", {}).get("stages", {}).items():
+            stages[stage].append(entry["seconds"] * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 2),
+        "latency_ms": summarize(latencies),
+        "stages_ms": {stage: dict(summarize(values), calls=len(values)) for stage, values in sorted(stages.items())}
+    }
+
+
+def parse_stage_delays(values):
+    delays = {}
+    for value in values or []:
+        stage, _, seconds = value.partition("=")
+        delays[stage] = float(seconds)
+    return delays
+
+
+async def main_async(args) -> dict:
+    results = []
+    for target_name in args.targets:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                # Agente novo por combinação: memória, conversas e métricas não vazam entre rodadas
+                with contextlib.redirect_stdout(io.StringIO()):
+                    agent = build_agent(args)
+                    target = AgentTarget(agent) if target_name == "agent" else ApiTarget(agent)
+                    result = await run(target, scenario, args.requests, concurrency,
+                                       f"{target_name}-{scenario}-{concurrency}")
+                result.update(target=target_name, scenario=scenario, concurrency=concurrency)
+                results.append(result)
+                latency = result["latency_ms"]
+                print(f"{target_name:>6} {scenario:>7} c={concurrency:<3} {result['requests_per_s']:>8.1f} req/s  "
+                      f"p50 {latency.get('p50', 0):>8.1f}  p95 {latency.get('p95', 0):>8.1f}  "
+                      f"p99 {latency.get('p99', 0):>8.1f} ms  erros {result['errors']}")
+    return {
+        "config": {
+            "delay_s": args.delay,
+            "stage_delays_s": args.stage_delays,
+            "jitter": args.jitter,
+            "seed": args.seed,
+            "requests": args.requests,
+            "pipeline_mode": args.pipeline_mode,
+            "cache": not args.no_cache,
+            "local_classifier": not args.no_local_classifier,
+            "metric_templates": not args.no_templates,
+            "python": platform.python_version()
+        },
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta com modelo simulado")
+    parser.add_argument("--targets", nargs="+", default=["agent", "api"], choices=["agent", "api"])
+    parser.add_argument("--scenarios", nargs="+", default=["query", "refine"], choices=["query", "refine"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requisições por combinação")
+    parser.add_argument("--delay", type=float, default=0.05, help="Latência simulada por chamada ao modelo (s)")
+    parser.add_argument("--stage-delay", dest="stage_delays", action="append", metavar="ESTAGIO=S",
+                        help="Latência de um estágio (ex: classifier=0.2); pode repetir")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Variação relativa da latência simulada")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pipeline-mode", default="staged", choices=["staged", "merged", "single"])
+    parser.add_argument("--no-cache", action="store_true", help="Desativa o cache de respostas")
+    parser.add_argument("--no-local-classifier", action="store_true", help="Sempre classifica com o modelo")
+    parser.add_argument("--no-templates", action="store_true", help="Sempre gera a query com o modelo")
+    parser.add_argument("--output", help="Arquivo JSON com os resultados")
+    args = parser.parse_args()
+    args.stage_delays = parse_stage_delays(args.stage_delays)
+
+    # Memória de aprendizado e conversas são gravadas no diretório atual; isola em um temporário
+    output = os.path.abspath(args.output) if args.output else None
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-e2e-"))
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Resultados gravados em {output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Modelo simulado para benchmarks do agente SQL.
+
+Responde com saídas fixas para cada estágio do pipeline e aguarda um atraso
+configurável, imitando a latência de um provedor real sem consumir créditos.
+Com jitter, os atrasos variam a partir de uma semente fixa, então duas execuções
+com a mesma configuração produzem a mesma sequência de latências.
+"""
+
+import json
+import random
+from typing import Dict
+
+from src.agent.providers import StubProvider
+
+
+CLASSIFICATION = {
+    "domain": "vendas",
+    "metrics": ["faturamento_total"],
+    "filters": [],
+    "groupby": ["REGION"],
+    "timeframe": {"column": "CREATED_AT", "period": "day", "range": "last_7_days"},
+    "order_by": []
+}
+
+EXPERT_SQL = """```sql
+with pedidos_base as (
+  select
+    o.CREATED_AT::DATE as data
+    , o.TOTAL_PRICE
+    , o.REGION
+  from SCHEMA.DATABASE.ORDERS o
+  where 1=1
+    and o.REGION = 'LATAM'
+)
+
+select
+  data
+  , sum(TOTAL_PRICE) as faturamento
+from pedidos_base
+group by all
+```"""
+
+
+STRUCTURED_EXPLANATION = "Soma o faturamento diário dos pedidos da LATAM."
+
+
+class FakeLLM(StubProvider):
+    def __init__(self, delay: float = 0.1, token_delay: float = 0.0, stage_delays: Dict[str, float] = None,
+                 jitter: float = 0.0, seed: int = 42):
+        """
+        Args:
+            delay: Latência simulada de cada chamada, em segundos
+            token_delay: Intervalo simulado entre os tokens transmitidos por astream
+            stage_delays: Latência por estágio (classifier, expert, consolidator, structured,
+                          refinement, fallback), substituindo delay nos estágios informados
+            jitter: Variação relativa máxima da latência (0.2 = ±20%)
+            seed: Semente do gerador usado no jitter
+        """
+        super().__init__(responder=self._canned_response, delay=delay, token_delay=token_delay)
+        self.stage_delays = stage_delays or {}
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def stage_of(prompt: str) -> str:
+        """Identifica o estágio do pipeline pelo texto do prompt"""
+        if '"sql_query"' in prompt:
+            return "structured"
+        if "Responda APENAS no formato JSON" in prompt:
+            return "classifier"
+        if "Fragmento SQL gerado por especialista" in prompt:
+            return "consolidator"
+        if "Histórico da conversa" in prompt:
+            return "refinement"
+        if "A query deve começar com a palavra 'SELECT'" in prompt:
+            return "fallback"
+        return "expert"
+
+    def _stage(self, prompt: str, stage: str = None) -> str:
+        """Estágio informado pelo agente ou, sem ele, identificado pelo prompt"""
+        if stage in ("merged", "single"):
+            return "structured"
+        return stage or self.stage_of(prompt)
+
+    def _delay_for(self, prompt: str, stage: str = None) -> float:
+        delay = self.stage_delays.get(self._stage(prompt, stage), self.delay)
+        if self.jitter:
+            with self._lock:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def _canned_response(self, prompt: str, stage: str = None) -> str:
+        stage = self._stage(prompt, stage)
+        if stage == "structured":
+            # Modos "merged" e "single": explicação, metadados e SQL em um único JSON
+            sql_query = EXPERT_SQL.replace("```sql", "").replace("```", "").strip()
+            return json.dumps({
+                "metadata": CLASSIFICATION,
+                "explanation": STRUCTURED_EXPLANATION,
+                "sql_query": sql_query
+            }, ensure_ascii=False)
+        if stage == "classifier":
+            return f"```json\n{json.dumps(CLASSIFICATION)}\n```"
+        return EXPERT_SQL
@@ -0,0 +1,171 @@
+"""
+Benchmark do cliente HTTP compartilhado contra um servidor local compatível com a API do DeepSeek.
+
+O servidor responde a /chat/completions com latência sorteada (uma fração das
+requisições cai em uma cauda lenta) e uma fração de erros 503. Cada cenário envia as
+mesmas chamadas pelo DeepSeekProvider real (langchain-deepseek) e mede taxa de sucesso,
+latência, novas tentativas, hedges e quantas conexões TCP foram abertas (keep-alive).
+
+Uso:
+    python -m benchmarks.http_resilience --requests 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.report import summarize
+from src.agent.http_client import RetryPolicy
+from src.agent.providers import DeepSeekProvider
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float, slow_latency: float, slow_rate: float, error_rate: float, seed: int):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def draw(self):
+        """Sorteia (latência, falha) da próxima requisição"""
+        with self.lock:
+            self.requests += 1
+            slow = self.random.random() < self.slow_rate
+            failed = self.random.random() < self.error_rate
+            jitter = self.random.uniform(0.8, 1.2)
+        return (self.slow_latency if slow else self.latency) * jitter, failed
+
+    def handle_error(self, request, client_address):
+        # Hedges perdedores são cancelados e fecham a conexão no meio da resposta
+        pass
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        latency, failed = self.server.draw()
+        time.sleep(latency)
+        if failed:
+            self._send(503, {"error": {"message": "servidor sobrecarregado", "type": "server_error"}})
+            return
+        self._send(200, {
+            "id": "chatcmpl-local",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "deepseek-chat"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "```sql\nselect 1\n```"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        })
+
+
+SCENARIOS = {
+    "sem_retry": dict(max_retries=0),
+    "retry": dict(max_retries=3, backoff_base=0.02),
+    "retry_hedge": dict(max_retries=3, backoff_base=0.02, hedge=True, hedge_min_samples=20),
+}
+
+
+async def run_scenario(server: StandInServer, policy: RetryPolicy, requests: int, concurrency: int):
+    provider = DeepSeekProvider(api_key="local", base_url=server.base_url, policy=policy)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await provider.ainvoke(f"pergunta {i}", stage="expert")
+            except Exception:
+                failures += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    server.reset_counters()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return {
+        "succeeded": len(latencies),
+        "failed": failures,
+        "server_requests": server.requests,
+        "connections_opened": server.connections,
+        "latency_ms": summarize(latencies),
+        **{key: value for key, value in policy.stats().items() if key != "hedge_delays"}
+    }
+
+
+async def run(args):
+    results = {}
+    for name in args.scenarios:
+        server = StandInServer(args.latency, args.slow_latency, args.slow_rate, args.error_rate, args.seed)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            policy = RetryPolicy(default_timeout=args.timeout, seed=args.seed, **SCENARIOS[name])
+            results[name] = await run_scenario(server, policy, args.requests, args.concurrency)
+        finally:
+            server.shutdown()
+            server.server_close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Novas tentativas, hedge e keep-alive contra um servidor local")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="Latência típica do servidor (s)")
+    parser.add_argument("--slow-latency", type=float, default=0.4, help="Latência da cauda lenta (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Fração de requisições lentas")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fração de respostas 503")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark da busca de padrões similares na memória de aprendizado.
+
+Compara a varredura linear original (SequenceMatcher contra todos os padrões)
+com o índice invertido de tokens para memórias de 1k, 10k e 100k padrões.
+
+Uso:
+    python -m benchmarks.learning_index --sizes 1000 10000 100000
+"""
+
+import argparse
+import difflib
+import random
+import time
+from typing import Dict, List
+
+from src.agent.learning_index import PatternIndex
+
+METRICS = ["faturamento", "quantidade de pedidos", "ticket médio", "clientes ativos",
+           "valor em estoque", "rotatividade de estoque", "nível de disponibilidade"]
+GROUPS = ["por região", "por categoria", "por fornecedor", "por armazém", "por dia",
+          "por mês", "por canal", "por marca", "por loja", "por estado"]
+PERIODS = ["nos últimos 7 dias", "no último mês", "no último trimestre", "em 2023",
+           "na última semana", "hoje", "nos últimos 3 meses", "no ano passado"]
+EXTRAS = ["", "na região Sul", "apenas pedidos online", "para a marca X", "com desconto",
+          "ordenado do maior para o menor", "top 10", "comparando com o período anterior"]
+
+QUERIES = [
+    "Mostre o faturamento diário dos últimos 7 dias",
+    "Qual o ticket médio por categoria no último mês?",
+    "Quantos clientes ativos temos por região?",
+    "Qual é o valor total em estoque por armazém?",
+]
+
+
+def build_patterns(size: int, seed: int = 42) -> List[Dict]:
+    rng = random.Random(seed)
+    patterns = []
+    for i in range(size):
+        question = " ".join(filter(None, [
+            "Qual o", rng.choice(METRICS), rng.choice(GROUPS), rng.choice(PERIODS),
+            rng.choice(EXTRAS), f"#{i}"
+        ]))
+        patterns.append({"question": question, "domain": "vendas", "metrics": []})
+    return patterns
+
+
+def linear_scan(patterns: List[Dict], question: str) -> List[Dict]:
+    """Cópia da implementação original de _find_similar_patterns"""
+    similar_patterns = []
+    keywords = set(word.lower() for word in question.split())
+    for pattern in patterns:
+        pattern_keywords = set(word.lower() for word in pattern["question"].split())
+        similarity = difflib.SequenceMatcher(None, question.lower(), pattern["question"].lower()).ratio()
+        keyword_overlap = len(keywords.intersection(pattern_keywords)) / len(keywords)
+        if similarity > 0.6 or keyword_overlap > 0.7:
+            similar_patterns.append(pattern)
+    return similar_patterns[:3]
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for question in QUERIES:
+            fn(question)
+    return (time.perf_counter() - start) / (repeat * len(QUERIES)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da busca na memória de aprendizado")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições de cada pergunta")
+    args = parser.parse_args()
+
+    print(f"{'padrões':>8} {'linear (ms)':>12} {'índice (ms)':>12} {'build (ms)':>11} {'speedup':>8}")
+    for size in args.sizes:
+        patterns = build_patterns(size)
+
+        start = time.perf_counter()
+        index = PatternIndex()
+        for pattern in patterns:
+            index.add(pattern)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        linear_ms = timed(lambda q: linear_scan(patterns, q), 1)
+        indexed_ms = timed(lambda q: index.search(q, k=3), args.repeat)
+        print(f"{size:>8} {linear_ms:>12.2f} {indexed_ms:>12.3f} {build_ms:>11.1f} {linear_ms / indexed_ms:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark da persistência da memória de aprendizado.
+
+Compara o custo de gravar um padrão e de carregar a memória na inicialização
+entre a regravação completa do JSON (implementação original) e o armazenamento
+SQLite em modo WAL, para históricos de tamanhos crescentes.
+
+Uso:
+    python -m benchmarks.learning_store --sizes 1000 10000 100000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.learning_index import build_patterns
+from src.agent.learning_store import LearningMemoryStore
+
+
+def bench_json(directory: str, patterns, writes: int):
+    path = os.path.join(directory, "learning_memory.json")
+    memory = {"patterns": list(patterns)}
+
+    start = time.perf_counter()
+    for pattern in patterns[:writes]:
+        memory["patterns"].append(pattern)
+        memory["patterns"] = memory["patterns"][-1000:]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(memory, f, ensure_ascii=False, indent=2)
+    write_ms = (time.perf_counter() - start) / writes * 1000
+
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        json.load(f)
+    load_ms = (time.perf_counter() - start) * 1000
+    return write_ms, load_ms
+
+
+def bench_sqlite(directory: str, patterns, writes: int):
+    store = LearningMemoryStore(os.path.join(directory, "learning_memory.db"), prune_every=10 ** 9)
+    with store._conn:
+        store._conn.executemany(
+            "INSERT INTO patterns (payload) VALUES (?)",
+            [(json.dumps(p, ensure_ascii=False),) for p in patterns]
+        )
+
+    start = time.perf_counter()
+    for pattern in patterns[:writes]:
+        store.append(pattern)
+    write_ms = (time.perf_counter() - start) / writes * 1000
+
+    start = time.perf_counter()
+    store.load()
+    load_ms = (time.perf_counter() - start) * 1000
+    store.close()
+    return write_ms, load_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da persistência da memória de aprendizado")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--writes", type=int, default=50, help="Gravações medidas por rodada")
+    args = parser.parse_args()
+
+    print(f"{'histórico':>9} {'json grava (ms)':>16} {'json carrega (ms)':>18} "
+          f"{'sqlite grava (ms)':>18} {'sqlite carrega (ms)':>20}")
+    for size in args.sizes:
+        patterns = build_patterns(size)
+        # O JSON original nunca passa de 1000 padrões; o SQLite acumula o histórico inteiro
+        json_write, json_load = bench_json(tempfile.mkdtemp(), patterns[-1000:], args.writes)
+        sqlite_write, sqlite_load = bench_sqlite(tempfile.mkdtemp(), patterns, args.writes)
+        print(f"{size:>9} {json_write:>16.2f} {json_load:>18.2f} {sqlite_write:>18.3f} {sqlite_load:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
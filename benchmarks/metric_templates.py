@@ -0,0 +1,125 @@
+"""
+Cobertura e latência dos templates de métricas (query gerada sem LLM).
+
+Classifica as perguntas de exemplo do contexts.yaml (ou de --questions) com o
+classificador local e mostra quais são cobertas pelos templates e por que as
+demais seguem para o LLM. Cada query gerada é validada no DuckDB, contra tabelas
+vazias criadas a partir do catálogo (nomes de tabelas e colunas, tipos, joins e
+funções). Por fim, compara a latência e as chamadas ao modelo simulado por
+pergunta com e sem os templates.
+
+Uso:
+    python -m benchmarks.metric_templates --delay 0.2
+    python -m benchmarks.metric_templates --questions perguntas.txt --show-sql
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.duckdb_fixture import duckdb_connection
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.report import summarize
+from src.agent.metric_templates import TemplateMiss
+from src.agent.prompt_layout import sample_questions
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+
+def coverage(agent: SQLQueryAgent, questions, iterations: int, show_sql: bool):
+    """Perguntas cobertas, motivos dos demais casos e tempo de geração da query"""
+    connection = duckdb_connection(agent.business_context.current())
+    covered, misses, invalid, render_us = [], collections.Counter(), [], []
+    for question in questions:
+        metadata = agent._local_guess(question)
+        if metadata is None:
+            misses["local_classifier"] += 1
+            continue
+        metadata = agent._apply_default_filters(metadata)
+        try:
+            sql_query = agent.metric_templates.render(metadata)
+        except TemplateMiss as e:
+            misses[e.reason] += 1
+            continue
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            agent.metric_templates.render(metadata)
+        render_us.append((time.perf_counter() - start) / iterations * 1_000_000)
+        covered.append(question)
+        if show_sql:
+            print(f"-- {question}\n{sql_query}\n")
+        if connection is not None:
+            try:
+                connection.execute(sql_query).fetchall()
+            except Exception as e:
+                invalid.append((question, str(e).splitlines()[0]))
+    return covered, misses, invalid, render_us, connection is not None
+
+
+async def latency(questions, delay: float, templates: bool):
+    """Latência e chamadas ao modelo por pergunta, com o classificador local ligado"""
+    llm = FakeLLM(delay=delay)
+    agent = SQLQueryAgent(
+        api_key="benchmark",
+        llm=llm,
+        query_cache=QueryCache(max_entries=0),
+        metric_templates=templates
+    )
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        await agent.aquery(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies), llm.calls / len(questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cobertura e latência dos templates de métricas")
+    parser.add_argument("--questions", help="Arquivo com uma pergunta por linha (padrão: exemplos do contexts.yaml)")
+    parser.add_argument("--delay", type=float, default=0.2, help="Latência simulada por chamada ao modelo (s)")
+    parser.add_argument("--iterations", type=int, default=2000, help="Repetições para medir a geração da query")
+    parser.add_argument("--show-sql", action="store_true", help="Imprime as queries geradas")
+    args = parser.parse_args()
+
+    # A memória de aprendizado é gravada no diretório atual; isola em um diretório temporário
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-templates-"))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = SQLQueryAgent(api_key="benchmark", llm=FakeLLM(delay=0))
+    if not args.questions:
+        questions = sample_questions(agent.business_context)
+
+    covered, misses, invalid, render_us, validated = coverage(agent, questions, args.iterations, args.show_sql)
+    print(f"cobertas: {len(covered)}/{len(questions)} ({len(covered) / len(questions):.0%})")
+    for reason, count in misses.most_common():
+        print(f"  seguem para o LLM ({reason}): {count}")
+    if render_us:
+        print(f"geração da query: {sum(render_us) / len(render_us):.1f} µs/pergunta")
+    if not validated:
+        print("duckdb não instalado: validação das queries ignorada")
+    else:
+        print(f"válidas no DuckDB: {len(covered) - len(invalid)}/{len(covered)}")
+        for question, error in invalid:
+            print(f"  {question}: {error}")
+
+    if not covered:
+        return
+    print(f"\n{'templates':>10} {'média (ms)':>11} {'p95 (ms)':>9} {'chamadas':>9}")
+    for templates in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary, calls = asyncio.run(latency(covered, args.delay, templates))
+        label = "sim" if templates else "não"
+        print(f"{label:>10} {summary['mean']:>11.1f} {summary['p95']:>9.1f} {calls:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
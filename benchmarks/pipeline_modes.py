@@ -0,0 +1,88 @@
+"""
+Comparação de latência entre os modos do pipeline.
+
+Executa as mesmas perguntas nos modos "staged" (classificador, especialista e
+consolidador), "merged" (classificador + especialista/consolidador em uma chamada)
+e "single" (uma única chamada estruturada), reportando latência média, p50, p95
+e chamadas ao modelo por pergunta.
+
+Por padrão usa o modelo simulado; com --real usa o DeepSeek (DEEPSEEK_API_KEY).
+
+Uso:
+    python -m benchmarks.pipeline_modes --delay 0.3 --iterations 10
+    python -m benchmarks.pipeline_modes --real --iterations 3
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.report import percentile
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import PIPELINE_MODES, SQLQueryAgent
+
+QUESTIONS = [
+    "Mostre o faturamento diário dos últimos 7 dias",
+    "Qual o ticket médio por região no último mês?",
+    "Qual é o valor total em estoque por armazém?",
+]
+
+
+def run_mode(agent: SQLQueryAgent, mode: str, iterations: int, counter) -> dict:
+    latencies = []
+    calls_before = counter()
+    for i in range(iterations):
+        for question in QUESTIONS:
+            # Sufixo único por rodada para não cair no cache de respostas
+            question = f"{question} (rodada {mode}-{i})"
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = agent.query(question, pipeline_mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.get("status") != "success" or response.get("used_fallback"):
+                print(f"  aviso: {mode} não gerou a resposta estruturada para '{question}'")
+    total = len(latencies)
+    return {
+        "mean": statistics.mean(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "calls": (counter() - calls_before) / total if counter() is not None else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência por modo do pipeline")
+    parser.add_argument("--delay", type=float, default=0.3, help="Latência simulada por chamada ao modelo (s)")
+    parser.add_argument("--iterations", type=int, default=5, help="Rodadas sobre o conjunto de perguntas")
+    parser.add_argument("--modes", nargs="+", default=list(PIPELINE_MODES), choices=PIPELINE_MODES)
+    parser.add_argument("--real", action="store_true", help="Usa o DeepSeek em vez do modelo simulado")
+    args = parser.parse_args()
+
+    # A memória de aprendizado é gravada no diretório atual; isola em um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-modes-"))
+
+    llm = None if args.real else FakeLLM(delay=args.delay)
+    agent = SQLQueryAgent(
+        api_key=os.getenv("DEEPSEEK_API_KEY", "benchmark"),
+        llm=llm,
+        query_cache=QueryCache(max_entries=0),
+        # O atalho local e os templates esconderiam chamadas nos modos staged/merged
+        local_classifier_threshold=None,
+        metric_templates=False
+    )
+    counter = (lambda: llm.calls) if llm else (lambda: None)
+
+    print(f"{'modo':>8} {'média (ms)':>11} {'p50 (ms)':>9} {'p95 (ms)':>9} {'chamadas':>9}")
+    for mode in args.modes:
+        result = run_mode(agent, mode, args.iterations, counter)
+        calls = f"{result['calls']:.1f}" if result["calls"] is not None else "-"
+        print(f"{mode:>8} {result['mean']:>11.1f} {result['p50']:>9.1f} {result['p95']:>9.1f} {calls:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Reprodução de gravações do provedor de LLM.
+
+Executa perguntas pelo pipeline completo usando as respostas gravadas com
+LLM_PROVIDER=record (ou com --record, a partir do provedor stub), sem rede e sem
+latência de modelo, para medir e perfilar o custo do próprio serviço ou verificar
+uma versão nova contra tráfego capturado.
+
+Uso:
+    python -m benchmarks.replay --recording llm_recordings.jsonl --questions perguntas.txt
+    python -m benchmarks.replay --recording /tmp/gravacao.jsonl --record   # cria a gravação com o stub
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.e2e import QUESTIONS
+from benchmarks.report import summarize
+from src.agent.providers import RecordReplayProvider, StubProvider
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+
+async def run(agent: SQLQueryAgent, questions, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = []
+
+    async def one(question: str):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await agent.aquery(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses.append(response.get("status") == "success" and not response.get("used_fallback"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline completo com respostas gravadas do LLM")
+    parser.add_argument("--recording", required=True, help="Arquivo JSONL de gravações")
+    parser.add_argument("--questions", help="Arquivo com uma pergunta por linha (padrão: perguntas de exemplo)")
+    parser.add_argument("--record", action="store_true", help="Grava as respostas do provedor stub em vez de reproduzir")
+    parser.add_argument("--strict", action="store_true", help="Falha em prompts sem resposta gravada")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="Repetições do conjunto de perguntas")
+    args = parser.parse_args()
+
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = QUESTIONS
+    recording = os.path.abspath(args.recording)
+
+    if args.record:
+        provider = RecordReplayProvider(recording, mode="record", inner=StubProvider())
+    else:
+        provider = RecordReplayProvider(recording, mode="replay", strict=args.strict)
+
+    # Memória de aprendizado e conversas são gravadas no diretório atual; isola em um temporário
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-replay-"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = SQLQueryAgent(
+            api_key="replay",
+            llm=provider,
+            query_cache=QueryCache(max_entries=0),
+            local_classifier_threshold=None,
+            metric_templates=False
+        )
+        latencies, statuses, elapsed = asyncio.run(run(agent, questions * args.repeat, args.concurrency))
+
+    print(json.dumps({
+        "mode": provider.mode,
+        "questions": len(latencies),
+        "succeeded": sum(statuses),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "latency_ms": summarize(latencies),
+        "replay_hits": provider.hits,
+        "replay_misses": provider.misses
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Estatísticas compartilhadas pelos benchmarks (percentis e resumo de latências).
+"""
+
+import statistics
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil pelo método nearest-rank"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_ms: List[float]) -> Dict:
+    """Média, p50, p95, p99 e máximo de uma lista de latências em milissegundos"""
+    if not latencies_ms:
+        return {}
+    return {
+        "mean": round(statistics.mean(latencies_ms), 3),
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+        "max": round(max(latencies_ms), 3)
+    }
@@ -0,0 +1,186 @@
+"""
+Benchmark do catálogo compilado do contexts.yaml.
+
+Mede as consultas tabela -> colunas, coluna -> tabelas, métrica -> definição e o
+caminho de joins entre duas tabelas percorrendo o dicionário do YAML (como antes) e pelos índices do SchemaCatalog, com
+o contexts.yaml real replicado --scale vezes. Em seguida, verifica a recarga a quente:
+perguntas simuladas em várias threads fixam o catálogo e leem o contexto duas vezes
+enquanto outra thread reescreve o arquivo; nenhuma pergunta pode ver duas versões.
+
+Uso:
+    python -m benchmarks.schema_catalog --scale 1 10 100 --reload-seconds 2
+"""
+
+import argparse
+import json
+from collections import deque
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from src.config.business_context import BusinessContext
+from src.config.schema_catalog import SchemaCatalog
+
+
+def scaled_contexts(contexts: dict, scale: int) -> dict:
+    """Cópias dos contextos com nomes de tabelas, colunas e métricas distintos"""
+    if scale == 1:
+        return contexts
+    result = {}
+    for i in range(scale):
+        for name, context in contexts.items():
+            result[f"{name}_{i}"] = dict(
+                context,
+                tables={
+                    f"{table}_{i}": dict(info, columns={f"{col}_{i}": t for col, t in info['columns'].items()})
+                    for table, info in context['tables'].items()
+                },
+                aggregation_fields={f"{key}_{i}": info for key, info in context['aggregation_fields'].items()}
+            )
+    return result
+
+
+def linear_tables_with_column(contexts: dict, column: str):
+    return [table for context in contexts.values()
+            for table, info in context['tables'].items() if column in info['columns']]
+
+
+def linear_metric(contexts: dict, key: str):
+    for context in contexts.values():
+        if key in context['aggregation_fields']:
+            return context['aggregation_fields'][key]
+    return None
+
+
+def linear_columns(contexts: dict, table: str):
+    for context in contexts.values():
+        if table in context['tables']:
+            return context['tables'][table]['columns']
+    return {}
+
+
+def linear_join_path(context: dict, start: str, end: str):
+    """Cópia da busca original: grafo e busca em largura refeitos a cada chamada"""
+    graph = {table: {} for table in context['tables']}
+    for rel in context.get('relationships', []):
+        if isinstance(rel, dict) and len(rel.get('tables', [])) == 2:
+            left, right = rel['tables']
+            if left in graph and right in graph:
+                graph[left][right] = graph[right][left] = rel.get('join_keys', [])
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        table = queue.popleft()
+        if table == end:
+            path = []
+            while table is not None:
+                path.append(table)
+                table = previous[table]
+            return path[::-1]
+        for neighbour in graph[table]:
+            if neighbour not in previous:
+                previous[neighbour] = table
+                queue.append(neighbour)
+    return None
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - start) / iterations * 1_000_000, 3)
+
+
+def lookup_report(contexts: dict, iterations: int) -> dict:
+    start = time.perf_counter()
+    catalog = SchemaCatalog(contexts)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    # Os últimos itens do YAML: o pior caso para a busca linear
+    table = list(catalog.tables)[-1]
+    column = list(catalog.columns(table))[-1]
+    metric = list(catalog.metrics)[-1]
+    context_name = next(name for name, graph in catalog.join_graphs.items() if len(graph) > 2)
+    start, end = list(catalog.join_graphs[context_name])[-1], list(catalog.join_graphs[context_name])[0]
+    return {
+        "tables": len(catalog.tables),
+        "compile_ms": round(compile_ms, 3),
+        "table_columns_us": {"linear": per_call_us(lambda: linear_columns(contexts, table), iterations),
+                             "catalog": per_call_us(lambda: catalog.columns(table), iterations)},
+        "column_tables_us": {"linear": per_call_us(lambda: linear_tables_with_column(contexts, column), iterations),
+                             "catalog": per_call_us(lambda: catalog.tables_with_column(column), iterations)},
+        "metric_us": {"linear": per_call_us(lambda: linear_metric(contexts, metric), iterations),
+                      "catalog": per_call_us(lambda: catalog.metric(metric), iterations)},
+        "join_path_us": {"linear": per_call_us(lambda: linear_join_path(contexts[context_name], start, end), iterations),
+                         "catalog": per_call_us(lambda: catalog.join_path(context_name, start, end), iterations)},
+    }
+
+
+def reload_report(seconds: float, readers: int) -> dict:
+    """Perguntas concorrentes com o arquivo sendo reescrito: versões vistas e inconsistências"""
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "contexts.yaml")
+    shutil.copy(os.path.join(os.path.dirname(__file__), "..", "src", "config", "contexts.yaml"), path)
+    with open(path, "r", encoding="utf-8") as f:
+        original = f.read()
+    context = BusinessContext(path)
+
+    stop = threading.Event()
+    counts = {"requests": 0, "inconsistent": 0, "writes": 0}
+    versions = set()
+    lock = threading.Lock()
+
+    def reader():
+        while not stop.is_set():
+            with context.pin() as catalog:
+                first = context.format_for_prompt()
+                time.sleep(0.001)
+                second = context.format_for_prompt()
+            with lock:
+                counts["requests"] += 1
+                counts["inconsistent"] += first != second
+                versions.add(catalog.version)
+
+    def writer():
+        while not stop.is_set():
+            counts["writes"] += 1
+            text = original.replace("Análise de vendas", f"Análise de vendas ({counts['writes']})")
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            # mtime com resolução grosseira em alguns sistemas de arquivos
+            os.utime(path, (time.time(), time.time() + counts["writes"]))
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return dict(counts, versions_seen=len(versions), final_version=context.catalog.version)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas e recarga a quente do catálogo de esquema")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--reload-seconds", type=float, default=2.0)
+    parser.add_argument("--readers", type=int, default=8)
+    args = parser.parse_args()
+
+    contexts = BusinessContext().contexts
+    report = {
+        "lookups": {scale: lookup_report(scaled_contexts(contexts, scale), args.iterations) for scale in args.scale},
+        "hot_reload": reload_report(args.reload_seconds, args.readers)
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Ganho e desperdício da geração especulativa (especialista em paralelo à classificação).
+
+O modelo simulado responde ao classificador com o mesmo palpite do classificador
+local em uma fração das perguntas (--agreement), escrito como o LLM costuma
+escrever (colunas com apelido, período em datas), e com outra classificação nas
+demais, imitando a taxa de acerto do palpite. Para cada taxa, compara o modo
+"staged" com e sem especulação: latência, chamadas ao modelo por pergunta e
+gerações especulativas aproveitadas, descartadas ou canceladas.
+
+Uso:
+    python -m benchmarks.speculative --delay 0.2 --agreement 1 0.7 0.3 0
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_llm import CLASSIFICATION, FakeLLM
+from benchmarks.report import summarize
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTIONS = [
+    "Mostre o faturamento diário dos últimos 7 dias",
+    "Qual o ticket médio por região no último mês?",
+    "Qual é o valor total em estoque por armazém?",
+    "Faturamento por categoria no último trimestre",
+]
+
+
+def as_llm_writes(guess: dict) -> dict:
+    """O mesmo palpite na forma em que o LLM costuma escrever: colunas com apelido e período em datas"""
+    classification = json.loads(json.dumps(guess))
+    classification["groupby"] = [f"o.{column}" for column in classification.get("groupby") or []]
+    for item in classification.get("filters") or []:
+        item["column"] = f"o.{item['column']}"
+    timeframe = classification.get("timeframe")
+    if timeframe:
+        timeframe.pop("range", None)
+    return classification
+
+
+class AgreeingFakeLLM(FakeLLM):
+    def __init__(self, guesses, agreement: float, seed: int, **kwargs):
+        """Modelo simulado cujo classificador concorda com o palpite local na fração agreement"""
+        super().__init__(**kwargs)
+        self.guesses = guesses
+        self.agreement = agreement
+        self._agree = random.Random(seed)
+
+    def _canned_response(self, prompt: str, stage: str = None) -> str:
+        if self._stage(prompt, stage) == "classifier":
+            # A pergunta fica no fim do prompt; antes dela podem aparecer perguntas anteriores
+            # vindas da memória de aprendizado
+            asked = prompt.rsplit("Pergunta do usuário:", 1)[-1].strip()
+            for question, guess in self.guesses.items():
+                if question == asked:
+                    with self._lock:
+                        agrees = self._agree.random() < self.agreement
+                    disagreement = dict(CLASSIFICATION, metrics=["outra_metrica"])
+                    classification = as_llm_writes(guess) if agrees else disagreement
+                    return f"```json\n{json.dumps(classification, ensure_ascii=False)}\n```"
+        return super()._canned_response(prompt, stage)
+
+
+async def run(agent: SQLQueryAgent, questions):
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        await agent.aquery(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def measure(agreement: float, speculative: bool, args) -> dict:
+    questions = [f"{q} (rodada {i})" for i in range(args.iterations) for q in QUESTIONS]
+    with contextlib.redirect_stdout(io.StringIO()):
+        probe = SQLQueryAgent(api_key="benchmark", llm=FakeLLM(delay=0), local_classifier_threshold=None)
+        guesses = {q: probe.local_classifier.classify(q)[0] for q in questions}
+
+        llm = AgreeingFakeLLM(guesses, agreement, args.seed, delay=args.delay)
+        agent = SQLQueryAgent(
+            api_key="benchmark",
+            llm=llm,
+            query_cache=QueryCache(max_entries=0),
+            local_classifier_threshold=None,
+            speculative_generation=speculative,
+            # Com templates, as perguntas cobertas não chegariam ao especialista
+            metric_templates=False
+        )
+        latencies = asyncio.run(run(agent, questions))
+
+    outcomes = {}
+    for line in agent.metrics.speculations.render():
+        if not line.startswith("#"):
+            outcomes[line.split('result="')[1].split('"')[0]] = int(float(line.rsplit(" ", 1)[1]))
+    return {
+        "latency_ms": summarize(latencies),
+        "calls_per_question": round(llm.calls / len(questions), 2),
+        "speculations": outcomes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geração especulativa: latência e chamadas desperdiçadas")
+    parser.add_argument("--delay", type=float, default=0.2, help="Latência simulada por chamada ao modelo (s)")
+    parser.add_argument("--iterations", type=int, default=5, help="Rodadas sobre o conjunto de perguntas")
+    parser.add_argument("--agreement", type=float, nargs="+", default=[1.0, 0.7, 0.3, 0.0],
+                        help="Frações de perguntas em que o LLM concorda com o palpite local")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # A memória de aprendizado é gravada no diretório atual; isola em um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-speculative-"))
+
+    results = {"sem_especulacao": measure(1.0, False, args)}
+    for agreement in args.agreement:
+        results[f"especulativo_{agreement}"] = measure(agreement, True, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Tempo e resultado da análise estática das queries (src/agent/sql_lint.py).
+
+Por padrão analisa a query do modelo simulado e as queries dos templates de
+métricas para as perguntas de exemplo do contexts.yaml; com --queries, lê as
+queries de um arquivo, separadas por ';'. Mostra, por query, o tempo de
+análise, a nota de risco e os avisos, e ao final os avisos por tipo.
+
+Uso:
+    python -m benchmarks.sql_lint --iterations 2000
+    python -m benchmarks.sql_lint --queries queries.sql
+"""
+
+import argparse
+import collections
+import time
+
+from benchmarks.fake_llm import EXPERT_SQL
+from src.agent.local_classifier import LocalClassifier
+from src.agent.metric_templates import MetricTemplateEngine, TemplateMiss
+from src.agent.prompt_layout import sample_questions
+from src.agent.sql_lint import SQLLinter, tokenize
+from src.config.business_context import BusinessContext
+
+
+def default_queries(business_context: BusinessContext):
+    """Query do modelo simulado e queries dos templates para as perguntas de exemplo"""
+    queries = [("modelo simulado", EXPERT_SQL.strip("`").split("\n", 1)[1])]
+    classifier = LocalClassifier(business_context)
+    engine = MetricTemplateEngine(business_context)
+    for question in sample_questions(business_context):
+        metadata, _ = classifier.classify(question)
+        try:
+            queries.append((question, engine.render(metadata)))
+        except TemplateMiss:
+            continue
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo e avisos da análise estática das queries")
+    parser.add_argument("--queries", help="Arquivo com as queries, separadas por ';'")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    business_context = BusinessContext()
+    linter = SQLLinter(business_context)
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [(f"query {i + 1}", q.strip()) for i, q in enumerate(f.read().split(";")) if q.strip()]
+    else:
+        queries = default_queries(business_context)
+
+    codes = collections.Counter()
+    total_us = []
+    print(f"{'tokens':>6} {'µs':>8} {'risco':>6} {'nota':>5}  query")
+    for label, sql in queries:
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            report = linter.lint(sql)
+        micros = (time.perf_counter() - start) / args.iterations * 1_000_000
+        total_us.append(micros)
+        codes.update(warning["code"] for warning in report["warnings"])
+        print(f"{len(tokenize(sql)):>6} {micros:>8.1f} {report['risk']:>6} {report['risk_score']:>5}  {label[:60]}")
+        for warning in report["warnings"]:
+            print(f"{'':>29}- {warning['code']}: {warning['message']}")
+
+    print(f"\nmédia: {sum(total_us) / len(total_us):.1f} µs/query em {len(queries)} queries")
+    for code, count in codes.most_common():
+        print(f"  {code}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Reescrita das queries (src/agent/sql_rewrite.py): mudanças, tempo e equivalência no DuckDB.
+
+Aplica a reescrita a um conjunto de queries no formato das geradas pelo agente
+(a do modelo simulado, filtros no select externo, conversões de CREATED_AT,
+date_trunc, left join, CTE lida duas vezes, agregação sem group by) e às queries
+dos templates de métricas para as perguntas de exemplo do contexts.yaml. Cada
+par (original, reescrita) roda em um DuckDB com dados sintéticos e os resultados
+são comparados linha a linha; o período e os filtros adicionados a partir da
+classificação são conferidos rodando a query original sobre as tabelas já
+filtradas. Mostra também a nota de risco do linter antes e depois.
+
+Termina com código 1 se algum resultado for diferente.
+
+Uso:
+    python -m benchmarks.sql_rewrite --rows 2000
+    python -m benchmarks.sql_rewrite --show-sql
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+
+from benchmarks.duckdb_fixture import duckdb_connection
+from benchmarks.fake_llm import CLASSIFICATION, EXPERT_SQL
+from src.agent.local_classifier import LocalClassifier
+from src.agent.metric_templates import MetricTemplateEngine, TemplateMiss
+from src.agent.prompt_layout import sample_questions
+from src.agent.sql_lint import SQLLinter
+from src.agent.sql_rewrite import SQLRewriter
+from src.config.business_context import BusinessContext
+
+LATAM = {"column": "REGION", "operator": "=", "value": "LATAM"}
+
+
+def corpus(today: date):
+    """Queries de exemplo (rótulo, query, metadados), com datas dentro do período dos dados sintéticos"""
+    days = {f"d{n}": (today - timedelta(days=n)).isoformat() for n in (7, 10, 20, 30, 45, 60, 90)}
+    days["m2"] = (today.replace(day=1) - timedelta(days=40)).replace(day=1).isoformat()
+    queries = [
+        ("modelo simulado", EXPERT_SQL.strip("`").split("\n", 1)[1], dict(CLASSIFICATION, filters=[LATAM])),
+        ("filtros no select externo", """
+with pedidos as (
+  select
+    o.ORDER_ID
+    , o.CREATED_AT::DATE as data
+    , o.REGION
+    , o.TOTAL_PRICE
+    , o.DISCOUNT
+    , o.PAYMENT_METHOD
+  from SCHEMA.DATABASE.ORDERS o
+)
+
+select
+  data
+  , REGION
+  , sum(TOTAL_PRICE) as faturamento
+  , count(distinct ORDER_ID) as pedidos
+from pedidos
+where REGION = 'LATAM'
+  and data >= '{d30}'
+  and data < '{d10}'
+group by all
+""", {}),
+        ("cadeia de CTEs agregadas", """
+with pedidos as (
+  select
+    o.CREATED_AT::DATE as data
+    , o.REGION
+    , o.TOTAL_PRICE
+    , o.DISCOUNT
+    , o.CUSTOMER_ID
+  from SCHEMA.DATABASE.ORDERS o
+),
+diario as (
+  select data, REGION, sum(TOTAL_PRICE) as faturamento, count(*) as pedidos
+  from pedidos
+  group by all
+)
+select data, faturamento
+from diario
+where REGION = 'LATAM' and data between '{d45}' and '{d20}'
+order by 1
+""", {}),
+        ("date_trunc por mês", """
+with mensal as (
+  select
+    date_trunc('month', o.CREATED_AT) as mes
+    , o.TOTAL_PRICE
+    , o.QUANTITY
+  from SCHEMA.DATABASE.ORDERS o
+  where date_trunc('month', o.CREATED_AT) >= '{m2}'
+    and date_trunc('month', o.CREATED_AT)::date <= '{d20}'
+    and o.REGION = 'LATAM'
+)
+select mes, sum(TOTAL_PRICE) as faturamento
+from mensal
+group by all
+""", {}),
+        ("left join", """
+with clientes as (
+  select c.CUSTOMER_ID, c.REGION as regiao_cliente, c.IS_ACTIVE, c.EMAIL
+  from SCHEMA.DATABASE.CUSTOMERS c
+),
+pedidos as (
+  select o.CUSTOMER_ID, o.TOTAL_PRICE, o.CREATED_AT
+  from SCHEMA.DATABASE.ORDERS o
+  where cast(o.CREATED_AT as date) between '{d60}' and '{d30}'
+)
+select p.CUSTOMER_ID, cl.regiao_cliente, sum(p.TOTAL_PRICE) as total
+from pedidos p
+left join clientes cl on cl.CUSTOMER_ID = p.CUSTOMER_ID
+where cl.IS_ACTIVE is null
+  and p.TOTAL_PRICE > 100
+group by all
+""", {}),
+        ("CTE lida duas vezes", """
+with base as (
+  select o.CUSTOMER_ID, o.CREATED_AT::date as data, o.TOTAL_PRICE, o.STORE_ID
+  from SCHEMA.DATABASE.ORDERS o
+)
+select a.data, count(*) as pares
+from base a
+join base b on a.CUSTOMER_ID = b.CUSTOMER_ID and a.data = b.data
+where a.TOTAL_PRICE > 500
+group by all
+""", {}),
+        ("datas relativas", """
+select o.CREATED_AT::date as data, sum(o.TOTAL_PRICE) as faturamento
+from SCHEMA.DATABASE.ORDERS o
+where o.CREATED_AT::date >= current_date - 7
+  and cast(o.CREATED_AT as date) < current_date
+  and o.REGION = 'LATAM'
+group by all
+""", {}),
+        ("agregação sem group by", """
+with totais as (
+  select sum(o.TOTAL_PRICE) as total, 'LATAM' as regiao
+  from SCHEMA.DATABASE.ORDERS o
+)
+select total from totais where regiao = 'NA'
+""", {}),
+        ("período e filtro da classificação", """
+with pedidos_dia as (
+  select
+    o.CREATED_AT::date as data
+    , o.PAYMENT_METHOD
+    , o.TOTAL_PRICE
+  from SCHEMA.DATABASE.ORDERS o
+  join SCHEMA.DATABASE.CUSTOMERS c on c.CUSTOMER_ID = o.CUSTOMER_ID and c.REGION = o.REGION
+)
+select data, sum(TOTAL_PRICE) as faturamento
+from pedidos_dia
+group by all
+""", {
+            "timeframe": {"column": "CREATED_AT", "start_date": days["d90"], "end_date": days["d7"]},
+            "filters": [{"column": "PAYMENT_METHOD", "operator": "=", "value": "payment_method_1"}]
+        }),
+        ("igualdade de data", """
+select o.REGION, count(*) as pedidos
+from SCHEMA.DATABASE.ORDERS o
+where o.CREATED_AT::date = '{d20}' or date(o.UPDATED_AT) > '{d10}'
+group by all
+""", {}),
+    ]
+    return [(label, sql.strip().format(**days), metadata) for label, sql, metadata in queries]
+
+
+def template_queries(business_context: BusinessContext):
+    """Queries dos templates para as perguntas de exemplo, com os metadados da classificação"""
+    classifier = LocalClassifier(business_context)
+    engine = MetricTemplateEngine(business_context)
+    queries = []
+    for question in sample_questions(business_context):
+        metadata, _ = classifier.classify(question)
+        try:
+            queries.append((f"template: {question}", engine.render(metadata), metadata))
+        except TemplateMiss:
+            continue
+    return queries
+
+
+def rows(connection, sql_query: str):
+    """Linhas do resultado, arredondadas e ordenadas, para comparar duas queries"""
+    result = connection.execute(sql_query).fetchall()
+    normalized = [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in result]
+    return sorted(normalized, key=repr)
+
+
+def equivalent(connection, sql_query: str, rewritten: str, changes):
+    """Se a reescrita devolve o mesmo resultado; acréscimos da classificação são aplicados às tabelas da original"""
+    actual = rows(connection, rewritten)
+    connection.execute("begin transaction")
+    try:
+        for change in changes:
+            for added in change.get("tables", []):
+                connection.execute(f"delete from {added['table']} where not coalesce({added['predicate']}, false)")
+        expected = rows(connection, sql_query)
+    finally:
+        connection.execute("rollback")
+    return expected == actual, len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mudanças, tempo e equivalência da reescrita das queries")
+    parser.add_argument("--rows", type=int, default=2000, help="Linhas por tabela no DuckDB")
+    parser.add_argument("--iterations", type=int, default=200, help="Repetições para medir a reescrita")
+    parser.add_argument("--show-sql", action="store_true", help="Imprime as queries reescritas")
+    args = parser.parse_args()
+
+    business_context = BusinessContext()
+    catalog = business_context.current()
+    rewriter = SQLRewriter(business_context)
+    linter = SQLLinter(business_context)
+    connection = duckdb_connection(catalog, rows=args.rows)
+    if connection is None:
+        print("duckdb não instalado: a equivalência das queries não pode ser conferida")
+        sys.exit(1)
+
+    mismatches, total_us = [], []
+    print(f"{'µs':>8} {'mudanças':>8} {'risco':>11} {'linhas':>6}  query")
+    for label, sql_query, metadata in corpus(date.today()) + template_queries(business_context):
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            rewritten, changes = rewriter.rewrite(sql_query, metadata)
+        micros = (time.perf_counter() - start) / args.iterations * 1_000_000
+        total_us.append(micros)
+
+        try:
+            same, count = equivalent(connection, sql_query, rewritten, changes)
+        except Exception as e:
+            same, count = False, 0
+            print(f"  erro ao executar: {str(e).splitlines()[0]}")
+        if not same:
+            mismatches.append(label)
+        risk = f"{linter.lint(sql_query, metadata)['risk_score']} -> {linter.lint(rewritten, metadata)['risk_score']}"
+        print(f"{micros:>8.1f} {len(changes):>8} {risk:>11} {count:>6}  {label[:60]}{'' if same else '  DIFERENTE'}")
+        for change in changes:
+            print(f"{'':>37}- {change['code']}: {change['message']}")
+        if args.show_sql and changes:
+            print(f"\n{rewritten}\n")
+
+    print(f"\nmédia: {sum(total_us) / len(total_us):.1f} µs/query em {len(total_us)} queries")
+    if mismatches:
+        print(f"resultados diferentes: {', '.join(mismatches)}")
+        sys.exit(1)
+    print("mesmos resultados em todas as queries")
+
+
+if __name__ == "__main__":
+    main()
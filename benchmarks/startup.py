@@ -0,0 +1,142 @@
+"""
+Benchmark do tempo de importação e de inicialização da API.
+
+Cada execução roda em um processo Python novo (sem módulos já carregados) e mede:
+a importação de src.api.main, os hooks de startup, o tempo até /ready responder 200
+(agente criado e aquecido em segundo plano) e a latência da primeira pergunta em
+/query. Reporta a mediana das execuções em JSON; com --importtime, lista também os
+módulos mais caros segundo python -X importtime.
+
+Uso:
+    python -m benchmarks.startup --runs 5 --importtime 15
+    python -m benchmarks.startup --provider deepseek   # cliente real, sem a primeira pergunta
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTION = "Qual o faturamento total por região nos últimos 7 dias?"
+
+
+def measure_once(question: str = None) -> dict:
+    """Uma inicialização completa no processo atual, que deve ser novo"""
+    start = time.perf_counter()
+    import src.api.main as api
+    imported = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+    client = TestClient(api.app)
+    entering = time.perf_counter()
+    with client:
+        started = time.perf_counter()
+        while True:
+            response = client.get("/ready")
+            if response.status_code == 200 or response.json().get("status") == "failed":
+                break
+            time.sleep(0.002)
+        ready = time.perf_counter()
+        result = {
+            "import_seconds": imported - start,
+            "startup_hook_seconds": started - entering,
+            "ready_seconds": ready - entering,
+            "ready": response.json()
+        }
+        if question and response.status_code == 200:
+            before = time.perf_counter()
+            client.post("/query", json={"question": question}).raise_for_status()
+            result["first_query_seconds"] = time.perf_counter() - before
+    return result
+
+
+def child_env(args, workdir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "LLM_PROVIDER": args.provider,
+        "LEARNING_MEMORY_PATH": os.path.join(workdir, "learning_memory.db"),
+    })
+    if args.provider == "deepseek":
+        env.setdefault("DEEPSEEK_API_KEY", "benchmark")
+    for name in ("QUERY_CACHE_PATH", "CONVERSATION_STORE_PATH"):
+        env.pop(name, None)
+    if args.no_snapshot:
+        env.pop("CONTEXT_SNAPSHOT_PATH", None)
+    else:
+        env["CONTEXT_SNAPSHOT_PATH"] = os.path.join(workdir, "contexts.snapshot.json")
+    return env
+
+
+def run_child(args, env: dict, workdir: str) -> dict:
+    command = [sys.executable, "-m", "benchmarks.startup", "--once"]
+    if args.provider != "stub":
+        command.append("--no-query")
+    start = time.perf_counter()
+    completed = subprocess.run(command, env=env, cwd=workdir, capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def import_profile(env: dict, workdir: str, top: int) -> list:
+    """Módulos com maior tempo próprio de importação (python -X importtime)"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.api.main"],
+        env=env, cwd=workdir, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": round(int(self_us) / 1000, 1),
+            "cumulative_ms": round(int(cumulative_us) / 1000, 1)
+        })
+    return sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação e de inicialização da API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--provider", default="stub", choices=["stub", "deepseek"])
+    parser.add_argument("--no-snapshot", action="store_true", help="Sem o snapshot pré-compilado do contexts.yaml")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="Lista os N módulos mais caros")
+    parser.add_argument("--once", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-query", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.once:
+        print(json.dumps(measure_once(None if args.no_query else QUESTION), ensure_ascii=False))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = child_env(args, workdir)
+        runs = [run_child(args, env, workdir) for _ in range(args.runs)]
+        report = {
+            "provider": args.provider,
+            "snapshot": not args.no_snapshot,
+            "runs": args.runs,
+            "ready": runs[-1]["ready"],
+        }
+        for metric in ("import_seconds", "startup_hook_seconds", "ready_seconds",
+                       "first_query_seconds", "process_seconds"):
+            values = [run[metric] for run in runs if metric in run]
+            if values:
+                report[metric] = round(statistics.median(values), 4)
+        if args.importtime:
+            report["slowest_imports"] = import_profile(env, workdir, args.importtime)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Tempo até o primeiro evento do pipeline em streaming.
+
+Compara o tempo até a primeira informação ficar disponível para o cliente em
+aquery (resposta única ao final do pipeline, usada por /query) e em astream_query
+(evento "classified" após o primeiro estágio, usado por /query/stream), com o
+modelo simulado.
+
+Uso:
+    python -m benchmarks.stream_ttfb --delay 0.3 --requests 5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_llm import FakeLLM
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTION = "Mostre o faturamento diário dos últimos 7 dias"
+
+
+async def measure(agent: SQLQueryAgent, total: int):
+    blocking, first_event, first_token, stream_total = [], [], [], []
+    for i in range(total):
+        start = time.perf_counter()
+        await agent.aquery(f"{QUESTION} #{i}")
+        blocking.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        first = token = None
+        async for event in agent.astream_query(f"{QUESTION} (stream) #{i}"):
+            elapsed = time.perf_counter() - start
+            first = first or elapsed
+            if event["event"] == "token":
+                token = token or elapsed
+        first_event.append(first)
+        first_token.append(token or elapsed)
+        stream_total.append(time.perf_counter() - start)
+    return blocking, first_event, first_token, stream_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo até o primeiro evento: aquery vs astream_query")
+    parser.add_argument("--delay", type=float, default=0.3, help="Latência simulada até o primeiro token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Intervalo entre tokens transmitidos (s)")
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    # A memória de aprendizado é gravada no diretório atual; isola em um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-stream-"))
+
+    agent = SQLQueryAgent(
+        api_key="benchmark",
+        llm=FakeLLM(delay=args.delay, token_delay=args.token_delay),
+        query_cache=QueryCache(max_entries=0),
+        local_classifier_threshold=None,
+        metric_templates=False
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        blocking, first_event, first_token, stream_total = asyncio.run(measure(agent, args.requests))
+
+    def ms(values):
+        return statistics.mean(values) * 1000
+
+    print(f"{'modo':>14} {'1º evento (ms)':>15} {'1º token (ms)':>14} {'total (ms)':>11}")
+    print(f"{'/query':>14} {ms(blocking):>15.1f} {ms(blocking):>14.1f} {ms(blocking):>11.1f}")
+    print(f"{'/query/stream':>14} {ms(first_event):>15.1f} {ms(first_token):>14.1f} {ms(stream_total):>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Vazão da contagem de tokens BPE.
+
+Mede a contagem dos prompts reais do pipeline (classificador, especialista e
+consolidador com o contexto de negócio) com o cache de pedaços frio e quente,
+além da contagem por palavras usada antes, para garantir que a contabilização
+de tokens por estágio não vire gargalo.
+
+Uso:
+    python -m benchmarks.tokenizer --iterations 200
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fake_llm import CLASSIFICATION, EXPERT_SQL
+from src.agent.sql_agent import SQLQueryAgent
+from src.agent.tokens import DEFAULT_TOKENIZER_PATH, BPETokenizer
+
+QUESTION = "Qual o faturamento total por região nos últimos 7 dias?"
+
+
+def build_prompts():
+    # A memória de aprendizado é gravada no diretório atual; isola em um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="sql-agent-tokens-"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = SQLQueryAgent(api_key="benchmark", llm=object())
+    return [
+        agent._build_classifier_prompt(QUESTION),
+        agent._build_expert_prompt(QUESTION, CLASSIFICATION),
+        agent._build_consolidator_prompt(EXPERT_SQL, CLASSIFICATION),
+        agent.business_context.format_for_prompt(),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão da contagem de tokens")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    prompts = build_prompts()
+    total_chars = sum(len(p) for p in prompts)
+
+    tokenizer = BPETokenizer.from_file(DEFAULT_TOKENIZER_PATH)
+    start = time.perf_counter()
+    tokens = sum(tokenizer.count(p) for p in prompts)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        # Texto novo a cada rodada (sem o cache de textos inteiros), como uma pergunta inédita
+        for prompt in prompts:
+            tokenizer.count(f"{prompt} #{i}")
+    warm_ms = (time.perf_counter() - start) * 1000 / args.iterations
+
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        for prompt in prompts:
+            len(f"{prompt} #{i}".split())
+    words_ms = (time.perf_counter() - start) * 1000 / args.iterations
+
+    print(json.dumps({
+        "prompts": len(prompts),
+        "chars": total_chars,
+        "bpe_tokens": tokens,
+        "chars_per_token": round(total_chars / tokens, 2),
+        "cold_ms": round(cold_ms, 3),
+        "warm_ms_per_pipeline": round(warm_ms, 3),
+        "warm_mb_per_s": round(total_chars / (warm_ms / 1000) / 1e6, 2),
+        "word_split_ms_per_pipeline": round(words_ms, 3)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+import asyncio
+import threading
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        """Agrupa chamadas concorrentes com a mesma chave em uma única execução
+
+        Enquanto a primeira chamada de uma chave está em andamento, as seguintes
+        aguardam o mesmo resultado em vez de repetir o trabalho. A chave é liberada
+        assim que a execução termina; chamadas posteriores executam de novo.
+        """
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._tasks) + len(self._futures)
+
+    def _count_shared(self):
+        with self._lock:
+            self.shared += 1
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """Executa fn() uma vez por chave entre threads concorrentes
+
+        Returns:
+            Tupla (resultado, compartilhado); compartilhado é True para quem aguardou
+            a execução iniciada por outra chamada
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+        if not leader:
+            self._count_shared()
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    async def ado(self, key: str, factory: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Versão assíncrona de do para corrotinas do mesmo event loop
+
+        A execução roda em uma tarefa própria: se quem a iniciou for cancelado
+        (cliente desconectado), as demais chamadas continuam aguardando o resultado.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        leader = task is None or task.get_loop() is not loop
+        if leader:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+
+            def release(done: asyncio.Future):
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+
+            task.add_done_callback(release)
+        else:
+            self._count_shared()
+        return await asyncio.shield(task), not leader
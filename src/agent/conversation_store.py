@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+import json
+import sqlite3
+import threading
+import time
+
+
+class ConversationStore:
+    """Interface dos armazenamentos de conversas usados no refinamento
+
+    As conversas são dicionários com original_question, metadata e iterations. Quem
+    altera uma conversa obtida com get deve gravá-la de volta com set. Armazenamentos
+    com blocking = True fazem E/S em get e set; nos caminhos assíncronos o agente
+    os chama fora do event loop.
+    """
+
+    blocking = False
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def set(self, conversation_id: str, conversation: Dict):
+        raise NotImplementedError
+
+    def delete(self, conversation_id: str):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class InMemoryConversationStore(ConversationStore):
+    def __init__(self, max_conversations: int = 10000, ttl_seconds: float = 3600,
+                 max_memory_bytes: int = 64 * 1024 * 1024):
+        """Conversas em memória com despejo LRU + TTL e limite de memória
+
+        O TTL conta a partir do último uso da conversa (criação ou refinamento), então
+        a ordem LRU também é a ordem de expiração.
+
+        Args:
+            max_conversations: Número máximo de conversas mantidas
+            ttl_seconds: Tempo sem uso após o qual a conversa é descartada
+            max_memory_bytes: Limite do tamanho somado das conversas (JSON serializado)
+        """
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, conversation_id: str):
+        _, size, _ = self._entries.pop(conversation_id)
+        self._size -= size
+
+    def _expire(self, now: float):
+        """Remove do início da fila as conversas sem uso há mais que o TTL"""
+        while self._entries:
+            conversation_id, (used_at, _, _) = next(iter(self._entries.items()))
+            if now - used_at <= self.ttl_seconds:
+                break
+            self._remove(conversation_id)
+            self.expirations += 1
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            _, size, conversation = entry
+            self._entries[conversation_id] = (now, size, conversation)
+            self._entries.move_to_end(conversation_id)
+            return conversation
+
+    def set(self, conversation_id: str, conversation: Dict):
+        size = len(json.dumps(conversation, ensure_ascii=False, default=str))
+        now = time.time()
+        with self._lock:
+            if conversation_id in self._entries:
+                self._remove(conversation_id)
+            self._entries[conversation_id] = (now, size, conversation)
+            self._size += size
+            self._expire(now)
+            # A conversa recém-gravada fica por último e só sai se sozinha exceder o limite
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_conversations or self._size > self.max_memory_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            if conversation_id in self._entries:
+                self._remove(conversation_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "conversations": len(self._entries),
+                "max_conversations": self.max_conversations,
+                "memory_bytes": self._size,
+                "max_memory_bytes": self.max_memory_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    blocking = True
+
+    def __init__(self, path: str = "conversations.db", max_conversations: int = 100000,
+                 ttl_seconds: float = 3600, prune_every: int = 100):
+        """Conversas em SQLite (modo WAL), compartilhadas entre os workers da API
+
+        Um refinamento que chega a outro processo uvicorn encontra a conversa criada
+        pelo primeiro. O despejo segue as mesmas regras LRU + TTL do armazenamento em
+        memória, aplicado a cada prune_every gravações.
+
+        Args:
+            path: Caminho do arquivo SQLite
+            max_conversations: Número máximo de conversas mantidas
+            ttl_seconds: Tempo sem uso após o qual a conversa é descartada
+            prune_every: A cada quantas gravações as conversas excedentes são removidas
+        """
+        self.path = path
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id TEXT PRIMARY KEY, payload TEXT NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_conversations_used_at ON conversations (used_at)"
+            )
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, used_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                with self._conn:
+                    self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE conversations SET used_at = ? WHERE id = ?", (now, conversation_id)
+                )
+        return json.loads(row[0])
+
+    def set(self, conversation_id: str, conversation: Dict):
+        payload = json.dumps(conversation, ensure_ascii=False, default=str)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (id, payload, used_at) VALUES (?, ?, ?)",
+                    (conversation_id, payload, time.time())
+                )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune()
+
+    def _prune(self):
+        """Remove as conversas expiradas e as menos usadas além do limite"""
+        with self._conn:
+            expired = self._conn.execute(
+                "DELETE FROM conversations WHERE used_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            evicted = self._conn.execute(
+                "DELETE FROM conversations WHERE id IN ("
+                "SELECT id FROM conversations ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_conversations,)
+            ).rowcount
+        self.evictions += expired + evicted
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {
+            "backend": "sqlite",
+            "conversations": len(self),
+            "max_conversations": self.max_conversations,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,318 @@
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import math
+import random
+import threading
+import time
+
+import httpx
+
+T = TypeVar("T")
+
+# Códigos HTTP que indicam falha transitória do provedor
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Erros do SDK da OpenAI (usado pelo ChatDeepSeek) sem código HTTP que valem nova tentativa
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+class PoolSettings:
+    def __init__(self, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0, connect_timeout: float = 5.0):
+        """Limites do pool de conexões compartilhado por todos os estágios do agente
+
+        Args:
+            max_connections: Conexões simultâneas com o provedor
+            max_keepalive_connections: Conexões ociosas mantidas abertas para reuso
+            keepalive_expiry: Tempo, em segundos, que uma conexão ociosa fica aberta
+            connect_timeout: Tempo máximo para abrir uma conexão
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def timeout(self, read_timeout: float) -> httpx.Timeout:
+        return httpx.Timeout(read_timeout, connect=self.connect_timeout)
+
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(settings: PoolSettings = None, read_timeout: float = 60.0) -> httpx.Client:
+    """Cliente HTTP síncrono do processo, com keep-alive; criado na primeira chamada"""
+    with _clients_lock:
+        client = _clients.get("sync")
+        if client is None:
+            settings = settings or PoolSettings()
+            client = _clients["sync"] = httpx.Client(
+                limits=settings.limits(),
+                timeout=settings.timeout(read_timeout)
+            )
+        return client
+
+
+def get_async_http_client(settings: PoolSettings = None, read_timeout: float = 60.0) -> httpx.AsyncClient:
+    """Cliente HTTP assíncrono do processo, com keep-alive; criado na primeira chamada
+
+    As conexões do pool ficam presas ao event loop que as abriu: o cliente deve ser
+    usado a partir de um único loop (o da API).
+    """
+    with _clients_lock:
+        client = _clients.get("async")
+        if client is None:
+            settings = settings or PoolSettings()
+            client = _clients["async"] = httpx.AsyncClient(
+                limits=settings.limits(),
+                timeout=settings.timeout(read_timeout)
+            )
+        return client
+
+
+async def aclose_http_clients():
+    """Fecha os clientes compartilhados (desligamento da API)"""
+    with _clients_lock:
+        clients = dict(_clients)
+        _clients.clear()
+    if "sync" in clients:
+        clients["sync"].close()
+    if "async" in clients:
+        await clients["async"].aclose()
+
+
+def parse_stage_timeouts(value: str) -> Dict[str, float]:
+    """Converte "classifier=10,expert=30" em {"classifier": 10.0, "expert": 30.0}"""
+    timeouts = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        stage, _, seconds = item.partition("=")
+        timeouts[stage.strip()] = float(seconds)
+    return timeouts
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Falhas transitórias: timeouts, erros de conexão e respostas 408/429/5xx"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Espera, em segundos, pedida pelo provedor em Retry-After (segundos ou data HTTP) ou retry-after-ms"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        """Latências recentes de chamadas bem-sucedidas, usadas para calcular o atraso do hedge"""
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 default_timeout: float = 60.0, stage_timeouts: Dict[str, float] = None,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_delay: float = None,
+                 hedge_min_samples: int = 20, seed: int = None):
+        """Timeouts por estágio, novas tentativas com backoff exponencial e requisições em hedge
+
+        Args:
+            max_retries: Novas tentativas após uma falha transitória (0 desativa)
+            backoff_base: Espera base, em segundos; a n-ésima nova tentativa espera um valor
+                          sorteado entre 0 e min(backoff_max, backoff_base * 2**n), ou o
+                          tempo pedido pelo provedor em Retry-After
+            backoff_max: Limite da espera entre tentativas
+            default_timeout: Timeout de leitura dos estágios sem valor próprio
+            stage_timeouts: Timeout de leitura por estágio (classifier, expert, ...)
+            hedge: Dispara uma segunda requisição quando a primeira demora mais que o
+                   quantil hedge_quantile das latências recentes do estágio e usa a que
+                   terminar primeiro (apenas nas chamadas assíncronas)
+            hedge_quantile: Quantil das latências recentes usado como atraso do hedge
+            hedge_delay: Atraso fixo do hedge; sem ele, o hedge só é ativado depois de
+                         hedge_min_samples chamadas do estágio
+            hedge_min_samples: Amostras necessárias para calcular o atraso pelo quantil
+            seed: Semente do sorteio das esperas (reprodutibilidade em benchmarks)
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_timeout = default_timeout
+        self.stage_timeouts = stage_timeouts or {}
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._random = random.Random(seed)
+        self._latencies: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def timeout_for(self, stage: str = None) -> float:
+        return self.stage_timeouts.get(stage or "", self.default_timeout)
+
+    def backoff(self, attempt: int) -> float:
+        """Espera antes da nova tentativa de número attempt (0, 1, ...), com jitter completo"""
+        with self._lock:
+            return self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def retry_delay(self, attempt: int, error: BaseException) -> float:
+        """Espera antes da nova tentativa: a pedida pelo provedor (Retry-After), se houver, ou o backoff
+
+        A espera pedida é limitada a backoff_max.
+        """
+        requested = retry_after(error)
+        if requested is not None:
+            return min(self.backoff_max, requested)
+        return self.backoff(attempt)
+
+    def _window(self, stage: str) -> LatencyWindow:
+        with self._lock:
+            window = self._latencies.get(stage or "")
+            if window is None:
+                window = self._latencies[stage or ""] = LatencyWindow()
+            return window
+
+    def observe(self, stage: str, seconds: float):
+        self._window(stage).add(seconds)
+
+    def hedge_delay_for(self, stage: str = None) -> Optional[float]:
+        """Atraso do hedge para o estágio, ou None se o hedge não deve ser usado"""
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        window = self._window(stage)
+        if len(window) < self.hedge_min_samples:
+            return None
+        return window.quantile(self.hedge_quantile)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_retry(self):
+        self._count("retries")
+
+    def call(self, stage: str, fn: Callable[[float], T]) -> T:
+        """Executa fn(timeout) com novas tentativas em falhas transitórias"""
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = fn(self.timeout_for(stage))
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self.record_retry()
+                time.sleep(self.retry_delay(attempt, e))
+                attempt += 1
+                continue
+            self.observe(stage, time.perf_counter() - start)
+            return result
+
+    async def acall(self, stage: str, fn: Callable[[float], Awaitable[T]]) -> T:
+        """Versão assíncrona de call; cada tentativa pode disparar um hedge"""
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged(stage, fn)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self.record_retry()
+                await asyncio.sleep(self.retry_delay(attempt, e))
+                attempt += 1
+
+    async def _timed(self, stage: str, fn: Callable[[float], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await fn(self.timeout_for(stage))
+        self.observe(stage, time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, stage: str, fn: Callable[[float], Awaitable[T]]) -> T:
+        delay = self.hedge_delay_for(stage)
+        if delay is None:
+            return await self._timed(stage, fn)
+
+        primary = asyncio.ensure_future(self._timed(stage, fn))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._count("hedges")
+                tasks.append(asyncio.ensure_future(self._timed(stage, fn)))
+
+            # A primeira resposta bem-sucedida vence; erro só se todas falharem
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "max_retries": self.max_retries,
+            "retries": self.retries,
+            "hedge": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delays": {
+                stage: self.hedge_delay_for(stage) for stage in list(self._latencies)
+            } if self.hedge else {}
+        }
@@ -0,0 +1,99 @@
+from collections import OrderedDict, defaultdict
+from typing import Dict, List
+import difflib
+import heapq
+
+from src.agent.normalization import normalize_question, tokenize
+
+
+class PatternIndex:
+    def __init__(self, rerank_limit: int = 20, candidate_limit: int = 200, max_df_ratio: float = 0.1):
+        """Índice invertido de tokens para busca de padrões na memória de aprendizado
+
+        Args:
+            rerank_limit: Quantos candidatos (por sobreposição de tokens) passam pelo
+                          cálculo de similaridade de texto, que é a etapa mais cara
+            candidate_limit: Quantos candidatos bastam para deixar de percorrer as
+                             listas de tokens muito frequentes
+            max_df_ratio: Fração dos padrões a partir da qual um token é considerado
+                          muito frequente
+        """
+        self.rerank_limit = rerank_limit
+        self.candidate_limit = candidate_limit
+        self.max_df_ratio = max_df_ratio
+        self._patterns = OrderedDict()
+        self._tokens = {}
+        self._texts = {}
+        self._postings = defaultdict(set)
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(self, pattern: Dict) -> int:
+        """Indexa um padrão e retorna seu identificador interno"""
+        pattern_id = self._next_id
+        self._next_id += 1
+
+        tokens = set(tokenize(pattern["question"]))
+        self._patterns[pattern_id] = pattern
+        self._tokens[pattern_id] = tokens
+        self._texts[pattern_id] = normalize_question(pattern["question"])
+        for token in tokens:
+            self._postings[token].add(pattern_id)
+        return pattern_id
+
+    def remove_oldest(self):
+        """Remove o padrão mais antigo do índice"""
+        if not self._patterns:
+            return
+        pattern_id, _ = self._patterns.popitem(last=False)
+        for token in self._tokens.pop(pattern_id):
+            postings = self._postings[token]
+            postings.discard(pattern_id)
+            if not postings:
+                del self._postings[token]
+        del self._texts[pattern_id]
+
+    def search(self, question: str, k: int = 3, min_similarity: float = 0.6,
+               min_overlap: float = 0.7) -> List[Dict]:
+        """Retorna os k padrões mais similares à pergunta, do mais para o menos relevante
+
+        Um padrão é considerado similar quando a similaridade de texto passa de
+        min_similarity ou a sobreposição de palavras-chave passa de min_overlap,
+        os mesmos critérios da busca linear original.
+        """
+        query_tokens = set(tokenize(question))
+        if not query_tokens:
+            return []
+
+        # Percorre primeiro os tokens mais raros, que são os mais discriminantes; tokens
+        # presentes em boa parte da memória só são usados se faltarem candidatos
+        max_df = self.max_df_ratio * len(self._patterns)
+        candidates = set()
+        for token in sorted(query_tokens, key=lambda t: len(self._postings.get(t, ()))):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            if len(candidates) >= self.candidate_limit and len(postings) > max_df:
+                break
+            candidates.update(postings)
+
+        if not candidates:
+            return []
+
+        # A sobreposição considera todos os tokens do padrão, não só os percorridos
+        shared = {pattern_id: len(query_tokens & self._tokens[pattern_id]) for pattern_id in candidates}
+
+        query_text = normalize_question(question)
+        ranked = []
+        for pattern_id, count in heapq.nlargest(self.rerank_limit, shared.items(), key=lambda item: item[1]):
+            overlap = count / len(query_tokens)
+            similarity = difflib.SequenceMatcher(None, query_text, self._texts[pattern_id]).ratio()
+            if similarity > min_similarity or overlap > min_overlap:
+                ranked.append((max(similarity, overlap), similarity, pattern_id))
+
+        # Com sobreposição total o escore satura em 1.0; a similaridade de texto desempata,
+        # para que a pergunta idêntica venha antes das que só a contêm, e depois o mais recente
+        ranked.sort(reverse=True)
+        return [self._patterns[pattern_id] for _, _, pattern_id in ranked[:k]]
@@ -0,0 +1,95 @@
+from typing import Dict, List
+import json
+import os
+import sqlite3
+import threading
+
+
+class LearningMemoryStore:
+    def __init__(self, path: str = "learning_memory.db", max_patterns: int = 1000,
+                 legacy_json_path: str = None, prune_every: int = 100):
+        """Armazenamento da memória de aprendizado em SQLite (modo WAL)
+
+        Cada padrão é uma linha inserida ao final da tabela, então gravar custa O(1)
+        independentemente do tamanho do histórico, e vários processos podem gravar
+        ao mesmo tempo sem corromper o arquivo.
+
+        Args:
+            path: Caminho do arquivo SQLite
+            max_patterns: Quantidade de padrões mais recentes mantidos
+            legacy_json_path: Arquivo learning_memory.json antigo, importado uma única vez
+                              quando o banco ainda está vazio
+            prune_every: A cada quantas inserções os padrões excedentes são removidos
+        """
+        self.path = path
+        self.max_patterns = max_patterns
+        self.prune_every = prune_every
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS patterns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)"
+            )
+
+        if legacy_json_path:
+            self._import_legacy_json(legacy_json_path)
+
+    def _import_legacy_json(self, legacy_json_path: str):
+        """Importa o learning_memory.json do formato antigo, se o banco estiver vazio"""
+        if not os.path.exists(legacy_json_path):
+            return
+        try:
+            with self._lock:
+                if self._conn.execute("SELECT 1 FROM patterns LIMIT 1").fetchone():
+                    return
+                with open(legacy_json_path, 'r', encoding='utf-8') as f:
+                    patterns = json.load(f).get("patterns", [])
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO patterns (payload) VALUES (?)",
+                        [(json.dumps(p, ensure_ascii=False),) for p in patterns[-self.max_patterns:]]
+                    )
+            print(f"Memória de aprendizado importada de {legacy_json_path}: {len(patterns)} padrões")
+        except Exception as e:
+            print(f"Erro ao importar memória de aprendizado antiga: {str(e)}")
+
+    def load(self) -> List[Dict]:
+        """Carrega os padrões mais recentes, do mais antigo para o mais novo
+
+        Lê apenas as últimas max_patterns linhas pela chave primária, então o tempo
+        de carga não cresce com o histórico acumulado.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM patterns ORDER BY id DESC LIMIT ?", (self.max_patterns,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def append(self, pattern: Dict):
+        """Grava um novo padrão ao final do histórico"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO patterns (payload) VALUES (?)",
+                    (json.dumps(pattern, ensure_ascii=False),)
+                )
+            self._inserts += 1
+            if self._inserts % self.prune_every == 0:
+                self._prune()
+
+    def _prune(self):
+        """Remove os padrões mais antigos além do limite (substitui o fatiamento [-1000:])"""
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM patterns WHERE id <= (SELECT MAX(id) FROM patterns) - ?",
+                (self.max_patterns,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,262 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import re
+import threading
+
+from src.agent.normalization import strip_accents, tokenize
+from src.config.business_context import BusinessContext
+
+# Palavras após "por" que indicam agrupamento por uma coluna conhecida
+GROUPBY_ALIASES = {
+    "regiao": "REGION",
+    "categoria": "CATEGORY_NAME",
+    "categorias": "CATEGORY_NAME",
+    "fornecedor": "SUPPLIER_NAME",
+    "fornecedores": "SUPPLIER_NAME",
+    "armazem": "WAREHOUSE_NAME",
+    "armazens": "WAREHOUSE_NAME",
+    "produto": "PRODUCT_NAME",
+    "produtos": "PRODUCT_NAME",
+    "marca": "BRAND_NAME",
+    "loja": "STORE_ID",
+    "cliente": "CUSTOMER_ID",
+    "estado": "STATE",
+    "cidade": "CITY",
+    "pais": "COUNTRY",
+    "plano": "PLAN_NAME",
+    "status": "ORDER_STATUS",
+}
+
+# Granularidade temporal do agrupamento
+PERIOD_PATTERNS = [
+    (re.compile(r"\b(por dia|diari[oa]s?|dia a dia)\b"), "day"),
+    (re.compile(r"\b(por semana|semana(l|is)|semana a semana)\b"), "week"),
+    (re.compile(r"\b(por mes|mensa(l|is)|mes a mes)\b"), "month"),
+]
+
+# Períodos relativos: (padrão, dias); None lê a quantidade e a unidade do texto
+TIMEFRAME_PATTERNS = [
+    (re.compile(r"\bultim[oa]s (\d+) (dias?|semanas?|mes|meses)\b"), None),
+    (re.compile(r"\bultima semana\b"), 7),
+    (re.compile(r"\bultimo mes\b"), 30),
+    (re.compile(r"\bultimo trimestre\b"), 90),
+    (re.compile(r"\b(ultimo ano|ano passado)\b"), 365),
+    (re.compile(r"\bhoje\b"), 0),
+]
+
+# Palavras da forma de perguntar, que não viram filtro, agrupamento nem período
+QUESTION_WORDS = {
+    "quanto", "quantos", "quanta", "quantas", "como", "e", "esta", "sao", "tem", "total", "valor",
+    "atual", "nivel", "base", "crescendo", "cresceu", "evoluiu", "evolucao",
+    "distribuido", "distribuida", "distribuicao"
+}
+
+# Confiança máxima de uma pergunta com palavras que o classificador não explica
+UNEXPLAINED_CONFIDENCE = 0.5
+
+# Construções que o classificador local não sabe traduzir em metadados
+UNSUPPORTED_PATTERNS = [
+    re.compile(r"\b(top \d+|\d+ (maiores|menores|mais|menos)|mais vendid|menos vendid|ranking)"),
+    re.compile(r"\b(compar|versus|vs\b|entre \d{4})"),
+    re.compile(r"\b(apenas|somente|exceto|sem|onde|online)\b|\bfiltr|\bregiao (sul|norte|sudeste|nordeste|centro)"),
+    re.compile(r"\b(20\d{2})\b|['\"]"),
+]
+
+
+class ClassifierStats:
+    def __init__(self):
+        """Métricas do classificador local: taxa de uso e concordância com o LLM"""
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.llm_calls = 0
+        self.comparisons = 0
+        self.domain_agreements = 0
+        self.metrics_agreements = 0
+        self.full_agreements = 0
+
+    def record_hit(self):
+        with self._lock:
+            self.local_hits += 1
+
+    def record_llm_call(self, local_metadata: Optional[Dict], llm_metadata: Dict):
+        """Registra uma chamada ao LLM e compara com o palpite local, se houver"""
+        with self._lock:
+            self.llm_calls += 1
+            if not local_metadata or "error" in llm_metadata:
+                return
+            self.comparisons += 1
+            same_domain = (local_metadata.get("domain") or "").lower() == (llm_metadata.get("domain") or "").lower()
+            same_metrics = set(local_metadata.get("metrics") or []) == set(llm_metadata.get("metrics") or [])
+            self.domain_agreements += same_domain
+            self.metrics_agreements += same_metrics
+            self.full_agreements += same_domain and same_metrics
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = self.local_hits + self.llm_calls
+            compared = self.comparisons or 1
+            return {
+                "local_hits": self.local_hits,
+                "llm_calls": self.llm_calls,
+                "local_hit_rate": round(self.local_hits / total, 4) if total else 0.0,
+                "comparisons": self.comparisons,
+                "domain_agreement": round(self.domain_agreements / compared, 4) if self.comparisons else None,
+                "metrics_agreement": round(self.metrics_agreements / compared, 4) if self.comparisons else None,
+                "full_agreement": round(self.full_agreements / compared, 4) if self.comparisons else None
+            }
+
+
+class LocalClassifier:
+    def __init__(self, business_context: BusinessContext):
+        """Classificador sem LLM baseado nas métricas e exemplos do contexts.yaml
+
+        Para cada métrica, as palavras do display_name e as que aparecem em todos os
+        seus exemplos formam a assinatura; as que não se repetem em outras métricas
+        são as palavras fortes, que precisam aparecer na pergunta.
+        """
+        self.business_context = business_context
+        self.stats = ClassifierStats()
+        self._context_hash = None
+        self._signatures = {}
+
+    def _compile(self):
+        """Recalcula as assinaturas das métricas quando o contexts.yaml muda"""
+        catalog = self.business_context.current()
+        if self._context_hash == catalog.content_hash:
+            return
+
+        candidates = {}
+        for metric_key, definition in catalog.metrics.items():
+            display_tokens = set(tokenize(definition['display_name']))
+            display_tokens |= set(tokenize(metric_key.replace("_", " ")))
+            example_tokens = [set(tokenize(example)) for example in definition.get('examples', [])]
+            common = set.intersection(*example_tokens) if example_tokens else set()
+            candidates[metric_key] = (definition['context'].lower(), display_tokens, common)
+
+        signatures = {}
+        for metric_key, (domain, display_tokens, strong) in candidates.items():
+            others = set()
+            for other_key, (_, _, other_strong) in candidates.items():
+                if other_key != metric_key:
+                    others |= other_strong
+            strong = (strong or display_tokens) - others
+            signatures[metric_key] = (domain, display_tokens | strong, strong)
+
+        self._signatures = signatures
+        self._context_hash = catalog.content_hash
+
+    def classify(self, question: str) -> Tuple[Dict, float]:
+        """Classifica a pergunta localmente
+
+        Returns:
+            Tupla (metadados no mesmo formato do classificador LLM, confiança entre 0 e 1)
+        """
+        metadata, confidence, _ = self.explain(question)
+        return metadata, confidence
+
+    def explain(self, question: str) -> Tuple[Dict, float, List[str]]:
+        """Classifica a pergunta e lista as palavras que a classificação não explica
+
+        Cada palavra da pergunta precisa ser stopword, palavra da forma de perguntar,
+        parte da assinatura de uma métrica encontrada, de um agrupamento conhecido
+        ("por região") ou de um período reconhecido ("últimos 7 dias"). Palavras
+        restantes ("Brasil", "cancelados", "ontem") são restrições que os metadados
+        locais perderiam: cada uma reduz a confiança, que fica no máximo em
+        UNEXPLAINED_CONFIDENCE, e a pergunta segue para o LLM.
+
+        Returns:
+            Tupla (metadados, confiança entre 0 e 1, palavras não explicadas)
+        """
+        self._compile()
+        text = strip_accents(question.lower())
+        words = tokenize(question)
+        tokens = set(words)
+
+        metrics = []
+        domains = set()
+        for metric_key, (domain, signature, strong) in self._signatures.items():
+            if strong & tokens and len(signature & tokens) / len(signature) >= 0.5:
+                metrics.append(metric_key)
+                domains.add(domain)
+
+        if not metrics:
+            return {"domain": None, "metrics": [], "filters": [], "groupby": [], "timeframe": None}, 0.0, words
+
+        confidence = 1.0
+        if len(domains) > 1:
+            confidence *= 0.5
+
+        explained = set(QUESTION_WORDS)
+        for metric_key in metrics:
+            explained |= self._signatures[metric_key][1]
+
+        period = None
+        for pattern, value in PERIOD_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                period = value
+                explained |= set(tokenize(match.group(0)))
+                break
+
+        groupby = ["CREATED_AT"] if period else []
+        for word, detail in re.findall(r"\bpor (\w+)(?: de (\w+))?", text):
+            if word in GROUPBY_ALIASES:
+                if GROUPBY_ALIASES[word] not in groupby:
+                    groupby.append(GROUPBY_ALIASES[word])
+                explained.add(word)
+                # "por categoria de produto": o complemento só qualifica o agrupamento
+                if detail in GROUPBY_ALIASES:
+                    explained.add(detail)
+            elif word not in ("dia", "semana", "mes"):
+                # Agrupamento por algo que não sabemos mapear
+                confidence *= 0.6
+
+        for pattern in UNSUPPORTED_PATTERNS:
+            if pattern.search(text):
+                confidence *= 0.6
+
+        timeframe, timeframe_text = self._timeframe(text, period)
+        explained |= set(tokenize(timeframe_text))
+
+        unexplained = [word for word in words if word not in explained]
+        if unexplained:
+            confidence = min(confidence * 0.6 ** len(unexplained), UNEXPLAINED_CONFIDENCE)
+
+        metadata = {
+            "domain": sorted(domains)[0],
+            "metrics": metrics,
+            "filters": [],
+            "groupby": groupby,
+            "timeframe": timeframe,
+            "order_by": [{"column": "CREATED_AT", "direction": "asc"}] if period else []
+        }
+        return metadata, round(confidence, 4), unexplained
+
+    def warm_up(self):
+        """Compila as assinaturas das métricas antes da primeira pergunta"""
+        self._compile()
+
+    def _timeframe(self, text: str, period: Optional[str]) -> Tuple[Optional[Dict], str]:
+        """Converte expressões como 'últimos 7 dias' ou 'último mês' em um período
+
+        Returns:
+            Tupla (período ou None, trecho do texto reconhecido)
+        """
+        for pattern, days in TIMEFRAME_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                break
+        else:
+            return None, ""
+        if days is None:
+            days = int(match.group(1)) * {"dia": 1, "sem": 7, "mes": 30}[match.group(2)[:3]]
+
+        today = date.today()
+        return {
+            "column": "CREATED_AT",
+            "period": period or "day",
+            "range": f"last_{days}_days" if days else "custom",
+            # N dias contando hoje, como em metric_templates.timeframe_dates
+            "start_date": (today - timedelta(days=max(days - 1, 0))).isoformat(),
+            "end_date": today.isoformat()
+        }, match.group(0)
@@ -0,0 +1,258 @@
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+import re
+
+from src.config.business_context import BusinessContext, table_aliases
+from src.config.schema_catalog import SchemaCatalog
+
+COLUMN_PATTERN = re.compile(r"\b[A-Z][A-Z0-9_]*\b")
+
+# Operadores aceitos nos filtros dos metadados
+FILTER_OPERATORS = {"=", "!=", "<>", ">", "<", ">=", "<=", "like", "ilike", "in", "not in"}
+
+# Coluna de data do resultado por granularidade do período
+PERIOD_COLUMNS = {"day": "data", "week": "semana", "month": "mes"}
+
+NUMERIC_TYPES = ("NUMBER", "FLOAT", "INT", "DECIMAL")
+
+
+class TemplateMiss(ValueError):
+    def __init__(self, reason: str, detail: str = ""):
+        """Elemento dos metadados que os templates não cobrem; reason é um rótulo curto para as métricas"""
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def _column_name(name) -> str:
+    """Nome da coluna sem apelido de tabela nem conversão (ex: 'o.CREATED_AT::DATE' -> CREATED_AT)"""
+    column = str(name or "").split(".")[-1].split("::")[0].strip().upper()
+    if not re.fullmatch(r"[A-Z][A-Z0-9_]*", column):
+        raise TemplateMiss("column", str(name))
+    return column
+
+
+class MetricTemplateEngine:
+    def __init__(self, business_context: BusinessContext):
+        """Gera a query sem LLM para perguntas canônicas sobre as métricas do contexts.yaml
+
+        Cada métrica com table e expression no contexts.yaml vira uma CTE com as colunas
+        necessárias, os joins do catálogo, os filtros e o período, seguida do select
+        agregado no padrão exigido pelo consolidador (vírgula antes da coluna, 1=1 no
+        where, group by all). Só é usado quando todos os elementos dos metadados
+        (métricas, filtros, agrupamentos, período e ordenação) são cobertos e todos os
+        joins vão da base para o lado "um" (a chave primária da tabela ligada está nas
+        join_keys); caso contrário, render levanta TemplateMiss e a pergunta segue
+        para o LLM. Os metadados precisam descrever a pergunta inteira (classificação
+        do LLM ou local sem palavras não explicadas): o template não vê a pergunta e
+        não tem como notar uma restrição que ficou de fora deles.
+        """
+        self.business_context = business_context
+
+    def covers(self, metadata: Dict) -> bool:
+        try:
+            self.render(metadata)
+        except TemplateMiss:
+            return False
+        return True
+
+    def render(self, metadata: Dict) -> str:
+        """Query SQL para os metadados da classificação"""
+        if metadata.get("error"):
+            raise TemplateMiss("classification_error")
+        catalog = self.business_context.current()
+        definitions = self._definitions(catalog, metadata.get("metrics") or [])
+        base, context = definitions[0]["table"], definitions[0]["context"]
+
+        # Coluna -> tabela de onde ela vem, na ordem em que aparece na query
+        owners: Dict[str, str] = {}
+
+        def use(name) -> str:
+            column = _column_name(name)
+            if column not in owners:
+                owners[column] = self._owner(catalog, context, base, column)
+            return column
+
+        metric_columns = [use(col) for d in definitions for col in COLUMN_PATTERN.findall(d["expression"])]
+        metric_filter = definitions[0].get("filter")
+        for col in COLUMN_PATTERN.findall(metric_filter or ""):
+            use(col)
+
+        timeframe = metadata.get("timeframe") or None
+        if timeframe is not None and not isinstance(timeframe, dict):
+            raise TemplateMiss("timeframe")
+        period = (timeframe or {}).get("period") or "day"
+        time_column = _column_name((timeframe or {}).get("column") or "CREATED_AT")
+
+        # Dimensões: (coluna na CTE, nome no resultado); a data vem sempre primeiro
+        dimensions: List[Tuple[str, str]] = []
+        for name in metadata.get("groupby") or []:
+            column = use(name)
+            if column == time_column:
+                if period not in PERIOD_COLUMNS:
+                    raise TemplateMiss("timeframe", period)
+                dimensions.insert(0, (column, PERIOD_COLUMNS[period]))
+            elif column not in [c for c, _ in dimensions]:
+                dimensions.append((column, column))
+
+        conditions = []
+        for item in metadata.get("filters") or []:
+            if not isinstance(item, dict):
+                raise TemplateMiss("filter", str(item))
+            column = use(item.get("column"))
+            conditions.append((column, *filter_condition(catalog, owners[column], column, item)))
+
+        if timeframe is not None:
+            use(time_column)
+            start, end = timeframe_dates(timeframe)
+            conditions.append((time_column, ">=", f"'{start.isoformat()}'"))
+            conditions.append((time_column, "<", f"'{(end + timedelta(days=1)).isoformat()}'"))
+
+        outputs = {output: output for _, output in dimensions}
+        outputs.update({d["key"]: d["key"] for d in definitions})
+        if time_column in owners and any(column == time_column for column, _ in dimensions):
+            outputs[time_column] = PERIOD_COLUMNS[period]
+        order_by = []
+        for item in metadata.get("order_by") or []:
+            if not isinstance(item, dict):
+                raise TemplateMiss("order_by", str(item))
+            name = str(item.get("column") or "")
+            output = outputs.get(name) or outputs.get(_column_name(name))
+            direction = str(item.get("direction") or "asc").lower()
+            if output is None or direction not in ("asc", "desc"):
+                raise TemplateMiss("order_by", name)
+            order_by.append(f"{output} {direction}")
+
+        plan = catalog.join_plan(context, base, list(dict.fromkeys(owners.values())))
+        for join in plan:
+            # Um join para o lado "muitos" repetiria as linhas da base e inflaria as agregações
+            if not catalog.joins_to_one(join["right"], join["join_keys"]):
+                raise TemplateMiss("fan_out", join["right"])
+        aliases = table_aliases([base] + [join["right"] for join in plan])
+
+        def qualified(column: str) -> str:
+            return f"{aliases[owners[column]]}.{column}"
+
+        select = []
+        for column, output in dimensions:
+            if column == time_column:
+                expression = qualified(column) if period == "day" else f"date_trunc('{period}', {qualified(column)})"
+                select.append(f"{expression}::DATE as {output}")
+            else:
+                select.append(qualified(column))
+        dimension_columns = {column for column, _ in dimensions}
+        select.extend(qualified(column) for column in dict.fromkeys(metric_columns) if column not in dimension_columns)
+
+        cte = f"{base.split('.')[-1].lower()}_base"
+        lines = [f"with {cte} as (", "  select"]
+        lines.extend(f"    {', ' if i else ''}{item}" for i, item in enumerate(select))
+        lines.append(f"  from {base} {aliases[base]}")
+        for join in plan:
+            left, right = aliases[join["left"]], aliases[join["right"]]
+            condition = " and ".join(f"{left}.{key} = {right}.{key}" for key in join["join_keys"])
+            lines.append(f"  join {join['right']} {right} on {condition}")
+        lines.append("  where 1=1")
+        if metric_filter:
+            lines.append(f"    and {COLUMN_PATTERN.sub(lambda m: qualified(m.group(0)), metric_filter)}")
+        lines.extend(f"    and {qualified(column)} {operator} {value}" for column, operator, value in conditions)
+        lines.extend([")", "", "select"])
+
+        final = [output for _, output in dimensions]
+        final.extend(f"{d['expression']} as {d['key']}" for d in definitions)
+        lines.extend(f"  {', ' if i else ''}{item}" for i, item in enumerate(final))
+        lines.append(f"from {cte}")
+        if dimensions:
+            lines.append("group by all")
+        if order_by:
+            lines.append(f"order by {', '.join(order_by)}")
+        return "\n".join(lines)
+
+    def _definitions(self, catalog: SchemaCatalog, metrics: List[str]) -> List[Dict]:
+        """Definições das métricas pedidas; todas precisam de template e da mesma tabela base"""
+        if not metrics:
+            raise TemplateMiss("no_metrics")
+        definitions = []
+        for key in metrics:
+            definition = catalog.metric(key)
+            if not definition or not definition.get("table") or not definition.get("expression"):
+                raise TemplateMiss("metric", key)
+            definitions.append(definition)
+        first = definitions[0]
+        if first["table"] not in catalog.context_tables.get(first["context"], []):
+            raise TemplateMiss("metric", first["key"])
+        for definition in definitions[1:]:
+            same_base = (definition["table"], definition["context"]) == (first["table"], first["context"])
+            if not same_base or definition.get("filter") != first.get("filter"):
+                raise TemplateMiss("mixed_metrics", definition["key"])
+        return definitions
+
+    def _owner(self, catalog: SchemaCatalog, context: str, base: str, column: str) -> str:
+        """Tabela da coluna: a base, se tiver a coluna, ou a de menor caminho de joins até ela
+
+        Tabelas sem caminho até a base (inclusive pelas ligadas só por relacionamentos
+        com join_keys inválidas, que ficam fora do grafo) não são candidatas.
+        """
+        context_tables = catalog.context_tables.get(context, [])
+        candidates = []
+        for table in catalog.tables_with_column(column):
+            if table == base:
+                return base
+            if table not in context_tables:
+                continue
+            path = catalog.join_path(context, base, table)
+            if path is not None:
+                candidates.append((len(path), context_tables.index(table), table))
+        if not candidates:
+            raise TemplateMiss("column", column)
+        return min(candidates)[2]
+
+
+def filter_condition(catalog: SchemaCatalog, table: str, column: str, item: Dict) -> Tuple[str, str]:
+    """Operador e valor SQL de um filtro dos metadados ({"column", "operator", "value"})"""
+    operator = str(item.get("operator") or "=").strip().lower()
+    value = item.get("value")
+    if operator not in FILTER_OPERATORS or value is None:
+        raise TemplateMiss("filter", column)
+    column_type = str(catalog.columns(table).get(column, "")).upper()
+
+    if operator in ("in", "not in"):
+        if not isinstance(value, list) or not value:
+            raise TemplateMiss("filter", column)
+        return operator, "(" + ", ".join(sql_literal(v, column_type) for v in value) + ")"
+    if operator in ("like", "ilike"):
+        if not isinstance(value, str):
+            raise TemplateMiss("filter", column)
+        return "ilike", sql_literal(value if "%" in value else f"%{value}%", "TEXT")
+    return operator, sql_literal(value, column_type)
+
+
+def sql_literal(value, column_type: str) -> str:
+    """Literal SQL do valor, de acordo com o tipo da coluna"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if not isinstance(value, str):
+        raise TemplateMiss("filter", str(value))
+    if column_type == "BOOLEAN" and value.lower() in ("true", "false"):
+        return value.lower()
+    if column_type.startswith(NUMERIC_TYPES) and re.fullmatch(r"-?\d+(\.\d+)?", value.strip()):
+        return value.strip()
+    return "'" + value.replace("'", "''") + "'"
+
+
+def timeframe_dates(timeframe: Dict) -> Tuple[date, date]:
+    """Datas inicial e final (inclusive) do período; last_N_days sem datas conta a partir de hoje
+
+    last_N_days cobre N dias contando o final: last_7_days termina hoje e começa
+    há 6 dias.
+    """
+    try:
+        end = date.fromisoformat(str(timeframe["end_date"])) if timeframe.get("end_date") else date.today()
+        if timeframe.get("start_date"):
+            return date.fromisoformat(str(timeframe["start_date"])), end
+    except ValueError:
+        raise TemplateMiss("timeframe", str(timeframe))
+    match = re.fullmatch(r"last_(\d+)_days", str(timeframe.get("range") or ""))
+    if not match:
+        raise TemplateMiss("timeframe", str(timeframe.get("range")))
+    return end - timedelta(days=max(int(match.group(1)) - 1, 0)), end
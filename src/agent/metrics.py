@@ -0,0 +1,335 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import functools
+import math
+import threading
+import time
+
+from src.agent.tokens import count_tokens
+
+# Limites dos buckets (segundos) para latência de estágios e chamadas ao LLM
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Limites dos buckets para tokens de entrada e saída por chamada
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        """Contador monotônico no formato de exposição do Prometheus"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # Sem rótulos, a série existe desde o início com valor zero
+        self._values = {} if labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        """Histograma com buckets cumulativos no formato de exposição do Prometheus"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class RequestTrace:
+    def __init__(self):
+        """Tempos e tokens de cada estágio de uma única pergunta (campo timings da resposta)"""
+        self.started_at = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float, input_tokens: int = None, output_tokens: int = None):
+        entry = self.stages.setdefault(stage, {"seconds": 0.0})
+        entry["seconds"] += seconds
+        if input_tokens is not None:
+            entry["input_tokens"] = entry.get("input_tokens", 0) + input_tokens
+            entry["output_tokens"] = entry.get("output_tokens", 0) + (output_tokens or 0)
+
+    def report(self) -> Dict:
+        stages = {
+            stage: dict(entry, seconds=round(entry["seconds"], 4))
+            for stage, entry in self.stages.items()
+        }
+        return {
+            "stages": stages,
+            "input_tokens": sum(entry.get("input_tokens", 0) for entry in stages.values()),
+            "output_tokens": sum(entry.get("output_tokens", 0) for entry in stages.values()),
+            "total_seconds": round(time.perf_counter() - self.started_at, 4)
+        }
+
+
+# Trace da pergunta em andamento; cada tarefa asyncio ou thread enxerga o seu
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("sql_agent_trace", default=None)
+
+
+class PipelineMetrics:
+    def __init__(self):
+        """Métricas do pipeline do agente: latência e tokens por estágio, cache e fallback"""
+        self.stage_duration = Histogram(
+            "sql_agent_stage_duration_seconds",
+            "Duração de cada estágio do pipeline",
+            ("stage",)
+        )
+        self.llm_duration = Histogram(
+            "sql_agent_llm_call_duration_seconds",
+            "Duração de cada chamada ao LLM por estágio",
+            ("stage",)
+        )
+        self.llm_tokens = Histogram(
+            "sql_agent_llm_tokens",
+            "Tokens de entrada e saída por chamada ao LLM",
+            ("stage", "direction"),
+            buckets=TOKEN_BUCKETS
+        )
+        self.llm_tokens_total = Counter(
+            "sql_agent_llm_tokens_total",
+            "Total de tokens de entrada e saída enviados ao LLM",
+            ("stage", "direction")
+        )
+        self.llm_cached_tokens_total = Counter(
+            "sql_agent_llm_cached_input_tokens_total",
+            "Tokens de entrada servidos do cache de prefixo do provedor, quando informados",
+            ("stage",)
+        )
+        self.llm_errors = Counter(
+            "sql_agent_llm_errors_total",
+            "Chamadas ao LLM que terminaram em erro",
+            ("stage",)
+        )
+        self.request_duration = Histogram(
+            "sql_agent_request_duration_seconds",
+            "Duração total de cada pergunta ou refinamento",
+            ("operation",)
+        )
+        self.cache_requests = Counter(
+            "sql_agent_cache_requests_total",
+            "Consultas ao cache de respostas",
+            ("result",)
+        )
+        self.fallbacks = Counter(
+            "sql_agent_fallback_total",
+            "Respostas geradas pelo prompt de fallback (used_fallback)"
+        )
+        self.local_classifications = Counter(
+            "sql_agent_local_classifications_total",
+            "Perguntas classificadas sem chamar o LLM"
+        )
+        self.speculations = Counter(
+            "sql_agent_speculative_generations_total",
+            "Gerações especulativas pelo palpite local: accepted (aproveitada), "
+            "discarded (concluída e descartada) ou cancelled (interrompida)",
+            ("mode", "result")
+        )
+        self.coalesced = Counter(
+            "sql_agent_coalesced_requests_total",
+            "Perguntas que aguardaram a mesma pergunta já em andamento"
+        )
+        self.lint_queries = Counter(
+            "sql_agent_lint_queries_total",
+            "Queries analisadas pelo linter, por nível de risco (low, medium, high)",
+            ("risk",)
+        )
+        self.lint_warnings = Counter(
+            "sql_agent_lint_warnings_total",
+            "Avisos do linter de SQL por tipo (ex: missing_time_predicate, select_star)",
+            ("code",)
+        )
+        self.templates = Counter(
+            "sql_agent_template_generations_total",
+            "Queries geradas pelos templates de métricas, sem LLM (hit), ou motivo pelo "
+            "qual a pergunta seguiu para o LLM",
+            ("result",)
+        )
+        self.rewrites = Counter(
+            "sql_agent_sql_rewrites_total",
+            "Mudanças feitas pela reescrita das queries, por tipo (ex: predicate_pushdown, projection_pruned)",
+            ("change",)
+        )
+
+    @contextmanager
+    def trace(self, operation: str):
+        """Abre o trace de uma pergunta; ao sair, registra a duração total da operação"""
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # Gerador de streaming encerrado em outro contexto
+                _current_trace.set(None)
+            self.request_duration.observe(time.perf_counter() - trace.started_at, operation=operation)
+
+    def record_stage(self, stage: str, seconds: float):
+        """Registra um estágio sem chamada ao LLM (ex: busca na memória de aprendizado)"""
+        self.stage_duration.observe(seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start)
+
+    def record_llm_call(self, stage: str, seconds: float, prompt: str, output, usage: Dict = None):
+        """Registra latência e tokens de uma chamada ao LLM
+
+        Usa os tokens informados pelo provedor (usage_metadata) quando disponíveis e,
+        caso contrário, a contagem local.
+        """
+        if usage and usage.get("input_tokens") is not None:
+            input_tokens = int(usage["input_tokens"])
+            output_tokens = int(usage.get("output_tokens") or 0)
+            cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+            if cached_tokens:
+                self.llm_cached_tokens_total.inc(int(cached_tokens), stage=stage)
+        else:
+            input_tokens = count_tokens(prompt)
+            output_tokens = count_tokens(str(output))
+
+        self.stage_duration.observe(seconds, stage=stage)
+        self.llm_duration.observe(seconds, stage=stage)
+        for direction, tokens in (("input", input_tokens), ("output", output_tokens)):
+            self.llm_tokens.observe(tokens, stage=stage, direction=direction)
+            self.llm_tokens_total.inc(tokens, stage=stage, direction=direction)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds, input_tokens, output_tokens)
+
+    def record_llm_error(self, stage: str, seconds: float):
+        self.llm_errors.inc(stage=stage)
+        self.stage_duration.observe(seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+    def record_cache(self, hit: bool):
+        self.cache_requests.inc(result="hit" if hit else "miss")
+
+    def record_fallback(self):
+        self.fallbacks.inc()
+
+    def record_local_classification(self):
+        self.local_classifications.inc()
+
+    def record_speculation(self, mode: str, result: str):
+        self.speculations.inc(mode=mode, result=result)
+
+    def record_coalesced(self):
+        self.coalesced.inc()
+
+    def record_lint(self, report: Dict):
+        self.lint_queries.inc(risk=report["risk"])
+        for warning in report["warnings"]:
+            self.lint_warnings.inc(code=warning["code"])
+
+    def record_template(self, result: str):
+        self.templates.inc(result=result)
+
+    def record_rewrite(self, changes: List[Dict]):
+        for change in changes:
+            self.rewrites.inc(change=change["code"])
+
+    def render(self) -> str:
+        """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in (self.request_duration, self.stage_duration, self.llm_duration, self.llm_tokens,
+                       self.llm_tokens_total, self.llm_cached_tokens_total, self.llm_errors, self.cache_requests, self.fallbacks,
+                       self.local_classifications, self.speculations, self.coalesced, self.templates,
+                       self.lint_queries, self.lint_warnings, self.rewrites):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def traced(operation: str):
+    """Decorador dos métodos públicos do agente: abre o trace e anexa o campo timings à resposta
+
+    A pergunta também fixa a versão do contexto de negócio em uso, para que todos os
+    estágios vejam o mesmo catálogo mesmo que o contexts.yaml seja recarregado.
+    """
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                with self.metrics.trace(operation) as trace:
+                    # A recarga do contexts.yaml lê e compila o arquivo: roda fora do event loop
+                    await asyncio.to_thread(self._refresh_business_context)
+                    with self.business_context.pin(reload=False):
+                        response = await method(self, *args, **kwargs)
+                response["timings"] = trace.report()
+                return response
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.trace(operation) as trace, self.business_context.pin():
+                response = method(self, *args, **kwargs)
+            response["timings"] = trace.report()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,38 @@
+import re
+import unicodedata
+from typing import List
+
+# Palavras muito frequentes em português que não alteram o sentido da pergunta. Ficam
+# de fora as conjunções ("e", "ou": "SP e RJ" não é "SP ou RJ") e as palavras que
+# também fazem parte de nomes e siglas ("sao" em São Paulo, "esta", "se" de Sergipe),
+# pois a forma normalizada é a chave do cache e da união de perguntas em andamento
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das",
+    "em", "no", "na", "nos", "nas", "por", "para", "pra", "com", "que",
+    "qual", "quais", "me", "mostre", "mostra", "mostrar", "liste", "listar", "traga",
+    "quero", "ver", "gostaria", "saber", "ao", "aos", "pelo", "pela", "pelos",
+    "pelas", "foi", "estao", "temos", "tivemos", "nosso", "nossa",
+    "nossos", "nossas", "favor", "porfavor"
+}
+
+
+def strip_accents(text: str) -> str:
+    """Remove acentos mantendo apenas os caracteres base"""
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in normalized if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """Quebra o texto em tokens minúsculos, sem acentos, pontuação ou stopwords"""
+    text = strip_accents(text.lower())
+    words = re.findall(r"[a-z0-9_]+", text)
+    return [word for word in words if word not in STOPWORDS]
+
+
+def normalize_question(question: str) -> str:
+    """Normaliza a pergunta para uso como chave de cache
+
+    Perguntas que diferem apenas em caixa, acentos, pontuação, espaços ou stopwords
+    produzem a mesma forma normalizada.
+    """
+    return " ".join(tokenize(question))
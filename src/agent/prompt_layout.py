@@ -0,0 +1,167 @@
+from typing import Dict, List
+import copy
+import os
+import re
+import statistics
+
+from src.agent.tokens import count_tokens
+
+# Variáveis que mudam a cada pergunta; o contexto de negócio é fixo (ou, com a seleção
+# de esquema, compartilhado pelas perguntas que usam as mesmas tabelas)
+REQUEST_VARIABLES = ("input", "metadata", "expert_sql", "similar_patterns",
+                     "original_question", "previous_query", "feedback")
+
+# Estágio do pipeline -> atributo do template no agente
+STAGE_TEMPLATES = {
+    "classifier": "classifier_prompt",
+    "expert:vendas": "sales_expert_prompt",
+    "expert:produtos": "products_expert_prompt",
+    "consolidator": "consolidator_prompt",
+    "fallback": "custom_prompt",
+    "refinement": "refinement_prompt",
+    "merged": "merged_prompt",
+    "single": "single_call_prompt",
+}
+
+# Unidade de armazenamento do cache de prefixo do DeepSeek, em tokens
+CACHE_BLOCK_TOKENS = 64
+
+PLACEHOLDER_PATTERN = re.compile(r"(?<!\{)\{(\w+)\}(?!\})")
+
+SAMPLE_SQL = """with pedidos_base as (
+  select
+    o.CREATED_AT::DATE as data
+    , o.TOTAL_PRICE
+  from SCHEMA.DATABASE.ORDERS o
+  where 1=1
+    and o.REGION = 'LATAM'
+)
+
+select
+  data
+  , sum(TOTAL_PRICE) as faturamento
+from pedidos_base
+group by all"""
+
+SAMPLE_FEEDBACK = "Considere apenas os pedidos online"
+
+
+def static_after_request(template: str) -> str:
+    """Texto fixo do template que vem depois da primeira variável da pergunta
+
+    Esse texto fica fora do prefixo em cache: só rótulos curtos deveriam aparecer
+    depois das partes variáveis.
+    """
+    for match in PLACEHOLDER_PATTERN.finditer(template):
+        if match.group(1) in REQUEST_VARIABLES:
+            return PLACEHOLDER_PATTERN.sub("", template[match.start():])
+    return ""
+
+
+def sample_questions(business_context) -> List[str]:
+    """Perguntas de exemplo das métricas do contexts.yaml"""
+    questions = []
+    for context in business_context.get_all_contexts().values():
+        for info in context.get("aggregation_fields", {}).values():
+            if isinstance(info, dict):
+                questions.extend(info.get("examples", []))
+    return questions
+
+
+def render_prompts(agent, questions: List[str]) -> Dict[str, List[str]]:
+    """Monta os prompts de cada estágio para as perguntas, como o agente faria"""
+    prompts = {stage: [] for stage in STAGE_TEMPLATES}
+    for question in questions:
+        metadata, _ = agent.local_classifier.classify(question)
+        if not metadata["metrics"]:
+            metadata = dict(metadata, domain="vendas", metrics=["faturamento_total"])
+        metadata = agent._apply_default_filters(copy.deepcopy(metadata))
+        domain = "produtos" if metadata["domain"] == "produtos" else "vendas"
+        conversation = {"original_question": question, "iterations": [{"sql_query": SAMPLE_SQL}]}
+
+        prompts["classifier"].append(agent._build_classifier_prompt(question))
+        prompts[f"expert:{domain}"].append(agent._build_expert_prompt(question, metadata))
+        prompts["consolidator"].append(agent._build_consolidator_prompt(SAMPLE_SQL, metadata))
+        prompts["fallback"].append(agent._build_custom_prompt(question))
+        prompts["refinement"].append(agent._build_refinement_prompt(conversation, SAMPLE_FEEDBACK))
+        prompts["merged"].append(agent._build_merged_prompt(question, metadata))
+        prompts["single"].append(agent._build_single_call_prompt(question))
+    return prompts
+
+
+def prefix_report(agent, questions: List[str], block_size: int = CACHE_BLOCK_TOKENS) -> Dict:
+    """Prefixo compartilhado e fração de tokens que o provedor pode servir do cache, por estágio
+
+    O prefixo compartilhado é o maior início comum aos prompts das perguntas; o
+    provedor armazena prefixos em blocos de block_size tokens, então só os blocos
+    completos contam como cacheáveis.
+    """
+    first = render_prompts(agent, questions)
+    second = render_prompts(agent, questions)
+
+    report = {}
+    for stage, prompts in first.items():
+        if not prompts:
+            continue
+        shared = os.path.commonprefix(prompts) if len(prompts) > 1 else ""
+        shared_tokens = count_tokens(shared) if shared else 0
+        cacheable = shared_tokens // block_size * block_size
+        tokens = [count_tokens(prompt) for prompt in prompts]
+        template = getattr(agent, STAGE_TEMPLATES[stage]).template
+        report[stage] = {
+            "prompts": len(prompts),
+            "prompt_tokens": round(statistics.mean(tokens), 1),
+            "shared_prefix_tokens": shared_tokens,
+            "cacheable_ratio": round(statistics.mean(min(cacheable, t) / t for t in tokens), 4),
+            "static_after_request_tokens": count_tokens(static_after_request(template)),
+            "deterministic": prompts == second[stage]
+        }
+    return report
+
+
+def check_prefix_stability(report: Dict, block_size: int = CACHE_BLOCK_TOKENS) -> List[str]:
+    """Problemas que impedem o reaproveitamento do prefixo; lista vazia se estiver tudo certo"""
+    problems = []
+    for stage, entry in report.items():
+        if not entry["deterministic"]:
+            problems.append(f"{stage}: o mesmo pedido gera prompts diferentes")
+        if entry["static_after_request_tokens"] > block_size:
+            problems.append(
+                f"{stage}: {entry['static_after_request_tokens']} tokens de texto fixo depois das "
+                f"partes variáveis; mova-os para antes de {{input}}/{{metadata}}"
+            )
+    return problems
+
+
+if __name__ == "__main__":
+    # Verifica o layout dos prompts e imprime o relatório de prefixo cacheável por estágio
+    import argparse
+    import json
+    import sys
+
+    from src.agent.providers import StubProvider
+    from src.agent.query_cache import QueryCache
+    from src.agent.sql_agent import SQLQueryAgent
+
+    parser = argparse.ArgumentParser(description="Estabilidade do prefixo dos prompts para o cache do provedor")
+    parser.add_argument("--questions", help="Arquivo com uma pergunta por linha (padrão: exemplos do contexts.yaml)")
+    parser.add_argument("--block-size", type=int, default=CACHE_BLOCK_TOKENS)
+    parser.add_argument("--no-schema-pruning", action="store_true", help="Usa o contexto completo nos especialistas")
+    args = parser.parse_args()
+
+    agent = SQLQueryAgent(
+        api_key="",
+        llm=StubProvider(),
+        query_cache=QueryCache(max_entries=0),
+        schema_pruning=not args.no_schema_pruning
+    )
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = sample_questions(agent.business_context)
+
+    report = prefix_report(agent, questions, args.block_size)
+    problems = check_prefix_stability(report, args.block_size)
+    print(json.dumps({"stages": report, "problems": problems}, indent=2, ensure_ascii=False))
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,26 @@
+from string import Formatter
+from typing import List
+
+
+class PromptTemplate:
+    def __init__(self, template: str, input_variables: List[str]):
+        """Template de prompt no formato de str.format ({variavel}, chaves literais como {{ }})
+
+        Substitui o PromptTemplate do langchain, com a mesma interface usada pelo agente,
+        sem o custo de importar o langchain ao carregar o agente.
+
+        Args:
+            template: Texto do template
+            input_variables: Variáveis esperadas; devem ser exatamente as do texto
+        """
+        found = {name for _, name, _, _ in Formatter().parse(template) if name}
+        if found != set(input_variables):
+            raise ValueError(
+                f"Variáveis do template ({', '.join(sorted(found))}) diferem de "
+                f"input_variables ({', '.join(sorted(input_variables))})"
+            )
+        self.template = template
+        self.input_variables = list(input_variables)
+
+    def format(self, **kwargs) -> str:
+        return self.template.format(**kwargs)
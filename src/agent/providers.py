@@ -0,0 +1,357 @@
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from src.agent.http_client import (
+    PoolSettings, RetryPolicy, get_async_http_client, get_http_client, is_retryable
+)
+
+
+class LLMResponse:
+    """Resposta de um provedor: texto gerado e, se informado pelo provedor, o uso de tokens"""
+
+    def __init__(self, content: str, usage_metadata: Optional[Dict] = None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+
+class LLMProvider:
+    """Interface dos provedores de LLM usados pelo agente
+
+    Todos os métodos recebem o estágio do pipeline que fez a chamada (classifier,
+    expert, consolidator, ...), usado por provedores que precisam distingui-los.
+    """
+
+    name = "provider"
+
+    def invoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        raise NotImplementedError
+
+    async def ainvoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        raise NotImplementedError
+
+    async def astream(self, prompt: str, stage: str = None) -> AsyncIterator[LLMResponse]:
+        """Transmite a resposta em trechos; por padrão entrega a resposta inteira de uma vez"""
+        yield await self.ainvoke(prompt, stage=stage)
+
+    def warm_up(self):
+        """Prepara o provedor antes da primeira chamada (importações, clientes)"""
+
+    def stats(self) -> Dict:
+        return {"provider": self.name}
+
+
+class DeepSeekProvider(LLMProvider):
+    name = "deepseek"
+
+    def __init__(self, api_key: str, model: str = "deepseek-chat", temperature: float = 0,
+                 base_url: str = None, policy: RetryPolicy = None, pool: PoolSettings = None):
+        """Provedor DeepSeek via langchain-deepseek
+
+        Todas as instâncias do processo usam os mesmos clientes HTTP com keep-alive
+        (src/agent/http_client.py). Timeouts, novas tentativas e hedge seguem a
+        política informada; as novas tentativas do SDK ficam desativadas.
+
+        Args:
+            base_url: Endereço da API (padrão: o do DeepSeek); permite apontar para um
+                      servidor compatível com a API da OpenAI
+            policy: Timeouts por estágio, novas tentativas e hedge
+            pool: Limites do pool de conexões, aplicados na criação dos clientes
+
+        O langchain-deepseek só é importado na primeira chamada ou em warm_up, fora
+        da inicialização da API.
+        """
+        self.model = model
+        self.policy = policy or RetryPolicy()
+        self._options = {"model": model, "api_key": api_key, "temperature": temperature}
+        if base_url:
+            self._options["api_base"] = base_url
+        self._pool = pool
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from langchain_deepseek import ChatDeepSeek
+
+                    self._client = ChatDeepSeek(
+                        max_retries=0,
+                        http_client=get_http_client(self._pool, self.policy.default_timeout),
+                        http_async_client=get_async_http_client(self._pool, self.policy.default_timeout),
+                        **self._options
+                    )
+        return self._client
+
+    def warm_up(self):
+        self.client
+
+    @staticmethod
+    def _response(message) -> LLMResponse:
+        return LLMResponse(str(message.content), getattr(message, "usage_metadata", None))
+
+    def invoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        return self.policy.call(stage, lambda timeout: self._response(self.client.invoke(prompt, timeout=timeout)))
+
+    async def ainvoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        async def call(timeout: float) -> LLMResponse:
+            return self._response(await self.client.ainvoke(prompt, timeout=timeout))
+        return await self.policy.acall(stage, call)
+
+    async def astream(self, prompt: str, stage: str = None) -> AsyncIterator[LLMResponse]:
+        """Transmite a resposta; só há nova tentativa se a falha ocorrer antes do primeiro trecho"""
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async for chunk in self.client.astream(prompt, timeout=self.policy.timeout_for(stage)):
+                    started = True
+                    yield self._response(chunk)
+                return
+            except Exception as e:
+                if started or attempt >= self.policy.max_retries or not is_retryable(e):
+                    raise
+                self.policy.record_retry()
+                await asyncio.sleep(self.policy.retry_delay(attempt, e))
+                attempt += 1
+
+    def stats(self) -> Dict:
+        return {"provider": self.name, **self.policy.stats()}
+
+
+class StubProvider(LLMProvider):
+    name = "stub"
+
+    def __init__(self, responder: Callable[[str, Optional[str]], str] = None, delay: float = 0.0,
+                 token_delay: float = 0.0):
+        """Provedor em processo, sem rede, para desenvolvimento e testes de carga
+
+        Args:
+            responder: Função (prompt, estágio) -> texto; se não informada, responde com
+                       saídas fixas válidas para cada estágio do pipeline
+            delay: Latência simulada de cada chamada, em segundos
+            token_delay: Intervalo simulado entre os trechos transmitidos por astream
+        """
+        self.responder = responder or default_stub_response
+        self.delay = delay
+        self.token_delay = token_delay
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _delay_for(self, prompt: str, stage: str = None) -> float:
+        return self.delay
+
+    def _respond(self, prompt: str, stage: str = None) -> LLMResponse:
+        with self._lock:
+            self.calls += 1
+        return LLMResponse(self.responder(prompt, stage))
+
+    def invoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        delay = self._delay_for(prompt, stage)
+        if delay:
+            time.sleep(delay)
+        return self._respond(prompt, stage)
+
+    async def ainvoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        await asyncio.sleep(self._delay_for(prompt, stage))
+        return self._respond(prompt, stage)
+
+    async def astream(self, prompt: str, stage: str = None) -> AsyncIterator[LLMResponse]:
+        """Transmite a resposta palavra a palavra; o atraso inicial é o tempo até o primeiro trecho"""
+        await asyncio.sleep(self._delay_for(prompt, stage))
+        content = self._respond(prompt, stage).content
+        for token in re.findall(r"\S+\s*|\s+", content):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield LLMResponse(token)
+
+
+# Saídas fixas do StubProvider padrão
+STUB_CLASSIFICATION = {
+    "domain": "vendas",
+    "metrics": ["faturamento_total"],
+    "filters": [],
+    "groupby": [],
+    "timeframe": None,
+    "order_by": []
+}
+
+STUB_SQL = """select
+  o.CREATED_AT::DATE as data
+  , sum(o.TOTAL_PRICE) as faturamento
+from SCHEMA.DATABASE.ORDERS o
+where 1=1
+  and o.REGION = 'LATAM'
+group by all"""
+
+
+def default_stub_response(prompt: str, stage: str = None) -> str:
+    """Resposta fixa e válida para o estágio informado"""
+    if stage in ("merged", "single"):
+        return json.dumps({
+            "metadata": STUB_CLASSIFICATION,
+            "explanation": "Resposta do provedor stub.",
+            "sql_query": STUB_SQL
+        }, ensure_ascii=False)
+    if stage == "classifier":
+        return json.dumps(STUB_CLASSIFICATION)
+    return f"```sql\n{STUB_SQL}\n```"
+
+
+class ReplayMissError(KeyError):
+    """Prompt sem resposta gravada no modo replay estrito"""
+
+
+class RecordReplayProvider(LLMProvider):
+    name = "replay"
+
+    def __init__(self, path: str, mode: str = "replay", inner: LLMProvider = None, strict: bool = False):
+        """Grava pares prompt -> resposta em um arquivo JSONL e os reproduz de forma determinística
+
+        No modo "record", cada chamada vai ao provedor interno e é gravada. No modo
+        "replay", a resposta vem do arquivo: o mesmo prompt devolve as respostas
+        gravadas na ordem em que foram capturadas (voltando ao início ao final).
+        Prompts inéditos, comuns ao reproduzir capturas em uma versão nova, recebem
+        as respostas gravadas do mesmo estágio em sequência; com strict=True geram
+        ReplayMissError.
+
+        Args:
+            path: Arquivo JSONL com as gravações
+            mode: "record" ou "replay"
+            inner: Provedor real usado no modo "record"
+            strict: No replay, falha em vez de reaproveitar respostas do mesmo estágio
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de gravação inválido: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("O modo record precisa de um provedor interno")
+
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._by_prompt = defaultdict(list)
+        self._by_stage = defaultdict(list)
+        self._positions = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+
+        if mode == "replay":
+            self._load()
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Arquivo de gravações não encontrado: {self.path}")
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = LLMResponse(record["response"], record.get("usage"))
+                self._by_prompt[record["key"]].append(response)
+                self._by_stage[record.get("stage") or ""].append(response)
+
+    def _next(self, bucket: str, responses: List[LLMResponse]) -> LLMResponse:
+        position = self._positions[bucket]
+        self._positions[bucket] = position + 1
+        return responses[position % len(responses)]
+
+    def _replay(self, prompt: str, stage: str = None) -> LLMResponse:
+        key = self.prompt_key(prompt)
+        with self._lock:
+            if key in self._by_prompt:
+                self.hits += 1
+                return self._next(f"prompt:{key}", self._by_prompt[key])
+            self.misses += 1
+            responses = self._by_stage.get(stage or "")
+            if self.strict or not responses:
+                raise ReplayMissError(f"Nenhuma resposta gravada para o prompt do estágio {stage}")
+            return self._next(f"stage:{stage}", responses)
+
+    def _record(self, prompt: str, stage: str, response: LLMResponse):
+        record = {
+            "key": self.prompt_key(prompt),
+            "stage": stage,
+            "prompt": prompt,
+            "response": response.content,
+            "usage": response.usage_metadata,
+            "recorded_at": time.time()
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def invoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        if self.mode == "replay":
+            return self._replay(prompt, stage)
+        response = self.inner.invoke(prompt, stage=stage)
+        self._record(prompt, stage, response)
+        return response
+
+    async def ainvoke(self, prompt: str, stage: str = None) -> LLMResponse:
+        if self.mode == "replay":
+            return self._replay(prompt, stage)
+        response = await self.inner.ainvoke(prompt, stage=stage)
+        # A gravação no arquivo acontece fora do event loop
+        await asyncio.to_thread(self._record, prompt, stage, response)
+        return response
+
+    async def astream(self, prompt: str, stage: str = None) -> AsyncIterator[LLMResponse]:
+        if self.mode == "replay":
+            yield self._replay(prompt, stage)
+            return
+        chunks = []
+        async for chunk in self.inner.astream(prompt, stage=stage):
+            chunks.append(chunk.content)
+            yield chunk
+        await asyncio.to_thread(self._record, prompt, stage, LLMResponse("".join(chunks)))
+
+    def warm_up(self):
+        if self.inner is not None:
+            self.inner.warm_up()
+
+    def stats(self) -> Dict:
+        stats = {"provider": self.mode, "path": self.path, "hits": self.hits, "misses": self.misses}
+        if self.inner is not None:
+            stats["inner"] = self.inner.stats()
+        return stats
+
+
+PROVIDERS = ("deepseek", "stub", "record", "replay")
+
+
+def create_provider(name: str, api_key: str = "", model: str = "deepseek-chat", temperature: float = 0,
+                    recording_path: str = "llm_recordings.jsonl", stub_delay: float = 0.0,
+                    base_url: str = None, policy: RetryPolicy = None, pool: PoolSettings = None) -> LLMProvider:
+    """Cria o provedor configurado (LLM_PROVIDER)
+
+    Args:
+        name: "deepseek", "stub", "record" (DeepSeek gravando em recording_path) ou
+              "replay" (respostas de recording_path, sem rede)
+        base_url, policy, pool: Repassados ao DeepSeekProvider
+    """
+    if name in ("deepseek", "record"):
+        deepseek = DeepSeekProvider(api_key=api_key, model=model, temperature=temperature,
+                                    base_url=base_url, policy=policy, pool=pool)
+        if name == "deepseek":
+            return deepseek
+        return RecordReplayProvider(recording_path, mode="record", inner=deepseek)
+    if name == "stub":
+        return StubProvider(delay=stub_delay)
+    if name == "replay":
+        return RecordReplayProvider(recording_path, mode="replay")
+    raise ValueError(f"Provedor de LLM inválido: {name}. Use um de: {', '.join(PROVIDERS)}")
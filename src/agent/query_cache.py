@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from src.agent.normalization import normalize_question
+
+
+class QueryCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, disk_path: Optional[str] = None):
+        """Cache de respostas do agente com despejo LRU + TTL
+
+        Args:
+            max_entries: Número máximo de respostas mantidas em memória
+            ttl_seconds: Tempo de vida de cada resposta, em segundos
+            disk_path: Caminho opcional de um arquivo SQLite usado como segunda camada,
+                       compartilhada entre processos e preservada entre reinícios
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS query_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        """Abre uma conexão com a camada em disco, confirmando e fechando ao final"""
+        conn = sqlite3.connect(self.disk_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(question: str, context_hash: str) -> str:
+        """Gera a chave a partir da pergunta normalizada e do hash do contexto de negócio"""
+        raw = f"{normalize_question(question)}|{context_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Retorna a resposta em cache ou None, contabilizando hit/miss"""
+        value = self.get_from_memory(key)
+        return value if value is not None else self.read_from_disk(key)
+
+    def get_from_memory(self, key: str) -> Optional[Dict]:
+        """Retorna a resposta da camada de memória ou None; o miss só conta em read_from_disk"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._is_expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def read_from_disk(self, key: str) -> Optional[Dict]:
+        """Consulta a camada em disco depois de um miss na memória, contabilizando hit/miss
+
+        Sem camada em disco apenas conta o miss; com ela bloqueia, então pode rodar
+        fora do event loop.
+        """
+        value = self._get_from_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, value[0], value[1])
+            return value[1]
+
+    def _get_from_disk(self, key: str):
+        if not self.disk_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT created_at, value FROM query_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None or self._is_expired(row[0]):
+                return None
+            return row[0], json.loads(row[1])
+        except Exception as e:
+            print(f"Erro ao ler cache em disco: {str(e)}")
+            return None
+
+    def _store(self, key: str, created_at: float, value: Dict):
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Dict):
+        """Armazena uma resposta nas camadas de memória e de disco"""
+        self.write_to_disk(key, value, self.set_in_memory(key, value))
+
+    def set_in_memory(self, key: str, value: Dict) -> float:
+        """Armazena a resposta só na camada de memória; retorna o instante de criação para write_to_disk"""
+        created_at = time.time()
+        with self._lock:
+            self._store(key, created_at, value)
+        return created_at
+
+    def write_to_disk(self, key: str, value: Dict, created_at: float):
+        """Grava a resposta na camada em disco, se houver; bloqueia, então pode rodar fora do event loop"""
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO query_cache (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), created_at)
+                    )
+                    conn.execute(
+                        "DELETE FROM query_cache WHERE created_at < ?", (created_at - self.ttl_seconds,)
+                    )
+            except Exception as e:
+                print(f"Erro ao gravar cache em disco: {str(e)}")
+
+    def clear(self):
+        """Remove todas as respostas (ex: quando o contexto de negócio muda)"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM query_cache")
+            except Exception as e:
+                print(f"Erro ao limpar cache em disco: {str(e)}")
+
+    def stats(self) -> Dict:
+        """Estatísticas de uso do cache para medir a taxa de acerto"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_tier": bool(self.disk_path)
+            }
@@ -0,0 +1,173 @@
+from typing import Dict, List, Optional, Set, Tuple
+import re
+
+from src.agent.tokens import count_tokens
+from src.config.business_context import BusinessContext
+from src.config.schema_catalog import SchemaCatalog
+
+# Domínios do classificador que não têm um contexto com o mesmo nome
+DOMAIN_CONTEXTS = {
+    "usuarios": "Vendas"
+}
+
+COLUMN_PATTERN = re.compile(r"\b[A-Z][A-Z0-9_]*\b")
+
+
+class SchemaSelection:
+    def __init__(self, tables: Dict[str, Dict[str, List[str]]], prompt_text: str, full_prompt_text: str,
+                 joins: Dict[str, Dict] = None):
+        """Resultado da seleção de esquema para uma pergunta
+
+        Args:
+            tables: Dicionário contexto -> tabela -> colunas selecionadas
+            prompt_text: Contexto de negócio reduzido, enviado ao especialista
+            full_prompt_text: Contexto de negócio completo, usado para medir a economia
+            joins: Dicionário contexto -> {"anchor": tabela âncora, "plan": joins do catálogo}
+        """
+        self.tables = tables
+        self.joins = joins or {}
+        self.prompt_text = prompt_text
+        self.full_tokens = count_tokens(full_prompt_text)
+        self.pruned_tokens = count_tokens(prompt_text)
+
+    def report(self) -> Dict:
+        """Resumo da seleção e da economia de tokens para a resposta da API"""
+        return {
+            "tables": sorted({table for tables in self.tables.values() for table in tables}),
+            "joins": [
+                f"{join['left']} -> {join['right']} ({', '.join(join['join_keys'])})"
+                for entry in self.joins.values() for join in entry["plan"]
+            ],
+            "context_tokens_full": self.full_tokens,
+            "context_tokens_pruned": self.pruned_tokens,
+            "tokens_saved": self.full_tokens - self.pruned_tokens
+        }
+
+
+class SchemaSelector:
+    def __init__(self, business_context: BusinessContext):
+        """Seleciona o conjunto mínimo de tabelas e colunas para uma pergunta
+
+        Usa os metadados do classificador (domínio, métricas, filtros, agrupamentos
+        e período) e o grafo de joins do catálogo; os joins que ligam as tabelas
+        escolhidas vão prontos no prompt, no lugar da lista de relacionamentos.
+        """
+        self.business_context = business_context
+
+    def select(self, metadata: Dict) -> Optional[SchemaSelection]:
+        """Retorna a seleção para os metadados, ou None quando não é possível reduzir com segurança"""
+        catalog = self.business_context.current()
+        metrics = metadata.get("metrics") or []
+        context_names = self._resolve_contexts(catalog, metadata.get("domain") or "", metrics)
+        if not context_names:
+            return None
+
+        selection = {}
+        joins = {}
+        for name in context_names:
+            tables, anchor = self._select_tables(catalog, name, metadata, metrics)
+            if tables:
+                selection[name] = tables
+                joins[name] = {"anchor": anchor, "plan": catalog.join_plan(name, anchor, list(tables))}
+        if not selection:
+            return None
+
+        return SchemaSelection(
+            selection,
+            self.business_context.format_selection_for_prompt(selection, metrics, joins),
+            self.business_context.format_for_prompt(),
+            joins
+        )
+
+    def _resolve_contexts(self, catalog: SchemaCatalog, domain: str, metrics: List[str]) -> List[str]:
+        """Contextos do domínio classificado e dos contextos que definem as métricas pedidas"""
+        domain = DOMAIN_CONTEXTS.get(domain.lower(), domain).lower()
+        names = [name for name in catalog.contexts if name.lower() == domain]
+        for metric in metrics:
+            definition = catalog.metric(metric)
+            if definition and definition['context'] not in names:
+                names.append(definition['context'])
+        return names
+
+    def _requested_columns(self, catalog: SchemaCatalog, context_name: str, metadata: Dict, metrics: List[str]):
+        """Colunas citadas pelas métricas e pelos filtros, agrupamentos, ordenação e período"""
+        known_columns = catalog.context_columns[context_name]
+
+        metric_columns = []
+        for metric in metrics:
+            definition = catalog.metric(metric)
+            if not definition or definition['context'] != context_name:
+                continue
+            text = definition.get('description', '')
+            metric_columns.extend(col for col in COLUMN_PATTERN.findall(text) if col in known_columns)
+
+        names = [f.get("column") for f in metadata.get("filters") or [] if isinstance(f, dict)]
+        names += metadata.get("groupby") or []
+        names += [o.get("column") for o in metadata.get("order_by") or [] if isinstance(o, dict)]
+        timeframe = metadata.get("timeframe")
+        if isinstance(timeframe, dict) and timeframe.get("column"):
+            names.append(timeframe["column"])
+
+        other_columns = []
+        for name in names:
+            other_columns.extend(self._match_columns(str(name or ""), known_columns))
+        return metric_columns, other_columns
+
+    def _match_columns(self, name: str, known_columns: Set[str]) -> List[str]:
+        """Associa um nome vindo do classificador (ex: 'o.REGION', 'CATEGORY') às colunas reais"""
+        name = name.split(".")[-1].split("::")[0].strip().upper()
+        if name in known_columns:
+            return [name]
+        return sorted(col for col in known_columns if col.startswith(f"{name}_"))
+
+    def _select_tables(self, catalog: SchemaCatalog, context_name: str, metadata: Dict,
+                       metrics: List[str]) -> Tuple[Dict[str, List[str]], Optional[str]]:
+        """Tabelas -> colunas do contexto para a pergunta e a tabela âncora"""
+        tables = catalog.contexts[context_name]['tables']
+        graph = catalog.join_graphs[context_name]
+        metric_columns, other_columns = self._requested_columns(catalog, context_name, metadata, metrics)
+        if not metric_columns and not other_columns:
+            return {}, None
+
+        # A tabela âncora é a que contém mais colunas das métricas (a primeira do YAML em empates)
+        table_names = list(tables)
+        anchor = max(
+            table_names,
+            key=lambda t: (sum(col in tables[t]['columns'] for col in metric_columns or other_columns),
+                           -table_names.index(t))
+        )
+
+        chosen = {anchor: set()}
+        for col in metric_columns + other_columns:
+            if col in tables[anchor]['columns']:
+                chosen[anchor].add(col)
+                continue
+            owners = [t for t in table_names if col in tables[t]['columns']]
+            if not owners:
+                continue
+            owner = min(owners, key=lambda t: len(catalog.join_path(context_name, anchor, t) or table_names))
+            chosen.setdefault(owner, set()).add(col)
+
+        # Inclui as tabelas intermediárias necessárias para ligar as escolhidas à âncora
+        for table in list(chosen):
+            path = catalog.join_path(context_name, anchor, table) or [table]
+            for left, right in zip(path, path[1:]):
+                keys = graph[left][right]
+                chosen.setdefault(left, set()).update(keys)
+                chosen.setdefault(right, set()).update(keys)
+
+        # Relacionamentos com join_keys inválidas vão como texto: as chaves que existem entram nas colunas
+        for rel in catalog.invalid_joins.get(context_name, []):
+            if all(t in chosen for t in rel['tables']):
+                for t in rel['tables']:
+                    chosen[t].update(key for key in rel['join_keys'] if key in tables[t]['columns'])
+
+        selection = {}
+        for table in table_names:
+            if table not in chosen:
+                continue
+            columns = chosen[table]
+            if 'primary_key' in tables[table]:
+                columns.add(tables[table]['primary_key'])
+            selection[table] = [col for col in tables[table]['columns'] if col in columns]
+        return selection, anchor
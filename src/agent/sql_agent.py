@@ -1,15 +1,41 @@
-from langchain.prompts import PromptTemplate
-from langchain_deepseek import ChatDeepSeek
+from src.agent.prompt_template import PromptTemplate
 from src.config.business_context import BusinessContext
-from typing import Dict, List
+from src.agent.query_cache import QueryCache
+from src.agent.learning_index import PatternIndex
+from src.agent.learning_store import LearningMemoryStore
+from src.agent.schema_selector import SchemaSelector, SchemaSelection
+from src.agent.local_classifier import LocalClassifier
+from src.agent.metric_templates import MetricTemplateEngine, TemplateMiss, timeframe_dates
+from src.agent.sql_lint import SQLLinter
+from src.agent.sql_rewrite import SQLRewriter
+from src.agent.normalization import normalize_question
+from src.agent.metrics import PipelineMetrics, traced
+from src.agent.providers import DeepSeekProvider, LLMProvider, LLMResponse
+from src.agent.conversation_store import ConversationStore, InMemoryConversationStore
+from src.agent.coalescing import SingleFlight
+from typing import AsyncIterator, Dict, List, Optional
+from collections import deque
+import asyncio
+import copy
+import functools
 import re
+import time
 import json
-import os
+import uuid
 from datetime import datetime
-import difflib
+
+# Modos do pipeline: três chamadas (classificador, especialista, consolidador), duas
+# chamadas (classificador + especialista/consolidador unidos) ou uma única chamada
+PIPELINE_MODES = ("staged", "merged", "single")
 
 class SQLQueryAgent:
-    def __init__(self, api_key: str, model: str = "deepseek-chat", temperature: float = 0):
+    def __init__(self, api_key: str, model: str = "deepseek-chat", temperature: float = 0, llm: LLMProvider = None,
+                 query_cache: QueryCache = None, learning_memory_path: str = "learning_memory.db",
+                 schema_pruning: bool = True, local_classifier_threshold: float = 0.8,
+                 pipeline_mode: str = "staged", conversation_store: ConversationStore = None,
+                 coalesce_requests: bool = True, speculative_generation: bool = False,
+                 metric_templates: bool = True, sql_lint: bool = True,
+                 sql_rewrite: bool = True):
         """
         Inicializa o agente de consulta SQL.
         
@@ -17,18 +43,89 @@ class SQLQueryAgent:
             api_key: Chave API do provedor do modelo
             model: Nome do modelo a ser usado
             temperature: Parâmetro de aleatoriedade para geração (0-1)
+            llm: Provedor de LLM (DeepSeek, stub ou gravação/reprodução); se não informado,
+                 usa o DeepSeekProvider com api_key, model e temperature
+            query_cache: Cache de respostas por pergunta normalizada; se não informado,
+                         usa um cache em memória com os limites padrão
+            learning_memory_path: Arquivo SQLite da memória de aprendizado
+            schema_pruning: Envia aos especialistas apenas as tabelas e colunas relevantes
+                            para a pergunta; False mantém o contexto completo
+            local_classifier_threshold: Confiança mínima para usar o classificador local
+                                        sem chamar o LLM; None desativa o atalho
+            pipeline_mode: Modo padrão do pipeline ("staged", "merged" ou "single"),
+                           que pode ser substituído em cada pergunta
+            conversation_store: Armazenamento das conversas usadas no refinamento; se não
+                                informado, usa um armazenamento em memória com os limites padrão
+            coalesce_requests: Perguntas idênticas (após normalização) que chegam enquanto
+                               a primeira ainda está sendo gerada aguardam o mesmo resultado
+            speculative_generation: Nas chamadas assíncronas, inicia o especialista com o
+                                    palpite do classificador local em paralelo à
+                                    classificação do LLM (gasta chamadas descartadas
+                                    quando o palpite erra)
+            metric_templates: Nos modos "staged" e "merged", gera sem LLM a query das
+                              perguntas cujos metadados são todos cobertos pelos
+                              templates de métricas do contexts.yaml
+            sql_lint: Analisa cada query gerada ou refinada e inclui na resposta a nota
+                      de risco de custo e os avisos (campo lint)
+            sql_rewrite: Reescreve cada query gerada ou refinada para ler menos dados
+                         (filtros e período nas CTEs, intervalos de data sem conversão,
+                         colunas não usadas removidas) e lista as mudanças no campo rewrite
         """
-        self.llm = ChatDeepSeek(
-            model=model,
+        if pipeline_mode not in PIPELINE_MODES:
+            raise ValueError(f"Modo de pipeline inválido: {pipeline_mode}")
+        self.pipeline_mode = pipeline_mode
+
+        self.llm = llm or DeepSeekProvider(
             api_key=api_key,
+            model=model,
             temperature=temperature
         )
         self.business_context = BusinessContext()
-        self.conversation_history = {}
+        # Latência e tokens por estágio, expostos em /metrics e no campo timings
+        self.metrics = PipelineMetrics()
+        self.conversations = conversation_store if conversation_store is not None else InMemoryConversationStore()
         
-        # Inicializa a memória de aprendizado
-        self.learning_memory_file = "learning_memory.json"
+        # Perguntas idênticas em andamento compartilham uma única execução do pipeline
+        self.coalesce_requests = coalesce_requests
+        self.in_flight = SingleFlight()
+        self.speculative_generation = speculative_generation
+        
+        # Cache de respostas, invalidado quando o contexts.yaml muda
+        self.query_cache = query_cache or QueryCache()
+        self._context_hash = self.business_context.content_hash
+        
+        # Seleção das tabelas e colunas enviadas aos especialistas
+        self.schema_pruning = schema_pruning
+        self.schema_selector = SchemaSelector(self.business_context)
+        
+        # Classificador local, usado no lugar do LLM para perguntas de alta confiança
+        self.local_classifier_threshold = local_classifier_threshold
+        self.local_classifier = LocalClassifier(self.business_context)
+
+        # Templates de métricas, usados no lugar do especialista e do consolidador
+        self.metric_templates = MetricTemplateEngine(self.business_context) if metric_templates else None
+
+        # Análise estática das queries antes de chegarem ao banco
+        self.sql_linter = SQLLinter(self.business_context) if sql_lint else None
+
+        # Reescrita das queries para poda de partições e de colunas
+        self.sql_rewriter = SQLRewriter(self.business_context) if sql_rewrite else None
+        
+        # Inicializa a memória de aprendizado (importa o learning_memory.json antigo, se existir)
+        self.max_learning_patterns = 1000
+        self.learning_store = LearningMemoryStore(
+            learning_memory_path,
+            max_patterns=self.max_learning_patterns,
+            legacy_json_path="learning_memory.json"
+        )
         self.learning_memory = self._load_learning_memory()
+        self.pattern_index = PatternIndex()
+        for pattern in self.learning_memory["patterns"]:
+            self.pattern_index.add(pattern)
+        
+        # Os templates começam pelas partes fixas (instruções e contexto de negócio) e
+        # terminam nas partes de cada pergunta, para que o provedor sirva o início do
+        # prompt do cache de prefixo (verificado por python -m src.agent.prompt_layout)
         
         # Template para o classificador com memória de aprendizado
         self.classifier_prompt = PromptTemplate(
@@ -41,11 +138,6 @@ Sua tarefa é analisar a pergunta do usuário e identificar:
 3. Os filtros que devem ser aplicados
 4. Os agrupamentos necessários
 
-Pergunta do usuário: {input}
-
-Padrões similares encontrados na memória de aprendizado:
-{similar_patterns}
-
 Responda APENAS no formato JSON abaixo:
 ```json
 {{
@@ -67,7 +159,12 @@ Observações:
 - Inclua sempre 'país/região' como filtro padrão quando relevante
 - Use os padrões similares encontrados na memória como referência quando apropriado
 
-Apenas forneça o JSON, SEM comentários adicionais."""
+Apenas forneça o JSON, SEM comentários adicionais.
+
+Padrões similares encontrados na memória de aprendizado:
+{similar_patterns}
+
+Pergunta do usuário: {input}"""
             ,input_variables=["input", "similar_patterns"]
         )
         
@@ -76,16 +173,11 @@ Apenas forneça o JSON, SEM comentários adicionais."""
             template="""
 Você é um especialista em análise de vendas e SQL.
 
-{business_context}
-
 REGRAS IMPORTANTES:
-1. Use apenas as tabelas e colunas fornecidas no contexto acima
+1. Use apenas as tabelas e colunas fornecidas no contexto de negócios
 2. Siga os relacionamentos definidos no contexto
 3. Utilize as métricas conforme definidas no contexto
 
-Pergunta do usuário: {input}
-Metadados da classificação: {metadata}
-
 Sua tarefa é gerar uma query SQL bem estruturada que:
 1. Use CTEs para organizar a lógica
 2. Aplique os joins corretos conforme relacionamentos
@@ -113,7 +205,12 @@ from pedidos_base
 group by all
 ```
 
-Forneça apenas o código SQL, sem explicações ou comentários adicionais."""
+Forneça apenas o código SQL, sem explicações ou comentários adicionais.
+
+{business_context}
+
+Pergunta do usuário: {input}
+Metadados da classificação: {metadata}"""
             ,input_variables=["input", "metadata", "business_context"]
         )
         
@@ -121,17 +218,12 @@ Forneça apenas o código SQL, sem explicações ou comentários adicionais."""
             template="""
 Você é um especialista em análise de produtos e estoque e SQL.
 
-{business_context}
-
 REGRAS IMPORTANTES:
-1. Use apenas as tabelas e colunas fornecidas no contexto acima
+1. Use apenas as tabelas e colunas fornecidas no contexto de negócios
 2. Siga os relacionamentos definidos no contexto
 3. Considere as regras específicas de cada tipo de produto
 4. Utilize os joins corretos para produtos e inventário
 
-Pergunta do usuário: {input}
-Metadados da classificação: {metadata}
-
 Sua tarefa é gerar uma query SQL bem estruturada que:
 1. Use CTEs para organizar a lógica
 2. Aplique os joins corretos conforme relacionamentos
@@ -160,7 +252,12 @@ select
 from produtos_base
 ```
 
-Forneça apenas o código SQL, sem explicações ou comentários adicionais."""
+Forneça apenas o código SQL, sem explicações ou comentários adicionais.
+
+{business_context}
+
+Pergunta do usuário: {input}
+Metadados da classificação: {metadata}"""
             ,input_variables=["input", "metadata", "business_context"]
         )
         
@@ -169,10 +266,6 @@ Forneça apenas o código SQL, sem explicações ou comentários adicionais."""
             template="""
 Você é um especialista em SQL que constrói queries bem formatadas, organizadas e eficientes.
 
-Fragmento SQL gerado por especialista: {expert_sql}
-
-Metadados da classificação: {metadata}
-
 Sua tarefa é construir uma query SQL completa, bem formatada e organizada. Siga estas diretrizes:
 
 1. ESTRUTURA E ORGANIZAÇÃO:
@@ -202,7 +295,11 @@ Sua tarefa é construir uma query SQL completa, bem formatada e organizada. Siga
    - Descrição das CTEs (se houver)
    - Principais métricas calculadas
 
-Forneça primeiro a explicação completa e depois a query SQL, separadas por uma linha em branco."""
+Forneça primeiro a explicação completa e depois a query SQL, separadas por uma linha em branco.
+
+Metadados da classificação: {metadata}
+
+Fragmento SQL gerado por especialista: {expert_sql}"""
             ,input_variables=["expert_sql", "metadata"]
         )
         
@@ -228,8 +325,6 @@ Você é um especialista em análise de dados que entende profundamente o contex
 
 {business_context}
 
-Pergunta do usuário: {input}
-
 Siga estas instruções rigorosamente:
 
 1. ANÁLISE DO CONTEXTO:
@@ -264,7 +359,9 @@ Siga estas instruções rigorosamente:
 Primeiro, forneça uma breve explicação do que a query faz.
 Em seguida, forneça a query SQL completa e bem formatada.
 
-IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
+IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha.
+
+Pergunta do usuário: {input}"""
             ,input_variables=["business_context", "input"]
         )
         
@@ -275,16 +372,7 @@ Você é um especialista em análise de dados que entende profundamente o contex
 
 {business_context}
 
-Histórico da conversa:
-Pergunta original: {original_question}
-Query SQL gerada anteriormente:
-```sql
-{previous_query}
-```
-
-Feedback/solicitação de refinamento do usuário: {feedback}
-
-Sua tarefa é refinar a query SQL anterior com base no feedback do usuário. 
+Sua tarefa é refinar a query SQL anterior, apresentada no histórico da conversa ao final, com base no feedback do usuário.
 Mantenha o estilo e as boas práticas da query anterior, mas incorpore as melhorias solicitadas.
 
 Siga estas instruções rigorosamente:
@@ -296,57 +384,129 @@ Siga estas instruções rigorosamente:
 Primeiro, forneça uma breve explicação das mudanças realizadas.
 Em seguida, forneça a query SQL refinada completa e bem formatada.
 
-IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
+IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha.
+
+Histórico da conversa:
+Pergunta original: {original_question}
+Query SQL gerada anteriormente:
+```sql
+{previous_query}
+```
+
+Feedback/solicitação de refinamento do usuário: {feedback}"""
             ,input_variables=["business_context", "original_question", "previous_query", "feedback"]
         )
+        
+        # Template que une especialista e consolidador em uma única chamada (modo "merged")
+        self.merged_prompt = PromptTemplate(
+            template="""
+Você é um especialista em análise de dados e SQL que constrói queries bem formatadas, organizadas e eficientes.
+
+Sua tarefa é gerar diretamente a query SQL final. Siga estas diretrizes:
+
+1. ESTRUTURA E ORGANIZAÇÃO:
+   - Use apenas as tabelas e colunas fornecidas no contexto de negócios
+   - Aplique os joins corretos conforme os relacionamentos do contexto de negócios
+   - Calcule as métricas conforme as definições do contexto
+   - Use CTEs (WITH) para quebrar lógicas complexas em partes menores, cada uma com uma única responsabilidade
+
+2. FORMATAÇÃO:
+   - Escreva preferencialmente as cláusulas em letras minúsculas
+   - Coloque a vírgula antes de cada coluna em uma nova linha
+   - Para análises temporais, use CREATED_AT como primeira coluna
+   - Para agregar, utilize group by all tudo na mesma linha
+   - Sempre utilize 1=1 no where
+
+3. REGRAS DE NEGÓCIO:
+   - Sempre filtre por região/país quando relevante
+   - Para pesquisas por nome, use ilike com % ou ilike any
+   - Para case when: 'case' em linha única, 'when' em outra linha, 'end as' em outra
+
+Responda APENAS no formato JSON abaixo:
+```json
+{{
+  "explanation": "Sumário do pedido, estratégia da query, descrição das CTEs e principais métricas",
+  "sql_query": "with ... select ..."
+}}
+```
+
+{business_context}
+
+Pergunta do usuário: {input}
+Metadados da classificação: {metadata}"""
+            ,input_variables=["business_context", "input", "metadata"]
+        )
+        
+        # Template que classifica e gera a query final em uma única chamada (modo "single")
+        self.single_call_prompt = PromptTemplate(
+            template="""
+Você é um especialista em análise de dados que entende profundamente o contexto de negócios e SQL.
+
+{business_context}
+
+Sua tarefa é, em uma única resposta:
+1. Classificar a pergunta: domínio (vendas, produtos, usuarios), métricas, filtros, agrupamentos e período
+2. Gerar a query SQL final usando apenas as tabelas, colunas, relacionamentos e métricas do contexto de negócios
+
+Diretrizes para a query:
+   - Use CTEs (WITH) para quebrar lógicas complexas em partes menores
+   - Escreva preferencialmente as cláusulas em letras minúsculas
+   - Coloque a vírgula antes de cada coluna em uma nova linha
+   - Para análises temporais, use CREATED_AT como primeira coluna
+   - Para agregar, utilize group by all tudo na mesma linha
+   - Sempre utilize 1=1 no where
+   - Sempre filtre por região/país quando relevante
+
+Responda APENAS no formato JSON abaixo:
+```json
+{{
+  "metadata": {{
+    "domain": "vendas|produtos|usuarios",
+    "metrics": ["faturamento_total"],
+    "filters": [{{ "column": "column_name", "operator": "=|>|<|like", "value": "value" }}],
+    "groupby": ["column1"],
+    "timeframe": {{ "column": "CREATED_AT", "period": "day|week|month", "range": "last_7_days|last_30_days|custom", "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD" }},
+    "order_by": [{{ "column": "column_name", "direction": "asc|desc" }}]
+  }},
+  "explanation": "Sumário do pedido, estratégia da query, descrição das CTEs e principais métricas",
+  "sql_query": "with ... select ..."
+}}
+```
+
+Padrões similares encontrados na memória de aprendizado:
+{similar_patterns}
+
+Pergunta do usuário: {input}"""
+            ,input_variables=["business_context", "input", "similar_patterns"]
+        )
     
     def _load_learning_memory(self) -> Dict:
-        """Carrega a memória de aprendizado do arquivo JSON"""
+        """Carrega os padrões mais recentes da memória de aprendizado"""
+        patterns = deque(maxlen=self.max_learning_patterns)
         try:
-            if os.path.exists(self.learning_memory_file):
-                with open(self.learning_memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {"patterns": []}
+            patterns.extend(self.learning_store.load())
         except Exception as e:
             print(f"Erro ao carregar memória de aprendizado: {str(e)}")
-            return {"patterns": []}
-    
-    def _save_learning_memory(self):
-        """Salva a memória de aprendizado no arquivo JSON"""
-        try:
-            with open(self.learning_memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.learning_memory, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Erro ao salvar memória de aprendizado: {str(e)}")
+        return {"patterns": patterns}
     
     def _find_similar_patterns(self, question: str) -> List[Dict]:
-        """Encontra padrões similares na memória de aprendizado"""
-        similar_patterns = []
-        
-        # Extrai palavras-chave da pergunta
-        keywords = set(word.lower() for word in question.split())
-        
-        for pattern in self.learning_memory["patterns"]:
-            pattern_keywords = set(word.lower() for word in pattern["question"].split())
-            # Calcula similaridade usando difflib
-            similarity = difflib.SequenceMatcher(
-                None, 
-                question.lower(), 
-                pattern["question"].lower()
-            ).ratio()
-            
-            # Verifica sobreposição de palavras-chave
-            keyword_overlap = len(keywords.intersection(pattern_keywords)) / len(keywords)
-            
-            # Se houver boa similaridade ou sobreposição de palavras-chave
-            if similarity > 0.6 or keyword_overlap > 0.7:
-                similar_patterns.append(pattern)
-        
-        # Retorna até 3 padrões mais relevantes
-        return similar_patterns[:3]
+        """Encontra os padrões mais similares na memória de aprendizado
+
+        Usa o índice invertido de tokens, de modo que apenas os padrões que
+        compartilham palavras-chave com a pergunta são avaliados.
+        """
+        # Retorna até 3 padrões mais relevantes, ordenados por similaridade
+        with self.metrics.time_stage("learning_memory_lookup"):
+            return self.pattern_index.search(question, k=3)
     
-    def _add_to_learning_memory(self, question: str, metadata: Dict, sql_query: str, success: bool = True):
-        """Adiciona um novo padrão à memória de aprendizado"""
+    def _add_to_learning_memory(self, question: str, metadata: Dict, sql_query: str, success: bool = True,
+                                writes: List = None):
+        """Adiciona um novo padrão à memória de aprendizado
+
+        Args:
+            writes: Se informada, a gravação no SQLite entra nesta lista em vez de
+                    ser feita aqui (ver _arun_writes)
+        """
         try:
             # Cria um novo padrão
             pattern = {
@@ -359,163 +519,505 @@ IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
                 "timestamp": datetime.now().isoformat()
             }
             
-            # Adiciona à memória
+            # Adiciona à memória (a deque descarta os padrões além do limite) e ao índice
             self.learning_memory["patterns"].append(pattern)
+            self.pattern_index.add(pattern)
+            while len(self.pattern_index) > self.max_learning_patterns:
+                self.pattern_index.remove_oldest()
             
-            # Mantém apenas os últimos 1000 padrões
-            if len(self.learning_memory["patterns"]) > 1000:
-                self.learning_memory["patterns"] = self.learning_memory["patterns"][-1000:]
-            
-            # Salva a memória atualizada
-            self._save_learning_memory()
+            # Grava apenas o novo padrão, sem reescrever o histórico
+            if writes is None:
+                self.learning_store.append(pattern)
+            else:
+                writes.append(functools.partial(self.learning_store.append, pattern))
             
         except Exception as e:
             print(f"Erro ao adicionar à memória de aprendizado: {str(e)}")
     
+
+    def _invoke(self, stage: str, prompt: str):
+        """Chama o LLM registrando latência e tokens do estágio"""
+        start = time.perf_counter()
+        try:
+            result = self.llm.invoke(prompt, stage=stage)
+        except Exception:
+            self.metrics.record_llm_error(stage, time.perf_counter() - start)
+            raise
+        self.metrics.record_llm_call(stage, time.perf_counter() - start, prompt, result.content,
+                                     getattr(result, "usage_metadata", None))
+        return result
+
+    async def _ainvoke(self, stage: str, prompt: str):
+        """Versão assíncrona de _invoke"""
+        start = time.perf_counter()
+        try:
+            result = await self.llm.ainvoke(prompt, stage=stage)
+        except Exception:
+            self.metrics.record_llm_error(stage, time.perf_counter() - start)
+            raise
+        self.metrics.record_llm_call(stage, time.perf_counter() - start, prompt, result.content,
+                                     getattr(result, "usage_metadata", None))
+        return result
+
+    def _strip_code_fences(self, text: str, language: str) -> str:
+        """Remove os marcadores de bloco de código (```json, ```sql) da resposta do modelo"""
+        if f"```{language}" in text:
+            return text.replace(f"```{language}", "").replace("```", "").strip()
+        if "```" in text:
+            return text.replace("```", "").strip()
+        return text
+
+    def _split_explanation_and_sql(self, result_text: str):
+        """Separa a explicação da query SQL em respostas de texto livre"""
+        sql_pattern = r'SELECT[\s\S]*'
+        sql_match = re.search(sql_pattern, result_text)
+
+        if sql_match:
+            sql_query = sql_match.group(0).strip()
+            explanation = result_text[:sql_match.start()].strip()
+        else:
+            parts = result_text.split('SELECT')
+            explanation = parts[0].strip()
+            sql_query = 'SELECT' + parts[1].strip() if len(parts) > 1 else result_text
+
+        return explanation, sql_query
+
+    def _format_similar_patterns(self, question: str) -> str:
+        """Formata os padrões similares da memória para os prompts"""
+        # Encontra padrões similares
+        similar_patterns = self._find_similar_patterns(question)
+
+        # Formata os padrões para o prompt
+        patterns_text = "Nenhum padrão similar encontrado."
+        if similar_patterns:
+            patterns_text = "\n".join([
+                f"- Pergunta: {p['question']}\n  Domínio: {p['domain']}\n  Métricas: {', '.join(p['metrics'])}"
+                for p in similar_patterns
+            ])
+        return patterns_text
+
+    def _build_classifier_prompt(self, question: str) -> str:
+        """Monta o prompt do classificador com os padrões similares da memória"""
+        return self.classifier_prompt.format(
+            input=question,
+            similar_patterns=self._format_similar_patterns(question)
+        )
+
+    def _parse_classification(self, result) -> Dict:
+        """Converte a resposta do classificador em metadados e aplica o filtro padrão de região"""
+        result_text = self._strip_code_fences(str(result.content), "json")
+        return self._apply_default_filters(json.loads(result_text))
+
+    def _apply_default_filters(self, metadata: Dict) -> Dict:
+        """Aplica o filtro padrão de região quando a classificação não trouxer um"""
+        # Garante filtro de região/país se necessário
+        has_region_filter = False
+        if metadata.get("filters"):
+            for filter_item in metadata["filters"]:
+                if str(filter_item.get("column") or "").split(".")[-1].upper() in ["COUNTRY", "REGION"]:
+                    has_region_filter = True
+                    break
+
+        # Aplicamos um filtro padrão de região apenas se for domínio de vendas ou produtos
+        # e não houver já um filtro de região
+        domain = metadata.get("domain", "").lower()
+        if not has_region_filter and domain in ["vendas", "produtos"]:
+            if not "filters" in metadata or not metadata["filters"]:
+                metadata["filters"] = []
+            metadata["filters"].append({
+                "column": "REGION",
+                "operator": "=",
+                "value": "LATAM"
+            })
+
+        return metadata
+
+    def _classification_fallback(self, error: Exception) -> Dict:
+        """Metadados padrão usados quando a classificação falha"""
+        print(f"Erro na classificação: {str(error)}")
+        return {
+            "domain": "vendas",
+            "metrics": [],
+            "filters": [],
+            "groupby": [],
+            "timeframe": None,
+            "error": str(error)
+        }
+
+    def _classify_locally(self, question: str):
+        """Tenta classificar a pergunta sem LLM
+
+        Os metadados locais só substituem o LLM quando explicam a pergunta inteira:
+        com qualquer palavra não explicada, eles seguem apenas como palpite, mesmo
+        que o limiar configurado seja baixo. Assim os templates de métricas só
+        recebem metadados locais completos ou metadados do LLM.
+
+        Returns:
+            Tupla (metadados locais ou None, True se a confiança atinge o limiar)
+        """
+        if self.local_classifier_threshold is None:
+            return None, False
+        try:
+            with self.metrics.time_stage("local_classifier"):
+                metadata, confidence, unexplained = self.local_classifier.explain(question)
+        except Exception as e:
+            print(f"Erro na classificação local: {str(e)}")
+            return None, False
+        if not metadata["metrics"]:
+            return None, False
+        if confidence >= self.local_classifier_threshold and not unexplained:
+            print(f"[AGENT] Classificação local (confiança {confidence}): {metadata}")
+            self.local_classifier.stats.record_hit()
+            self.metrics.record_local_classification()
+            return self._apply_default_filters(metadata), True
+        return metadata, False
+
     def classify_query(self, question: str) -> Dict:
-        """Classifica a pergunta para identificar domínio, métricas e filtros necessários"""
+        """Classifica a pergunta para identificar domínio, métricas e filtros necessários
+
+        Perguntas que o classificador local resolve com confiança acima do limiar
+        dispensam a chamada ao LLM.
+        """
+        local_metadata, confident = self._classify_locally(question)
+        if confident:
+            return local_metadata
         try:
-            # Encontra padrões similares
-            similar_patterns = self._find_similar_patterns(question)
-            
-            # Formata os padrões para o prompt
-            patterns_text = "Nenhum padrão similar encontrado."
-            if similar_patterns:
-                patterns_text = "\n".join([
-                    f"- Pergunta: {p['question']}\n  Domínio: {p['domain']}\n  Métricas: {', '.join(p['metrics'])}"
-                    for p in similar_patterns
-                ])
-            
-            # Chama o modelo para classificação
-            result = self.llm.invoke(
-                self.classifier_prompt.format(
-                    input=question,
-                    similar_patterns=patterns_text
-                )
-            )
-            
-            # Processa o resultado como antes
-            result_text = str(result.content)
-            if "```json" in result_text:
-                result_text = result_text.replace("```json", "").replace("```", "").strip()
-            elif "```" in result_text:
-                result_text = result_text.replace("```", "").strip()
-            
-            metadata = json.loads(result_text)
-            
-            # Garante filtro de região/país se necessário
-            has_region_filter = False
-            if metadata.get("filters"):
-                for filter_item in metadata["filters"]:
-                    if filter_item.get("column", "").upper() in ["COUNTRY", "REGION"]:
-                        has_region_filter = True
-                        break
-            
-            # Aplicamos um filtro padrão de região apenas se for domínio de vendas ou produtos
-            # e não houver já um filtro de região
-            domain = metadata.get("domain", "").lower()
-            if not has_region_filter and domain in ["vendas", "produtos"]:
-                if not "filters" in metadata or not metadata["filters"]:
-                    metadata["filters"] = []
-                metadata["filters"].append({
-                    "column": "REGION", 
-                    "operator": "=", 
-                    "value": "LATAM"
-                })
-            
+            result = self._invoke("classifier", self._build_classifier_prompt(question))
+            metadata = self._parse_classification(result)
+            self.local_classifier.stats.record_llm_call(local_metadata, metadata)
             return metadata
-            
         except Exception as e:
-            print(f"Erro na classificação: {str(e)}")
-            return {
-                "domain": "vendas",
-                "metrics": [],
-                "filters": [],
-                "groupby": [],
-                "timeframe": None,
-                "error": str(e)
-            }
-    
-    def generate_expert_sql(self, question: str, metadata: Dict) -> str:
-        """Gera o fragmento SQL baseado no domínio usando o especialista apropriado"""
+            return self._classification_fallback(e)
+
+    async def aclassify_query(self, question: str) -> Dict:
+        """Versão assíncrona de classify_query"""
+        local_metadata, confident = self._classify_locally(question)
+        if confident:
+            return local_metadata
+        return await self._allm_classify(question, local_metadata)
+
+    async def _allm_classify(self, question: str, local_metadata: Dict = None) -> Dict:
+        """Classificação pelo LLM, comparada com o palpite local para as estatísticas"""
         try:
-            domain = metadata.get("domain", "vendas").lower()
-            
-            # Obtém o contexto de negócio formatado
-            business_context = self.business_context.format_for_prompt()
-            
-            # Seleciona o template apropriado
-            if domain == "produtos":
-                expert_prompt = self.products_expert_prompt
-            else:  # default para vendas
-                expert_prompt = self.sales_expert_prompt
-            
-            # Invoca o LLM com o prompt do especialista
-            result = self.llm.invoke(
-                expert_prompt.format(
-                    input=question,
-                    metadata=json.dumps(metadata, ensure_ascii=False),
-                    business_context=business_context
-                )
-            )
-            
-            # Extrai o SQL da resposta
-            result_text = str(result.content)
-            
-            # Remove backticks
-            if "```sql" in result_text:
-                result_text = result_text.replace("```sql", "").replace("```", "").strip()
-            elif "```" in result_text:
-                result_text = result_text.replace("```", "").strip()
-            
-            return result_text
-            
+            result = await self._ainvoke("classifier", self._build_classifier_prompt(question))
+            metadata = self._parse_classification(result)
+            self.local_classifier.stats.record_llm_call(local_metadata, metadata)
+            return metadata
+        except Exception as e:
+            return self._classification_fallback(e)
+
+    def _local_guess(self, question: str):
+        """Metadados do classificador local, qualquer que seja a confiança, ou None"""
+        try:
+            metadata, _ = self.local_classifier.classify(question)
+        except Exception as e:
+            print(f"Erro na classificação local: {str(e)}")
+            return None
+        return metadata if metadata["metrics"] else None
+
+    @staticmethod
+    def _generation_inputs(metadata: Dict) -> str:
+        """O que decide a query gerada a partir dos metadados, em forma canônica
+
+        Compara o significado, não a forma em que o classificador escreveu: métricas
+        e contexto sem ordem nem caixa, o período pelas datas que ele resolve
+        (last_7_days ou as datas equivalentes), filtros como (coluna, operador, valor)
+        ordenados e com "in" de um só valor igual a "=", e agrupamentos e ordenação
+        sem apelido de tabela.
+        """
+        def column(name) -> str:
+            return str(name or "").split(".")[-1].split("::")[0].strip().upper()
+
+        def text(value) -> str:
+            return str(value).strip().lower()
+
+        filters = []
+        for item in metadata.get("filters") or []:
+            if not isinstance(item, dict):
+                filters.append(("", "", text(item)))
+                continue
+            operator, value = text(item.get("operator") or "="), item.get("value")
+            if operator in ("=", "in") and isinstance(value, list) and len(value) == 1:
+                operator, value = "=", value[0]
+            value = json.dumps(sorted(text(v) for v in value)) if isinstance(value, list) else text(value)
+            filters.append((column(item.get("column")), "!=" if operator == "<>" else operator, value))
+
+        timeframe = metadata.get("timeframe") or None
+        if isinstance(timeframe, dict):
+            try:
+                dates = [day.isoformat() for day in timeframe_dates(timeframe)]
+            except TemplateMiss:
+                dates = [text(timeframe.get("range"))]
+            timeframe = [column(timeframe.get("column") or "CREATED_AT"), text(timeframe.get("period") or "day")] + dates
+
+        return json.dumps({
+            "error": bool(metadata.get("error")),
+            "domain": text(metadata.get("domain") or ""),
+            "metrics": sorted(text(key) for key in metadata.get("metrics") or []),
+            "filters": sorted(filters),
+            "groupby": sorted(column(name) for name in metadata.get("groupby") or []),
+            "timeframe": timeframe,
+            "order_by": [(column(item.get("column")), text(item.get("direction") or "asc"))
+                         if isinstance(item, dict) else text(item) for item in metadata.get("order_by") or []]
+        }, ensure_ascii=False, default=str)
+
+    async def _aclassify_speculatively(self, question: str, pipeline_mode: str):
+        """Classifica a pergunta enquanto gera, em paralelo, o passo seguinte pelo palpite local
+
+        O especialista (ou a chamada "merged") começa com os metadados do classificador
+        local, mesmo abaixo do limiar de confiança, ao mesmo tempo que a classificação
+        do LLM. Se os metadados do LLM tiverem o mesmo significado que o palpite (ver
+        _generation_inputs), o resultado especulativo é aproveitado e uma ida e volta
+        ao modelo sai do caminho crítico; caso contrário, é cancelado ou descartado.
+
+        Returns:
+            Tupla (metadados, resultado especulativo ou None): o fragmento do
+            especialista no modo "staged" ou o resultado de agenerate_merged_sql
+        """
+        guess, confident = self._classify_locally(question)
+        if confident:
+            return guess, None
+        if guess is None and self.local_classifier_threshold is None:
+            # Atalho local desligado: o palpite ainda serve para especular
+            guess = self._local_guess(question)
+        if guess is None:
+            return await self._allm_classify(question), None
+
+        guess_metadata = self._apply_default_filters(copy.deepcopy(guess))
+        if self.metric_templates is not None and self.metric_templates.covers(guess_metadata):
+            # Se o LLM confirmar o palpite, o template gera a query sem outra chamada
+            return await self._allm_classify(question, guess), None
+        guess_schema = self._select_schema(guess_metadata)
+        if pipeline_mode == "merged":
+            speculative = asyncio.ensure_future(self.agenerate_merged_sql(question, guess_metadata, guess_schema))
+        else:
+            speculative = asyncio.ensure_future(self.agenerate_expert_sql(question, guess_metadata, guess_schema))
+
+        try:
+            metadata = await self._allm_classify(question, guess)
+            if self._generation_inputs(metadata) == self._generation_inputs(guess_metadata):
+                result = await speculative
+                self.metrics.record_speculation(pipeline_mode, "accepted")
+                print("[AGENT] Geração especulativa aproveitada")
+                return metadata, result
+            self.metrics.record_speculation(pipeline_mode, "discarded" if speculative.done() else "cancelled")
+            return metadata, None
+        finally:
+            if not speculative.done():
+                speculative.cancel()
+
+    async def _aclassify(self, question: str, pipeline_mode: str):
+        """Classificação dos modos "staged" e "merged", especulativa se ativada"""
+        if self.speculative_generation:
+            return await self._aclassify_speculatively(question, pipeline_mode)
+        return await self.aclassify_query(question), None
+
+    def _select_schema(self, metadata: Dict) -> SchemaSelection:
+        """Seleciona as tabelas e colunas relevantes; None mantém o contexto completo"""
+        if not self.schema_pruning:
+            return None
+        try:
+            return self.schema_selector.select(metadata)
+        except Exception as e:
+            print(f"Erro na seleção de esquema: {str(e)}")
+            return None
+
+    def _render_template(self, metadata: Dict):
+        """Query pelos templates de métricas, ou None se algum elemento não for coberto
+
+        Recebe apenas metadados do LLM ou do classificador local que explicam a
+        pergunta inteira (ver _classify_locally); o palpite local da geração
+        especulativa nunca chega aqui.
+        """
+        if self.metric_templates is None:
+            return None
+        try:
+            with self.metrics.time_stage("template"):
+                sql_query = self.metric_templates.render(metadata)
+        except TemplateMiss as e:
+            self.metrics.record_template(e.reason)
+            return None
+        except Exception as e:
+            print(f"Erro no template de métricas: {str(e)}")
+            self.metrics.record_template("error")
+            return None
+        self.metrics.record_template("hit")
+        print("[AGENT] Query gerada pelo template de métricas")
+        return {
+            "sql_query": sql_query,
+            "explanation": self._generate_explanation(sql_query, metadata),
+            "template": True
+        }
+
+    def _build_expert_prompt(self, question: str, metadata: Dict, schema: SchemaSelection = None) -> str:
+        """Seleciona o especialista pelo domínio e monta o prompt com o contexto de negócio"""
+        domain = metadata.get("domain", "vendas").lower()
+
+        # Obtém o contexto de negócio formatado, reduzido às tabelas selecionadas quando houver
+        if schema is None:
+            schema = self._select_schema(metadata)
+        business_context = schema.prompt_text if schema else self.business_context.format_for_prompt()
+
+        # Seleciona o template apropriado
+        if domain == "produtos":
+            expert_prompt = self.products_expert_prompt
+        else:  # default para vendas
+            expert_prompt = self.sales_expert_prompt
+
+        return expert_prompt.format(
+            input=question,
+            metadata=json.dumps(metadata, ensure_ascii=False),
+            business_context=business_context
+        )
+
+    def generate_expert_sql(self, question: str, metadata: Dict, schema: SchemaSelection = None) -> str:
+        """Gera o fragmento SQL baseado no domínio usando o especialista apropriado
+
+        Args:
+            question: Pergunta do usuário
+            metadata: Metadados da classificação
+            schema: Seleção de esquema já calculada; se não informada, é calculada aqui
+        """
+        try:
+            result = self._invoke("expert", self._build_expert_prompt(question, metadata, schema))
+            return self._strip_code_fences(str(result.content), "sql")
         except Exception as e:
             print(f"Erro ao gerar SQL especialista: {str(e)}")
             return "SELECT * FROM SCHEMA.DATABASE.ORDERS"
-    
+
+    async def agenerate_expert_sql(self, question: str, metadata: Dict, schema: SchemaSelection = None) -> str:
+        """Versão assíncrona de generate_expert_sql"""
+        try:
+            result = await self._ainvoke("expert", self._build_expert_prompt(question, metadata, schema))
+            return self._strip_code_fences(str(result.content), "sql")
+        except Exception as e:
+            print(f"Erro ao gerar SQL especialista: {str(e)}")
+            return "SELECT * FROM SCHEMA.DATABASE.ORDERS"
+
+    def _build_consolidator_prompt(self, expert_sql: str, metadata: Dict) -> str:
+        """Monta o prompt do consolidador"""
+        return self.consolidator_prompt.format(
+            expert_sql=expert_sql,
+            metadata=json.dumps(metadata, ensure_ascii=False)
+        )
+
+    def _parse_consolidation(self, result, expert_sql: str, metadata: Dict) -> Dict:
+        """Extrai a query consolidada e gera a explicação automática"""
+        return {
+            "sql_query": self._strip_code_fences(str(result.content), "sql"),
+            "explanation": self._generate_explanation(expert_sql, metadata)
+        }
+
+    def _consolidation_fallback(self, expert_sql: str, error: Exception) -> Dict:
+        """Usa o fragmento do especialista quando a consolidação falha"""
+        return {
+            "sql_query": expert_sql,
+            "explanation": f"Query consolidada diretamente do especialista. (Erro: {str(error)})"
+        }
+
     def consolidate_sql(self, expert_sql: str, metadata: Dict) -> Dict:
         """Consolida o fragmento SQL do especialista em uma query completa"""
         try:
-            # Invoca o LLM para consolidar a query
-            result = self.llm.invoke(
-                self.consolidator_prompt.format(
-                    expert_sql=expert_sql,
-                    metadata=json.dumps(metadata, ensure_ascii=False)
-                )
-            )
-            
-            # Extrai o SQL
-            result_text = str(result.content)
-            
-            # Remove marcadores de código
-            if "```sql" in result_text:
-                result_text = result_text.replace("```sql", "").replace("```", "").strip()
-            elif "```" in result_text:
-                result_text = result_text.replace("```", "").strip()
-            
-            # Gera explicação automática
-            explanation = self._generate_explanation(expert_sql, metadata)
-            
-            return {
-                "sql_query": result_text,
-                "explanation": explanation
-            }
-            
+            result = self._invoke("consolidator", self._build_consolidator_prompt(expert_sql, metadata))
+            return self._parse_consolidation(result, expert_sql, metadata)
         except Exception as e:
-            # Fallback para explicação de erro
-            return {
-                "sql_query": expert_sql,
-                "explanation": f"Query consolidada diretamente do especialista. (Erro: {str(e)})"
-            }
-    
+            return self._consolidation_fallback(expert_sql, e)
+
+    async def aconsolidate_sql(self, expert_sql: str, metadata: Dict) -> Dict:
+        """Versão assíncrona de consolidate_sql"""
+        try:
+            result = await self._ainvoke("consolidator", self._build_consolidator_prompt(expert_sql, metadata))
+            return self._parse_consolidation(result, expert_sql, metadata)
+        except Exception as e:
+            return self._consolidation_fallback(expert_sql, e)
+
+    def _parse_structured_output(self, result) -> Dict:
+        """Interpreta a resposta JSON dos modos "merged" e "single"
+
+        Se o modelo não respeitar o formato JSON, separa explicação e SQL do texto livre.
+        """
+        result_text = self._strip_code_fences(str(result.content), "json")
+        try:
+            output = json.loads(result_text)
+        except ValueError:
+            match = re.search(r"\{[\s\S]*\}", result_text)
+            try:
+                output = json.loads(match.group(0)) if match else None
+            except ValueError:
+                output = None
+        if not isinstance(output, dict) or not output.get("sql_query"):
+            explanation, sql_query = self._split_explanation_and_sql(result_text)
+            return {"explanation": explanation, "sql_query": sql_query}
+        output["sql_query"] = self._strip_code_fences(str(output["sql_query"]), "sql")
+        return output
+
+    def _build_merged_prompt(self, question: str, metadata: Dict, schema: SchemaSelection = None) -> str:
+        """Monta o prompt do modo "merged" (especialista e consolidador em uma chamada)"""
+        if schema is None:
+            schema = self._select_schema(metadata)
+        return self.merged_prompt.format(
+            business_context=schema.prompt_text if schema else self.business_context.format_for_prompt(),
+            input=question,
+            metadata=json.dumps(metadata, ensure_ascii=False)
+        )
+
+    def _merged_result(self, result, metadata: Dict) -> Dict:
+        output = self._parse_structured_output(result)
+        return {
+            "sql_query": output["sql_query"],
+            "explanation": output.get("explanation") or self._generate_explanation(output["sql_query"], metadata)
+        }
+
+    def generate_merged_sql(self, question: str, metadata: Dict, schema: SchemaSelection = None) -> Dict:
+        """Gera a query final e a explicação em uma única chamada a partir dos metadados"""
+        result = self._invoke("merged", self._build_merged_prompt(question, metadata, schema))
+        return self._merged_result(result, metadata)
+
+    async def agenerate_merged_sql(self, question: str, metadata: Dict, schema: SchemaSelection = None) -> Dict:
+        """Versão assíncrona de generate_merged_sql"""
+        result = await self._ainvoke("merged", self._build_merged_prompt(question, metadata, schema))
+        return self._merged_result(result, metadata)
+
+    def _build_single_call_prompt(self, question: str) -> str:
+        """Monta o prompt do modo "single" (classificação e query em uma chamada)"""
+        return self.single_call_prompt.format(
+            business_context=self.business_context.format_for_prompt(),
+            input=question,
+            similar_patterns=self._format_similar_patterns(question)
+        )
+
+    def _single_call_result(self, result):
+        output = self._parse_structured_output(result)
+        metadata = output.get("metadata")
+        if not isinstance(metadata, dict):
+            metadata = {"domain": "vendas", "metrics": [], "filters": [], "groupby": [], "timeframe": None}
+        metadata = self._apply_default_filters(metadata)
+        return metadata, {
+            "sql_query": output["sql_query"],
+            "explanation": output.get("explanation") or self._generate_explanation(output["sql_query"], metadata)
+        }
+
+    def generate_single_call(self, question: str):
+        """Classifica a pergunta e gera a query final em uma única chamada
+
+        Returns:
+            Tupla (metadados da classificação, dicionário com sql_query e explanation)
+        """
+        result = self._invoke("single", self._build_single_call_prompt(question))
+        return self._single_call_result(result)
+
+    async def agenerate_single_call(self, question: str):
+        """Versão assíncrona de generate_single_call"""
+        result = await self._ainvoke("single", self._build_single_call_prompt(question))
+        return self._single_call_result(result)
+
     def _generate_explanation(self, expert_sql: str, metadata: Dict) -> str:
         """Gera uma explicação detalhada para a query baseada nos metadados"""
         domain = metadata.get("domain", "vendas")
         metrics = metadata.get("metrics", [])
         filters = metadata.get("filters", [])
         groupby = metadata.get("groupby", [])
-        
+
         # Gera sumário do pedido
         summary = f"Análise de {domain} "
         if metrics:
@@ -525,7 +1027,7 @@ IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
             summary += f" com filtros: {', '.join(filter_desc)}"
         if groupby:
             summary += f" agrupado por {', '.join(groupby)}"
-            
+
         # Gera explicação da estratégia
         strategy = []
         if domain == "vendas":
@@ -538,7 +1040,7 @@ IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
                 strategy.append("Calculando ticket médio (faturamento / número de pedidos)")
         elif domain == "produtos":
             strategy.append("Analisando o catálogo de produtos (PRODUCTS) e inventário (INVENTORY)")
-            
+
         # Retorna explicação formatada
         return self.explanation_template.format(
             summary=summary,
@@ -546,200 +1048,692 @@ IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
             structure="Query organizada com CTEs para melhor legibilidade e manutenção" if "with" in expert_sql.lower() else "Query direta sem necessidade de CTEs",
             metrics="\n".join(f"- {m}" for m in metrics)
         )
-    
-    def query(self, question: str, conversation_id: str = None) -> Dict:
-        """Gera uma query SQL a partir de uma pergunta em linguagem natural"""
+
+    def _lint(self, sql_query: str, metadata: Dict = None) -> Dict:
+        """Nota de risco e avisos do linter para a resposta"""
+        if self.sql_linter is None:
+            return {"enabled": False}
         try:
-            if not conversation_id:
-                import uuid
-                conversation_id = str(uuid.uuid4())
-            
-            print(f"[AGENT] Classificando pergunta: {question}")
-            metadata = self.classify_query(question)
-            print(f"[AGENT] Classificação: {metadata}")
-            
-            expert_sql = self.generate_expert_sql(question, metadata)
-            print(f"[AGENT] SQL especialista: {expert_sql}")
-            
-            result = self.consolidate_sql(expert_sql, metadata)
-            sql_query = result["sql_query"]
-            explanation = result["explanation"]
-            print(f"[AGENT] SQL final: {sql_query}")
-            
-            # Adiciona à memória de aprendizado
-            self._add_to_learning_memory(question, metadata, sql_query, success=True)
-            
-            self.conversation_history[conversation_id] = {
-                "original_question": question,
-                "metadata": metadata,
-                "iterations": [
-                    {
-                        "explanation": explanation,
-                        "sql_query": sql_query
-                    }
-                ]
-            }
-            
-            return {
-                "status": "success",
+            with self.metrics.time_stage("sql_lint"):
+                report = self.sql_linter.lint(sql_query, metadata)
+        except Exception as e:
+            print(f"Erro na análise da query: {str(e)}")
+            return {"enabled": False}
+        self.metrics.record_lint(report)
+        if report["warnings"]:
+            print(f"[AGENT] Risco da query: {report['risk']} (nota {report['risk_score']}): "
+                  f"{', '.join(w['code'] for w in report['warnings'])}")
+        return dict(report, enabled=True)
+
+    def _rewrite(self, sql_query: str, metadata: Dict = None):
+        """Query reescrita e o campo rewrite da resposta; em caso de erro, a query original"""
+        if self.sql_rewriter is None:
+            return sql_query, {"enabled": False}
+        try:
+            with self.metrics.time_stage("sql_rewrite"):
+                rewritten, changes = self.sql_rewriter.rewrite(sql_query, metadata)
+        except Exception as e:
+            print(f"Erro na reescrita da query: {str(e)}")
+            return sql_query, {"enabled": False}
+        self.metrics.record_rewrite(changes)
+        if not changes:
+            return sql_query, {"enabled": True, "changes": []}
+        print(f"[AGENT] Query reescrita: {', '.join(change['code'] for change in changes)}")
+        return rewritten, {"enabled": True, "changes": changes, "original_sql_query": sql_query}
+
+    def _refresh_business_context(self):
+        """Recarrega o contexts.yaml se ele mudou e invalida o cache de respostas"""
+        self.business_context.reload_if_changed()
+        if self.business_context.content_hash != self._context_hash:
+            self._context_hash = self.business_context.content_hash
+            self.query_cache.clear()
+
+    def _lookup_cache(self, question: str, conversation_id: str):
+        """Consulta o cache de respostas antes de acionar o pipeline
+
+        Returns:
+            Tupla (chave do cache, resposta); a resposta é None em caso de miss
+        """
+        self._refresh_business_context()
+        with self.metrics.time_stage("cache_lookup"):
+            cache_key = self.query_cache.make_key(question, self._context_hash)
+            cached = self.query_cache.get(cache_key)
+        return cache_key, self._cached_response(question, conversation_id, cached)
+
+    async def _alookup_cache(self, question: str, conversation_id: str, writes: List):
+        """Versão assíncrona de _lookup_cache, com a E/S em disco fora do event loop
+
+        A leitura da camada em disco, depois de um miss na memória, roda em uma
+        thread. O contexts.yaml já foi recarregado (o que pode limpar a camada em
+        disco) também em uma thread, na entrada da pergunta (ver traced).
+
+        Args:
+            writes: Recebe a gravação da conversa (ver _set_conversation)
+        """
+        with self.metrics.time_stage("cache_lookup"):
+            cache_key = self.query_cache.make_key(question, self._context_hash)
+            cached = self.query_cache.get_from_memory(cache_key)
+            if cached is None and self.query_cache.disk_path:
+                cached = await asyncio.to_thread(self.query_cache.read_from_disk, cache_key)
+            elif cached is None:
+                cached = self.query_cache.read_from_disk(cache_key)
+        return cache_key, self._cached_response(question, conversation_id, cached, writes)
+
+    def _cached_response(self, question: str, conversation_id: str, cached: Optional[Dict],
+                         writes: List = None) -> Optional[Dict]:
+        """Resposta a partir da entrada do cache, registrando a conversa; None em caso de miss"""
+        self.metrics.record_cache(cached is not None)
+        if cached is None:
+            return None
+
+        print(f"[AGENT] Resposta encontrada no cache: {question}")
+        # Cada conversa recebe sua própria cópia, pois o refinamento altera os metadados
+        metadata = copy.deepcopy(cached["metadata"])
+        self._set_conversation(conversation_id, {
+            "original_question": question,
+            "metadata": metadata,
+            "iterations": [
+                {
+                    "explanation": cached["explanation"],
+                    "sql_query": cached["sql_query"]
+                }
+            ]
+        }, writes)
+
+        return {
+            "status": "success",
+            "sql_query": cached["sql_query"],
+            "explanation": cached["explanation"],
+            "conversation_id": conversation_id,
+            "iteration": 1,
+            "cache": "hit",
+            # A análise vale enquanto a versão do contexts.yaml não mudar (o cache é limpo junto)
+            "lint": cached.get("lint") or self._lint(cached["sql_query"], metadata),
+            "rewrite": cached.get("rewrite") or {"enabled": self.sql_rewriter is not None, "changes": []}
+        }
+
+    def _record_success(self, question: str, conversation_id: str, metadata: Dict, result: Dict,
+                        cache_key: str = None, schema: SchemaSelection = None,
+                        pipeline_mode: str = "staged", writes: List = None) -> Dict:
+        """Registra a query gerada na memória, no histórico da conversa e no cache
+
+        Args:
+            writes: Nos caminhos assíncronos, lista que recebe as gravações em disco
+                    (memória de aprendizado, camada em disco do cache e conversa),
+                    executadas depois por _arun_writes fora do event loop
+        """
+        sql_query, rewrite = self._rewrite(result["sql_query"], metadata)
+        explanation = result["explanation"]
+        print(f"[AGENT] SQL final: {sql_query}")
+        lint = self._lint(sql_query, metadata)
+
+        # Adiciona à memória de aprendizado
+        self._add_to_learning_memory(question, metadata, sql_query, success=True, writes=writes)
+
+        # Só guarda no cache respostas de uma classificação bem-sucedida
+        if cache_key and "error" not in metadata:
+            cached = {
+                "metadata": copy.deepcopy(metadata),
                 "sql_query": sql_query,
                 "explanation": explanation,
-                "conversation_id": conversation_id,
-                "iteration": 1
+                "lint": lint,
+                "rewrite": rewrite
             }
-            
-        except Exception as e:
-            print(f"[AGENT] Erro: {str(e)}")
-            # Em caso de erro, ainda tenta adicionar à memória para aprender com falhas
-            try:
-                self._add_to_learning_memory(
-                    question, 
-                    {"domain": "unknown", "metrics": []}, 
-                    "", 
-                    success=False
-                )
-            except:
-                pass
-                
-            # Continua com o fallback como antes
-            try:
-                business_context = self.business_context.format_for_prompt()
-                result = self.llm.invoke(
-                    self.custom_prompt.format(
-                        input=question,
-                        business_context=business_context
-                    )
-                )
-                
-                result_text = str(result.content)
-                sql_pattern = r'SELECT[\s\S]*'
-                sql_match = re.search(sql_pattern, result_text)
-                
-                if sql_match:
-                    sql_query = sql_match.group(0).strip()
-                    explanation = result_text[:sql_match.start()].strip()
-                else:
-                    parts = result_text.split('SELECT')
-                    explanation = parts[0].strip()
-                    sql_query = 'SELECT' + parts[1].strip() if len(parts) > 1 else result_text
-                
-                self.conversation_history[conversation_id] = {
-                    "original_question": question,
-                    "iterations": [
-                        {
-                            "explanation": explanation,
-                            "sql_query": sql_query
-                        }
-                    ],
-                    "fallback_used": True
+            if writes is None:
+                self.query_cache.set(cache_key, cached)
+            elif self.query_cache.disk_path:
+                created_at = self.query_cache.set_in_memory(cache_key, cached)
+                writes.append(functools.partial(self.query_cache.write_to_disk, cache_key, cached, created_at))
+            else:
+                self.query_cache.set_in_memory(cache_key, cached)
+
+        self._set_conversation(conversation_id, {
+            "original_question": question,
+            "metadata": metadata,
+            "iterations": [
+                {
+                    "explanation": explanation,
+                    "sql_query": sql_query
                 }
-                
-                return {
-                    "status": "success",
-                    "sql_query": sql_query,
+            ]
+        }, writes)
+
+        return {
+            "status": "success",
+            "sql_query": sql_query,
+            "explanation": explanation,
+            "conversation_id": conversation_id,
+            "iteration": 1,
+            "cache": "miss",
+            "pipeline_mode": pipeline_mode,
+            "template": result.get("template", False),
+            "lint": lint,
+            "rewrite": rewrite,
+            "schema_pruning": dict(schema.report(), enabled=True) if schema else {"enabled": False}
+        }
+
+    def _record_failure(self, question: str, error: Exception, writes: List = None):
+        """Em caso de erro, ainda tenta adicionar à memória para aprender com falhas"""
+        print(f"[AGENT] Erro: {str(error)}")
+        try:
+            self._add_to_learning_memory(
+                question,
+                {"domain": "unknown", "metrics": []},
+                "",
+                success=False,
+                writes=writes
+            )
+        except:
+            pass
+
+    @staticmethod
+    def _run_writes(writes: List):
+        """Executa as gravações em disco acumuladas, na ordem em que foram pedidas"""
+        for write in writes:
+            try:
+                write()
+            except Exception as e:
+                print(f"Erro ao gravar em disco: {str(e)}")
+
+    async def _arun_writes(self, writes: List):
+        """Executa as gravações em disco acumuladas em uma thread, sem bloquear o event loop
+
+        Espera a gravação terminar antes de devolver a resposta, como no caminho síncrono.
+        """
+        if writes:
+            await asyncio.to_thread(self._run_writes, writes)
+
+    def _set_conversation(self, conversation_id: str, conversation: Dict, writes: List = None):
+        """Grava a conversa; com writes e um armazenamento em disco, a gravação entra na lista"""
+        if writes is not None and self.conversations.blocking:
+            writes.append(functools.partial(self.conversations.set, conversation_id, conversation))
+        else:
+            self.conversations.set(conversation_id, conversation)
+
+    async def _aconversation_call(self, function, *args):
+        """Chama uma função que lê ou grava conversas, em uma thread se o armazenamento fizer E/S"""
+        if self.conversations.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def _build_custom_prompt(self, question: str) -> str:
+        """Monta o prompt único usado no fallback"""
+        return self.custom_prompt.format(
+            input=question,
+            business_context=self.business_context.format_for_prompt()
+        )
+
+    def _record_fallback(self, question: str, conversation_id: str, result, writes: List = None) -> Dict:
+        """Registra a resposta do prompt de fallback no histórico da conversa"""
+        self.metrics.record_fallback()
+        explanation, sql_query = self._split_explanation_and_sql(str(result.content))
+        sql_query, rewrite = self._rewrite(sql_query)
+
+        self._set_conversation(conversation_id, {
+            "original_question": question,
+            "iterations": [
+                {
                     "explanation": explanation,
-                    "conversation_id": conversation_id,
-                    "iteration": 1,
-                    "used_fallback": True
+                    "sql_query": sql_query
                 }
-                
+            ],
+            "fallback_used": True
+        }, writes)
+
+        return {
+            "status": "success",
+            "sql_query": sql_query,
+            "explanation": explanation,
+            "conversation_id": conversation_id,
+            "iteration": 1,
+            "used_fallback": True,
+            "cache": "miss",
+            "lint": self._lint(sql_query),
+            "rewrite": rewrite
+        }
+
+    def _coalesced_response(self, response: Dict, conversation_id: str) -> Dict:
+        """Resposta de quem aguardou a mesma pergunta já em andamento
+
+        A conversa gerada para a primeira chamada é copiada para o conversation_id
+        desta, para que cada usuário refine a sua de forma independente.
+        """
+        self.metrics.record_coalesced()
+        response = dict(response, coalesced=True)
+        response.pop("timings", None)
+        original_id = response.get("conversation_id")
+        if original_id:
+            conversation = self.conversations.get(original_id)
+            if conversation is not None:
+                conversation = copy.deepcopy(conversation)
+                conversation["iterations"] = conversation["iterations"][:1]
+                self.conversations.set(conversation_id, conversation)
+            response["conversation_id"] = conversation_id
+        return response
+
+    def _resolve_pipeline_mode(self, pipeline_mode: str = None) -> str:
+        """Retorna o modo pedido na pergunta ou o padrão do agente, validando o valor"""
+        pipeline_mode = pipeline_mode or self.pipeline_mode
+        if pipeline_mode not in PIPELINE_MODES:
+            raise ValueError(f"Modo de pipeline inválido: {pipeline_mode}. Use um de: {', '.join(PIPELINE_MODES)}")
+        return pipeline_mode
+
+    @traced("query")
+    def query(self, question: str, conversation_id: str = None, pipeline_mode: str = None) -> Dict:
+        """Gera uma query SQL a partir de uma pergunta em linguagem natural
+
+        Args:
+            question: Pergunta do usuário
+            conversation_id: ID da conversa; se não informado, uma nova conversa é criada
+            pipeline_mode: "staged", "merged" ou "single"; se não informado, usa o padrão do agente
+        """
+        try:
+            pipeline_mode = self._resolve_pipeline_mode(pipeline_mode)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+
+        if not conversation_id:
+            conversation_id = str(uuid.uuid4())
+
+        cache_key, cached = self._lookup_cache(question, conversation_id)
+        if cached:
+            return cached
+
+        if not self.coalesce_requests:
+            return self._generate(question, conversation_id, cache_key, pipeline_mode)
+        response, shared = self.in_flight.do(
+            f"{pipeline_mode}|{cache_key}",
+            lambda: self._generate(question, conversation_id, cache_key, pipeline_mode)
+        )
+        return self._coalesced_response(response, conversation_id) if shared else response
+
+    def _generate(self, question: str, conversation_id: str, cache_key: str, pipeline_mode: str) -> Dict:
+        """Executa o pipeline para uma pergunta que não estava no cache"""
+        try:
+            schema = None
+            if pipeline_mode == "single":
+                print(f"[AGENT] Gerando em chamada única: {question}")
+                metadata, result = self.generate_single_call(question)
+                print(f"[AGENT] Classificação: {metadata}")
+            else:
+                print(f"[AGENT] Classificando pergunta: {question}")
+                metadata = self.classify_query(question)
+                print(f"[AGENT] Classificação: {metadata}")
+
+                schema = self._select_schema(metadata)
+                result = self._render_template(metadata)
+                if result is None and pipeline_mode == "merged":
+                    result = self.generate_merged_sql(question, metadata, schema)
+                elif result is None:
+                    expert_sql = self.generate_expert_sql(question, metadata, schema)
+                    print(f"[AGENT] SQL especialista: {expert_sql}")
+                    result = self.consolidate_sql(expert_sql, metadata)
+
+            return self._record_success(question, conversation_id, metadata, result, cache_key, schema, pipeline_mode)
+
+        except Exception as e:
+            self._record_failure(question, e)
+
+            # Continua com o fallback como antes
+            try:
+                result = self._invoke("fallback", self._build_custom_prompt(question))
+                return self._record_fallback(question, conversation_id, result)
             except Exception as fallback_error:
                 return {"status": "error", "message": f"Erro original: {str(e)}, Erro no fallback: {str(fallback_error)}"}
-    
+
+    @traced("query")
+    async def aquery(self, question: str, conversation_id: str = None, pipeline_mode: str = None) -> Dict:
+        """Versão assíncrona de query: as chamadas ao modelo não bloqueiam o event loop"""
+        try:
+            pipeline_mode = self._resolve_pipeline_mode(pipeline_mode)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+
+        if not conversation_id:
+            conversation_id = str(uuid.uuid4())
+
+        writes = []
+        cache_key, cached = await self._alookup_cache(question, conversation_id, writes)
+        if cached:
+            await self._arun_writes(writes)
+            return cached
+
+        if not self.coalesce_requests:
+            return await self._agenerate(question, conversation_id, cache_key, pipeline_mode)
+        response, shared = await self.in_flight.ado(
+            f"{pipeline_mode}|{cache_key}",
+            lambda: self._agenerate(question, conversation_id, cache_key, pipeline_mode)
+        )
+        if shared:
+            return await self._aconversation_call(self._coalesced_response, response, conversation_id)
+        return response
+
+    async def _agenerate(self, question: str, conversation_id: str, cache_key: str, pipeline_mode: str) -> Dict:
+        """Versão assíncrona de _generate"""
+        try:
+            schema = None
+            if pipeline_mode == "single":
+                print(f"[AGENT] Gerando em chamada única: {question}")
+                metadata, result = await self.agenerate_single_call(question)
+                print(f"[AGENT] Classificação: {metadata}")
+            else:
+                print(f"[AGENT] Classificando pergunta: {question}")
+                metadata, speculated = await self._aclassify(question, pipeline_mode)
+                print(f"[AGENT] Classificação: {metadata}")
+
+                schema = self._select_schema(metadata)
+                result = self._render_template(metadata) if speculated is None else None
+                if result is None and pipeline_mode == "merged":
+                    result = speculated or await self.agenerate_merged_sql(question, metadata, schema)
+                elif result is None:
+                    expert_sql = speculated if speculated is not None else \
+                        await self.agenerate_expert_sql(question, metadata, schema)
+                    print(f"[AGENT] SQL especialista: {expert_sql}")
+                    result = await self.aconsolidate_sql(expert_sql, metadata)
+
+            writes = []
+            response = self._record_success(question, conversation_id, metadata, result, cache_key, schema,
+                                            pipeline_mode, writes)
+            await self._arun_writes(writes)
+            return response
+
+        except Exception as e:
+            writes = []
+            self._record_failure(question, e, writes)
+
+            # Continua com o fallback como antes
+            try:
+                result = await self._ainvoke("fallback", self._build_custom_prompt(question))
+                response = self._record_fallback(question, conversation_id, result, writes)
+            except Exception as fallback_error:
+                response = {"status": "error", "message": f"Erro original: {str(e)}, Erro no fallback: {str(fallback_error)}"}
+            await self._arun_writes(writes)
+            return response
+
+    async def _astream_consolidation(self, expert_sql: str, metadata: Dict) -> AsyncIterator[Dict]:
+        """Transmite a saída do consolidador token a token e termina com a query consolidada"""
+        chunks = []
+        prompt = self._build_consolidator_prompt(expert_sql, metadata)
+        start = time.perf_counter()
+        try:
+            async for chunk in self.llm.astream(prompt, stage="consolidator"):
+                text = str(chunk.content)
+                if text:
+                    chunks.append(text)
+                    yield {"event": "token", "text": text}
+            content = "".join(chunks)
+            self.metrics.record_llm_call("consolidator", time.perf_counter() - start, prompt, content)
+            result = self._parse_consolidation(LLMResponse(content), expert_sql, metadata)
+        except Exception as e:
+            self.metrics.record_llm_error("consolidator", time.perf_counter() - start)
+            result = self._consolidation_fallback(expert_sql, e)
+        yield {"event": "consolidated", "result": result}
+
+    async def astream_query(self, question: str, conversation_id: str = None,
+                            pipeline_mode: str = None) -> AsyncIterator[Dict]:
+        """Versão de aquery que emite eventos a cada estágio do pipeline
+
+        Eventos, na ordem: "classified" (metadados), "expert_sql" (fragmento do
+        especialista), "token" (trechos da saída do consolidador, apenas no modo
+        "staged") e "done" com a mesma resposta de aquery. Em caso de erro, "error".
+        """
+        with self.metrics.trace("query") as trace:
+            await asyncio.to_thread(self._refresh_business_context)
+            with self.business_context.pin(reload=False):
+                async for event in self._astream_query(question, conversation_id, pipeline_mode):
+                    if event["event"] == "done":
+                        event["result"]["timings"] = trace.report()
+                    yield event
+
+    async def _astream_query(self, question: str, conversation_id: str = None,
+                             pipeline_mode: str = None) -> AsyncIterator[Dict]:
+        try:
+            pipeline_mode = self._resolve_pipeline_mode(pipeline_mode)
+        except ValueError as e:
+            yield {"event": "error", "message": str(e)}
+            return
+
+        if not conversation_id:
+            conversation_id = str(uuid.uuid4())
+
+        writes = []
+        cache_key, cached = await self._alookup_cache(question, conversation_id, writes)
+        if cached:
+            await self._arun_writes(writes)
+            yield {"event": "done", "result": cached}
+            return
+
+        try:
+            schema = None
+            if pipeline_mode == "single":
+                metadata, result = await self.agenerate_single_call(question)
+                yield {"event": "classified", "metadata": metadata}
+            else:
+                metadata, speculated = await self._aclassify(question, pipeline_mode)
+                yield {"event": "classified", "metadata": metadata}
+
+                schema = self._select_schema(metadata)
+                result = self._render_template(metadata) if speculated is None else None
+                if result is None and pipeline_mode == "merged":
+                    result = speculated or await self.agenerate_merged_sql(question, metadata, schema)
+                elif result is None:
+                    expert_sql = speculated if speculated is not None else \
+                        await self.agenerate_expert_sql(question, metadata, schema)
+                    yield {"event": "expert_sql", "sql": expert_sql}
+                    async for event in self._astream_consolidation(expert_sql, metadata):
+                        if event["event"] == "consolidated":
+                            result = event["result"]
+                        else:
+                            yield event
+
+            writes = []
+            response = self._record_success(question, conversation_id, metadata, result, cache_key, schema,
+                                            pipeline_mode, writes)
+            await self._arun_writes(writes)
+
+        except Exception as e:
+            writes = []
+            self._record_failure(question, e, writes)
+
+            # Continua com o fallback como antes
+            try:
+                result = await self._ainvoke("fallback", self._build_custom_prompt(question))
+                response = self._record_fallback(question, conversation_id, result, writes)
+            except Exception as fallback_error:
+                await self._arun_writes(writes)
+                yield {"event": "error", "message": f"Erro original: {str(e)}, Erro no fallback: {str(fallback_error)}"}
+                return
+            await self._arun_writes(writes)
+
+        yield {"event": "done", "result": response}
+
+    def _warm_up(self):
+        """Prepara uma única vez o que todas as perguntas de um lote compartilham
+
+        Recarrega o contexts.yaml se necessário e compila o texto do contexto de
+        negócio e as assinaturas do classificador local antes de disparar o lote.
+        """
+        self._refresh_business_context()
+        self.business_context.format_for_prompt()
+        self.local_classifier.warm_up()
+
+    async def abatch_query(self, questions: List[str], pipeline_mode: str = None,
+                           concurrency: int = 4) -> AsyncIterator[Dict]:
+        """Gera as queries de uma lista de perguntas com concorrência limitada
+
+        Perguntas idênticas (após normalização) são processadas uma única vez. Os
+        resultados são emitidos na ordem em que ficam prontos, um por pergunta
+        recebida, com o índice dela na lista original.
+
+        Args:
+            questions: Perguntas do lote
+            pipeline_mode: Modo do pipeline aplicado a todas as perguntas
+            concurrency: Número máximo de perguntas processadas ao mesmo tempo
+        """
+        await asyncio.to_thread(self._warm_up)
+
+        # Agrupa os índices das perguntas equivalentes sob a primeira ocorrência
+        unique = {}
+        for index, question in enumerate(questions):
+            key = normalize_question(question) or question
+            unique.setdefault(key, (question, []))[1].append(index)
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(question: str, indexes: List[int]):
+            async with semaphore:
+                result = await self.aquery(question, pipeline_mode=pipeline_mode)
+            return question, indexes, result
+
+        tasks = [asyncio.ensure_future(run(question, indexes)) for question, indexes in unique.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                question, indexes, result = await next_done
+                for position, index in enumerate(indexes):
+                    yield {
+                        "index": index,
+                        "question": questions[index],
+                        "deduplicated": position > 0 or questions[index] != question,
+                        "result": result
+                    }
+        finally:
+            # Cliente desconectado ou erro: não deixa perguntas rodando sem destino
+            for task in tasks:
+                task.cancel()
+
+    def _get_refinable_conversation(self, conversation_id: str):
+        """Recupera a conversa e valida o limite de iterações
+
+        Returns:
+            Tupla (conversa, erro); erro é um dicionário de resposta quando não é possível refinar
+        """
+        # Verifica se a conversa existe (e não expirou)
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            return None, {"status": "error", "message": "Conversa não encontrada"}
+
+        # Limita a 3 iterações (original + 2 refinamentos)
+        if len(conversation["iterations"]) >= 3:
+            return None, {"status": "error", "message": "Limite de iterações atingido (máximo 3)"}
+
+        return conversation, None
+
+    def _build_refinement_prompt(self, conversation: Dict, feedback: str) -> str:
+        """Monta o prompt de refinamento a partir da última iteração da conversa"""
+        return self.refinement_prompt.format(
+            business_context=self.business_context.format_for_prompt(),
+            original_question=conversation["original_question"],
+            previous_query=conversation["iterations"][-1]["sql_query"],
+            feedback=feedback
+        )
+
+    def _append_iteration(self, conversation: Dict, conversation_id: str, feedback: str,
+                          explanation: str, sql_query: str, writes: List = None) -> Dict:
+        """Adiciona a iteração refinada ao histórico e monta a resposta
+
+        A reescrita não recebe os metadados da pergunta original: o pedido de ajuste
+        pode ter mudado o período ou os filtros, que não devem ser readicionados.
+        """
+        sql_query, rewrite = self._rewrite(sql_query)
+        iterations = conversation["iterations"]
+        iterations.append({
+            "feedback": feedback,
+            "explanation": explanation,
+            "sql_query": sql_query
+        })
+        self._set_conversation(conversation_id, conversation, writes)
+
+        return {
+            "status": "success",
+            "sql_query": sql_query,
+            "explanation": explanation,
+            "conversation_id": conversation_id,
+            "iteration": len(iterations),
+            "lint": self._lint(sql_query, conversation.get("metadata")),
+            "rewrite": rewrite
+        }
+
+    @traced("refine")
     def refine_query(self, feedback: str, conversation_id: str) -> Dict:
         """Refina uma query SQL com base no feedback do usuário
-        
+
         Args:
             feedback: Feedback ou pedido de refinamento do usuário
             conversation_id: ID da conversa para recuperar histórico
         """
         try:
-            # Verifica se a conversa existe
-            if conversation_id not in self.conversation_history:
-                return {"status": "error", "message": "Conversa não encontrada"}
-                
-            # Recupera informações da conversa
-            conversation = self.conversation_history[conversation_id]
-            iterations = conversation["iterations"]
-            
-            # Limita a 3 iterações (original + 2 refinamentos)
-            if len(iterations) >= 3:
-                return {"status": "error", "message": "Limite de iterações atingido (máximo 3)"}
-            
-            # Recupera a última query e a pergunta original
-            previous_iteration = iterations[-1]
-            original_question = conversation["original_question"]
-            previous_query = previous_iteration["sql_query"]
-            
+            conversation, error = self._get_refinable_conversation(conversation_id)
+            if error:
+                return error
+
             # Se já existe metadata da classificação, usa ela
             metadata = conversation.get("metadata", None)
-            
+
             # Se usou o método de agentes aninhados e tem metadata
             if metadata:
                 # Atualiza a metadata com o feedback
                 metadata["feedback"] = feedback
-                
-                # Usa a abordagem de agentes aninhados para refinamento
+
                 # Gera o SQL especialista novamente, mas considerando o feedback
-                expert_sql = self.generate_expert_sql(f"{original_question}\n\nConsiderando o feedback: {feedback}", metadata)
-                
+                expert_sql = self.generate_expert_sql(
+                    f"{conversation['original_question']}\n\nConsiderando o feedback: {feedback}", metadata
+                )
+
                 # Consolidar com base na versão anterior e no feedback
                 result = self.consolidate_sql(expert_sql, metadata)
                 sql_query = result["sql_query"]
                 explanation = f"Query refinada conforme feedback: {feedback}"
             else:
                 # Fallback para o método original
-                # Adiciona contexto de negócios ao prompt
-                business_context = self.business_context.format_for_prompt()
-                
-                # Usa o LLM para refinar a query
-                result = self.llm.invoke(
-                    self.refinement_prompt.format(
-                        business_context=business_context,
-                        original_question=original_question,
-                        previous_query=previous_query,
-                        feedback=feedback
-                    )
+                result = self._invoke("refinement", self._build_refinement_prompt(conversation, feedback))
+                explanation, sql_query = self._split_explanation_and_sql(str(result.content))
+
+            return self._append_iteration(conversation, conversation_id, feedback, explanation, sql_query)
+
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    @traced("refine")
+    async def arefine_query(self, feedback: str, conversation_id: str) -> Dict:
+        """Versão assíncrona de refine_query
+
+        Args:
+            feedback: Feedback ou pedido de refinamento do usuário
+            conversation_id: ID da conversa para recuperar histórico
+        """
+        try:
+            conversation, error = await self._aconversation_call(self._get_refinable_conversation, conversation_id)
+            if error:
+                return error
+
+            metadata = conversation.get("metadata", None)
+
+            if metadata:
+                metadata["feedback"] = feedback
+
+                expert_sql = await self.agenerate_expert_sql(
+                    f"{conversation['original_question']}\n\nConsiderando o feedback: {feedback}", metadata
                 )
-                
-                # Converte o resultado para string e divide em explicação e query
-                result_text = str(result.content)
-                
-                # Usa expressão regular para extrair a parte SQL
-                sql_pattern = r'SELECT[\s\S]*'
-                sql_match = re.search(sql_pattern, result_text)
-                
-                if sql_match:
-                    sql_query = sql_match.group(0).strip()
-                    explanation = result_text[:sql_match.start()].strip()
-                else:
-                    # Fallback para o método anterior
-                    parts = result_text.split('SELECT')
-                    explanation = parts[0].strip()
-                    sql_query = 'SELECT' + parts[1].strip() if len(parts) > 1 else result_text
-            
-            # Adiciona ao histórico de iterações
-            iterations.append({
-                "feedback": feedback,
-                "explanation": explanation,
-                "sql_query": sql_query
-            })
-            
-            return {
-                "status": "success",
-                "sql_query": sql_query,
-                "explanation": explanation,
-                "conversation_id": conversation_id,
-                "iteration": len(iterations)
-            }
-            
+
+                result = await self.aconsolidate_sql(expert_sql, metadata)
+                sql_query = result["sql_query"]
+                explanation = f"Query refinada conforme feedback: {feedback}"
+            else:
+                result = await self._ainvoke("refinement", self._build_refinement_prompt(conversation, feedback))
+                explanation, sql_query = self._split_explanation_and_sql(str(result.content))
+
+            writes = []
+            response = self._append_iteration(conversation, conversation_id, feedback, explanation, sql_query, writes)
+            await self._arun_writes(writes)
+            return response
+
         except Exception as e:
             return {"status": "error", "message": str(e)}
-    
-    def add_business_context(self, name: str, description: str, tables: Dict[str, Dict], 
+
+    def add_business_context(self, name: str, description: str, tables: Dict[str, Dict],
                            relationships: List[Dict], metrics: Dict[str, Dict]):
         """Adiciona um novo contexto de negócio
-        
+
         Args:
             name: Nome do contexto (ex: "Vendas", "Produtos")
             description: Descrição do contexto
@@ -747,4 +1741,4 @@ IMPORTANTE: A query deve começar com a palavra 'SELECT' em uma nova linha."""
             relationships: Lista de relacionamentos entre tabelas
             metrics: Dicionário com métricas suportadas
         """
-        self.business_context.add_context(name, description, tables, relationships, metrics) 
\ No newline at end of file
+        self.business_context.add_context(name, description, tables, relationships, metrics)
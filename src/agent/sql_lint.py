@@ -0,0 +1,819 @@
+from typing import Dict, List, Optional, Set, Tuple
+import re
+
+from src.config.business_context import BusinessContext
+from src.config.schema_catalog import SchemaCatalog
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<=|>=|<>|!=|\|\||[(),.;*=<>+\-/%])
+  | (?P<other>.)
+""", re.X | re.S)
+
+# Cláusulas que encerram a anterior no nível de um select
+CLAUSES = {"select", "from", "where", "group", "having", "qualify", "order", "limit", "window", "union",
+           "except", "intersect"}
+JOIN_WORDS = {"join", "left", "right", "full", "inner", "outer", "cross", "natural", "lateral"}
+
+# Palavras que não são colunas: palavras reservadas, literais e partes de data
+KEYWORDS = CLAUSES | JOIN_WORDS | {
+    "with", "as", "on", "using", "by", "all", "distinct", "and", "or", "not", "in", "is", "null", "like",
+    "ilike", "rlike", "between", "exists", "any", "some", "case", "when", "then", "else", "end", "true",
+    "false", "asc", "desc", "nulls", "first", "last", "over", "partition", "rows", "range", "unbounded",
+    "preceding", "following", "current", "row", "filter", "within", "interval", "offset", "top", "escape",
+    "current_date", "current_timestamp", "localtimestamp", "year", "quarter", "month", "week", "day",
+    "hour", "minute", "second", "epoch", "dow", "doy", "date", "time", "timestamp", "recursive", "materialized",
+}
+
+# Peso de cada aviso na nota de risco (0 a 100)
+RISK_WEIGHTS = {
+    "parse_error": 10,
+    "unknown_table": 30,
+    "unknown_column": 30,
+    "cartesian_product": 50,
+    "missing_join_keys": 35,
+    "fan_out_join": 20,
+    "missing_time_predicate": 25,
+    "non_sargable_time_predicate": 15,
+    "select_star": 20,
+    "unused_cte": 5,
+}
+RISK_LEVELS = ((50, "high"), (20, "medium"), (0, "low"))
+
+# Agregações cujo resultado muda quando as linhas se repetem (min, max e count distinct não mudam)
+AGGREGATE_FUNCTIONS = {"sum", "avg", "count", "count_if", "median", "stddev", "variance", "listagg", "array_agg"}
+
+
+class Token:
+    __slots__ = ("kind", "text", "start", "end", "depth", "word", "name", "identifier")
+
+    def __init__(self, kind: str, text: str, start: int, end: int, depth: int):
+        """Token da query com a posição no texto original e a profundidade de parênteses
+
+        word é a palavra em minúsculas (vazia se não for palavra), para comparar com as
+        palavras reservadas; name é o identificador em maiúsculas e sem aspas, como no
+        catálogo.
+        """
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+        self.depth = depth
+        self.word = text.lower() if kind == "word" else ""
+        self.name = text[1:-1].replace('""', '"').upper() if kind == "quoted" else text.upper()
+        self.identifier = kind == "quoted" or (kind == "word" and self.word not in KEYWORDS)
+
+    def is_identifier(self) -> bool:
+        return self.identifier
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.text!r})"
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Tokens da query, sem espaços e comentários, com a profundidade de parênteses de cada um"""
+    tokens = []
+    depth = 0
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        text = match.group()
+        if text == ")":
+            depth = max(0, depth - 1)
+        tokens.append(Token(kind, text, match.start(), match.end(), depth))
+        if text == "(":
+            depth += 1
+    return tokens
+
+
+def closing_paren(tokens: List[Token], index: int) -> int:
+    """Índice do parêntese que fecha o aberto em tokens[index]"""
+    depth = tokens[index].depth
+    for position in range(index + 1, len(tokens)):
+        if tokens[position].text == ")" and tokens[position].depth == depth:
+            return position
+    return len(tokens)
+
+
+def split_tokens(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    """Divide os tokens pelo separador no nível mais externo"""
+    if not tokens:
+        return []
+    depth = tokens[0].depth
+    parts, current = [], []
+    for token in tokens:
+        if token.text == separator and token.depth == depth:
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return [part for part in parts if part]
+
+
+class Source:
+    def __init__(self, name: str, alias: str, kind: str, join: str, tokens: List[Token],
+                 condition: List[Token] = None, using: List[str] = None, block: "SelectBlock" = None):
+        """Tabela, CTE ou subconsulta lida no from de um select
+
+        Args:
+            name: Nome da tabela ou CTE em maiúsculas (vazio para subconsultas)
+            alias: Apelido em maiúsculas (o próprio nome, sem o esquema, se não houver)
+            kind: "table", "cte", "subquery" ou "function"
+            join: Como a fonte entra no from: "from", "join", "left join", "cross join", "comma"...
+            tokens: Tokens da fonte (nome e apelido, ou a subconsulta inteira)
+            condition: Tokens da condição do on
+            using: Colunas do using
+            block: Select da subconsulta
+        """
+        self.name = name
+        self.alias = alias
+        self.kind = kind
+        self.join = join
+        self.tokens = tokens
+        self.condition = condition or []
+        self.using = using or []
+        self.block = block
+
+
+class SelectBlock:
+    def __init__(self, tokens: List[Token], name: str = None):
+        """Um select (corpo de CTE, query principal ou subconsulta) dividido em cláusulas
+
+        Args:
+            tokens: Tokens do select, do "select" até o fim
+            name: Nome da CTE em maiúsculas, ou None
+        """
+        self.tokens = tokens
+        self.name = name
+        self.clauses: Dict[str, List[Token]] = {}
+        # Palavra que abre cada cláusula (ex: o token "where"), para inserir texto na posição certa
+        self.keywords: Dict[str, Token] = {}
+        self.items: List[List[Token]] = []
+        self.sources: List[Source] = []
+        self.subqueries: List["SelectBlock"] = []
+        self.unions: List["SelectBlock"] = []
+        self._parse()
+
+    def _parse(self):
+        depth = self.tokens[0].depth if self.tokens else 0
+        clause = None
+        for index, token in enumerate(self.tokens):
+            word = token.word
+            if token.depth == depth and word in CLAUSES:
+                if word in ("union", "except", "intersect"):
+                    rest = self.tokens[index + 1:]
+                    while rest and rest[0].word in ("all", "distinct"):
+                        rest = rest[1:]
+                    if rest:
+                        self.unions.append(SelectBlock(rest, self.name))
+                    break
+                if word == "group" or word == "order":
+                    following = self.tokens[index + 1] if index + 1 < len(self.tokens) else None
+                    if following is None or following.word != "by":
+                        self.clauses.setdefault(clause, []).append(token)
+                        continue
+                clause = word
+                self.clauses.setdefault(clause, [])
+                self.keywords.setdefault(clause, token)
+                continue
+            if clause is not None:
+                self.clauses[clause].append(token)
+
+        select = self.clauses.get("select", [])
+        while select and select[0].word in ("distinct", "all"):
+            select = select[1:]
+        self.items = split_tokens(select)
+        self._parse_from(self.clauses.get("from", []))
+
+        # Subconsultas fora do from (ex: where x in (select ...))
+        for clause_name, clause_tokens in self.clauses.items():
+            if clause_name == "from":
+                continue
+            self.subqueries.extend(_nested_selects(clause_tokens))
+        for source in self.sources:
+            self.subqueries.extend(_nested_selects(source.condition))
+
+    def _parse_from(self, tokens: List[Token]):
+        if not tokens:
+            return
+        depth = tokens[0].depth
+        segments = []
+        join, current = "from", []
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            if token.depth == depth and (token.text == "," or token.word in JOIN_WORDS):
+                words = []
+                if token.text == ",":
+                    words, index = ["comma"], index + 1
+                else:
+                    while index < len(tokens) and tokens[index].depth == depth and tokens[index].word in JOIN_WORDS:
+                        words.append(tokens[index].word)
+                        index += 1
+                segments.append((join, current))
+                join, current = " ".join(word for word in words if word != "outer"), []
+                continue
+            current.append(token)
+            index += 1
+        segments.append((join, current))
+
+        for join, segment in segments:
+            if segment:
+                self.sources.append(self._parse_source(join, segment, depth))
+
+    def _parse_source(self, join: str, segment: List[Token], depth: int) -> Source:
+        condition, using = [], []
+        for index, token in enumerate(segment):
+            if token.depth == depth and token.word in ("on", "using"):
+                if token.word == "on":
+                    condition = segment[index + 1:]
+                else:
+                    using = [t.name for t in segment[index + 1:] if t.is_identifier()]
+                segment = segment[:index]
+                break
+
+        block, name, kind = None, "", "table"
+        if segment[0].text == "(":
+            end = closing_paren(segment, 0)
+            inner = segment[1:end]
+            block = parse_query(inner) if inner and inner[0].word in ("select", "with") else None
+            kind, rest = "subquery", segment[end + 1:]
+        else:
+            parts, index = [segment[0].name], 1
+            while index + 1 < len(segment) and segment[index].text == "." and segment[index + 1].kind in ("word", "quoted"):
+                parts.append(segment[index + 1].name)
+                index += 2
+            name, rest = ".".join(parts), segment[index:]
+            if rest and rest[0].text == "(":
+                kind, rest = "function", rest[closing_paren(rest, 0) + 1:]
+        if rest and rest[0].word == "as":
+            rest = rest[1:]
+        alias = rest[0].name if rest and rest[0].is_identifier() else name.split(".")[-1]
+        return Source(name, alias, kind, join, segment, condition, using, block)
+
+    def blocks(self) -> List["SelectBlock"]:
+        """Este select, os unidos por union e todas as subconsultas, recursivamente"""
+        result = [self]
+        for union in self.unions:
+            result.extend(union.blocks())
+        for source in self.sources:
+            if source.block is not None:
+                result.extend(source.block.blocks())
+        for subquery in self.subqueries:
+            result.extend(subquery.blocks())
+        return result
+
+
+class ParsedQuery:
+    def __init__(self, ctes: List[SelectBlock], main: Optional[SelectBlock]):
+        """Query dividida nas CTEs (na ordem do with) e no select principal"""
+        self.ctes = ctes
+        self.main = main
+
+    def blocks(self) -> List[SelectBlock]:
+        result = []
+        for block in self.ctes + ([self.main] if self.main else []):
+            result.extend(block.blocks())
+        return result
+
+
+def _nested_selects(tokens: List[Token]) -> List[SelectBlock]:
+    """Selects entre parênteses dentro de uma cláusula"""
+    blocks = []
+    index = 0
+    while index < len(tokens):
+        if tokens[index].text == "(" and index + 1 < len(tokens) and tokens[index + 1].word in ("select", "with"):
+            end = closing_paren(tokens, index)
+            parsed = parse_query(tokens[index + 1:end])
+            blocks.extend(parsed.ctes + ([parsed.main] if parsed.main else []))
+            index = end
+        index += 1
+    return blocks
+
+
+def parse_query(tokens) -> ParsedQuery:
+    """Divide a query (texto ou tokens) em CTEs e select principal
+
+    Cobre o SQL que o agente gera: with com CTEs, select com joins, subconsultas,
+    union e as funções do banco. Não valida a sintaxe; trechos que não reconhece
+    ficam de fora das verificações.
+    """
+    if isinstance(tokens, str):
+        tokens = tokenize(tokens)
+    tokens = [token for token in tokens if token.text != ";" or token.depth > 0]
+    if not tokens:
+        raise ValueError("Query vazia")
+
+    ctes = []
+    index = 0
+    if tokens[0].word == "with":
+        index = 1
+        if index < len(tokens) and tokens[index].word == "recursive":
+            index += 1
+        while index < len(tokens):
+            name = tokens[index]
+            index += 1
+            # Lista de colunas opcional: with x (A, B) as (...)
+            if index < len(tokens) and tokens[index].text == "(":
+                index = closing_paren(tokens, index) + 1
+            if index < len(tokens) and tokens[index].word == "as":
+                index += 1
+            while index < len(tokens) and tokens[index].word in ("not", "materialized"):
+                index += 1
+            if index >= len(tokens) or tokens[index].text != "(":
+                raise ValueError(f"CTE {name.text} sem corpo")
+            end = closing_paren(tokens, index)
+            body = tokens[index + 1:end]
+            if body:
+                inner = parse_query(body)
+                ctes.extend(inner.ctes)
+                if inner.main is not None:
+                    inner.main.name = name.name
+                    ctes.append(inner.main)
+            index = end + 1
+            if index < len(tokens) and tokens[index].text == ",":
+                index += 1
+                continue
+            break
+
+    rest = tokens[index:]
+    main = SelectBlock(rest) if rest and rest[0].word == "select" else None
+    if main is None and rest:
+        raise ValueError(f"Esperado select, encontrado '{rest[0].text}'")
+    return ParsedQuery(ctes, main)
+
+
+def column_refs(tokens: List[Token]) -> List[Tuple[Optional[str], str, int]]:
+    """Referências a colunas nos tokens: (apelido ou None, coluna, índice do token da coluna)
+
+    Ignora funções, tipos depois de ::, apelidos definidos com as, literais e
+    subconsultas entre parênteses.
+    """
+    refs = []
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token.text == "(" and index + 1 < len(tokens) and tokens[index + 1].word in ("select", "with"):
+            index = closing_paren(tokens, index) + 1
+            continue
+        previous = tokens[index - 1].text.lower() if index else ""
+        following = tokens[index + 1].text if index + 1 < len(tokens) else ""
+        if not token.is_identifier() or previous in ("::", "as", ".") or following == "(":
+            index += 1
+            continue
+        if following == "." and index + 2 < len(tokens):
+            column = tokens[index + 2]
+            if column.kind in ("word", "quoted") and (index + 3 >= len(tokens) or tokens[index + 3].text != "("):
+                refs.append((token.name, column.name, index + 2))
+            index += 3
+            continue
+        refs.append((None, token.name, index))
+        index += 1
+    return refs
+
+
+def output_name(item: List[Token]) -> Optional[str]:
+    """Nome da coluna produzida por um item do select, ou None se não for possível saber"""
+    if len(item) >= 2 and item[-2].word == "as" and item[-1].kind in ("word", "quoted"):
+        return item[-1].name
+    if len(item) == 1 and item[0].is_identifier():
+        return item[0].name
+    if len(item) == 3 and item[1].text == "." and item[2].kind in ("word", "quoted") and item[2].text != "*":
+        return item[2].name
+    if len(item) == 4 and item[1].text == "." and item[3].is_identifier():
+        return item[3].name
+    if len(item) == 2 and item[0].is_identifier() and item[1].is_identifier():
+        return item[1].name
+    return None
+
+
+def equalities(tokens: List[Token]) -> List[Tuple[Tuple[Optional[str], str], Tuple[Optional[str], str]]]:
+    """Igualdades entre duas colunas (ex: o.CUSTOMER_ID = c.CUSTOMER_ID) na condição"""
+    pairs = []
+    for index, token in enumerate(tokens):
+        if token.text != "=" or index < 1:
+            continue
+        left = _column_at(tokens, index - 1, backwards=True)
+        right = _column_at(tokens, index + 1)
+        if left and right:
+            pairs.append((left, right))
+    return pairs
+
+
+def aggregated_refs(tokens: List[Token]) -> List[Tuple[Optional[str], str]]:
+    """Colunas (apelido ou None, coluna) dentro das agregações de AGGREGATE_FUNCTIONS, exceto com distinct"""
+    refs = []
+    for index, token in enumerate(tokens):
+        if token.word not in AGGREGATE_FUNCTIONS or index + 1 >= len(tokens) or tokens[index + 1].text != "(":
+            continue
+        inner = tokens[index + 2:closing_paren(tokens, index + 1)]
+        if inner and inner[0].word == "distinct":
+            continue
+        refs.extend((alias, column) for alias, column, _ in column_refs(inner))
+    return refs
+
+
+def _column_at(tokens: List[Token], index: int, backwards: bool = False) -> Optional[Tuple[Optional[str], str]]:
+    """Coluna (apelido, nome) que termina (backwards) ou começa na posição, sem funções nem conversões"""
+    if index < 0 or index >= len(tokens) or not tokens[index].is_identifier():
+        return None
+    if backwards:
+        if index >= 2 and tokens[index - 1].text == ".":
+            return tokens[index - 2].name, tokens[index].name
+        return None, tokens[index].name
+    if index + 2 < len(tokens) and tokens[index + 1].text == ".":
+        if index + 3 < len(tokens) and tokens[index + 3].text in ("::", "("):
+            return None
+        return tokens[index].name, tokens[index + 2].name
+    if index + 1 < len(tokens) and tokens[index + 1].text in ("::", "(", "."):
+        return None
+    return None, tokens[index].name
+
+
+class SQLLinter:
+    def __init__(self, business_context: BusinessContext):
+        """Análise estática das queries geradas, antes de chegarem ao banco
+
+        Confere tabelas e colunas com o catálogo do contexts.yaml e aponta o que
+        costuma virar leitura completa das tabelas: select *, leitura da tabela
+        de fatos sem intervalo na time_column (ou com a coluna dentro de uma função),
+        joins sem todas as join_keys declaradas, joins que multiplicam linhas (fora
+        dos relacionamentos ou para o lado "muitos" de um deles, com agregações),
+        produtos cartesianos e CTEs não usadas. Cada aviso soma um peso na nota de
+        risco (0 a 100).
+        """
+        self.business_context = business_context
+
+    def lint(self, sql_query: str, metadata: Dict = None) -> Dict:
+        """Nota de risco e avisos da query"""
+        metadata = metadata or {}
+        timeframe = metadata.get("timeframe") if isinstance(metadata.get("timeframe"), dict) else None
+        time_column = str((timeframe or {}).get("column") or "").split(".")[-1].split("::")[0].upper() or None
+
+        warnings = []
+        try:
+            parsed = parse_query(sql_query or "")
+        except ValueError as e:
+            parsed = None
+            warnings.append(self._warning("parse_error", "info", f"Query não analisada: {str(e)}"))
+
+        if parsed is not None:
+            catalog = self.business_context.current()
+            state = _LintState(self, catalog, parsed, time_column, timeframe is not None)
+            warnings.extend(state.run())
+
+        score = min(100, sum(RISK_WEIGHTS[w["code"]] * (1 if w["severity"] != "info" else 0.5) for w in warnings))
+        return {
+            "risk_score": int(score),
+            "risk": next(level for threshold, level in RISK_LEVELS if score >= threshold),
+            "warnings": warnings
+        }
+
+    @staticmethod
+    def _warning(code: str, severity: str, message: str, **details) -> Dict:
+        return dict({"code": code, "severity": severity, "message": message}, **details)
+
+
+class _LintState:
+    def __init__(self, linter: SQLLinter, catalog: SchemaCatalog, parsed: ParsedQuery, time_column: Optional[str],
+                 timeframe_requested: bool):
+        """Verificações de uma query já dividida em blocos"""
+        self.warning = linter._warning
+        self.catalog = catalog
+        self.parsed = parsed
+        self.time_column = time_column
+        self.timeframe_requested = timeframe_requested
+        self.cte_names = {block.name for block in parsed.ctes}
+        # Nome curto (sem esquema) -> nomes completos, para queries que omitem o esquema
+        self.short_names: Dict[str, List[str]] = {}
+        for table in catalog.tables:
+            self.short_names.setdefault(table.split(".")[-1], []).append(table)
+        self.cte_outputs: Dict[str, Optional[Set[str]]] = {}
+
+    def run(self) -> List[Dict]:
+        warnings = []
+        for block in self.parsed.ctes:
+            warnings.extend(self._check_block(block))
+            self.cte_outputs[block.name] = self._outputs(block)
+        if self.parsed.main is not None:
+            warnings.extend(self._check_block(self.parsed.main))
+        warnings.extend(self._unused_ctes())
+        return warnings
+
+    def _table(self, source: Source) -> Optional[str]:
+        """Nome da tabela do catálogo lida pela fonte, ou None"""
+        if source.kind != "table" or source.name in self.cte_names:
+            return None
+        if source.name in self.catalog.tables:
+            return source.name
+        candidates = self.short_names.get(source.name.split(".")[-1], [])
+        return candidates[0] if len(candidates) == 1 and "." not in source.name else None
+
+    def _source_columns(self, source: Source) -> Optional[Set[str]]:
+        """Colunas disponíveis na fonte, ou None se não for possível saber"""
+        if source.kind == "table" and source.name in self.cte_names:
+            return self.cte_outputs.get(source.name)
+        if source.kind == "subquery" and source.block is not None:
+            return self._outputs(source.block)
+        table = self._table(source)
+        return set(self.catalog.columns(table)) if table else None
+
+    def _outputs(self, block: SelectBlock) -> Optional[Set[str]]:
+        """Colunas produzidas pelo select, ou None se alguma não puder ser determinada"""
+        aliases = {source.alias: source for source in block.sources}
+        outputs = set()
+        for item in block.items:
+            if item[-1].text == "*":
+                if len(item) == 1:
+                    sources = block.sources
+                elif len(item) == 3 and item[0].name in aliases:
+                    sources = [aliases[item[0].name]]
+                else:
+                    return None
+                for source in sources:
+                    columns = self._source_columns(source)
+                    if columns is None:
+                        return None
+                    outputs |= columns
+                continue
+            name = output_name(item)
+            if name is None:
+                return None
+            outputs.add(name)
+        return outputs
+
+    def _check_block(self, block: SelectBlock) -> List[Dict]:
+        warnings = []
+        for nested in block.blocks():
+            warnings.extend(self._check_sources(nested))
+            warnings.extend(self._check_columns(nested))
+            warnings.extend(self._check_select_star(nested))
+            warnings.extend(self._check_joins(nested))
+            warnings.extend(self._check_time_predicate(nested))
+        return warnings
+
+    def _label(self, block: SelectBlock) -> str:
+        """Onde está o select, para as mensagens ("na CTE x" ou "no select principal")"""
+        return f"na CTE {block.name.lower()}" if block.name else "no select principal"
+
+    def _check_sources(self, block: SelectBlock) -> List[Dict]:
+        warnings = []
+        for source in block.sources:
+            if source.kind == "table" and source.name not in self.cte_names and self._table(source) is None:
+                warnings.append(self.warning(
+                    "unknown_table", "error", f"Tabela {source.name} não existe no catálogo", table=source.name
+                ))
+        return warnings
+
+    def _check_columns(self, block: SelectBlock) -> List[Dict]:
+        """Colunas que não existem na tabela do apelido (ou em nenhuma das fontes, sem apelido)"""
+        aliases = {source.alias: source for source in block.sources}
+        available = set()
+        for source in block.sources:
+            columns = self._source_columns(source)
+            if columns is None:
+                available = None
+                break
+            available |= columns
+        if available is not None:
+            available |= {name for name in (output_name(item) for item in block.items) if name}
+
+        warnings, reported = [], set()
+        tokens = [t for name, clause in block.clauses.items() if name != "from" for t in clause]
+        tokens += [t for source in block.sources for t in source.condition]
+        for alias, column, _ in column_refs(tokens):
+            if alias is not None:
+                source = aliases.get(alias)
+                columns = self._source_columns(source) if source else None
+                if source is None:
+                    message = f"Apelido {alias.lower()} não definido {self._label(block)}"
+                elif columns is not None and column not in columns:
+                    message = f"Coluna {column} não existe em {source.name} ({alias.lower()})"
+                else:
+                    continue
+            elif available is not None and block.sources and column not in available:
+                message = f"Coluna {column} não existe nas tabelas lidas {self._label(block)}"
+            else:
+                continue
+            if (alias, column) not in reported:
+                reported.add((alias, column))
+                warnings.append(self.warning("unknown_column", "error", message, column=column))
+        return warnings
+
+    def _check_select_star(self, block: SelectBlock) -> List[Dict]:
+        """select * sobre tabelas do catálogo lê todas as colunas"""
+        aliases = {source.alias: source for source in block.sources}
+        warnings = []
+        for item in block.items:
+            if item[-1].text != "*" or (len(item) != 1 and not (len(item) == 3 and item[1].text == ".")):
+                continue
+            sources = block.sources if len(item) == 1 else [aliases.get(item[0].name)]
+            for source in sources:
+                table = self._table(source) if source else None
+                if table:
+                    warnings.append(self.warning(
+                        "select_star", "warning",
+                        f"select * em {table} lê todas as {len(self.catalog.columns(table))} colunas; "
+                        "liste apenas as necessárias",
+                        table=table
+                    ))
+        return warnings
+
+    def _check_joins(self, block: SelectBlock) -> List[Dict]:
+        warnings = []
+        sources = block.sources
+        where_pairs = equalities(block.clauses.get("where", []))
+        for position, source in enumerate(sources[1:], start=1):
+            previous = sources[:position]
+            if source.join == "cross join" or (source.join != "comma" and not source.condition and not source.using):
+                if source.kind != "function":
+                    warnings.append(self.warning(
+                        "cartesian_product", "error",
+                        f"{source.alias.lower()} entra {self._label(block)} sem condição de join (produto cartesiano)",
+                        table=source.name
+                    ))
+                continue
+
+            if source.using:
+                pairs = [((other.alias, key), (source.alias, key)) for key in source.using for other in previous]
+            else:
+                pairs = equalities(source.condition if source.join != "comma" else [])
+                pairs += [pair for pair in where_pairs if source.join == "comma"]
+            linked = self._linked_columns(source, previous, pairs)
+            if not linked:
+                warnings.append(self.warning(
+                    "cartesian_product", "error",
+                    f"Nenhuma igualdade liga {source.alias.lower()} às demais tabelas {self._label(block)}",
+                    table=source.name
+                ))
+                continue
+            warnings.extend(self._check_join_keys(block, source, linked))
+        return warnings
+
+    def _linked_columns(self, source: Source, previous: List[Source], pairs) -> Dict[str, Tuple[Set[str], Set[str]]]:
+        """Fonte anterior -> (colunas dela, colunas da fonte) ligadas por igualdades"""
+        by_alias = {other.alias: other for other in previous}
+        single = previous[0] if len(previous) == 1 else None
+        linked = {}
+        for left, right in pairs:
+            for mine, theirs in ((right, left), (left, right)):
+                if mine[0] not in (source.alias, None) or (mine[0] is None and theirs[0] is None):
+                    continue
+                other = by_alias.get(theirs[0]) if theirs[0] else single
+                if other is None or other is source:
+                    continue
+                entry = linked.setdefault(other.alias, (set(), set()))
+                entry[0].add(theirs[1])
+                entry[1].add(mine[1])
+                break
+        return linked
+
+    def _check_join_keys(self, block: SelectBlock, source: Source, linked) -> List[Dict]:
+        """join_keys declaradas no contexts.yaml que faltam e joins que podem multiplicar linhas"""
+        warnings = []
+        table = self._table(source)
+        if table is None:
+            return warnings
+        sources = {s.alias: s for s in block.sources}
+        for alias, (other_columns, source_columns) in linked.items():
+            other = self._table(sources[alias])
+            if other is None:
+                continue
+            declared = self._declared_keys(other, table)
+            missing = [key for key in declared if key not in other_columns or key not in source_columns]
+            if missing:
+                warnings.append(self.warning(
+                    "missing_join_keys", "error",
+                    f"Join {alias.lower()} -> {source.alias.lower()} sem as join_keys {', '.join(missing)} "
+                    f"declaradas para {other} e {table}",
+                    table=table
+                ))
+
+            # Fora dos relacionamentos declarados, só a chave primária garante que o join não multiplica linhas
+            keys = [(self.catalog.table(t) or {}).get("primary_key") for t in (other, table)]
+            if not declared and any(keys) and keys[0] not in other_columns and keys[1] not in source_columns:
+                warnings.append(self.warning(
+                    "fan_out_join", "warning",
+                    f"Join {alias.lower()} -> {source.alias.lower()} não segue um relacionamento do contexts.yaml "
+                    f"nem usa uma chave primária ({', '.join(k for k in keys if k)}) e pode multiplicar as linhas",
+                    table=table
+                ))
+            elif declared and not self.catalog.joins_to_one(table, sorted(source_columns)):
+                # Relacionamento declarado, mas para o lado "muitos": as linhas das outras tabelas se repetem
+                repeated = sorted(self._aggregated_aliases(block) - {source.alias})
+                if repeated:
+                    warnings.append(self.warning(
+                        "fan_out_join", "warning",
+                        f"Join {alias.lower()} -> {source.alias.lower()} vai para o lado \"muitos\" de {table} "
+                        f"(chave primária {keys[1] or 'não declarada'} fora do join) e repete as linhas de "
+                        f"{', '.join(a.lower() for a in repeated)}, cujas colunas são agregadas {self._label(block)}",
+                        table=table
+                    ))
+        return warnings
+
+    def _aggregated_aliases(self, block: SelectBlock) -> Set[str]:
+        """Apelidos das fontes com colunas agregadas no select ou, numa CTE, pelos selects que a leem"""
+        def owners(alias: Optional[str], column: str) -> Set[str]:
+            if alias is not None:
+                return {alias}
+            return {s.alias for s in block.sources if column in (self._source_columns(s) or set())}
+
+        tokens = [t for name, clause in block.clauses.items() if name != "from" for t in clause]
+        aliases = set()
+        for alias, column in aggregated_refs(tokens):
+            aliases |= owners(alias, column)
+
+        if block.name:
+            downstream = set()
+            for reader in self.parsed.blocks():
+                if reader.name == block.name:
+                    continue
+                for source in reader.sources:
+                    if source.kind == "table" and source.name == block.name:
+                        reader_tokens = [t for name, clause in reader.clauses.items() if name != "from" for t in clause]
+                        downstream.update(column for alias, column in aggregated_refs(reader_tokens)
+                                          if alias in (None, source.alias))
+            for item in block.items:
+                if output_name(item) in downstream:
+                    for alias, column, _ in column_refs(item):
+                        aliases |= owners(alias, column)
+        return aliases
+
+    def _declared_keys(self, left: str, right: str) -> List[str]:
+        """join_keys do relacionamento entre as tabelas, só as que existem nas duas"""
+        keys = []
+        for graph in self.catalog.join_graphs.values():
+            for key in graph.get(left, {}).get(right, []):
+                if key not in keys and key in self.catalog.columns(left) and key in self.catalog.columns(right):
+                    keys.append(key)
+        return keys
+
+    def _check_time_predicate(self, block: SelectBlock) -> List[Dict]:
+        """A tabela principal do select (a primeira do from) precisa de um intervalo na coluna de data
+
+        Só as tabelas de fatos, com time_column no contexts.yaml, são conferidas sempre
+        ("warning"). Nas demais (cadastros e fotos, como CUSTOMERS e INVENTORY) ler a
+        tabela inteira é o normal; o aviso só aparece, como "info", quando a pergunta
+        pediu um período.
+        """
+        if not block.sources:
+            return []
+        source = block.sources[0]
+        table = self._table(source)
+        if table is None:
+            return []
+        declared = (self.catalog.table(table) or {}).get("time_column")
+        time_column = self.time_column or declared or "CREATED_AT"
+        if time_column not in self.catalog.columns(table) or not (declared or self.timeframe_requested):
+            return []
+        severity = "warning" if declared else "info"
+
+        owners = [s for s in block.sources if time_column in (self._source_columns(s) or set())]
+        conditions = [block.clauses.get("where", [])] + [s.condition for s in block.sources]
+        found, sargable = False, False
+        for tokens in conditions:
+            for alias, column, index in column_refs(tokens):
+                if column != time_column or (alias or (owners[0].alias if len(owners) == 1 else None)) != source.alias:
+                    continue
+                found = True
+                start = index - 2 if alias else index
+                wrapped = index + 1 < len(tokens) and tokens[index + 1].text == "::"
+                if start > 0 and tokens[start - 1].text == ",":
+                    wrapped = tokens[start - 1].depth > 0
+                elif start > 1 and tokens[start - 1].text == "(":
+                    # Parênteses de uma função (date_trunc, cast...), não de agrupamento
+                    wrapped = wrapped or tokens[start - 2].is_identifier()
+                sargable = sargable or not wrapped
+
+        if not found:
+            # Na tabela de fatos, mesmo sem período pedido a leitura completa continua cara
+            requested = "; o período pedido não foi aplicado" if self.timeframe_requested else ""
+            return [self.warning(
+                "missing_time_predicate", severity,
+                f"{table} é lida sem intervalo de {time_column} {self._label(block)} "
+                f"(leitura completa da tabela{requested})",
+                table=table
+            )]
+        if not sargable:
+            return [self.warning(
+                "non_sargable_time_predicate", severity,
+                f"O filtro de {time_column} em {table} aplica uma função ou conversão à coluna, "
+                f"o que impede a poda de partições; compare a coluna diretamente (>= início e < fim)",
+                table=table
+            )]
+        return []
+
+    def _unused_ctes(self) -> List[Dict]:
+        used = set()
+        for block in self.parsed.blocks():
+            used.update(t.name for t in block.tokens if t.name in self.cte_names and t.name != block.name)
+        return [
+            self.warning("unused_cte", "info", f"A CTE {block.name.lower()} não é usada", cte=block.name.lower())
+            for block in self.parsed.ctes if block.name not in used
+        ]
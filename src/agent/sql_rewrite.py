@@ -0,0 +1,752 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+import re
+
+from src.agent.metric_templates import TemplateMiss, filter_condition, timeframe_dates
+from src.agent.sql_lint import (
+    ParsedQuery, SelectBlock, Source, Token, closing_paren, column_refs, output_name, parse_query,
+    split_tokens, tokenize
+)
+from src.config.business_context import BusinessContext
+from src.config.schema_catalog import SchemaCatalog
+
+# Limite de transformações por query (cada uma reanalisa a query)
+MAX_ROUNDS = 100
+
+# Tipos de coluna em que a conversão para data pode ser trocada por um intervalo na própria coluna
+TIME_TYPES = ("DATE", "DATETIME", "TIMESTAMP", "TIMESTAMP_NTZ")
+
+# Truncamentos de data aceitos em date_trunc, com o início do período que contém o dia
+TRUNCATIONS = {
+    "day": lambda d: d,
+    "week": lambda d: d - timedelta(days=d.weekday()),
+    "month": lambda d: d.replace(day=1),
+    "year": lambda d: d.replace(month=1, day=1),
+}
+
+AGGREGATES = {
+    "sum", "count", "avg", "min", "max", "median", "mode", "count_if", "sum_if", "avg_if", "any_value",
+    "listagg", "string_agg", "array_agg", "stddev", "stddev_samp", "stddev_pop", "variance", "var_samp",
+    "var_pop", "approx_count_distinct", "approx_percentile", "percentile_cont", "percentile_disc",
+    "bool_and", "bool_or", "booland_agg", "boolor_agg", "hll", "object_agg", "arg_max", "arg_min",
+    "max_by", "min_by", "corr", "covar_samp", "covar_pop",
+}
+
+# Operadores de comparação e o operador equivalente com a coluna sem conversão
+COMPARISONS = {">=", ">", "<", "<=", "="}
+
+# Joins em que um filtro sobre a fonte pode ser aplicado antes do join
+INNER_JOINS = {"from", "join", "inner join", "comma", "cross join"}
+
+DATE_LITERAL = re.compile(r"'(\d{4}-\d{2}-\d{2})'")
+
+
+class Edit:
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start: int, end: int, text: str = ""):
+        """Troca do trecho [start, end) da query por text (inserção quando start == end)"""
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+def apply_edits(sql_query: str, edits: List[Edit]) -> str:
+    """Aplica as edições, que não podem se sobrepor, do fim para o começo da query"""
+    for edit in sorted(edits, key=lambda e: (e.start, e.end), reverse=True):
+        sql_query = sql_query[:edit.start] + edit.text + sql_query[edit.end:]
+    return sql_query
+
+
+def conjuncts(tokens: List[Token]) -> Optional[List[List[Token]]]:
+    """Condições ligadas por and no nível mais externo, ou None se houver um or nesse nível"""
+    if not tokens:
+        return []
+    depth = tokens[0].depth
+    parts, current, between = [], [], False
+    for token in tokens:
+        if token.depth == depth and token.word == "or":
+            return None
+        if token.depth == depth and token.word == "between":
+            between = True
+        elif token.depth == depth and token.word == "and":
+            if between:
+                between = False
+            else:
+                parts.append(current)
+                current = []
+                continue
+        current.append(token)
+    parts.append(current)
+    return [part for part in parts if part]
+
+
+def _is_aggregate(tokens: List[Token]) -> bool:
+    """Se a expressão chama uma função de agregação (fora de uma função de janela)"""
+    for index, token in enumerate(tokens[:-1]):
+        if token.word in AGGREGATES and tokens[index + 1].text == "(":
+            end = closing_paren(tokens, index + 1)
+            if not (end + 1 < len(tokens) and tokens[end + 1].word == "over"):
+                return True
+    return False
+
+
+def _expression(item: List[Token]) -> List[Token]:
+    """Tokens da expressão de um item do select, sem o apelido"""
+    if len(item) >= 3 and item[-2].word == "as":
+        return item[:-2]
+    if len(item) == 2 and item[0].is_identifier() and item[1].is_identifier():
+        return item[:-1]
+    return item
+
+
+def _plain_column(item: List[Token], column: str) -> bool:
+    """Se o item do select é a própria coluna (COLUNA ou apelido.COLUNA)"""
+    expression = _expression(item)
+    return len(expression) in (1, 3) and expression[-1].name == column and \
+        (len(expression) == 1 or expression[1].text == ".")
+
+
+def _is_simple(tokens: List[Token]) -> bool:
+    """Coluna, função ou conversão que pode entrar numa comparação sem parênteses"""
+    if tokens and tokens[-1].text != ")" and len(tokens) >= 3 and tokens[-2].text == "::":
+        tokens = tokens[:-2]
+    if not tokens:
+        return False
+    if len(tokens) in (1, 3) and all(t.kind in ("word", "quoted") for t in tokens[::2]) \
+            and all(t.text == "." for t in tokens[1::2]):
+        return True
+    return len(tokens) >= 3 and tokens[0].kind == "word" and tokens[1].text == "(" \
+        and closing_paren(tokens, 1) == len(tokens) - 1
+
+
+def _line_indent(sql_query: str, position: int) -> str:
+    """Espaços no início da linha da posição"""
+    line_start = sql_query.rfind("\n", 0, position) + 1
+    line = sql_query[line_start:position]
+    return line[:len(line) - len(line.lstrip())]
+
+
+class SQLRewriter:
+    def __init__(self, business_context: BusinessContext):
+        """Reescrita mecânica das queries geradas para ler menos dados no banco
+
+        Aplica, uma de cada vez e reanalisando a query a cada passo, dois tipos de
+        transformação:
+
+        - Equivalentes, que não mudam o resultado: filtros do select externo sobre
+          colunas de uma CTE descem para o where da CTE (até a tabela), comparações de
+          CREATED_AT dentro de uma conversão ou date_trunc viram intervalos na própria
+          coluna (>= início e < fim) e colunas que nenhum select usa saem das CTEs.
+        - Acréscimos intencionais, que mudam o resultado da query do modelo para o
+          que a classificação pediu: timeframe_added (o período dos metadados) e
+          filter_added (cada filtro dos metadados, inclusive o REGION padrão), quando
+          a query não os aplica em lugar nenhum; entram no where dos selects que leem
+          a tabela. Só acontecem com metadados informados em rewrite.
+        """
+        self.business_context = business_context
+
+    def rewrite(self, sql_query: str, metadata: Dict = None) -> Tuple[str, List[Dict]]:
+        """Query reescrita e a lista de mudanças ({"code", "message", ...}); sem mudanças, a query original
+
+        Args:
+            sql_query: Query gerada
+            metadata: Classificação que descreve a pergunta inteira (do LLM ou do
+                      classificador local sem palavras não explicadas), usada nos
+                      acréscimos de período e filtros; sem ela, ou com uma
+                      classificação que falhou, só as transformações equivalentes
+                      são aplicadas
+        """
+        tokens = tokenize(sql_query or "")
+        try:
+            parsed = parse_query(tokens)
+        except ValueError:
+            return sql_query, []
+        if any(token.word == "recursive" for token in tokens[:2]):
+            return sql_query, []
+
+        catalog = self.business_context.current()
+        short_names: Dict[str, List[str]] = {}
+        for table in catalog.tables:
+            short_names.setdefault(table.split(".")[-1], []).append(table)
+        requested = self._requested_conditions(metadata or {})
+        changes = []
+        for _ in range(MAX_ROUNDS):
+            state = _RewriteState(catalog, short_names, sql_query, tokens, parsed, requested)
+            step = state.next_step()
+            if step is None:
+                break
+            edits, change = step
+            rewritten = apply_edits(sql_query, edits)
+            tokens = tokenize(rewritten)
+            try:
+                parsed = parse_query(tokens)
+            except ValueError:
+                break
+            sql_query = rewritten
+            changes.append(change)
+        return sql_query, changes
+
+    @staticmethod
+    def _requested_conditions(metadata: Dict) -> List[Dict]:
+        """Período e filtros da classificação, como condições a garantir na query"""
+        requested = []
+        if metadata.get("error"):
+            # Metadados padrão de uma classificação que falhou não descrevem a pergunta
+            return requested
+        timeframe = metadata.get("timeframe")
+        if isinstance(timeframe, dict) and timeframe:
+            column = str(timeframe.get("column") or "CREATED_AT").split(".")[-1].split("::")[0].strip().upper()
+            try:
+                start, end = timeframe_dates(timeframe)
+            except TemplateMiss:
+                start = None
+            if start is not None:
+                requested.append({
+                    "code": "timeframe_added",
+                    "column": column,
+                    "bounds": [(">=", f"'{start.isoformat()}'"), ("<", f"'{(end + timedelta(days=1)).isoformat()}'")]
+                })
+        for item in metadata.get("filters") or []:
+            if isinstance(item, dict) and item.get("column"):
+                column = str(item["column"]).split(".")[-1].split("::")[0].strip().upper()
+                requested.append({"code": "filter_added", "column": column, "filter": item})
+        return requested
+
+
+class _RewriteState:
+    def __init__(self, catalog: SchemaCatalog, short_names: Dict[str, List[str]], sql_query: str,
+                 tokens: List[Token], parsed: ParsedQuery, requested: List[Dict]):
+        """Uma rodada da reescrita: procura a primeira transformação aplicável na query analisada"""
+        self.catalog = catalog
+        # Nome curto (sem esquema) -> nomes completos, para queries que omitem o esquema
+        self.short_names = short_names
+        self.sql = sql_query
+        self.tokens = tokens
+        self.parsed = parsed
+        self.requested = requested
+        self.ctes = {block.name: block for block in parsed.ctes}
+        self.blocks = parsed.blocks()
+
+    def next_step(self) -> Optional[Tuple[List[Edit], Dict]]:
+        for step in (self._pushdown, self._sargable, self._requested, self._prune):
+            result = step()
+            if result is not None:
+                return result
+        return None
+
+    # Fontes e colunas
+
+    def _table(self, source: Source) -> Optional[str]:
+        """Tabela do catálogo lida pela fonte, ou None"""
+        if source.kind != "table" or source.name in self.ctes:
+            return None
+        if source.name in self.catalog.tables:
+            return source.name
+        candidates = self.short_names.get(source.name.split(".")[-1], [])
+        return candidates[0] if len(candidates) == 1 and "." not in source.name else None
+
+    def _columns(self, source: Source) -> Optional[Set[str]]:
+        """Colunas da fonte, ou None se não for possível saber"""
+        if source.kind == "table" and source.name in self.ctes:
+            block = self.ctes[source.name]
+            names = [output_name(item) for item in block.items]
+            return None if None in names or block.unions else set(names)
+        table = self._table(source)
+        return set(self.catalog.columns(table)) if table else None
+
+    def _resolve(self, block: SelectBlock, alias: Optional[str], column: str) -> Optional[Source]:
+        """Fonte do select de onde vem a coluna, ou None se for ambígua ou desconhecida"""
+        if alias is not None:
+            return next((s for s in block.sources if s.alias == alias), None)
+        if len(block.sources) == 1:
+            return block.sources[0]
+        owners = []
+        for source in block.sources:
+            columns = self._columns(source)
+            if columns is None:
+                return None
+            if column in columns:
+                owners.append(source)
+        return owners[0] if len(owners) == 1 else None
+
+    def _consumers(self, name: str) -> List[Tuple[SelectBlock, Source]]:
+        """Selects que leem a CTE e a fonte correspondente"""
+        return [(block, source) for block in self.blocks if block.name != name
+                for source in block.sources if source.kind == "table" and source.name == name]
+
+    def _referenced(self, name: str) -> int:
+        """Quantas vezes a CTE é lida fora dela (o nome fora de apelidos e de referências como cte.COLUNA)"""
+        count = 0
+        for block in self.parsed.ctes + ([self.parsed.main] if self.parsed.main else []):
+            if block.name == name:
+                continue
+            tokens = block.tokens
+            count += sum(1 for i, token in enumerate(tokens) if token.name == name and token.is_identifier()
+                         and not (i + 1 < len(tokens) and tokens[i + 1].text == ".")
+                         and not (i and tokens[i - 1].word == "as"))
+        return count
+
+    # Inserção no where
+
+    def _append_predicates(self, block: SelectBlock, predicates: List[str]) -> List[Edit]:
+        """Edições que acrescentam as condições ao where do select (criando o where, se preciso)"""
+        where = block.clauses.get("where")
+        if where:
+            edits, closing = [], ""
+            if conjuncts(where) is None:
+                edits, closing = [Edit(where[0].start, where[0].start, "(")], ")"
+            keyword = block.keywords["where"]
+            last_and = next((t for t in reversed(where) if t.depth == where[0].depth and t.word == "and"), None)
+            if last_and is not None and self._starts_line(last_and):
+                separator = "\n" + _line_indent(self.sql, last_and.start)
+            elif self._starts_line(keyword):
+                separator = "\n" + _line_indent(self.sql, keyword.start) + "  "
+            else:
+                separator = " "
+            text = closing + "".join(f"{separator}and {predicate}" for predicate in predicates)
+            return edits + [Edit(where[-1].end, where[-1].end, text)]
+
+        anchor = block.clauses.get("from")
+        if not anchor:
+            return []
+        keyword = block.keywords["from"]
+        if self._starts_line(keyword):
+            indent = _line_indent(self.sql, keyword.start)
+            separator, conjunction = f"\n{indent}", f"\n{indent}  and "
+        else:
+            separator, conjunction = " ", " and "
+        text = f"{separator}where {predicates[0]}" + "".join(f"{conjunction}{p}" for p in predicates[1:])
+        return [Edit(anchor[-1].end, anchor[-1].end, text)]
+
+    def _starts_line(self, token: Token) -> bool:
+        """Se o token é o primeiro da sua linha"""
+        return not self.sql[self.sql.rfind("\n", 0, token.start) + 1:token.start].strip()
+
+    # Filtros do select externo para o where da CTE
+
+    def _pushdown(self) -> Optional[Tuple[List[Edit], Dict]]:
+        for block in self.blocks:
+            if any(source.join not in INNER_JOINS | {"left join"} for source in block.sources):
+                continue
+            parts = conjuncts(block.clauses.get("where", []))
+            for position, part in enumerate(parts or []):
+                target = self._pushdown_target(block, part)
+                if target is None:
+                    continue
+                cte, substitutions = target
+                predicate = self._substitute(part, substitutions)
+                edits = self._append_predicates(cte, [predicate])
+                if not edits:
+                    continue
+                edits.append(self._remove_conjunct(block, parts, position))
+                return edits, {
+                    "code": "predicate_pushdown",
+                    "cte": cte.name.lower(),
+                    "predicate": predicate,
+                    "message": f"Filtro {self._text(part)} movido para o where da CTE {cte.name.lower()}"
+                }
+        return None
+
+    def _pushdown_target(self, block: SelectBlock, part: List[Token]):
+        """CTE que recebe a condição e a troca de cada coluna pela expressão dela na CTE"""
+        if any(t.word in ("select", "exists") for t in part):
+            return None
+        refs = column_refs(part)
+        if not refs:
+            return None
+        own_outputs = {output_name(item): item for item in block.items}
+        cte, substitutions = None, []
+        for alias, column, index in refs:
+            # Apelido do próprio select com o mesmo nome de uma coluna da fonte
+            if alias is None and column in own_outputs and not _plain_column(own_outputs[column], column):
+                return None
+            source = self._resolve(block, alias, column)
+            if source is None or source.kind != "table" or source.name not in self.ctes:
+                return None
+            if source.join not in INNER_JOINS or (cte is not None and cte.name != source.name):
+                return None
+            cte = self.ctes[source.name]
+            item = self._pushable_item(cte, column)
+            if item is None:
+                return None
+            start = part[index - 2] if alias is not None else part[index]
+            substitutions.append((start.start, part[index].end, item))
+        if self._referenced(cte.name) != 1 or len(self._consumers(cte.name)) != 1:
+            return None
+        return cte, substitutions
+
+    def _pushable_item(self, cte: SelectBlock, column: str) -> Optional[List[Token]]:
+        """Expressão da coluna na CTE, se um filtro sobre ela puder ser aplicado antes do select da CTE"""
+        if cte.unions or any(name in cte.clauses for name in ("limit", "qualify")):
+            return None
+        if any(t.word in ("over", "top") for t in cte.tokens) or not cte.clauses.get("from"):
+            return None
+        matches = [item for item in cte.items if output_name(item) == column]
+        if len(matches) != 1:
+            return None
+        expression = _expression(matches[0])
+        if _is_aggregate(expression):
+            return None
+        # Sem group by, uma agregação devolve uma linha mesmo sem dados: o filtro não pode ir antes dela
+        if "group" not in cte.clauses and any(_is_aggregate(_expression(item)) for item in cte.items):
+            return None
+        # Apelidos de outras colunas da CTE não existem no where
+        others = {output_name(item) for item in cte.items if item is not matches[0]}
+        for alias, name, _ in column_refs(expression):
+            if alias is None and name in others and name != column:
+                return None
+        return expression
+
+    def _substitute(self, part: List[Token], substitutions) -> str:
+        """Texto da condição com as colunas trocadas pelas expressões da CTE"""
+        text, offset = self._text(part), part[0].start
+        for start, end, expression in sorted(substitutions, key=lambda s: s[0], reverse=True):
+            replacement = self.sql[expression[0].start:expression[-1].end]
+            if not _is_simple(expression):
+                replacement = f"({replacement})"
+            text = text[:start - offset] + replacement + text[end - offset:]
+        return text
+
+    def _remove_conjunct(self, block: SelectBlock, parts: List[List[Token]], position: int) -> Edit:
+        """Edição que tira a condição do where, com o and que a liga às demais (ou o where inteiro)"""
+        part = parts[position]
+        if len(parts) == 1:
+            keyword = block.keywords["where"]
+            previous = next(t for t in reversed(block.tokens) if t.start < keyword.start)
+            return Edit(previous.end, part[-1].end)
+        if position > 0:
+            return Edit(parts[position - 1][-1].end, part[-1].end)
+        return Edit(part[0].start, parts[1][0].start)
+
+    def _text(self, tokens: List[Token]) -> str:
+        return self.sql[tokens[0].start:tokens[-1].end]
+
+    # Comparações de data sobre a coluna convertida
+
+    def _sargable(self) -> Optional[Tuple[List[Edit], Dict]]:
+        for block in self.blocks:
+            conditions = [block.clauses.get("where", [])] + [source.condition for source in block.sources]
+            for tokens in conditions:
+                for index in range(len(tokens)):
+                    # A expressão precisa ser o lado esquerdo da comparação, não parte de uma conta
+                    previous = tokens[index - 1] if index else None
+                    if previous is not None and previous.text not in ("(", ",") and \
+                            previous.word not in ("and", "or", "not", "when", "then", "else"):
+                        continue
+                    found = self._wrapped_column(block, tokens, index)
+                    if found is None:
+                        continue
+                    end, column_text, unit = found
+                    replaced = self._sargable_comparison(tokens, index, end, column_text, unit)
+                    if replaced is not None:
+                        stop, text = replaced
+                        return [Edit(tokens[index].start, tokens[stop].end, text)], {
+                            "code": "sargable_time_predicate",
+                            "predicate": text,
+                            "message": f"{self.sql[tokens[index].start:tokens[stop].end]} reescrito como {text}"
+                        }
+        return None
+
+    def _wrapped_column(self, block: SelectBlock, tokens: List[Token], index: int):
+        """Coluna de data dentro de ::date, cast, date() ou date_trunc a partir de tokens[index]
+
+        Returns:
+            (índice do último token da expressão, texto da coluna, unidade do truncamento) ou None
+        """
+        def column_at(position: int):
+            if position < len(tokens) and tokens[position].is_identifier():
+                if position + 2 < len(tokens) and tokens[position + 1].text == ".":
+                    return position + 2, (tokens[position].name, tokens[position + 2].name)
+                return position, (None, tokens[position].name)
+            return None
+
+        token = tokens[index]
+        found, unit = None, "day"
+        if token.word in ("cast", "date", "to_date", "date_trunc") and index + 1 < len(tokens) \
+                and tokens[index + 1].text == "(":
+            close = closing_paren(tokens, index + 1)
+            first, last = index + 2, close - 1
+            if token.word == "date_trunc":
+                if last - first < 2 or tokens[first].kind != "string" or tokens[first + 1].text != ",":
+                    return None
+                unit = tokens[first].text.strip("'").lower()
+                if unit not in TRUNCATIONS:
+                    return None
+                first += 2
+            elif token.word == "cast":
+                if last - first < 2 or tokens[last - 1].word != "as" or tokens[last].word != "date":
+                    return None
+                last -= 2
+            found = column_at(first)
+            if found is None or found[0] != last:
+                return None
+            end = close
+            if end + 2 < len(tokens) and tokens[end + 1].text == "::" and tokens[end + 2].word == "date":
+                end += 2
+        elif token.is_identifier() and not (index and tokens[index - 1].text in (".", "::")):
+            found = column_at(index)
+            if found is None or found[0] + 2 >= len(tokens) or tokens[found[0] + 1].text != "::" \
+                    or tokens[found[0] + 2].word != "date":
+                return None
+            end = found[0] + 2
+        else:
+            return None
+
+        alias, column = found[1]
+        source = self._resolve(block, alias, column)
+        table = self._table(source) if source is not None else None
+        if table is None or str(self.catalog.columns(table).get(column, "")).upper() not in TIME_TYPES:
+            return None
+        first = found[0] - 2 if alias is not None else found[0]
+        return end, self.sql[tokens[first].start:tokens[found[0]].end], unit
+
+    def _sargable_comparison(self, tokens: List[Token], index: int, end: int, column: str, unit: str):
+        """Comparação da expressão com uma data trocada por um intervalo na coluna
+
+        Returns:
+            (índice do último token substituído, texto novo) ou None
+        """
+        if end + 2 >= len(tokens):
+            return None
+        operator = tokens[end + 1].word or tokens[end + 1].text
+        truncate = TRUNCATIONS[unit]
+
+        def advance(day: date) -> date:
+            if unit == "day":
+                return day + timedelta(days=1)
+            if unit == "week":
+                return day + timedelta(days=7)
+            if unit == "month":
+                return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+            return day.replace(year=day.year + 1)
+
+        def ceil(day: date) -> date:
+            return day if truncate(day) == day else advance(truncate(day))
+
+        def lower(day: date) -> str:
+            return f"{column} >= '{day.isoformat()}'"
+
+        def upper(day: date) -> str:
+            return f"{column} < '{day.isoformat()}'"
+
+        if operator == "between":
+            first = self._date_literal(tokens, end + 2)
+            if first is None or first[1] + 1 >= len(tokens) or tokens[first[1] + 1].word != "and":
+                return None
+            second = self._date_literal(tokens, first[1] + 2)
+            if second is None or not self._ends_operand(tokens, second[1]):
+                return None
+            text = f"{lower(ceil(first[0]))} and {upper(advance(truncate(second[0])))}"
+            return second[1], self._grouped(tokens, index, second[1], text)
+
+        if operator not in COMPARISONS:
+            return None
+        literal = self._date_literal(tokens, end + 2)
+        if literal is not None:
+            day, stop = literal
+            if not self._ends_operand(tokens, stop):
+                return None
+            if operator == ">=":
+                text = lower(ceil(day))
+            elif operator == ">":
+                text = lower(advance(truncate(day)))
+            elif operator == "<":
+                text = upper(ceil(day))
+            elif operator == "<=":
+                text = upper(advance(truncate(day)))
+            elif truncate(day) == day:
+                text = self._grouped(tokens, index, stop, f"{lower(day)} and {upper(advance(day))}")
+            else:
+                return None
+            return stop, text
+
+        # Limites relativos (current_date - 7): só >= e <, que não precisam somar um dia
+        if unit != "day" or operator not in (">=", "<"):
+            return None
+        stop = end + 2
+        if stop >= len(tokens) or tokens[stop].word != "current_date":
+            return None
+        while stop + 1 < len(tokens) and not self._ends_operand(tokens, stop):
+            following = tokens[stop + 1]
+            if following.text not in ("+", "-") and following.kind not in ("number", "string") \
+                    and following.word not in ("interval", "day", "days"):
+                return None
+            stop += 1
+        if not self._ends_operand(tokens, stop):
+            return None
+        return stop, f"{column} {operator} {self.sql[tokens[end + 2].start:tokens[stop].end]}"
+
+    def _date_literal(self, tokens: List[Token], index: int) -> Optional[Tuple[date, int]]:
+        """Data literal ('2024-01-31', date '2024-01-31' ou '2024-01-31'::date) e o índice do último token"""
+        if index < len(tokens) and tokens[index].word == "date":
+            index += 1
+        if index >= len(tokens):
+            return None
+        match = DATE_LITERAL.fullmatch(tokens[index].text)
+        if tokens[index].kind != "string" or match is None:
+            return None
+        try:
+            day = date.fromisoformat(match.group(1))
+        except ValueError:
+            return None
+        if index + 2 < len(tokens) and tokens[index + 1].text == "::" and tokens[index + 2].word == "date":
+            index += 2
+        return day, index
+
+    @staticmethod
+    def _ends_operand(tokens: List[Token], index: int) -> bool:
+        """Se o operando termina em tokens[index] (fim da condição, and, or, then ou parêntese)"""
+        if index + 1 >= len(tokens):
+            return True
+        following = tokens[index + 1]
+        return following.text == ")" or following.word in ("and", "or", "then", "when", "else", "end") \
+            or following.text == ","
+
+    @staticmethod
+    def _grouped(tokens: List[Token], start: int, stop: int, text: str) -> str:
+        """Parênteses no intervalo, a menos que ele seja uma condição inteira ligada por and"""
+        before = tokens[start - 1].word if start else ""
+        after = tokens[stop + 1].word if stop + 1 < len(tokens) else ""
+        if before in ("", "and", "where", "on", "having") and after in ("", "and") and \
+                (not start or tokens[start - 1].depth == tokens[start].depth):
+            return text
+        return f"({text})"
+
+    # Período e filtros da classificação que a query não aplica
+
+    def _requested(self) -> Optional[Tuple[List[Edit], Dict]]:
+        filtered = self._filtered_columns()
+        for condition in self.requested:
+            column = condition["column"]
+            if column in filtered:
+                continue
+            edits, added = [], []
+            for block in self.blocks:
+                source = self._owner(block, column)
+                if source is None:
+                    continue
+                table = self._table(source)
+                if condition["code"] == "timeframe_added":
+                    if str(self.catalog.columns(table).get(column, "")).upper() not in TIME_TYPES:
+                        continue
+                    predicates = [f"{source.alias.lower()}.{column} {op} {value}" for op, value in condition["bounds"]]
+                else:
+                    try:
+                        operator, value = filter_condition(self.catalog, table, column, condition["filter"])
+                    except TemplateMiss:
+                        continue
+                    predicates = [f"{source.alias.lower()}.{column} {operator} {value}"]
+                block_edits = self._append_predicates(block, predicates)
+                if block_edits:
+                    edits += block_edits
+                    added.append({"table": table, "predicate": " and ".join(p.split(".", 1)[1] for p in predicates)})
+            if edits:
+                predicate = added[0]["predicate"]
+                kind = "Período" if condition["code"] == "timeframe_added" else "Filtro"
+                return edits, {
+                    "code": condition["code"],
+                    "column": column,
+                    "tables": added,
+                    "message": f"{kind} da classificação ({predicate}) adicionado em "
+                               f"{', '.join(sorted({a['table'] for a in added}))}"
+                }
+        return None
+
+    def _filtered_columns(self) -> Set[str]:
+        """Colunas citadas em alguma condição (where, on, having ou qualify) da query"""
+        names = set()
+        for block in self.blocks:
+            tokens = [t for name in ("where", "having", "qualify") for t in block.clauses.get(name, [])]
+            tokens += [t for source in block.sources for t in source.condition]
+            names.update(column for _, column, _ in column_refs(tokens))
+            names.update(column for source in block.sources for column in source.using)
+        return names
+
+    def _owner(self, block: SelectBlock, column: str) -> Optional[Source]:
+        """Tabela principal do select (a primeira do from), se ela tiver a coluna"""
+        if not block.sources or any(s.join not in INNER_JOINS | {"left join"} for s in block.sources):
+            return None
+        table = self._table(block.sources[0])
+        return block.sources[0] if table and column in self.catalog.columns(table) else None
+
+    # Colunas das CTEs que ninguém usa
+
+    def _prune(self) -> Optional[Tuple[List[Edit], Dict]]:
+        for cte in self.parsed.ctes:
+            removed = self._unused_items(cte)
+            if not removed:
+                continue
+            items = cte.items
+            kept = [i for i in range(len(items)) if i not in removed]
+            edits = []
+            for i in removed:
+                if i < kept[0]:
+                    continue
+                edits.append(Edit(items[i - 1][-1].end, items[i][-1].end))
+            if removed[0] == 0:
+                edits.append(Edit(items[0][0].start, items[kept[0]][0].start))
+            columns = [output_name(items[i]) for i in removed]
+            label = "Colunas {} removidas da CTE {} (não usadas" if len(columns) > 1 else \
+                "Coluna {} removida da CTE {} (não usada"
+            return edits, {
+                "code": "projection_pruned",
+                "cte": cte.name.lower(),
+                "columns": columns,
+                "message": label.format(", ".join(columns), cte.name.lower()) + " no restante da query)"
+            }
+        return None
+
+    def _unused_items(self, cte: SelectBlock) -> List[int]:
+        """Índices dos itens da CTE que nenhum select usa"""
+        if cte.unions or len(cte.items) < 2 or self._has_column_list(cte):
+            return []
+        select = cte.clauses.get("select", [])
+        if select and select[0].word == "distinct":
+            return []
+        for clause in ("group", "order"):
+            if any(len(part) == 1 and part[0].kind == "number" for part in split_tokens(cte.clauses.get(clause, [])[1:])):
+                return []
+        consumers = self._consumers(cte.name)
+        if not consumers or self._referenced(cte.name) != len(consumers):
+            return []
+
+        used = set()
+        for block, source in consumers:
+            for item in block.items:
+                if item[-1].text == "*" and (len(item) == 1 or item[0].name == source.alias):
+                    return []
+            used.update(t.name for t in block.tokens if t.is_identifier())
+
+        group_all = [t.word for t in cte.clauses.get("group", [])[1:2]] == ["all"]
+        aggregated = [i for i, item in enumerate(cte.items) if _is_aggregate(_expression(item))]
+        removed = []
+        for index, item in enumerate(cte.items):
+            name = output_name(item)
+            if name is None or name in used:
+                continue
+            if group_all and index not in aggregated:
+                continue
+            # Apelidos citados em outros itens ou nas demais cláusulas da própria CTE
+            others = [t for i, other in enumerate(cte.items) if i != index for t in other]
+            others += [t for clause, tokens in cte.clauses.items() if clause not in ("select", "from") for t in tokens]
+            others += [t for source in cte.sources for t in source.condition]
+            if any(alias is None and column == name for alias, column, _ in column_refs(others)):
+                continue
+            removed.append(index)
+
+        if len(removed) == len(cte.items):
+            removed = removed[1:]
+        # Sem group by, a query agregada precisa continuar agregada
+        if aggregated and "group" not in cte.clauses and all(i in removed for i in aggregated):
+            removed = [i for i in removed if i != aggregated[0]]
+        return removed
+
+    def _has_column_list(self, cte: SelectBlock) -> bool:
+        """Se a CTE declara a lista de colunas (with x (A, B) as (...)), que depende da ordem dos itens"""
+        position = next(i for i, token in enumerate(self.tokens) if token.start == cte.tokens[0].start)
+        if position and self.tokens[position - 1].text == "(":
+            position -= 1
+        while position and self.tokens[position - 1].word in ("as", "materialized", "not"):
+            position -= 1
+        return position > 0 and self.tokens[position - 1].text == ")"
@@ -0,0 +1,204 @@
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+import json
+import os
+import re
+import threading
+
+# Vocabulário BPE distribuído com o projeto (sem acesso à rede). TOKENIZER_PATH pode
+# apontar para o tokenizer.json do provedor (ex: DeepSeek) para contagens exatas.
+DEFAULT_TOKENIZER_PATH = os.path.join(os.path.dirname(__file__), "data", "bpe_tokenizer.json")
+
+# Pré-tokenização no estilo GPT: palavras com o espaço anterior, números de até 3
+# dígitos, pontuação e blocos de espaços
+PRETOKENIZE_PATTERN = re.compile(
+    r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"""
+)
+
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    """Mapeia cada byte para um caractere imprimível, como no BPE em nível de bytes do GPT-2"""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) \
+        + list(range(ord("®"), ord("ÿ") + 1))
+    chars = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            chars.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, (chr(c) for c in chars)))
+
+
+BYTE_ENCODER = _bytes_to_unicode()
+
+
+def _to_symbols(piece: str) -> Tuple[str, ...]:
+    return tuple(BYTE_ENCODER[b] for b in piece.encode("utf-8"))
+
+
+class BPETokenizer:
+    def __init__(self, merges: List[Tuple[str, str]], cache_size: int = 50000):
+        """Tokenizador BPE em nível de bytes
+
+        Args:
+            merges: Pares de símbolos na ordem de prioridade das fusões
+            cache_size: Quantidade de pedaços pré-tokenizados memorizados; prompts repetem
+                        quase todas as palavras, então a maior parte da contagem vira consulta
+        """
+        self.ranks = {pair: rank for rank, pair in enumerate(merges)}
+        self.cache_size = cache_size
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "BPETokenizer":
+        """Carrega as fusões de um tokenizer.json (formato Hugging Face, model.merges)"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        merges = data["model"]["merges"] if "model" in data else data["merges"]
+        return cls([tuple(m.split(" ", 1)) if isinstance(m, str) else tuple(m) for m in merges])
+
+    def _bpe(self, piece: str) -> Tuple[str, ...]:
+        cached = self._cache.get(piece)
+        if cached is not None:
+            return cached
+
+        symbols = list(_to_symbols(piece))
+        while len(symbols) > 1:
+            best = None
+            best_rank = None
+            for pair in zip(symbols, symbols[1:]):
+                rank = self.ranks.get(pair)
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best, best_rank = pair, rank
+            if best is None:
+                break
+            merged = []
+            i = 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and symbols[i] == best[0] and symbols[i + 1] == best[1]:
+                    merged.append(best[0] + best[1])
+                    i += 2
+                else:
+                    merged.append(symbols[i])
+                    i += 1
+            symbols = merged
+
+        result = tuple(symbols)
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[piece] = result
+        return result
+
+    def tokenize(self, text: str) -> List[str]:
+        """Retorna os tokens (em caracteres do mapeamento de bytes) do texto"""
+        tokens = []
+        for piece in PRETOKENIZE_PATTERN.findall(text):
+            tokens.extend(self._bpe(piece))
+        return tokens
+
+    def count(self, text: str) -> int:
+        return sum(len(self._bpe(piece)) for piece in PRETOKENIZE_PATTERN.findall(text))
+
+
+def train_merges(texts: Iterable[str], num_merges: int, min_frequency: int = 2) -> List[Tuple[str, str]]:
+    """Treina as fusões BPE a partir de um corpus
+
+    Args:
+        texts: Textos do corpus
+        num_merges: Número máximo de fusões
+        min_frequency: Frequência mínima de um par para virar fusão
+    """
+    words = Counter()
+    for text in texts:
+        words.update(PRETOKENIZE_PATTERN.findall(text))
+    corpus = [[list(_to_symbols(word)), freq] for word, freq in words.items()]
+
+    pair_counts = Counter()
+    pair_words = defaultdict(set)
+    for index, (symbols, freq) in enumerate(corpus):
+        for pair in zip(symbols, symbols[1:]):
+            pair_counts[pair] += freq
+            pair_words[pair].add(index)
+
+    merges = []
+    while len(merges) < num_merges and pair_counts:
+        best, count = max(pair_counts.items(), key=lambda item: (item[1], item[0]))
+        if count < min_frequency:
+            break
+        merges.append(best)
+        for index in list(pair_words.pop(best, ())):
+            symbols, freq = corpus[index]
+            for pair in zip(symbols, symbols[1:]):
+                pair_counts[pair] -= freq
+                if pair_counts[pair] <= 0:
+                    del pair_counts[pair]
+            merged = []
+            i = 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and (symbols[i], symbols[i + 1]) == best:
+                    merged.append(symbols[i] + symbols[i + 1])
+                    i += 2
+                else:
+                    merged.append(symbols[i])
+                    i += 1
+            corpus[index][0] = merged
+            for pair in zip(merged, merged[1:]):
+                pair_counts[pair] += freq
+                pair_words[pair].add(index)
+    return merges
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer() -> BPETokenizer:
+    """Tokenizador compartilhado, carregado na primeira contagem"""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = BPETokenizer.from_file(os.getenv("TOKENIZER_PATH") or DEFAULT_TOKENIZER_PATH)
+    return _tokenizer
+
+
+@lru_cache(maxsize=256)
+def count_tokens(text: str) -> int:
+    """Número de tokens BPE de um texto
+
+    Textos idênticos (templates de prompt, contexto de negócio) são contados uma única
+    vez; nos prompts montados, as palavras dos templates saem do cache de pedaços.
+    """
+    return get_tokenizer().count(text)
+
+
+if __name__ == "__main__":
+    # Regenera o vocabulário distribuído a partir dos prompts, do contexto de negócio e da documentação
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Treina o vocabulário BPE distribuído com o projeto")
+    parser.add_argument("--merges", type=int, default=8000)
+    parser.add_argument("--output", default=DEFAULT_TOKENIZER_PATH)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    paths = [
+        os.path.join(root, "src", "agent", "sql_agent.py"),
+        os.path.join(root, "src", "config", "contexts.yaml"),
+        os.path.join(root, "README.md"),
+    ]
+    corpus = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            corpus.append(f.read())
+
+    merges = train_merges(corpus, args.merges)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"model": {"type": "BPE", "merges": [" ".join(pair) for pair in merges]}},
+                  f, ensure_ascii=False, indent=0)
+    print(f"{len(merges)} fusões gravadas em {args.output}")
@@ -1,9 +1,11 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, List, Any
+import asyncio
 import os
-from src.agent.sql_agent import SQLQueryAgent
+import json
 import logging
 import time
 from dotenv import load_dotenv
@@ -36,10 +38,79 @@ load_dotenv()
 # Obter a chave API do ambiente ou usar um valor padrão para desenvolvimento
 API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 
+# Provedor de LLM: deepseek, stub (sem rede), record (DeepSeek gravando as respostas)
+# ou replay (reproduz as respostas gravadas em LLM_RECORDING_PATH, sem rede)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "deepseek")
+LLM_RECORDING_PATH = os.getenv("LLM_RECORDING_PATH", "llm_recordings.jsonl")
+
+# Cliente HTTP compartilhado das chamadas ao LLM: pool com keep-alive, timeouts por
+# estágio ("classifier=15,expert=45"), novas tentativas com backoff e hedge opcional
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_STAGE_TIMEOUTS = os.getenv("LLM_STAGE_TIMEOUTS", "")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "0")) or None
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+
+# Configuração do cache de respostas (QUERY_CACHE_PATH ativa a camada em disco)
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "512"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH") or None
+
+# Envia aos especialistas apenas as tabelas e colunas relevantes (false = contexto completo)
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "true").lower() in ("1", "true", "yes")
+
+# Confiança mínima para classificar sem LLM (vazio mantém o LLM sempre, medindo só a concordância)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8") or "inf")
+
+# Modo padrão do pipeline: staged (3 chamadas), merged (2) ou single (1)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
+
+# Limites do endpoint /query/batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+# Conversas usadas no refinamento (CONVERSATION_STORE_PATH compartilha entre os workers via SQLite)
+CONVERSATION_STORE_PATH = os.getenv("CONVERSATION_STORE_PATH") or None
+CONVERSATION_MAX_ENTRIES = int(os.getenv("CONVERSATION_MAX_ENTRIES", "10000"))
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", "3600"))
+CONVERSATION_MAX_MEMORY_MB = float(os.getenv("CONVERSATION_MAX_MEMORY_MB", "64"))
+
+# Perguntas idênticas em andamento aguardam a mesma execução do pipeline
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+# Gera o especialista com o palpite do classificador local em paralelo à classificação
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() in ("1", "true", "yes")
+
+# Gera sem LLM a query das perguntas cobertas pelos templates de métricas
+METRIC_TEMPLATES = os.getenv("METRIC_TEMPLATES", "true").lower() in ("1", "true", "yes")
+
+# Nota de risco e avisos de custo das queries geradas (campo lint das respostas)
+SQL_LINT = os.getenv("SQL_LINT", "true").lower() in ("1", "true", "yes")
+
+# Reescrita das queries geradas: filtros e período nas CTEs, intervalos de data e colunas não usadas
+SQL_REWRITE = os.getenv("SQL_REWRITE", "true").lower() in ("1", "true", "yes")
+
+# Tempo máximo que uma requisição aguarda o agente terminar de inicializar
+AGENT_STARTUP_WAIT_SECONDS = float(os.getenv("AGENT_STARTUP_WAIT_SECONDS", "30"))
+
+# Arquivo SQLite da memória de aprendizado, compartilhado entre os workers
+LEARNING_MEMORY_PATH = os.getenv("LEARNING_MEMORY_PATH", "learning_memory.db")
+
 # Modelos Pydantic
 class QueryRequest(BaseModel):
     question: str
     conversation_id: Optional[str] = None
+    pipeline_mode: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    pipeline_mode: Optional[str] = None
+    concurrency: Optional[int] = None
 
 class RefinementRequest(BaseModel):
     feedback: str
@@ -49,13 +120,138 @@ class TokenTestRequest(BaseModel):
     text: str
 
 # Instanciar o agente SQL
-@app.on_event("startup")
-async def startup_event():
-    if not API_KEY:
+def build_agent():
+    """Cria o agente com a configuração do ambiente
+
+    As dependências pesadas (agente, provedor, langchain) são importadas aqui, fora do
+    carregamento do módulo, para que o processo aceite conexões o quanto antes.
+    """
+    from src.agent.sql_agent import SQLQueryAgent
+    from src.agent.query_cache import QueryCache
+    from src.agent.conversation_store import InMemoryConversationStore, SQLiteConversationStore
+    from src.agent.providers import create_provider
+    from src.agent.http_client import PoolSettings, RetryPolicy, parse_stage_timeouts
+
+    if not API_KEY and LLM_PROVIDER in ("deepseek", "record"):
         logger.warning("API_KEY não configurada. A API funcionará em modo de demonstração.")
     
-    app.state.sql_agent = SQLQueryAgent(api_key=API_KEY)
-    logger.info("Agente SQL inicializado com sucesso.")
+    policy = RetryPolicy(
+        max_retries=LLM_MAX_RETRIES,
+        backoff_base=LLM_BACKOFF_BASE_SECONDS,
+        backoff_max=LLM_BACKOFF_MAX_SECONDS,
+        default_timeout=LLM_TIMEOUT_SECONDS,
+        stage_timeouts=parse_stage_timeouts(LLM_STAGE_TIMEOUTS),
+        hedge=LLM_HEDGE,
+        hedge_delay=LLM_HEDGE_DELAY_SECONDS
+    )
+    pool = PoolSettings(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+    )
+    provider = create_provider(
+        LLM_PROVIDER,
+        api_key=API_KEY,
+        recording_path=LLM_RECORDING_PATH,
+        base_url=LLM_BASE_URL,
+        policy=policy,
+        pool=pool
+    )
+    logger.info(f"Provedor de LLM: {LLM_PROVIDER}")
+    
+    query_cache = QueryCache(
+        max_entries=QUERY_CACHE_MAX_ENTRIES,
+        ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+        disk_path=QUERY_CACHE_PATH
+    )
+    if CONVERSATION_STORE_PATH:
+        conversation_store = SQLiteConversationStore(
+            path=CONVERSATION_STORE_PATH,
+            max_conversations=CONVERSATION_MAX_ENTRIES,
+            ttl_seconds=CONVERSATION_TTL_SECONDS
+        )
+    else:
+        conversation_store = InMemoryConversationStore(
+            max_conversations=CONVERSATION_MAX_ENTRIES,
+            ttl_seconds=CONVERSATION_TTL_SECONDS,
+            max_memory_bytes=int(CONVERSATION_MAX_MEMORY_MB * 1024 * 1024)
+        )
+    return SQLQueryAgent(
+        api_key=API_KEY,
+        llm=provider,
+        query_cache=query_cache,
+        learning_memory_path=LEARNING_MEMORY_PATH,
+        schema_pruning=SCHEMA_PRUNING,
+        local_classifier_threshold=LOCAL_CLASSIFIER_THRESHOLD,
+        pipeline_mode=PIPELINE_MODE,
+        conversation_store=conversation_store,
+        coalesce_requests=COALESCE_REQUESTS,
+        speculative_generation=SPECULATIVE_GENERATION,
+        metric_templates=METRIC_TEMPLATES,
+        sql_lint=SQL_LINT,
+        sql_rewrite=SQL_REWRITE
+    )
+
+def warm_up_agent(agent):
+    """Deixa o agente pronto para a primeira pergunta: contexto, classificador, tokenizador e cliente do LLM"""
+    from src.agent.tokens import get_tokenizer
+
+    agent._warm_up()
+    get_tokenizer()
+    agent.llm.warm_up()
+
+async def initialize_agent():
+    """Cria e aquece o agente em uma thread, sem bloquear o event loop"""
+    started_at = time.perf_counter()
+    try:
+        agent = await asyncio.to_thread(build_agent)
+        built_at = time.perf_counter()
+        await asyncio.to_thread(warm_up_agent, agent)
+    except Exception as e:
+        logger.error(f"Erro ao inicializar o agente SQL: {str(e)}")
+        app.state.startup_error = str(e)
+    else:
+        finished_at = time.perf_counter()
+        app.state.sql_agent = agent
+        app.state.startup = {
+            "build_seconds": round(built_at - started_at, 4),
+            "warm_up_seconds": round(finished_at - built_at, 4),
+            "startup_seconds": round(finished_at - started_at, 4)
+        }
+        logger.info(f"Agente SQL inicializado com sucesso em {app.state.startup['startup_seconds']}s.")
+    finally:
+        app.state.agent_ready.set()
+
+@app.on_event("startup")
+async def startup_event():
+    app.state.agent_ready = asyncio.Event()
+    app.state.startup_task = asyncio.create_task(initialize_agent())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from src.agent.http_client import aclose_http_clients
+
+    app.state.startup_task.cancel()
+    await aclose_http_clients()
+
+async def get_agent():
+    """Agente inicializado; durante a inicialização, aguarda até AGENT_STARTUP_WAIT_SECONDS"""
+    agent = getattr(app.state, "sql_agent", None)
+    if agent is not None:
+        return agent
+    ready = getattr(app.state, "agent_ready", None)
+    if ready is not None:
+        try:
+            await asyncio.wait_for(ready.wait(), AGENT_STARTUP_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        agent = getattr(app.state, "sql_agent", None)
+        if agent is not None:
+            return agent
+    error = getattr(app.state, "startup_error", None)
+    raise HTTPException(
+        status_code=503,
+        detail=f"Falha ao inicializar o agente SQL: {error}" if error else "Agente SQL em inicialização. Tente novamente em instantes."
+    )
 
 # Endpoints
 @app.get("/")
@@ -63,24 +259,33 @@ async def root():
     """Endpoint de verificação para garantir que a API está funcionando"""
     return {"message": "SQL AI Chatbot API está ativa!"}
 
+@app.get("/ready")
+async def ready():
+    """Prontidão: 200 quando o agente está carregado e aquecido, 503 durante a inicialização"""
+    if getattr(app.state, "sql_agent", None) is not None:
+        return {"status": "ready", **getattr(app.state, "startup", {})}
+    error = getattr(app.state, "startup_error", None)
+    return JSONResponse(
+        status_code=503,
+        content={"status": "failed", "error": error} if error else {"status": "starting"}
+    )
+
 @app.post("/query")
-async def generate_query(request: QueryRequest):
+async def generate_query(request: QueryRequest, sql_agent=Depends(get_agent)):
     """Gerar uma consulta SQL a partir de uma pergunta em linguagem natural"""
     start_time = time.time()
     logger.info(f"Processando pergunta: {request.question}")
     
     try:
-        # Acesso ao agente inicializado durante o startup
-        sql_agent = app.state.sql_agent
-        
-        # Gerar a query SQL
-        result = sql_agent.query(
+        # Gerar a query SQL sem bloquear o event loop
+        result = await sql_agent.aquery(
             question=request.question,
-            conversation_id=request.conversation_id
+            conversation_id=request.conversation_id,
+            pipeline_mode=request.pipeline_mode
         )
         
         processing_time = round(time.time() - start_time, 2)
-        logger.info(f"Query gerada em {processing_time}s")
+        logger.info(f"Query gerada em {processing_time}s (cache: {result.get('cache', 'miss')})")
         
         # Adicionar o tempo de processamento ao resultado
         result["processing_time"] = processing_time
@@ -94,18 +299,84 @@ async def generate_query(request: QueryRequest):
             detail=f"Erro ao processar a requisição: {str(e)}"
         )
 
+@app.post("/query/stream")
+async def generate_query_stream(request: QueryRequest, sql_agent=Depends(get_agent)):
+    """Gerar uma consulta SQL transmitindo os estágios do pipeline via Server-Sent Events
+
+    Eventos: classified, expert_sql, token (saída do consolidador) e done, com a mesma
+    resposta de /query, ou error.
+    """
+    logger.info(f"Processando pergunta (stream): {request.question}")
+
+    async def event_stream():
+        start_time = time.time()
+        try:
+            async for event in sql_agent.astream_query(
+                question=request.question,
+                conversation_id=request.conversation_id,
+                pipeline_mode=request.pipeline_mode
+            ):
+                name = event.pop("event")
+                if name == "done":
+                    processing_time = round(time.time() - start_time, 2)
+                    event["result"]["processing_time"] = processing_time
+                    logger.info(f"Query gerada em {processing_time}s (stream, cache: {event['result'].get('cache', 'miss')})")
+                yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"Erro ao gerar query (stream): {str(e)}")
+            message = json.dumps({"message": f"Erro ao processar a requisição: {str(e)}"}, ensure_ascii=False)
+            yield f"event: error\ndata: {message}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch")
+async def generate_query_batch(request: BatchQueryRequest, sql_agent=Depends(get_agent)):
+    """Gerar consultas SQL para uma lista de perguntas
+
+    Perguntas idênticas são processadas uma única vez e os resultados são
+    transmitidos em NDJSON (uma linha por pergunta) à medida que ficam prontos.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma pergunta.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"O lote aceita no máximo {BATCH_MAX_QUESTIONS} perguntas."
+        )
+
+    concurrency = min(request.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    logger.info(f"Processando lote de {len(request.questions)} perguntas (concorrência {concurrency})")
+
+    async def result_stream():
+        start_time = time.time()
+        try:
+            async for item in sql_agent.abatch_query(
+                request.questions,
+                pipeline_mode=request.pipeline_mode,
+                concurrency=concurrency
+            ):
+                item["processing_time"] = round(time.time() - start_time, 2)
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            logger.info(f"Lote processado em {round(time.time() - start_time, 2)}s")
+        except Exception as e:
+            logger.error(f"Erro ao processar lote: {str(e)}")
+            yield json.dumps({"status": "error", "message": f"Erro ao processar o lote: {str(e)}"}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @app.post("/refine")
-async def refine_query(request: RefinementRequest):
+async def refine_query(request: RefinementRequest, sql_agent=Depends(get_agent)):
     """Refinar uma consulta SQL existente com base no feedback do usuário"""
     start_time = time.time()
     logger.info(f"Refinando consulta com feedback: {request.feedback}")
     
     try:
-        # Acesso ao agente inicializado durante o startup
-        sql_agent = app.state.sql_agent
-        
-        # Refinar a query
-        result = sql_agent.refine_query(
+        # Refinar a query sem bloquear o event loop
+        result = await sql_agent.arefine_query(
             feedback=request.feedback,
             conversation_id=request.conversation_id
         )
@@ -125,18 +396,54 @@ async def refine_query(request: RefinementRequest):
             detail=f"Erro ao processar a requisição: {str(e)}"
         )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(sql_agent=Depends(get_agent)):
+    """Histogramas de latência e tokens por estágio e contadores de cache e fallback (formato Prometheus)"""
+    return PlainTextResponse(
+        sql_agent.metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/cache/stats")
+async def cache_stats(sql_agent=Depends(get_agent)):
+    """Estatísticas do cache de respostas (hits, misses e taxa de acerto)"""
+    return sql_agent.query_cache.stats()
+
+@app.get("/conversations/stats")
+async def conversation_stats(sql_agent=Depends(get_agent)):
+    """Conversas armazenadas, limites e despejos do armazenamento de conversas"""
+    return sql_agent.conversations.stats()
+
+@app.get("/llm/stats")
+async def llm_stats(sql_agent=Depends(get_agent)):
+    """Provedor de LLM em uso, novas tentativas e hedges das chamadas"""
+    return sql_agent.llm.stats()
+
+@app.get("/classifier/stats")
+async def classifier_stats(sql_agent=Depends(get_agent)):
+    """Taxa de uso do classificador local e concordância com o classificador LLM"""
+    return sql_agent.local_classifier.stats.snapshot()
+
+@app.get("/context/stats")
+async def context_stats(sql_agent=Depends(get_agent)):
+    """Versão do catálogo do contexts.yaml em uso (recarregado quando o arquivo muda)"""
+    await asyncio.to_thread(sql_agent.business_context.reload_if_changed)
+    return sql_agent.business_context.catalog.stats()
+
 @app.post("/token-usage")
 async def check_token_usage(request: TokenTestRequest):
     """Verificar o consumo de tokens para um determinado texto"""
+    from src.agent.tokens import count_tokens
+
     try:
-        input_tokens = len(request.text.split())
+        input_tokens = count_tokens(request.text)
         estimated_cost = (input_tokens / 1000) * 0.00144 # Atribuindo (0.0007 / 1k tokens de input + 0.0027 / 1k tokens de input (cache miss) + 0.0110 / 1k tokens de output)
         
         return {
             "status": "success",
             "token_count": input_tokens,
             "estimated_input_cost": f"${estimated_cost:.6f}",
-            "message": f"Estimativa para {input_tokens} tokens (palavras). Custos reais podem variar."
+            "message": f"Estimativa para {input_tokens} tokens (BPE). Custos reais podem variar."
         }
     except Exception as e:
         logger.error(f"Erro ao calcular uso de tokens: {str(e)}")
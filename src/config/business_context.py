@@ -1,35 +1,203 @@
-from typing import Dict, List
-import yaml
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
 import os
+import threading
+
+from src.config.schema_catalog import SchemaCatalog
+
+
+def _parse_yaml(text: str):
+    """Lê o YAML com o parser em C (libyaml) quando disponível"""
+    import yaml
+
+    return yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+def table_aliases(tables: List[str]) -> Dict[str, str]:
+    """Apelidos curtos e únicos a partir do nome da tabela (ORDERS -> o, SUPPLIERS -> su)"""
+    aliases = {}
+    used = set()
+    for table in tables:
+        name = table.split(".")[-1].lower()
+        candidates = [name[:size] for size in range(1, len(name) + 1)]
+        alias = next((c for c in candidates if c not in used), None)
+        suffix = 2
+        while alias is None or alias in used:
+            alias = f"{name[0]}{suffix}"
+            suffix += 1
+        aliases[table] = alias
+        used.add(alias)
+    return aliases
+
+# Catálogo fixado pela pergunta em andamento; cada tarefa asyncio ou thread enxerga o seu
+_pinned_catalog: ContextVar[Optional[Tuple["BusinessContext", SchemaCatalog]]] = ContextVar(
+    "business_context_catalog", default=None
+)
 
 class BusinessContext:
-    def __init__(self, config_path: str = None):
+    def __init__(self, config_path: str = None, snapshot_path: str = None):
         """Inicializa o contexto de negócio
         
         Args:
             config_path: Caminho para o arquivo de configuração YAML. Se não fornecido,
                         usa o arquivo padrão em config/contexts.yaml
+            snapshot_path: Cópia pré-compilada (JSON) dos contextos, usada enquanto o hash
+                           do YAML não mudar; padrão: CONTEXT_SNAPSHOT_PATH, se definido
         """
-        self.contexts = {}
+        self.snapshot_path = snapshot_path or os.getenv("CONTEXT_SNAPSHOT_PATH") or None
+        self.catalog = SchemaCatalog({})
+        self.mtime = None
+        self._reload_lock = threading.Lock()
         self.config_path = config_path or os.path.join(
             os.path.dirname(__file__), 
             'contexts.yaml'
         )
         self.load_contexts()
     
+    @property
+    def contexts(self) -> Dict:
+        return self.current().contexts
+    
+    @property
+    def content_hash(self) -> str:
+        return self.current().content_hash
+    
+    def current(self) -> SchemaCatalog:
+        """Catálogo fixado pela pergunta em andamento ou, fora de uma pergunta, o mais recente"""
+        if self.is_pinned():
+            return _pinned_catalog.get()[1]
+        return self.catalog
+    
+    def is_pinned(self) -> bool:
+        """Se há uma pergunta em andamento com uma versão do catálogo fixada (ver pin)"""
+        pinned = _pinned_catalog.get()
+        return pinned is not None and pinned[0] is self
+    
+    @contextmanager
+    def pin(self, reload: bool = True):
+        """Fixa a versão atual do catálogo para a pergunta em andamento
+        
+        Recarrega o arquivo se ele mudou e, até o fim do bloco, todas as consultas
+        (prompts, seleção de esquema, classificador) usam a mesma versão, mesmo que o
+        arquivo seja recarregado por outra pergunta nesse meio tempo.
+        
+        Args:
+            reload: False quando o arquivo acabou de ser conferido fora do event loop
+        """
+        if reload:
+            self.reload_if_changed()
+        catalog = self.catalog
+        token = _pinned_catalog.set((self, catalog))
+        try:
+            yield catalog
+        finally:
+            try:
+                _pinned_catalog.reset(token)
+            except ValueError:
+                # Gerador de streaming encerrado em outro contexto
+                _pinned_catalog.set(None)
+    
     def load_contexts(self):
-        """Carrega os contextos do arquivo YAML"""
+        """Carrega os contextos do arquivo YAML
+        
+        A nova versão é compilada por inteiro antes de substituir a anterior em uma
+        única atribuição; um arquivo inválido (ex: salvo pela metade) mantém a versão
+        em uso.
+        """
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                self.contexts = yaml.safe_load(f)
+            # mtime antes da leitura: uma gravação no meio dela é vista na próxima verificação
+            mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, 'rb') as f:
+                raw = f.read()
         except FileNotFoundError:
             print(f"Arquivo de configuração não encontrado: {self.config_path}")
-            self.contexts = {}
+            self.catalog = SchemaCatalog({}, "", self.catalog.version + 1)
+            self.mtime = None
+            return
+        
+        content_hash = hashlib.sha256(raw).hexdigest()
+        self.mtime = mtime
+        if content_hash == self.catalog.content_hash:
+            return
+        
+        contexts = self._load_snapshot(content_hash)
+        if contexts is None:
+            try:
+                contexts = _parse_yaml(raw.decode('utf-8'))
+            except Exception as e:
+                if not self.catalog.version:
+                    raise
+                print(f"Erro ao recarregar {self.config_path}, mantendo a versão {self.catalog.version}: {str(e)}")
+                return
+            self._write_snapshot(content_hash, contexts)
+        self.catalog = SchemaCatalog(contexts or {}, content_hash, self.catalog.version + 1)
+        for context_name, relationships in self.catalog.invalid_joins.items():
+            for rel in relationships:
+                print(f"Relacionamento inválido em {context_name} ({' x '.join(rel['tables'])}): "
+                      f"{', '.join(rel['missing']) or 'sem join_keys'}; fica fora dos joins prontos")
+    
+    def _load_snapshot(self, content_hash: str):
+        """Contextos da cópia pré-compilada, ou None se ela não existir ou for de outra versão"""
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get("content_hash") != content_hash:
+            return None
+        return snapshot.get("contexts")
     
-    def save_contexts(self):
-        """Salva os contextos atuais no arquivo YAML"""
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            yaml.dump(self.contexts, f, allow_unicode=True, sort_keys=False)
+    def _write_snapshot(self, content_hash: str, contexts: Dict):
+        """Grava a cópia pré-compilada; contextos com tipos fora do JSON não são gravados"""
+        if not self.snapshot_path:
+            return
+        try:
+            if json.loads(json.dumps(contexts)) != contexts:
+                return
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"content_hash": content_hash, "contexts": contexts}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Não foi possível gravar o snapshot dos contextos: {str(e)}")
+    
+    def reload_if_changed(self) -> bool:
+        """Recarrega os contextos se o arquivo YAML mudou desde a última leitura
+        
+        Compara primeiro o mtime (barato) e só então o hash do conteúdo.
+        
+        Returns:
+            True se o conteúdo mudou e os contextos foram recarregados
+        """
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        
+        with self._reload_lock:
+            if mtime == self.mtime:
+                return False
+            previous_version = self.catalog.version
+            self.load_contexts()
+            return self.catalog.version != previous_version
+    
+    def save_contexts(self, contexts: Dict = None):
+        """Salva os contextos no arquivo YAML (padrão: os da versão atual) e recarrega"""
+        import yaml
+
+        with self._reload_lock:
+            tmp_path = f"{self.config_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(self.catalog.contexts if contexts is None else contexts, f,
+                          allow_unicode=True, sort_keys=False)
+            os.replace(tmp_path, self.config_path)
+            self.load_contexts()
     
     def add_context(self, name: str, description: str, tables: Dict[str, Dict], 
                     relationships: List[str], metrics: Dict[str, str]):
@@ -42,52 +210,180 @@ class BusinessContext:
             relationships: Lista de relacionamentos importantes
             metrics: Dicionário de métricas e suas descrições
         """
-        self.contexts[name] = {
+        # Os contextos de uma versão não são alterados: a nova versão parte de uma cópia
+        contexts = dict(self.catalog.contexts)
+        contexts[name] = {
             'description': description,
             'tables': tables,
             'relationships': relationships,
             'aggregation_fields': metrics
         }
-        self.save_contexts()
+        self.save_contexts(contexts)
     
     def get_context(self, name: str) -> Dict:
         """Retorna um contexto específico"""
-        return self.contexts.get(name, {})
+        return self.current().contexts.get(name, {})
     
     def get_all_contexts(self) -> Dict:
         """Retorna todos os contextos cadastrados"""
-        return self.contexts
-    
-    def format_for_prompt(self) -> str:
-        """Formata todos os contextos para uso no prompt do LLM"""
-        prompt = "CONTEXTO DE NEGÓCIOS:\n\n"
-        
-        for name, context in self.contexts.items():
-            prompt += f"=== {name} ===\n"
-            prompt += f"Descrição: {context['description']}\n"
-            prompt += "\nTabelas Relevantes:\n"
-            for table_name, table_info in context['tables'].items():
-                prompt += f"- {table_name}\n"
-                prompt += f"  Descrição: {table_info['description']}\n"
-                if 'primary_key' in table_info:
-                    prompt += f"  Chave Primária: {table_info['primary_key']}\n"
-                prompt += "  Colunas:\n"
-                for col, desc in table_info['columns'].items():
-                    prompt += f"    * {col}: {desc}\n"
+        return self.current().contexts
+    
+    def format_for_prompt(self, context_name: str = None) -> str:
+        """Formata os contextos para uso no prompt do LLM
+        
+        O texto é compilado uma vez por versão do contexts.yaml e memorizado por
+        contexto; chamadas seguintes são apenas uma consulta ao dicionário.
+        
+        Args:
+            context_name: Nome de um contexto específico. Se não fornecido, formata todos
+        """
+        # Com a versão fixada pela pergunta, recarregar não mudaria o texto
+        if not self.is_pinned():
+            self.reload_if_changed()
+        catalog = self.current()
+        prompt = catalog.prompts.get(context_name)
+        if prompt is None:
+            prompt = self._compile_prompt(catalog.contexts, context_name)
+            catalog.prompts[context_name] = prompt
+        return prompt
+    
+    def _compile_prompt(self, contexts: Dict, context_name: str = None) -> str:
+        """Monta o texto do prompt para um contexto ou para todos"""
+        if context_name is None:
+            names = list(contexts)
+        else:
+            names = [context_name] if context_name in contexts else []
+        
+        parts = ["CONTEXTO DE NEGÓCIOS:\n\n"]
+        parts.extend(self._format_context(name, contexts[name]) for name in names)
+        return "".join(parts)
+    
+    def format_selection_for_prompt(self, selection: Dict[str, Dict[str, List[str]]],
+                                    metrics: List[str] = None, joins: Dict[str, Dict] = None) -> str:
+        """Formata apenas as tabelas e colunas selecionadas para o prompt do LLM
+        
+        Args:
+            selection: Dicionário contexto -> tabela -> colunas a incluir
+            metrics: Métricas a incluir; se não fornecido, inclui todas dos contextos selecionados
+            joins: Dicionário contexto -> {"anchor", "plan"} (ver SchemaCatalog.join_plan); os
+                   joins entram prontos no lugar dos relacionamentos do contexto
+        """
+        # Com a versão fixada pela pergunta, recarregar não mudaria o texto
+        if not self.is_pinned():
+            self.reload_if_changed()
+        catalog = self.current()
+        joins = joins or {}
+        cache_key = (
+            tuple((name, tuple((t, tuple(cols)) for t, cols in tables.items()))
+                  for name, tables in selection.items()),
+            tuple(metrics or ()),
+            tuple((name, entry["anchor"]) for name, entry in joins.items())
+        )
+        prompt = catalog.prompts.get(cache_key)
+        if prompt is not None:
+            return prompt
+        
+        parts = ["CONTEXTO DE NEGÓCIOS:\n\n"]
+        for name, tables in selection.items():
+            context = catalog.contexts.get(name)
+            if not context:
+                continue
             
-            prompt += "\nRelacionamentos Importantes:\n"
-            for rel in context['relationships']:
-                prompt += f"- {rel}\n"
+            pruned_tables = {}
+            for table_name, columns in tables.items():
+                table_info = context['tables'][table_name]
+                pruned_tables[table_name] = dict(table_info, columns={
+                    col: desc for col, desc in table_info['columns'].items() if col in columns
+                })
             
-            prompt += "\nMétricas Disponíveis:\n"
-            for metric_key, metric_info in context['aggregation_fields'].items():
-                if isinstance(metric_info, dict):
-                    prompt += f"- {metric_info.get('display_name', metric_key)}: {metric_info.get('description', '')}\n"
-                else:
-                    prompt += f"- {metric_key}: {metric_info}\n"
-            prompt += "\n"
-        
-        return prompt 
+            pruned_metrics = {
+                key: info for key, info in context['aggregation_fields'].items()
+                if not metrics or key in metrics
+            }
+            join_lines = None
+            if name in joins:
+                # Relacionamentos em texto livre continuam; os estruturados viram os joins prontos,
+                # exceto os inválidos, que seguem como texto com o aviso das colunas que faltam
+                pruned_relationships = [rel for rel in context['relationships'] if not isinstance(rel, dict)]
+                pruned_relationships.extend(
+                    self._format_invalid_join(rel) for rel in catalog.invalid_joins.get(name, [])
+                    if all(t in tables for t in rel['tables'])
+                )
+                join_lines = self._format_joins(joins[name]["anchor"], joins[name]["plan"])
+            else:
+                pruned_relationships = [
+                    rel for rel in context['relationships']
+                    if not isinstance(rel, dict) or all(t in tables for t in rel.get('tables', []))
+                ]
+            
+            parts.append(self._format_context(name, dict(
+                context,
+                tables=pruned_tables,
+                relationships=pruned_relationships,
+                aggregation_fields=pruned_metrics or context['aggregation_fields']
+            ), join_lines))
+        
+        prompt = "".join(parts)
+        catalog.prompts[cache_key] = prompt
+        return prompt
+    
+    def _format_joins(self, anchor: str, plan: List[Dict]) -> List[str]:
+        """Cláusulas from/join prontas para o plano de joins, com apelidos curtos
+        
+        Sem joins (uma única tabela), não há o que informar além das tabelas.
+        """
+        if not plan:
+            return []
+        aliases = table_aliases([anchor] + [join["right"] for join in plan])
+        lines = [f"from {anchor} {aliases[anchor]}"]
+        for join in plan:
+            left, right = aliases[join["left"]], aliases[join["right"]]
+            condition = " and ".join(f"{left}.{key} = {right}.{key}" for key in join["join_keys"])
+            lines.append(f"join {join['right']} {right} on {condition}")
+        return lines
+    
+    def _format_invalid_join(self, rel: Dict) -> str:
+        """Relacionamento fora do grafo de joins, como texto livre com as colunas que faltam"""
+        left, right = rel['tables']
+        keys = ", ".join(rel['join_keys']) or "nenhuma"
+        missing = ", ".join(rel['missing']) or "join_keys vazias"
+        return (f"{left} e {right} (join_keys declaradas: {keys}; não existem: {missing}) - "
+                f"ligue as tabelas apenas pelas colunas que existem nas duas")
+    
+    def _format_context(self, name: str, context: Dict, join_lines: List[str] = None) -> str:
+        """Formata um único contexto com tabelas, relacionamentos (ou joins prontos) e métricas"""
+        lines = [
+            f"=== {name} ===",
+            f"Descrição: {context['description']}",
+            "",
+            "Tabelas Relevantes:"
+        ]
+        for table_name, table_info in context['tables'].items():
+            lines.append(f"- {table_name}")
+            lines.append(f"  Descrição: {table_info['description']}")
+            if 'primary_key' in table_info:
+                lines.append(f"  Chave Primária: {table_info['primary_key']}")
+            lines.append("  Colunas:")
+            lines.extend(f"    * {col}: {desc}" for col, desc in table_info['columns'].items())
+        
+        if join_lines is None or context['relationships']:
+            lines.append("")
+            lines.append("Relacionamentos Importantes:")
+            lines.extend(f"- {rel}" for rel in context['relationships'])
+        if join_lines:
+            lines.append("")
+            lines.append("Joins Necessários (use exatamente estes):")
+            lines.extend(join_lines)
+        
+        lines.append("")
+        lines.append("Métricas Disponíveis:")
+        for metric_key, metric_info in context['aggregation_fields'].items():
+            if isinstance(metric_info, dict):
+                lines.append(f"- {metric_info.get('display_name', metric_key)}: {metric_info.get('description', '')}")
+            else:
+                lines.append(f"- {metric_key}: {metric_info}")
+        
+        return "\n".join(lines) + "\n\n"
     
     def format_metrics_for_display(self, context_name: str) -> List[Dict]:
         """Formata as métricas para exibição na interface
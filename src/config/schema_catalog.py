@@ -0,0 +1,207 @@
+from collections import deque
+from typing import Dict, List, Optional
+import time
+
+
+class SchemaCatalog:
+    def __init__(self, contexts: Dict, content_hash: str = "", version: int = 0):
+        """Versão compilada e imutável do contexts.yaml
+
+        Monta uma única vez os índices consultados a cada pergunta: tabela -> definição,
+        coluna -> tabelas, métrica -> definição e contexto -> tabelas, além do grafo de
+        joins de cada contexto (relationships com join_keys) e dos menores caminhos
+        entre suas tabelas. Relacionamentos com alguma join_key que não é coluna das
+        duas tabelas ficam fora do grafo, em invalid_joins. Uma tabela declarada em
+        mais de um contexto (ex: PRODUCTS em Vendas e Produtos) aparece uma só vez no
+        índice, com a união das colunas. Os textos de prompt compilados também
+        pertencem à versão: quem recebeu o catálogo continua com ele, mesmo que o
+        arquivo seja recarregado no meio da pergunta.
+
+        Args:
+            contexts: Contextos como lidos do YAML (não devem ser alterados depois)
+            content_hash: Hash do conteúdo do arquivo que gerou a versão
+            version: Número sequencial da versão no processo
+        """
+        self.contexts = contexts or {}
+        self.content_hash = content_hash
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.tables: Dict[str, Dict] = {}
+        self.column_tables: Dict[str, List[str]] = {}
+        self.metrics: Dict[str, Dict] = {}
+        self.context_tables: Dict[str, List[str]] = {}
+        self.context_columns: Dict[str, frozenset] = {}
+        self.duplicated_tables: Dict[str, List[str]] = {}
+        # Contexto -> tabela -> tabela vizinha -> join_keys
+        self.join_graphs: Dict[str, Dict[str, Dict[str, List[str]]]] = {}
+        # Contexto -> tabela de origem -> tabela -> antecessora no menor caminho (busca em largura)
+        self._join_parents: Dict[str, Dict[str, Dict[str, Optional[str]]]] = {}
+        self._join_plans: Dict = {}
+        # Contexto -> relacionamentos fora do grafo, com as colunas que faltam ("TABELA.COLUNA")
+        self.invalid_joins: Dict[str, List[Dict]] = {}
+
+        # Textos de prompt compilados desta versão (ver BusinessContext.format_for_prompt)
+        self.prompts: Dict = {}
+        self._compile()
+
+    def _compile(self):
+        for context_name, context in self.contexts.items():
+            tables = context.get('tables') or {}
+            self.context_tables[context_name] = list(tables)
+            self.context_columns[context_name] = frozenset(
+                col for info in tables.values() for col in (info.get('columns') or {})
+            )
+            for table_name, info in tables.items():
+                self._add_table(context_name, table_name, info)
+
+            for metric_key, info in (context.get('aggregation_fields') or {}).items():
+                if metric_key in self.metrics:
+                    continue
+                definition = dict(info) if isinstance(info, dict) else {'description': str(info or '')}
+                definition.setdefault('display_name', metric_key)
+                definition.update(key=metric_key, context=context_name)
+                self.metrics[metric_key] = definition
+
+        for table_name, entry in self.tables.items():
+            for col in entry['columns']:
+                self.column_tables.setdefault(col, []).append(table_name)
+            if len(entry['contexts']) > 1:
+                self.duplicated_tables[table_name] = list(entry['contexts'])
+
+        # Depois de todas as tabelas: as join_keys são conferidas com a união das colunas
+        for context_name, context in self.contexts.items():
+            self._compile_joins(context_name, context)
+
+    def _add_table(self, context_name: str, table_name: str, info: Dict):
+        """Registra a tabela no índice; repetições de outros contextos só acrescentam colunas"""
+        entry = self.tables.get(table_name)
+        if entry is None:
+            entry = self.tables[table_name] = {
+                'name': table_name,
+                'description': info.get('description', ''),
+                'primary_key': info.get('primary_key'),
+                'time_column': info.get('time_column'),
+                'columns': {},
+                'contexts': []
+            }
+        entry['contexts'].append(context_name)
+        for key in ('primary_key', 'time_column'):
+            if entry[key] is None:
+                entry[key] = info.get(key)
+        for col, col_type in (info.get('columns') or {}).items():
+            entry['columns'].setdefault(col, col_type)
+
+    def _compile_joins(self, context_name: str, context: Dict):
+        """Grafo de joins do contexto e a árvore de menores caminhos a partir de cada tabela"""
+        graph = {table: {} for table in context.get('tables') or {}}
+        for rel in context.get('relationships') or []:
+            if not isinstance(rel, dict) or len(rel.get('tables', [])) != 2:
+                continue
+            left, right = rel['tables']
+            if left not in graph or right not in graph:
+                continue
+            keys = list(rel.get('join_keys') or [])
+            missing = [f"{table}.{key}" for key in keys for table in (left, right) if key not in self.columns(table)]
+            if missing or not keys:
+                self.invalid_joins.setdefault(context_name, []).append(
+                    {"tables": [left, right], "join_keys": keys, "missing": missing}
+                )
+                continue
+            graph[left][right] = keys
+            graph[right][left] = keys
+        self.join_graphs[context_name] = graph
+
+        parents = {}
+        for start in graph:
+            previous = {start: None}
+            queue = deque([start])
+            while queue:
+                table = queue.popleft()
+                for neighbour in graph[table]:
+                    if neighbour not in previous:
+                        previous[neighbour] = table
+                        queue.append(neighbour)
+            parents[start] = previous
+        self._join_parents[context_name] = parents
+
+    def join_path(self, context: str, start: str, end: str) -> Optional[List[str]]:
+        """Menor caminho de joins entre duas tabelas do contexto, ou None se não houver"""
+        previous = self._join_parents.get(context, {}).get(start)
+        if previous is None or end not in previous:
+            return None
+        path = []
+        table = end
+        while table is not None:
+            path.append(table)
+            table = previous[table]
+        return path[::-1]
+
+    def join_plan(self, context: str, anchor: str, tables: List[str]) -> List[Dict]:
+        """Joins que ligam as tabelas à tabela âncora, na ordem em que devem ser escritos
+
+        Usa o menor caminho da âncora até cada tabela; os caminhos saem da mesma
+        árvore de busca, então formam uma árvore e cada tabela entra uma única vez.
+        Tabelas sem caminho até a âncora ficam de fora. O resultado é memorizado
+        na versão.
+        """
+        key = (context, anchor, tuple(sorted(tables)))
+        plan = self._join_plans.get(key)
+        if plan is not None:
+            return plan
+
+        graph = self.join_graphs.get(context, {})
+        plan = []
+        joined = {anchor}
+        for table in tables:
+            path = self.join_path(context, anchor, table) or []
+            for left, right in zip(path, path[1:]):
+                if right not in joined:
+                    joined.add(right)
+                    plan.append({"left": left, "right": right, "join_keys": graph[left][right]})
+        self._join_plans[key] = plan
+        return plan
+
+    def table(self, name: str) -> Optional[Dict]:
+        """Definição da tabela (colunas de todos os contextos), ou None"""
+        return self.tables.get(name)
+
+    def columns(self, table: str) -> Dict[str, str]:
+        """Colunas da tabela -> tipo"""
+        entry = self.tables.get(table)
+        return entry['columns'] if entry else {}
+
+    def joins_to_one(self, table: str, join_keys: List[str]) -> bool:
+        """Se o join pelas join_keys liga cada linha a no máximo uma linha da tabela
+
+        Só é garantido quando a chave primária da tabela está entre as join_keys;
+        tabelas sem primary_key no contexts.yaml contam como lado "muitos".
+        """
+        primary_key = (self.tables.get(table) or {}).get('primary_key')
+        return bool(primary_key) and primary_key in join_keys
+
+    def tables_with_column(self, column: str) -> List[str]:
+        """Tabelas que têm a coluna, na ordem do YAML"""
+        return self.column_tables.get(column, [])
+
+    def metric(self, key: str) -> Optional[Dict]:
+        """Definição da métrica com o contexto onde foi declarada, ou None"""
+        return self.metrics.get(key)
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "content_hash": self.content_hash,
+            "loaded_at": self.loaded_at,
+            "contexts": len(self.contexts),
+            "tables": len(self.tables),
+            "columns": len(self.column_tables),
+            "metrics": len(self.metrics),
+            "duplicated_tables": self.duplicated_tables,
+            "join_edges": sum(len(neighbours) for graph in self.join_graphs.values()
+                              for neighbours in graph.values()) // 2,
+            "invalid_joins": [f"{' x '.join(rel['tables'])}: {', '.join(rel['missing']) or 'sem join_keys'}"
+                              for rels in self.invalid_joins.values() for rel in rels],
+            "join_plans": len(self._join_plans),
+            "compiled_prompts": len(self.prompts)
+        }
@@ -30,6 +30,10 @@ if 'explanation' not in st.session_state:
     st.session_state.explanation = ""
 if 'processing_time' not in st.session_state:
     st.session_state.processing_time = 0
+if 'lint' not in st.session_state:
+    st.session_state.lint = {}
+if 'rewrite' not in st.session_state:
+    st.session_state.rewrite = {}
 
 # URL base da API
 API_URL = os.getenv("API_URL", "http://localhost:8000")
@@ -205,6 +209,8 @@ def query_api(question):
             st.session_state.sql_query = result.get("sql_query", "")
             st.session_state.explanation = result.get("explanation", "")
             st.session_state.processing_time = result.get("processing_time", 0)
+            st.session_state.lint = result.get("lint", {})
+            st.session_state.rewrite = result.get("rewrite", {})
             return result
         else:
             st.error(f"Erro ao consultar API: {response.status_code} - {response.text}")
@@ -213,6 +219,73 @@ def query_api(question):
         st.error(f"Erro de conexão: {str(e)}")
         return None
 
+# Função para consultar a API exibindo cada estágio à medida que fica pronto
+def stream_query_api(question):
+    status = st.empty()
+    stage_details = st.empty()
+    streamed_output = st.empty()
+    try:
+        with requests.post(
+            f"{API_URL}/query/stream",
+            json={"question": question, "conversation_id": st.session_state.conversation_id},
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"Erro ao consultar API: {response.status_code} - {response.text}")
+                return None
+
+            response.encoding = "utf-8"
+            status.info("🔎 Classificando a pergunta...")
+            event = None
+            streamed_text = ""
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):])
+
+                if event == "classified":
+                    metadata = data.get("metadata", {})
+                    status.info("🧠 Pergunta classificada. Gerando a consulta...")
+                    stage_details.caption(
+                        f"Domínio: {metadata.get('domain', '-')} | "
+                        f"Métricas: {', '.join(metadata.get('metrics', [])) or '-'}"
+                    )
+                elif event == "expert_sql":
+                    status.info("🛠️ Fragmento do especialista pronto. Consolidando a consulta...")
+                    with stage_details.expander("Fragmento SQL do especialista"):
+                        st.code(data.get("sql", ""), language="sql")
+                elif event == "token":
+                    streamed_text += data.get("text", "")
+                    streamed_output.markdown(streamed_text)
+                elif event == "done":
+                    result = data.get("result", {})
+                    if result.get("status") == "error":
+                        st.error(result.get("message", "Erro ao gerar consulta"))
+                        return None
+                    st.session_state.conversation_id = result.get("conversation_id")
+                    st.session_state.iterations = result.get("iteration", 1)
+                    st.session_state.sql_query = result.get("sql_query", "")
+                    st.session_state.explanation = result.get("explanation", "")
+                    st.session_state.processing_time = result.get("processing_time", 0)
+                    st.session_state.lint = result.get("lint", {})
+                    st.session_state.rewrite = result.get("rewrite", {})
+                    return result
+                elif event == "error":
+                    st.error(data.get("message", "Erro ao gerar consulta"))
+                    return None
+        return None
+    except Exception as e:
+        st.error(f"Erro de conexão: {str(e)}")
+        return None
+    finally:
+        # O resultado final é exibido por show_results
+        status.empty()
+        stage_details.empty()
+        streamed_output.empty()
+
 # Função para refinar a consulta
 def refine_query(feedback):
     try:
@@ -230,6 +303,8 @@ def refine_query(feedback):
             st.session_state.sql_query = result.get("sql_query", "")
             st.session_state.explanation = result.get("explanation", "")
             st.session_state.processing_time = result.get("processing_time", 0)
+            st.session_state.lint = result.get("lint", {})
+            st.session_state.rewrite = result.get("rewrite", {})
             return result
         else:
             st.error(f"Erro ao refinar consulta: {response.status_code} - {response.text}")
@@ -287,6 +362,18 @@ def show_results():
             
             # Mostrar a query SQL como código
             st.code(st.session_state.sql_query, language="sql")
+
+            # Avisos do linter sobre o custo da query no banco
+            for warning in st.session_state.lint.get("warnings", []):
+                if warning.get("severity") != "info":
+                    st.warning(warning.get("message", ""))
+
+            # Mudanças feitas pela reescrita automática da query
+            changes = st.session_state.rewrite.get("changes", [])
+            if changes:
+                with st.expander(f"Query otimizada ({len(changes)} mudanças)"):
+                    for change in changes:
+                        st.markdown(f"- {change.get('message', '')}")
             
             # Botões para copiar e exportar
             col_copy, col_export = st.columns(2)
@@ -371,11 +458,10 @@ def main():
     
     # Se o botão for clicado, gerar a consulta
     if generate and question:
-        with st.spinner("Gerando consulta SQL..."):
-            st.session_state.conversation_id = None  # Reset para nova conversa
-            result = query_api(question)
-            if result:
-                st.success("Consulta gerada com sucesso!")
+        st.session_state.conversation_id = None  # Reset para nova conversa
+        result = stream_query_api(question)
+        if result:
+            st.success("Consulta gerada com sucesso!")
     
     # Mostrar os resultados se existirem
     show_results()
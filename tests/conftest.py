@@ -0,0 +1,25 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api.main as main
+
+
+@pytest.fixture
+def api_module(tmp_path, monkeypatch):
+    """Módulo da API configurado com o provedor stub, sem rede e com arquivos em tmp_path"""
+    monkeypatch.setattr(main, "LLM_PROVIDER", "stub")
+    monkeypatch.setattr(main, "LEARNING_MEMORY_PATH", str(tmp_path / "learning_memory.db"))
+    monkeypatch.setattr(main, "QUERY_CACHE_PATH", None)
+    monkeypatch.setattr(main, "CONVERSATION_STORE_PATH", None)
+    monkeypatch.setattr(main, "METRIC_TEMPLATES", False)
+    for name in ("sql_agent", "startup_error", "startup"):
+        if hasattr(main.app.state, name):
+            delattr(main.app.state, name)
+    return main
+
+
+@pytest.fixture
+def api(api_module):
+    """Cliente da API com o agente já inicializado"""
+    with TestClient(api_module.app) as client:
+        yield client
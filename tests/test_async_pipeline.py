@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from src.agent.providers import StubProvider
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTIONS = [
+    "faturamento total por região",
+    "quantidade de pedidos por status",
+    "ticket médio por cliente",
+    "faturamento por categoria de produto",
+    "pedidos cancelados por região",
+]
+
+
+def make_agent(tmp_path, delay: float) -> SQLQueryAgent:
+    """Agente em que toda pergunta passa pelas três chamadas do modelo (classificador, especialista e consolidador)"""
+    return SQLQueryAgent(api_key="", llm=StubProvider(delay=delay), query_cache=QueryCache(max_entries=0),
+                         learning_memory_path=str(tmp_path / "learning_memory.db"),
+                         local_classifier_threshold=None, metric_templates=False)
+
+
+def test_perguntas_concorrentes_se_sobrepoem(tmp_path):
+    agent = make_agent(tmp_path, delay=0.1)
+
+    async def run():
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(agent.aquery(question) for question in QUESTIONS))
+        return responses, time.perf_counter() - start
+
+    responses, elapsed = asyncio.run(run())
+    assert [response["status"] for response in responses] == ["success"] * len(QUESTIONS)
+    assert agent.llm.calls == 3 * len(QUESTIONS)
+    # Em série seriam 1,5 s (5 perguntas x 3 chamadas de 100 ms)
+    assert elapsed < 0.8
+
+
+def test_aquery_nao_bloqueia_o_event_loop(tmp_path):
+    agent = make_agent(tmp_path, delay=0.1)
+
+    async def run():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        beat = asyncio.ensure_future(heartbeat())
+        response = await agent.aquery(QUESTIONS[0])
+        done.set()
+        await beat
+        return response, ticks
+
+    response, ticks = asyncio.run(run())
+    assert response["status"] == "success"
+    # ~300 ms de chamadas ao modelo; um loop bloqueado não deixaria o heartbeat rodar
+    assert ticks >= 10
+
+
+def test_arefine_query_continua_a_conversa(tmp_path):
+    agent = make_agent(tmp_path, delay=0.0)
+
+    async def run():
+        first = await agent.aquery(QUESTIONS[0], conversation_id="conversa")
+        refined = await agent.arefine_query("agrupe por mês", "conversa")
+        missing = await agent.arefine_query("agrupe por mês", "inexistente")
+        return first, refined, missing
+
+    first, refined, missing = asyncio.run(run())
+    assert first["status"] == refined["status"] == "success"
+    assert refined["conversation_id"] == "conversa"
+    assert refined["iteration"] == 2
+    assert agent.conversations.get("conversa")["iterations"][-1]["feedback"] == "agrupe por mês"
+    assert (missing["status"], missing["message"]) == ("error", "Conversa não encontrada")
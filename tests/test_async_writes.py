@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.agent.conversation_store import SQLiteConversationStore
+from src.agent.providers import RecordReplayProvider, StubProvider
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+
+@pytest.fixture
+def agent(tmp_path):
+    return SQLQueryAgent(api_key="", llm=StubProvider(),
+                         query_cache=QueryCache(disk_path=str(tmp_path / "cache.db")),
+                         learning_memory_path=str(tmp_path / "learning_memory.db"))
+
+
+def record_threads(monkeypatch, target, name: str, threads: dict):
+    """Substitui o método por um que anota a thread em que foi chamado"""
+    original = getattr(target, name)
+
+    def wrapper(*args, **kwargs):
+        threads.setdefault(name, []).append(threading.current_thread())
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(target, name, wrapper)
+
+
+def test_gravacoes_em_disco_fora_do_event_loop(agent, monkeypatch):
+    threads = {}
+    record_threads(monkeypatch, agent.learning_store, "append", threads)
+    record_threads(monkeypatch, agent.query_cache, "write_to_disk", threads)
+
+    response = asyncio.run(agent.aquery("Qual o faturamento total no Brasil em março?"))
+    assert response["status"] == "success"
+    assert set(threads) == {"append", "write_to_disk"}
+    assert all(thread is not threading.main_thread() for calls in threads.values() for thread in calls)
+
+    # As gravações terminam antes da resposta: o padrão e a resposta já estão no disco
+    assert agent.learning_store.load()[-1]["question"] == "Qual o faturamento total no Brasil em março?"
+    assert QueryCache(disk_path=agent.query_cache.disk_path).get(
+        agent.query_cache.make_key("Qual o faturamento total no Brasil em março?", agent._context_hash)
+    ) is not None
+
+
+def test_leituras_em_disco_fora_do_event_loop(agent, monkeypatch):
+    question = "Qual o faturamento total no Brasil em março?"
+    asyncio.run(agent.aquery(question))
+    # Outro processo: a memória está vazia e a resposta vem da camada em disco
+    agent.query_cache = QueryCache(disk_path=agent.query_cache.disk_path)
+
+    threads = {}
+    record_threads(monkeypatch, agent.query_cache, "read_from_disk", threads)
+    record_threads(monkeypatch, agent.business_context, "reload_if_changed", threads)
+
+    async def run():
+        from_disk = await agent.aquery(question)
+        from_memory = await agent.aquery(question)
+        batch = [item async for item in agent.abatch_query([question])]
+        return from_disk, from_memory, batch
+
+    from_disk, from_memory, batch = asyncio.run(run())
+    assert from_disk["cache"] == "hit" and from_memory["cache"] == "hit"
+    assert batch[0]["result"]["cache"] == "hit"
+    # Só o miss na memória consulta o disco
+    assert len(threads["read_from_disk"]) == 1
+    assert len(threads["reload_if_changed"]) >= 3
+    assert all(thread is not threading.main_thread() for calls in threads.values() for thread in calls)
+    assert agent.query_cache.stats()["hits"] == 3
+
+
+def test_caminho_sincrono_grava_na_hora(agent, monkeypatch):
+    threads = {}
+    record_threads(monkeypatch, agent.learning_store, "append", threads)
+    agent.query("Qual o faturamento total no Brasil em março?")
+    assert threads["append"] == [threading.main_thread()]
+
+
+def test_conversas_em_sqlite_fora_do_event_loop(tmp_path, monkeypatch):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    agent = SQLQueryAgent(api_key="", llm=StubProvider(), conversation_store=store,
+                          learning_memory_path=str(tmp_path / "learning_memory.db"))
+    threads = {}
+    record_threads(monkeypatch, store, "get", threads)
+    record_threads(monkeypatch, store, "set", threads)
+
+    async def run():
+        first = await agent.aquery("Qual o faturamento total no Brasil em março?")
+        cached = await agent.aquery("Qual o faturamento total no Brasil em março?")
+        refined = await agent.arefine_query("Agrupe por região", cached["conversation_id"])
+        return first, cached, refined
+
+    first, cached, refined = asyncio.run(run())
+    assert cached["cache"] == "hit"
+    assert refined["status"] == "success" and refined["iteration"] == 2
+    assert set(threads) == {"get", "set"}
+    assert all(thread is not threading.main_thread() for calls in threads.values() for thread in calls)
+    assert len(store.get(cached["conversation_id"])["iterations"]) == 2
+
+
+def test_gravacao_do_record_replay_fora_do_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "recordings.jsonl")
+    provider = RecordReplayProvider(path, mode="record", inner=StubProvider())
+    threads = {}
+    record_threads(monkeypatch, provider, "_record", threads)
+
+    async def run():
+        response = await provider.ainvoke("prompt do classificador", stage="classifier")
+        chunks = [chunk.content async for chunk in provider.astream("prompt do consolidador", stage="consolidator")]
+        return response, "".join(chunks)
+
+    response, streamed = asyncio.run(run())
+    assert len(threads["_record"]) == 2
+    assert all(thread is not threading.main_thread() for thread in threads["_record"])
+
+    # As duas chamadas ficaram gravadas e são reproduzidas sem o provedor interno
+    replay = RecordReplayProvider(path, mode="replay", strict=True)
+    assert replay.invoke("prompt do classificador", stage="classifier").content == response.content
+    assert replay.invoke("prompt do consolidador", stage="consolidator").content == streamed
@@ -0,0 +1,68 @@
+import os
+import shutil
+
+import pytest
+
+from src.config.business_context import BusinessContext
+
+CONTEXTS_YAML = os.path.join(os.path.dirname(__file__), "..", "src", "config", "contexts.yaml")
+
+
+@pytest.fixture
+def business_context(tmp_path, monkeypatch):
+    """BusinessContext sobre uma cópia do contexts.yaml, contando as compilações do prompt"""
+    config_path = tmp_path / "contexts.yaml"
+    shutil.copy(CONTEXTS_YAML, config_path)
+    business_context = BusinessContext(str(config_path))
+    compiled = []
+    compile_prompt = business_context._compile_prompt
+
+    def counting(contexts, context_name=None):
+        compiled.append(context_name)
+        return compile_prompt(contexts, context_name)
+
+    monkeypatch.setattr(business_context, "_compile_prompt", counting)
+    return business_context, config_path, compiled
+
+
+def edit(config_path, old: str, new: str):
+    """Altera o arquivo e avança o mtime, como uma gravação feita alguns segundos depois"""
+    text = config_path.read_text(encoding="utf-8")
+    assert old in text
+    config_path.write_text(text.replace(old, new), encoding="utf-8")
+    mtime = os.path.getmtime(config_path) + 5
+    os.utime(config_path, (mtime, mtime))
+
+
+def test_prompt_compilado_uma_vez_por_versao(business_context):
+    business_context, _, compiled = business_context
+    first = business_context.format_for_prompt()
+    assert business_context.format_for_prompt() is first
+    assert business_context.format_for_prompt("Vendas") is business_context.format_for_prompt("Vendas")
+    assert compiled == [None, "Vendas"]
+    assert business_context.current().stats()["compiled_prompts"] == 2
+
+
+def test_nova_versao_do_yaml_recompila_o_prompt(business_context):
+    business_context, config_path, compiled = business_context
+    first = business_context.format_for_prompt()
+    version = business_context.catalog.version
+
+    edit(config_path, "ORDERS:\n", "ORDERS:  # tabela de pedidos\n")
+    # Só o comentário mudou: nova versão, mesmo texto, compilado de novo para a versão nova
+    assert business_context.format_for_prompt() == first
+    assert business_context.catalog.version == version + 1
+    assert compiled == [None, None]
+
+    edit(config_path, "Tabela principal de pedidos", "Tabela principal de vendas")
+    assert "Tabela principal de vendas" in business_context.format_for_prompt()
+    assert compiled == [None, None, None]
+
+
+def test_versao_fixada_mantem_o_prompt(business_context):
+    business_context, config_path, _ = business_context
+    with business_context.pin():
+        before = business_context.format_for_prompt()
+        edit(config_path, "Tabela principal de pedidos", "Tabela principal de vendas")
+        assert business_context.format_for_prompt() is before
+    assert "Tabela principal de vendas" in business_context.format_for_prompt()
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.agent.coalescing import SingleFlight
+from src.agent.providers import StubProvider
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+
+def test_chamadas_concorrentes_executam_uma_vez():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "resultado"
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("chave", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert {result for result, _ in results} == {"resultado"}
+    assert flight.shared == 4
+    assert flight.in_flight() == 0
+
+
+def test_cancelar_quem_iniciou_nao_cancela_quem_aguarda():
+    flight = SingleFlight()
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "resultado"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.ado("chave", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("chave", work))
+        await asyncio.sleep(0.01)
+        # Cliente de quem iniciou desconectou
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == ("resultado", True)
+    assert finished == [1]
+
+
+def test_chave_liberada_ao_terminar_e_erro_compartilhado():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("falhou")
+
+    async def run():
+        results = await asyncio.gather(flight.ado("chave", failing), flight.ado("chave", failing),
+                                       return_exceptions=True)
+        # Terminada a execução, a próxima chamada executa de novo
+        again = await asyncio.gather(flight.ado("chave", failing), return_exceptions=True)
+        return results + again
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(calls) == 2
+
+
+def test_do_entre_threads():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "resultado"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flight.do, "chave", work)
+        started.wait(5)
+        followers = [pool.submit(flight.do, "chave", work) for _ in range(3)]
+        while flight.shared < 3:
+            time.sleep(0.005)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert len(calls) == 1
+    assert results == [("resultado", False)] + [("resultado", True)] * 3
+
+
+def test_agente_une_perguntas_iguais_em_andamento(tmp_path):
+    llm = StubProvider(delay=0.05)
+    agent = SQLQueryAgent(api_key="", llm=llm, query_cache=QueryCache(max_entries=0),
+                          learning_memory_path=str(tmp_path / "learning_memory.db"), metric_templates=False)
+
+    async def run():
+        return await asyncio.gather(
+            agent.aquery("Qual o faturamento total no Brasil em março?", conversation_id="a"),
+            agent.aquery("qual o faturamento total no brasil em marco", conversation_id="b"),
+        )
+
+    first, second = asyncio.run(run())
+    assert first["sql_query"] == second["sql_query"]
+    assert not first.get("coalesced") and second["coalesced"] is True
+    assert (first["conversation_id"], second["conversation_id"]) == ("a", "b")
+    # Uma única execução do pipeline, e cada usuário com a sua conversa
+    calls = llm.calls
+    asyncio.run(agent.aquery("Qual o faturamento total no Brasil em março?"))
+    assert llm.calls == 2 * calls
+    assert agent.conversations.get("b")["original_question"] == agent.conversations.get("a")["original_question"]
@@ -0,0 +1,87 @@
+import pytest
+
+from src.agent import conversation_store
+from src.agent.conversation_store import InMemoryConversationStore, SQLiteConversationStore
+
+
+class Clock:
+    def __init__(self):
+        """Relógio controlado pelo teste no lugar de time.time"""
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation_store.time, "time", clock)
+    return clock
+
+
+def conversation(question: str, size: int = 0) -> dict:
+    return {"original_question": question, "metadata": {"padding": "x" * size}, "iterations": []}
+
+
+def test_lru_descarta_a_conversa_menos_usada(clock):
+    store = InMemoryConversationStore(max_conversations=2)
+    store.set("a", conversation("a"))
+    store.set("b", conversation("b"))
+    # Usar "a" a coloca no fim da fila; a próxima gravação descarta "b"
+    assert store.get("a")["original_question"] == "a"
+    store.set("c", conversation("c"))
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.stats()["evictions"] == 1
+
+
+def test_limite_de_memoria(clock):
+    store = InMemoryConversationStore(max_conversations=100, max_memory_bytes=1000)
+    for name in "abc":
+        store.set(name, conversation(name, size=400))
+    assert len(store) == 2
+    assert store.get("a") is None
+    assert store.stats()["memory_bytes"] <= 1000
+    # Uma conversa maior que o limite fica sozinha, em vez de ser descartada ao ser gravada
+    store.set("grande", conversation("grande", size=5000))
+    assert len(store) == 1 and store.get("grande") is not None
+
+
+def test_ttl_conta_a_partir_do_ultimo_uso(clock):
+    store = InMemoryConversationStore(ttl_seconds=60)
+    store.set("a", conversation("a"))
+    store.set("b", conversation("b"))
+    clock.now += 50
+    assert store.get("a") is not None
+    clock.now += 20
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.stats()["expirations"] == 1
+
+
+def test_sqlite_compartilha_conversas_entre_processos(tmp_path, clock):
+    path = str(tmp_path / "conversations.db")
+    first = SQLiteConversationStore(path, ttl_seconds=60)
+    second = SQLiteConversationStore(path, ttl_seconds=60)
+    first.set("a", conversation("a"))
+    assert second.get("a")["original_question"] == "a"
+    clock.now += 61
+    assert second.get("a") is None
+    assert len(first) == 0
+    first.close()
+    second.close()
+
+
+def test_sqlite_mantem_as_mais_usadas(tmp_path, clock):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"), max_conversations=2, prune_every=1)
+    for name in "abc":
+        clock.now += 1
+        store.set(name, conversation(name))
+        if name == "b":
+            clock.now += 1
+            store.get("a")
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.stats()["evictions"] == 1
+    store.close()
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.agent.http_client import RetryPolicy, aclose_http_clients
+from src.agent.providers import DeepSeekProvider
+
+
+class ScriptedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, script):
+        """Servidor local compatível com /chat/completions do DeepSeek
+
+        Args:
+            script: Uma resposta (status, atraso em segundos, cabeçalhos) por requisição,
+                    na ordem de chegada; a última se repete
+        """
+        super().__init__(("127.0.0.1", 0), ScriptedHandler)
+        self.script = list(script)
+        self.lock = threading.Lock()
+        self.arrivals = []
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def next_response(self):
+        with self.lock:
+            self.arrivals.append(time.monotonic())
+            return self.script[min(len(self.arrivals), len(self.script)) - 1]
+
+    def handle_error(self, request, client_address):
+        # O hedge perdedor é cancelado e fecha a conexão no meio da resposta
+        pass
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status, delay, headers = self.server.next_response()
+        time.sleep(delay)
+        if status == 200:
+            payload = {
+                "id": "chatcmpl-local",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "deepseek-chat",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+            }
+        else:
+            payload = {"error": {"message": f"erro {status}", "type": "server_error"}}
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def serve():
+    """Sobe um ScriptedServer por teste e devolve (servidor, provedor) para a política informada"""
+    servers = []
+
+    def start(script, **policy):
+        server = ScriptedServer(script)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        policy.setdefault("default_timeout", 5.0)
+        provider = DeepSeekProvider(api_key="local", base_url=server.base_url, policy=RetryPolicy(**policy))
+        # Como na API: o cliente é criado antes das chamadas, fora do tempo medido pelo hedge
+        provider.warm_up()
+        return server, provider
+
+    yield start
+    # Os clientes HTTP são compartilhados pelo processo; cada teste começa com clientes novos
+    asyncio.run(aclose_http_clients())
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def ok(delay: float = 0.0):
+    return 200, delay, {}
+
+
+def unavailable():
+    return 503, 0.0, {}
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_nova_tentativa_apos_falha_transitoria(serve, mode):
+    server, provider = serve([unavailable(), unavailable(), ok()], max_retries=3, backoff_base=0.01)
+
+    async def call():
+        try:
+            return await provider.ainvoke("pergunta")
+        finally:
+            await aclose_http_clients()
+
+    response = provider.invoke("pergunta") if mode == "sync" else asyncio.run(call())
+    assert response.content == "ok"
+    assert len(server.arrivals) == 3
+    assert provider.policy.retries == 2
+
+
+def test_desiste_depois_de_max_retries(serve):
+    server, provider = serve([unavailable()], max_retries=2, backoff_base=0.01)
+    with pytest.raises(Exception) as error:
+        provider.invoke("pergunta")
+    assert getattr(error.value, "status_code", None) == 503
+    assert len(server.arrivals) == 3
+    assert provider.policy.retries == 2
+
+
+def test_erro_definitivo_nao_e_repetido(serve):
+    server, provider = serve([(400, 0.0, {})], max_retries=3, backoff_base=0.01)
+    with pytest.raises(Exception):
+        provider.invoke("pergunta")
+    assert len(server.arrivals) == 1
+    assert provider.policy.retries == 0
+
+
+@pytest.mark.parametrize("headers", [{"Retry-After": "1"}, {"retry-after-ms": "600"}])
+def test_respeita_retry_after(serve, headers):
+    # Sem o Retry-After, o backoff esperaria no máximo 10 ms
+    server, provider = serve([(429, 0.0, headers), ok()], max_retries=1, backoff_base=0.01)
+    assert provider.invoke("pergunta").content == "ok"
+    waited = server.arrivals[1] - server.arrivals[0]
+    requested = float(headers.get("Retry-After", 0)) or float(headers.get("retry-after-ms", 0)) / 1000
+    assert requested <= waited < requested + 0.5
+
+
+def test_retry_after_limitado_a_backoff_max(serve):
+    server, provider = serve([(503, 0.0, {"Retry-After": "120"}), ok()], max_retries=1, backoff_max=0.2)
+    assert provider.invoke("pergunta").content == "ok"
+    assert server.arrivals[1] - server.arrivals[0] < 1.0
+
+
+def test_hedge_dispara_quando_a_primeira_demora(serve):
+    # A primeira requisição cai na cauda lenta; o hedge sai depois de 300 ms e responde antes
+    server, provider = serve([ok(delay=3.0), ok()], max_retries=0, hedge=True, hedge_delay=0.3)
+
+    async def call():
+        try:
+            start = time.perf_counter()
+            response = await provider.ainvoke("pergunta")
+            return response, time.perf_counter() - start
+        finally:
+            await aclose_http_clients()
+
+    response, elapsed = asyncio.run(call())
+    assert response.content == "ok"
+    assert elapsed < 1.5
+    assert len(server.arrivals) == 2
+    assert server.arrivals[1] - server.arrivals[0] >= 0.2
+    assert (provider.policy.hedges, provider.policy.hedge_wins) == (1, 1)
+
+
+def test_hedge_nao_dispara_quando_a_primeira_responde_a_tempo(serve):
+    server, provider = serve([ok()], max_retries=0, hedge=True, hedge_delay=0.5)
+
+    async def call():
+        try:
+            return await provider.ainvoke("pergunta")
+        finally:
+            await aclose_http_clients()
+
+    assert asyncio.run(call()).content == "ok"
+    assert len(server.arrivals) == 1
+    assert provider.policy.hedges == 0
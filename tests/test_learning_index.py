@@ -0,0 +1,55 @@
+from src.agent.learning_index import PatternIndex
+
+QUESTIONS = [
+    "faturamento total por regiao",
+    "faturamento total por regiao e mes",
+    "quantidade de pedidos por status",
+    "ticket medio por cliente",
+    "faturamento total",
+]
+
+
+def build(questions=QUESTIONS, **kwargs) -> PatternIndex:
+    index = PatternIndex(**kwargs)
+    for question in questions:
+        index.add({"question": question})
+    return index
+
+
+def questions(patterns):
+    return [pattern["question"] for pattern in patterns]
+
+
+def test_mais_similar_primeiro_e_limitado_a_k():
+    index = build()
+    found = questions(index.search("Qual o faturamento total por região?", k=3))
+    assert found == ["faturamento total por regiao", "faturamento total por regiao e mes", "faturamento total"]
+    assert questions(index.search("faturamento total por regiao", k=1)) == ["faturamento total por regiao"]
+
+
+def test_sem_padroes_similares():
+    index = build()
+    assert index.search("estoque por fornecedor") == []
+    assert index.search("qual o") == []
+    assert questions(index.search("ticket medio")) == ["ticket medio por cliente"]
+
+
+def test_empate_prefere_o_padrao_mais_recente():
+    index = PatternIndex()
+    for version in (1, 2):
+        index.add({"question": "faturamento por regiao", "version": version})
+    assert [pattern["version"] for pattern in index.search("faturamento por regiao")] == [2, 1]
+
+
+def test_remove_oldest_tira_o_padrao_do_indice():
+    index = build()
+    index.remove_oldest()
+    assert len(index) == len(QUESTIONS) - 1
+    assert "faturamento total por regiao" not in questions(index.search("faturamento total por regiao"))
+
+
+def test_tokens_frequentes_nao_escondem_o_padrao_raro():
+    # "faturamento" está em todos os padrões; o token raro "cupom" ainda traz o padrão certo
+    common = [f"faturamento por dimensao {i}" for i in range(300)]
+    index = build(common + ["faturamento com cupom de desconto"], candidate_limit=50)
+    assert questions(index.search("faturamento com cupom", k=1)) == ["faturamento com cupom de desconto"]
@@ -0,0 +1,58 @@
+import pytest
+
+from src.agent.local_classifier import LocalClassifier, UNEXPLAINED_CONFIDENCE
+from src.agent.prompt_layout import sample_questions
+from src.config.business_context import BusinessContext
+
+THRESHOLD = 0.8
+
+
+@pytest.fixture(scope="module")
+def business_context():
+    return BusinessContext()
+
+
+@pytest.fixture(scope="module")
+def classifier(business_context):
+    return LocalClassifier(business_context)
+
+
+@pytest.mark.parametrize("question, unexplained", [
+    ("Qual o faturamento total no Brasil em março?", ["brasil", "marco"]),
+    ("pedidos cancelados ontem", ["cancelados", "ontem"]),
+    ("faturamento dos pedidos acima de 100 reais", ["acima", "100", "reais"]),
+    ("faturamento da semana passada", ["semana", "passada"]),
+    ("faturamento na black friday", ["black", "friday"]),
+])
+def test_restricoes_nao_reconhecidas_vao_para_o_llm(classifier, question, unexplained):
+    metadata, confidence, words = classifier.explain(question)
+    assert metadata["metrics"]
+    assert words == unexplained
+    assert confidence <= UNEXPLAINED_CONFIDENCE < THRESHOLD
+    assert classifier.classify(question) == (metadata, confidence)
+
+
+@pytest.mark.parametrize("question, groupby, timeframe", [
+    ("Qual foi o faturamento total por fornecedor no último mês?", ["SUPPLIER_NAME"], "last_30_days"),
+    ("Quantos pedidos tivemos nos últimos 14 dias?", [], "last_14_days"),
+    ("Qual o ticket médio por categoria de produto?", ["CATEGORY_NAME"], None),
+])
+def test_pergunta_totalmente_explicada_dispensa_o_llm(classifier, question, groupby, timeframe):
+    metadata, confidence, words = classifier.explain(question)
+    assert words == []
+    assert confidence >= THRESHOLD
+    assert metadata["groupby"] == groupby
+    assert (metadata["timeframe"] or {}).get("range") == timeframe
+
+
+def test_maioria_dos_exemplos_classificada_localmente(business_context, classifier):
+    questions = sample_questions(business_context)
+    local = [q for q in questions if classifier.classify(q)[1] >= THRESHOLD]
+    assert len(local) >= len(questions) * 0.75
+
+
+def test_warm_up_compila_as_assinaturas(business_context):
+    classifier = LocalClassifier(business_context)
+    classifier.warm_up()
+    assert classifier._signatures
+    assert classifier._context_hash == business_context.content_hash
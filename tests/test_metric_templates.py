@@ -0,0 +1,93 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from src.agent.metric_templates import MetricTemplateEngine, TemplateMiss, timeframe_dates
+from src.agent.providers import StubProvider, default_stub_response
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+
+class RecordingStub(StubProvider):
+    def __init__(self):
+        """StubProvider que guarda o estágio de cada chamada"""
+        self.stages = []
+        super().__init__(responder=self._record)
+
+    def _record(self, prompt, stage=None):
+        self.stages.append(stage)
+        return default_stub_response(prompt, stage)
+
+
+def make_agent(tmp_path, **kwargs):
+    return SQLQueryAgent(api_key="", llm=RecordingStub(), query_cache=QueryCache(max_entries=0),
+                         learning_memory_path=str(tmp_path / "learning_memory.db"), sql_rewrite=False, **kwargs)
+
+
+@pytest.fixture
+def agent(tmp_path):
+    return make_agent(tmp_path)
+
+
+@pytest.mark.parametrize("threshold", [0.8, 0.1])
+@pytest.mark.parametrize("question", [
+    "Qual o faturamento total no Brasil em março?",
+    "Quantos pedidos cancelados ontem?",
+])
+def test_template_nao_usa_classificacao_local_incompleta(tmp_path, question, threshold):
+    agent = make_agent(tmp_path, local_classifier_threshold=threshold)
+    response = asyncio.run(agent.aquery(question))
+    assert response["status"] == "success"
+    # A restrição não explicada leva a pergunta ao classificador LLM
+    assert agent.llm.stages[0] == "classifier"
+    assert agent.local_classifier.stats.snapshot()["local_hits"] == 0
+
+
+def test_template_com_classificacao_local_completa(agent):
+    response = asyncio.run(agent.aquery("Mostre o faturamento diário dos últimos 7 dias"))
+    assert response["status"] == "success"
+    assert agent.llm.stages == []
+    assert "CREATED_AT" in response["sql_query"]
+
+
+def test_join_para_o_lado_muitos_vai_para_o_llm(agent):
+    # ORDERS -> CUSTOMERS -> SUBSCRIPTIONS repetiria cada pedido por assinatura do cliente
+    metadata, confidence = agent.local_classifier.classify("faturamento por plano")
+    assert confidence == 1.0
+    assert metadata["groupby"] == ["PLAN_NAME"]
+    with pytest.raises(TemplateMiss) as miss:
+        MetricTemplateEngine(agent.business_context).render(metadata)
+    assert miss.value.reason == "fan_out"
+
+    response = asyncio.run(agent.aquery("faturamento por plano"))
+    assert response["status"] == "success"
+    assert agent.llm.stages
+    assert 'result="fan_out"' in "".join(agent.metrics.templates.render())
+
+
+def test_join_para_o_lado_um_continua_no_template(agent):
+    metadata, _ = agent.local_classifier.classify("valor em estoque por armazém")
+    sql_query = MetricTemplateEngine(agent.business_context).render(metadata)
+    assert "join SCHEMA.DATABASE.WAREHOUSE w on i.WAREHOUSE_ID = w.WAREHOUSE_ID" in sql_query
+
+
+@pytest.mark.parametrize("days", [1, 7, 30])
+def test_last_n_days_cobre_n_dias(days):
+    today = date.today()
+    start, end = timeframe_dates({"range": f"last_{days}_days"})
+    assert end == today
+    assert (end - start).days + 1 == days
+
+
+def test_periodo_do_classificador_local_cobre_n_dias(tmp_path):
+    agent = make_agent(tmp_path)
+    metadata, _ = agent.local_classifier.classify("faturamento dos últimos 7 dias")
+    start, end = timeframe_dates(metadata["timeframe"])
+    assert (end - start).days + 1 == 7
+    assert timeframe_dates({"range": "last_7_days"}) == (start, end)
+
+    # O template filtra de start (inclusive) até end + 1 dia (exclusivo)
+    sql_query = MetricTemplateEngine(agent.business_context).render(metadata)
+    assert f">= '{start.isoformat()}'" in sql_query
+    assert f"< '{(end + timedelta(days=1)).isoformat()}'" in sql_query
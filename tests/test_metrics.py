@@ -0,0 +1,75 @@
+import asyncio
+
+from src.agent.metrics import Counter, Histogram, PipelineMetrics
+from src.agent.providers import StubProvider
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+from src.agent.tokens import count_tokens
+
+
+def test_histograma_com_buckets_cumulativos():
+    histogram = Histogram("latencia_seconds", "Latência", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value, stage="expert")
+    assert histogram.render() == [
+        "# HELP latencia_seconds Latência",
+        "# TYPE latencia_seconds histogram",
+        'latencia_seconds_bucket{stage="expert",le="0.1"} 1',
+        'latencia_seconds_bucket{stage="expert",le="1"} 3',
+        'latencia_seconds_bucket{stage="expert",le="+Inf"} 4',
+        'latencia_seconds_sum{stage="expert"} 4.25',
+        'latencia_seconds_count{stage="expert"} 4',
+    ]
+
+
+def test_contador_sem_rotulos_existe_desde_o_inicio():
+    counter = Counter("fallbacks_total", "Fallbacks")
+    assert counter.render()[-1] == "fallbacks_total 0"
+    counter.inc()
+    counter.inc(2)
+    assert counter.render()[-1] == "fallbacks_total 3"
+
+
+def test_tokens_informados_pelo_provedor_tem_precedencia():
+    metrics = PipelineMetrics()
+    with metrics.trace("query") as trace:
+        metrics.record_llm_call("expert", 0.2, "prompt " * 50, "saida",
+                                usage={"input_tokens": 900, "output_tokens": 40,
+                                       "input_token_details": {"cache_read": 768}})
+        metrics.record_llm_call("consolidator", 0.1, "um prompt curto", "select 1")
+    stages = trace.report()["stages"]
+    assert stages["expert"] == {"seconds": 0.2, "input_tokens": 900, "output_tokens": 40}
+    assert stages["consolidator"]["input_tokens"] == count_tokens("um prompt curto")
+    text = metrics.render()
+    assert 'sql_agent_llm_cached_input_tokens_total{stage="expert"} 768' in text
+    assert 'sql_agent_llm_tokens_total{stage="expert",direction="input"} 900' in text
+    assert 'sql_agent_request_duration_seconds_count{operation="query"} 1' in text
+
+
+def test_timings_de_perguntas_concorrentes_ficam_separados(tmp_path):
+    agent = SQLQueryAgent(api_key="", llm=StubProvider(delay=0.05), query_cache=QueryCache(max_entries=0),
+                          learning_memory_path=str(tmp_path / "learning_memory.db"),
+                          local_classifier_threshold=None, metric_templates=False)
+
+    async def run():
+        return await asyncio.gather(agent.aquery("faturamento total por região"),
+                                    agent.aquery("quantidade de pedidos por status"))
+
+    for response in asyncio.run(run()):
+        timings = response["timings"]
+        for stage in ("classifier", "expert", "consolidator"):
+            # Uma chamada de cada estágio por pergunta, não a soma das duas
+            assert 0.05 <= timings["stages"][stage]["seconds"] < 0.1
+            assert timings["stages"][stage]["input_tokens"] > 0
+        assert timings["input_tokens"] == sum(entry.get("input_tokens", 0) for entry in timings["stages"].values())
+        assert timings["total_seconds"] >= 0.15
+    assert 'sql_agent_llm_call_duration_seconds_count{stage="expert"} 2' in agent.metrics.render()
+
+
+def test_endpoint_metrics(api):
+    assert api.post("/query", json={"question": "Qual o faturamento total?"}).json()["status"] == "success"
+    response = api.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'sql_agent_request_duration_seconds_count{operation="query"} 1' in response.text
+    assert 'sql_agent_cache_requests_total{result="miss"} 1' in response.text
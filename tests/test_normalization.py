@@ -0,0 +1,21 @@
+import pytest
+
+from src.agent.normalization import normalize_question
+from src.agent.query_cache import QueryCache
+
+
+@pytest.mark.parametrize("first, second", [
+    ("vendas SP e RJ", "vendas SP ou RJ"),
+    ("faturamento em São Paulo", "faturamento em Paulo"),
+    ("pedidos de SE", "pedidos"),
+])
+def test_perguntas_diferentes_tem_chaves_diferentes(first, second):
+    assert normalize_question(first) != normalize_question(second)
+    assert QueryCache.make_key(first, "hash") != QueryCache.make_key(second, "hash")
+
+
+def test_variacoes_de_forma_tem_a_mesma_chave():
+    first = "Qual o faturamento total por região?"
+    second = "  me mostre   o FATURAMENTO total pela regiao "
+    assert normalize_question(first) == normalize_question(second) == "faturamento total regiao"
+    assert QueryCache.make_key(first, "hash") == QueryCache.make_key(second, "hash")
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from src.agent.providers import STUB_SQL, StubProvider, default_stub_response
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTION = "Qual o faturamento total?"
+
+
+class StageRecorder(StubProvider):
+    def __init__(self, responder=None):
+        """StubProvider que anota o estágio de cada chamada"""
+        self.stages = []
+        self.inner = responder or default_stub_response
+        super().__init__(responder=self._record)
+
+    def _record(self, prompt, stage=None):
+        self.stages.append(stage)
+        return self.inner(prompt, stage)
+
+
+def make_agent(tmp_path, llm, **kwargs) -> SQLQueryAgent:
+    return SQLQueryAgent(api_key="", llm=llm, query_cache=QueryCache(max_entries=0),
+                         learning_memory_path=str(tmp_path / "learning_memory.db"),
+                         local_classifier_threshold=None, metric_templates=False, **kwargs)
+
+
+@pytest.mark.parametrize("mode, stages", [
+    ("staged", ["classifier", "expert", "consolidator"]),
+    ("merged", ["classifier", "merged"]),
+    ("single", ["single"]),
+])
+@pytest.mark.parametrize("run", ["sync", "async"])
+def test_chamadas_ao_modelo_por_modo(tmp_path, mode, stages, run):
+    llm = StageRecorder()
+    agent = make_agent(tmp_path, llm)
+    if run == "sync":
+        response = agent.query(QUESTION, pipeline_mode=mode)
+    else:
+        response = asyncio.run(agent.aquery(QUESTION, pipeline_mode=mode))
+    assert response["status"] == "success"
+    assert response["pipeline_mode"] == mode
+    assert "sum(o.TOTAL_PRICE)" in response["sql_query"]
+    assert llm.stages == stages
+
+
+def test_modo_padrao_do_agente_e_modo_invalido(tmp_path):
+    llm = StageRecorder()
+    agent = make_agent(tmp_path, llm, pipeline_mode="single")
+    assert agent.query(QUESTION)["pipeline_mode"] == "single"
+    response = agent.query(QUESTION, pipeline_mode="paralelo")
+    assert response["status"] == "error"
+    assert "staged, merged, single" in response["message"]
+    assert llm.stages == ["single"]
+    with pytest.raises(ValueError):
+        make_agent(tmp_path, llm, pipeline_mode="paralelo")
+
+
+def test_resposta_fora_do_formato_json(tmp_path):
+    # Sem JSON, explicação e SQL são separados do texto livre
+    llm = StageRecorder(lambda prompt, stage: f"Soma das vendas.\n```sql\n{STUB_SQL}\n```" if stage == "merged"
+                        else default_stub_response(prompt, stage))
+    response = make_agent(tmp_path, llm).query(QUESTION, pipeline_mode="merged")
+    assert response["status"] == "success"
+    assert "sum(o.TOTAL_PRICE)" in response["sql_query"]
+    assert "```" not in response["sql_query"]
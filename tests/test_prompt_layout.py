@@ -0,0 +1,62 @@
+import pytest
+
+from src.agent.prompt_layout import (CACHE_BLOCK_TOKENS, check_prefix_stability, prefix_report,
+                                     sample_questions, static_after_request)
+from src.agent.prompt_template import PromptTemplate
+from src.agent.providers import StubProvider
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+
+@pytest.fixture
+def agent(tmp_path):
+    return SQLQueryAgent(api_key="", llm=StubProvider(), query_cache=QueryCache(max_entries=0),
+                         learning_memory_path=str(tmp_path / "learning_memory.db"))
+
+
+def entry(**changes):
+    return dict({"prompts": 2, "prompt_tokens": 500, "shared_prefix_tokens": 400, "cacheable_ratio": 0.768,
+                 "static_after_request_tokens": 3, "deterministic": True}, **changes)
+
+
+def test_texto_fixo_depois_da_pergunta():
+    template = "Instruções {business_context}\nPergunta: {input}\nResponda em JSON.\nMetadados: {metadata}"
+    assert static_after_request(template) == "\nResponda em JSON.\nMetadados: "
+    assert static_after_request("Só texto fixo {business_context}") == ""
+    # Chaves duplicadas são texto literal (exemplos de JSON), não variáveis
+    assert static_after_request("Exemplo {{input}} e depois {input}") == ""
+
+
+def test_checker_aponta_os_problemas():
+    report = {
+        "classifier": entry(),
+        "expert:vendas": entry(deterministic=False),
+        "consolidator": entry(static_after_request_tokens=CACHE_BLOCK_TOKENS + 1),
+    }
+    problems = check_prefix_stability(report)
+    assert len(problems) == 2
+    assert problems[0].startswith("expert:vendas: o mesmo pedido gera prompts diferentes")
+    assert problems[1].startswith(f"consolidator: {CACHE_BLOCK_TOKENS + 1} tokens de texto fixo")
+
+
+def test_prompts_do_agente_passam_no_checker(agent):
+    questions = sample_questions(agent.business_context)
+    report = prefix_report(agent, questions)
+    assert check_prefix_stability(report) == []
+    for stage in ("classifier", "consolidator", "fallback", "single"):
+        assert report[stage]["deterministic"]
+        assert report[stage]["shared_prefix_tokens"] >= CACHE_BLOCK_TOKENS
+        assert report[stage]["cacheable_ratio"] > 0.5
+
+
+def test_instrucoes_depois_da_pergunta_sao_apontadas(agent):
+    instructions = "Regras importantes para a classificação da pergunta do usuário. " * 20
+    agent.classifier_prompt = PromptTemplate(
+        template="Classifique.\n\nPergunta do usuário: {input}\n\n" + instructions + "\n{similar_patterns}",
+        input_variables=["input", "similar_patterns"]
+    )
+    report = prefix_report(agent, sample_questions(agent.business_context)[:5])
+    problems = check_prefix_stability(report)
+    assert [problem.split(":")[0] for problem in problems] == ["classifier"]
+    # O prefixo comum termina antes da pergunta: quase nada do prompt é cacheável
+    assert report["classifier"]["cacheable_ratio"] == 0
@@ -0,0 +1,153 @@
+import os
+import shutil
+
+import pytest
+
+from src.agent.metric_templates import MetricTemplateEngine, TemplateMiss
+from src.agent.schema_selector import SchemaSelector
+from src.config.business_context import BusinessContext
+from src.config.schema_catalog import SchemaCatalog
+
+ORDERS = "SCHEMA.DATABASE.ORDERS"
+PRODUCTS = "SCHEMA.DATABASE.PRODUCTS"
+CUSTOMERS = "SCHEMA.DATABASE.CUSTOMERS"
+
+CONTEXTS_YAML = os.path.join(os.path.dirname(__file__), "..", "src", "config", "contexts.yaml")
+
+
+def test_join_key_inexistente_fica_fora_do_grafo():
+    catalog = SchemaCatalog({"Vendas": {
+        "tables": {
+            ORDERS: {"columns": {"ORDER_ID": "NUMBER", "PRODUCT_ID": "NUMBER"}},
+            PRODUCTS: {"columns": {"PRODUCT_ID": "NUMBER", "CATEGORY": "TEXT"}},
+        },
+        "relationships": [{"tables": [ORDERS, PRODUCTS], "join_keys": ["PRODUCT_ID", "CATEGORY"]}],
+    }})
+    assert catalog.join_graphs["Vendas"][ORDERS] == {}
+    assert catalog.join_path("Vendas", ORDERS, PRODUCTS) is None
+    assert catalog.invalid_joins["Vendas"] == [
+        {"tables": [ORDERS, PRODUCTS], "join_keys": ["PRODUCT_ID", "CATEGORY"], "missing": [f"{ORDERS}.CATEGORY"]}
+    ]
+
+
+def test_prompt_usa_texto_para_relacionamento_invalido():
+    business_context = BusinessContext()
+    selection = SchemaSelector(business_context).select(
+        {"domain": "vendas", "metrics": ["faturamento_total"], "groupby": ["CATEGORY_NAME"], "filters": []}
+    )
+    assert selection.joins["Vendas"]["plan"] == []
+    assert "o.CATEGORY" not in selection.prompt_text
+    assert "exatamente" not in selection.prompt_text
+    assert f"{ORDERS} e {PRODUCTS} (join_keys declaradas: PRODUCT_ID, CATEGORY" in selection.prompt_text
+    assert "PRODUCT_ID" in selection.tables["Vendas"][ORDERS]
+
+    with pytest.raises(TemplateMiss):
+        MetricTemplateEngine(business_context).render(
+            {"domain": "vendas", "metrics": ["faturamento_total"], "groupby": ["CATEGORY_NAME"]}
+        )
+
+
+def test_relacionamento_valido_continua_exato():
+    selection = SchemaSelector(BusinessContext()).select(
+        {"domain": "vendas", "metrics": ["faturamento_total"], "groupby": ["IS_ACTIVE"], "filters": []}
+    )
+    assert selection.joins["Vendas"]["plan"] == [
+        {"left": ORDERS, "right": CUSTOMERS, "join_keys": ["CUSTOMER_ID", "REGION"]}
+    ]
+    assert "Joins Necessários (use exatamente estes):" in selection.prompt_text
+
+
+def test_indices_do_catalogo():
+    catalog = SchemaCatalog({
+        "Vendas": {
+            "tables": {
+                ORDERS: {"columns": {"ORDER_ID": "NUMBER", "PRODUCT_ID": "NUMBER"}},
+                PRODUCTS: {"columns": {"PRODUCT_ID": "NUMBER"}},
+            },
+            "aggregation_fields": {"pedidos": {"table": ORDERS, "expression": "count(ORDER_ID)"}},
+        },
+        "Produtos": {
+            "tables": {PRODUCTS: {"columns": {"PRODUCT_ID": "NUMBER", "PRODUCT_NAME": "TEXT"}}},
+            "aggregation_fields": {"pedidos": {"table": PRODUCTS, "expression": "count(*)"}},
+        },
+    }, "hash", 3)
+    # Tabela declarada nos dois contextos: uma entrada, com a união das colunas
+    assert catalog.duplicated_tables == {PRODUCTS: ["Vendas", "Produtos"]}
+    assert catalog.columns(PRODUCTS) == {"PRODUCT_ID": "NUMBER", "PRODUCT_NAME": "TEXT"}
+    assert catalog.tables_with_column("PRODUCT_ID") == [ORDERS, PRODUCTS]
+    assert catalog.tables_with_column("INEXISTENTE") == []
+    # Métrica repetida: vale a primeira declaração
+    assert catalog.metric("pedidos")["context"] == "Vendas"
+    assert catalog.stats()["version"] == 3
+
+
+def write_contexts(path, old: str = None, new: str = None):
+    """Grava o contexts.yaml (com a substituição pedida) e avança o mtime"""
+    text = path.read_text(encoding="utf-8")
+    path.write_text(text.replace(old, new) if old else text, encoding="utf-8")
+    mtime = os.path.getmtime(path) + 5
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "contexts.yaml"
+    shutil.copy(CONTEXTS_YAML, path)
+    return path
+
+
+def test_recarrega_so_quando_o_conteudo_muda(config_path):
+    business_context = BusinessContext(str(config_path))
+    first = business_context.catalog
+    assert first.version == 1
+
+    # mtime novo, mesmo conteúdo: o hash evita recompilar
+    write_contexts(config_path)
+    assert business_context.reload_if_changed() is False
+    assert business_context.catalog is first
+
+    write_contexts(config_path, "Análise de vendas", "Análise comercial")
+    assert business_context.reload_if_changed() is True
+    assert business_context.catalog.version == 2
+    assert business_context.get_context("Vendas")["description"].startswith("Análise comercial")
+    # Quem guardou a versão anterior continua com ela inteira
+    assert first.contexts["Vendas"]["description"].startswith("Análise de vendas")
+
+
+def test_pergunta_em_andamento_mantem_a_versao(config_path):
+    business_context = BusinessContext(str(config_path))
+    with business_context.pin() as pinned:
+        write_contexts(config_path, "Análise de vendas", "Análise comercial")
+        assert business_context.reload_if_changed() is True
+        assert business_context.current() is pinned
+        assert business_context.get_context("Vendas")["description"].startswith("Análise de vendas")
+    assert business_context.current().version == pinned.version + 1
+
+
+def test_yaml_invalido_mantem_a_versao_em_uso(config_path):
+    business_context = BusinessContext(str(config_path))
+    catalog = business_context.catalog
+    write_contexts(config_path, "Vendas:\n", "Vendas: [\n")
+    assert business_context.reload_if_changed() is False
+    assert business_context.catalog is catalog
+
+
+def test_snapshot_evita_ler_o_yaml(config_path, tmp_path, monkeypatch):
+    snapshot_path = str(tmp_path / "contexts.json")
+    first = BusinessContext(str(config_path), snapshot_path=snapshot_path)
+    assert os.path.exists(snapshot_path)
+
+    def fail(text):
+        raise AssertionError("o YAML não deveria ser interpretado")
+
+    monkeypatch.setattr("src.config.business_context._parse_yaml", fail)
+    second = BusinessContext(str(config_path), snapshot_path=snapshot_path)
+    assert second.contexts == first.contexts
+    assert second.content_hash == first.content_hash
+
+
+def test_endpoint_context_stats(api):
+    stats = api.get("/context/stats").json()
+    assert stats["version"] >= 1
+    assert stats["contexts"] == 2
+    assert stats["duplicated_tables"] == {PRODUCTS: ["Vendas", "Produtos"]}
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from src.agent.providers import StubProvider, default_stub_response
+from src.agent.query_cache import QueryCache
+from src.agent.schema_selector import SchemaSelector
+from src.agent.sql_agent import SQLQueryAgent
+from src.config.business_context import BusinessContext
+
+ORDERS = "SCHEMA.DATABASE.ORDERS"
+CUSTOMERS = "SCHEMA.DATABASE.CUSTOMERS"
+
+
+@pytest.fixture(scope="module")
+def selector():
+    return SchemaSelector(BusinessContext())
+
+
+def test_seleciona_apenas_as_colunas_usadas(selector):
+    selection = selector.select({
+        "domain": "vendas",
+        "metrics": ["faturamento_total"],
+        "filters": [{"column": "REGION", "operator": "=", "value": "LATAM"}],
+        "groupby": [],
+        "timeframe": {"column": "CREATED_AT", "range": "last_7_days"},
+    })
+    assert selection.tables == {"Vendas": {ORDERS: ["ORDER_ID", "TOTAL_PRICE", "REGION", "CREATED_AT"]}}
+    assert CUSTOMERS not in selection.prompt_text
+    assert "PRODUCT_NAME" not in selection.prompt_text
+    report = selection.report()
+    assert report["tables"] == [ORDERS]
+    assert report["context_tokens_pruned"] < report["context_tokens_full"] / 5
+    assert report["tokens_saved"] == report["context_tokens_full"] - report["context_tokens_pruned"]
+
+
+def test_coluna_de_outra_tabela_traz_a_tabela_e_o_join(selector):
+    selection = selector.select(
+        {"domain": "vendas", "metrics": ["faturamento_total"], "groupby": ["IS_ACTIVE"], "filters": []}
+    )
+    assert set(selection.tables["Vendas"]) == {ORDERS, CUSTOMERS}
+    assert "IS_ACTIVE" in selection.tables["Vendas"][CUSTOMERS]
+    assert selection.report()["joins"] == [f"{ORDERS} -> {CUSTOMERS} (CUSTOMER_ID, REGION)"]
+
+
+def test_sem_contexto_conhecido_nao_reduz(selector):
+    assert selector.select({"domain": "inexistente", "metrics": []}) is None
+
+
+def test_especialista_recebe_o_esquema_reduzido(tmp_path):
+    prompts = {}
+
+    def responder(prompt, stage=None):
+        prompts[stage] = prompt
+        return default_stub_response(prompt, stage)
+
+    agent = SQLQueryAgent(api_key="", llm=StubProvider(responder=responder), query_cache=QueryCache(max_entries=0),
+                          learning_memory_path=str(tmp_path / "learning_memory.db"),
+                          local_classifier_threshold=None, metric_templates=False)
+    response = asyncio.run(agent.aquery("Qual o faturamento total?"))
+    assert response["status"] == "success"
+    assert response["schema_pruning"]["enabled"] is True
+    assert response["schema_pruning"]["tables"] == [ORDERS]
+    assert ORDERS in prompts["expert"]
+    assert CUSTOMERS not in prompts["expert"] and "SCHEMA.DATABASE.INVENTORY" not in prompts["expert"]
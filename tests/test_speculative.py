@@ -0,0 +1,70 @@
+import asyncio
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from src.agent.providers import StubProvider, default_stub_response
+from src.agent.query_cache import QueryCache
+from src.agent.sql_agent import SQLQueryAgent
+
+QUESTION = "Mostre o faturamento diário dos últimos 7 dias"
+
+
+class ClassifyingStub(StubProvider):
+    def __init__(self, classification):
+        """StubProvider cujo classificador responde com os metadados informados"""
+        self.classification = classification
+        super().__init__(responder=self._respond_stage)
+
+    def _respond_stage(self, prompt, stage=None):
+        if stage == "classifier":
+            return f"```json\n{json.dumps(self.classification, ensure_ascii=False)}\n```"
+        return default_stub_response(prompt, stage)
+
+
+def speculate(tmp_path, change):
+    """Executa a pergunta com um classificador LLM que devolve o palpite local alterado por change"""
+    probe = SQLQueryAgent(api_key="", llm=StubProvider(), learning_memory_path=str(tmp_path / "probe.db"))
+    guess = probe._apply_default_filters(probe.local_classifier.classify(QUESTION)[0])
+    llm = ClassifyingStub(dict(guess, **change))
+    agent = SQLQueryAgent(api_key="", llm=llm, query_cache=QueryCache(max_entries=0),
+                          learning_memory_path=str(tmp_path / "learning_memory.db"),
+                          local_classifier_threshold=None, speculative_generation=True, metric_templates=False)
+    response = asyncio.run(agent.aquery(QUESTION))
+    assert response["status"] == "success"
+    # Resultado da especulação: accepted, discarded ou cancelled
+    results = [line for line in agent.metrics.speculations.render() if not line.startswith("#")]
+    assert len(results) == 1
+    return results[0].split('result="')[1].split('"')[0]
+
+
+def test_palpite_igual_aproveita_o_especialista(tmp_path):
+    assert speculate(tmp_path, {}) == "accepted"
+
+
+def test_palpite_escrito_de_outra_forma_aproveita_o_especialista(tmp_path):
+    today = date.today()
+    # Mesmo significado do palpite local, na forma que o LLM costuma escrever
+    change = {
+        "domain": "Vendas",
+        "filters": [{"column": "o.REGION", "operator": "in", "value": ["LATAM"]}],
+        "groupby": ["o.CREATED_AT"],
+        "timeframe": {"column": "o.CREATED_AT", "start_date": (today - timedelta(days=6)).isoformat(),
+                      "end_date": today.isoformat()},
+        "order_by": [{"column": "CREATED_AT"}],
+    }
+    assert speculate(tmp_path, change) == "accepted"
+
+
+@pytest.mark.parametrize("change", [
+    {"filters": [{"column": "REGION", "operator": "=", "value": "NA"}]},
+    {"groupby": ["CREATED_AT", "REGION"]},
+    {"timeframe": {"column": "CREATED_AT", "period": "day", "range": "last_30_days"}},
+    {"filters": [{"column": "REGION", "operator": "=", "value": "LATAM"},
+                 {"column": "PAYMENT_METHOD", "operator": "=", "value": "pix"}]},
+    {"order_by": [{"column": "CREATED_AT", "direction": "desc"}]},
+])
+def test_metadados_diferentes_refazem_o_especialista(tmp_path, change):
+    # O especialista especulativo é descartado e roda de novo com os metadados do LLM
+    assert speculate(tmp_path, change) in ("discarded", "cancelled")
@@ -0,0 +1,111 @@
+import pytest
+
+from src.agent.local_classifier import LocalClassifier
+from src.agent.metric_templates import MetricTemplateEngine
+from src.agent.sql_lint import SQLLinter
+from src.config.business_context import BusinessContext
+
+FULL_SCAN = """
+select o.REGION, sum(o.TOTAL_PRICE) as faturamento
+from SCHEMA.DATABASE.ORDERS o
+group by all
+"""
+
+
+@pytest.fixture(scope="module")
+def linter():
+    return SQLLinter(BusinessContext())
+
+
+@pytest.mark.parametrize("metadata", [
+    {},
+    {"timeframe": None},
+    {"timeframe": {"column": "CREATED_AT", "range": "last_7_days"}},
+])
+def test_tabela_de_fatos_sem_periodo_e_risco_medio(linter, metadata):
+    result = linter.lint(FULL_SCAN, metadata)
+    warnings = [w for w in result["warnings"] if w["code"] == "missing_time_predicate"]
+    assert [w["severity"] for w in warnings] == ["warning"]
+    assert result["risk_score"] >= 25
+    assert result["risk"] in ("medium", "high")
+
+
+DIMENSION_SCAN = """
+select c.STATE, count(distinct c.CUSTOMER_ID) as clientes_ativos
+from SCHEMA.DATABASE.CUSTOMERS c
+where c.IS_ACTIVE = true
+group by all
+"""
+
+
+def test_tabela_sem_time_column_lida_inteira_sem_aviso(linter):
+    result = linter.lint(DIMENSION_SCAN, {"timeframe": None})
+    assert result["warnings"] == []
+    assert result["risk"] == "low"
+
+
+def test_periodo_pedido_em_tabela_sem_time_column_e_informativo(linter):
+    result = linter.lint(DIMENSION_SCAN, {"timeframe": {"column": "CREATED_AT", "range": "last_7_days"}})
+    assert [(w["code"], w["severity"]) for w in result["warnings"]] == [("missing_time_predicate", "info")]
+    assert result["risk"] == "low"
+
+
+@pytest.mark.parametrize("question", [
+    "Qual é o valor total em estoque por armazém?",
+    "Quantos clientes ativos temos por região?",
+])
+def test_templates_de_cadastros_tem_risco_baixo(linter, question):
+    business_context = linter.business_context
+    metadata, _ = LocalClassifier(business_context).classify(question)
+    result = linter.lint(MetricTemplateEngine(business_context).render(metadata), metadata)
+    assert result["warnings"] == []
+    assert result["risk_score"] == 0
+
+
+def test_tabela_com_intervalo_de_data_sem_aviso(linter):
+    result = linter.lint(FULL_SCAN.replace("group by", "where o.CREATED_AT >= '2024-01-01'\ngroup by"), {})
+    assert result["warnings"] == []
+    assert result["risk"] == "low"
+
+
+FAN_OUT = """
+with orders_base as (
+  select
+    s.PLAN_NAME
+    , o.TOTAL_PRICE
+  from SCHEMA.DATABASE.ORDERS o
+  join SCHEMA.DATABASE.CUSTOMERS c on o.CUSTOMER_ID = c.CUSTOMER_ID and o.REGION = c.REGION
+  join SCHEMA.DATABASE.SUBSCRIPTIONS s on c.CUSTOMER_ID = s.CUSTOMER_ID and c.REGION = s.REGION
+  where 1=1
+    and o.CREATED_AT >= '2024-01-01'
+)
+
+select
+  PLAN_NAME
+  , {aggregate} as faturamento_total
+from orders_base
+group by all
+"""
+
+
+def test_join_declarado_para_o_lado_muitos_com_soma(linter):
+    result = linter.lint(FAN_OUT.format(aggregate="sum(TOTAL_PRICE)"), {})
+    assert [(w["code"], w["table"]) for w in result["warnings"]] == [
+        ("fan_out_join", "SCHEMA.DATABASE.SUBSCRIPTIONS")
+    ]
+    assert result["risk"] == "medium"
+
+
+@pytest.mark.parametrize("aggregate", ["max(TOTAL_PRICE)", "count(distinct TOTAL_PRICE)"])
+def test_join_para_o_lado_muitos_sem_agregacao_afetada(linter, aggregate):
+    assert linter.lint(FAN_OUT.format(aggregate=aggregate), {})["warnings"] == []
+
+
+def test_join_declarado_para_o_lado_um_sem_aviso(linter):
+    sql_query = FULL_SCAN.replace(
+        "from SCHEMA.DATABASE.ORDERS o",
+        "from SCHEMA.DATABASE.ORDERS o\n"
+        "join SCHEMA.DATABASE.CUSTOMERS c on o.CUSTOMER_ID = c.CUSTOMER_ID and o.REGION = c.REGION\n"
+        "where o.CREATED_AT >= '2024-01-01'"
+    )
+    assert linter.lint(sql_query, {})["warnings"] == []
@@ -0,0 +1,31 @@
+import pytest
+
+from src.agent.sql_rewrite import SQLRewriter
+from src.config.business_context import BusinessContext
+
+QUERY = """
+select o.CREATED_AT::date as data, sum(o.TOTAL_PRICE) as faturamento
+from SCHEMA.DATABASE.ORDERS o
+group by all
+"""
+
+METADATA = {
+    "timeframe": {"column": "CREATED_AT", "range": "last_7_days"},
+    "filters": [{"column": "REGION", "operator": "=", "value": "LATAM"}],
+}
+
+
+@pytest.fixture(scope="module")
+def rewriter():
+    return SQLRewriter(BusinessContext())
+
+
+def test_acrescimos_da_classificacao(rewriter):
+    rewritten, changes = rewriter.rewrite(QUERY, METADATA)
+    assert [c["code"] for c in changes] == ["timeframe_added", "filter_added"]
+    assert "o.REGION = 'LATAM'" in rewritten
+
+
+@pytest.mark.parametrize("metadata", [None, dict(METADATA, error="timeout")])
+def test_sem_classificacao_confiavel_nada_e_acrescentado(rewriter, metadata):
+    assert rewriter.rewrite(QUERY, metadata) == (QUERY, [])
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("src.agent.sql_agent", "langchain_deepseek", "langchain_core", "openai")
+
+
+def wait_ready(client, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200:
+            return response.json()
+        time.sleep(0.01)
+    raise AssertionError("agente não ficou pronto")
+
+
+def test_importar_a_api_nao_carrega_dependencias_pesadas():
+    code = (
+        "import json, sys\n"
+        "import src.api.main\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=ROOT).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
+
+
+def test_ready_durante_e_depois_da_inicializacao(api_module, monkeypatch):
+    release = threading.Event()
+    build_agent = api_module.build_agent
+
+    def slow_build():
+        release.wait(10)
+        return build_agent()
+
+    monkeypatch.setattr(api_module, "build_agent", slow_build)
+    with TestClient(api_module.app) as client:
+        # O processo já atende enquanto o agente é criado
+        assert client.get("/").status_code == 200
+        response = client.get("/ready")
+        assert (response.status_code, response.json()) == (503, {"status": "starting"})
+
+        release.set()
+        ready = wait_ready(client)
+        assert ready["status"] == "ready"
+        assert ready["startup_seconds"] >= ready["build_seconds"] > 0
+        assert client.post("/query", json={"question": "Qual o faturamento total?"}).json()["status"] == "success"
+
+
+def test_pergunta_aguarda_o_agente_ficar_pronto(api_module, monkeypatch):
+    build_agent = api_module.build_agent
+
+    def slow_build():
+        time.sleep(0.3)
+        return build_agent()
+
+    monkeypatch.setattr(api_module, "build_agent", slow_build)
+    with TestClient(api_module.app) as client:
+        response = client.post("/query", json={"question": "Qual o faturamento total?"})
+        assert response.status_code == 200
+        assert response.json()["status"] == "success"
+
+
+def test_falha_na_inicializacao(api_module, monkeypatch):
+    def failing_build():
+        raise RuntimeError("contexts.yaml inválido")
+
+    monkeypatch.setattr(api_module, "build_agent", failing_build)
+    with TestClient(api_module.app) as client:
+        deadline = time.monotonic() + 10
+        while client.get("/ready").json()["status"] == "starting" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = client.get("/ready")
+        assert (response.status_code, response.json()) == (503, {"status": "failed", "error": "contexts.yaml inválido"})
+        response = client.post("/query", json={"question": "Qual o faturamento total?"})
+        assert response.status_code == 503
+        assert "contexts.yaml inválido" in response.json()["detail"]
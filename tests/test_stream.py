@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+QUESTION = "Qual o faturamento total?"
+
+
+def read_events(response):
+    """Lista (evento, dados) de uma resposta Server-Sent Events"""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def stream(api, **body):
+    response = api.post("/query/stream", json=dict({"question": QUESTION}, **body))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return read_events(response)
+
+
+def test_eventos_na_ordem_dos_estagios(api):
+    events = stream(api, pipeline_mode="staged")
+    names = [name for name, _ in events]
+    assert names[:2] == ["classified", "expert_sql"]
+    assert names[-1] == "done"
+    assert set(names[2:-1]) == {"token"}
+
+    metadata = events[0][1]["metadata"]
+    assert "faturamento_total" in metadata["metrics"]
+    # Os trechos do consolidador formam a saída que deu origem à resposta final
+    streamed = "".join(data["text"] for name, data in events if name == "token")
+    result = events[-1][1]["result"]
+    assert result["status"] == "success"
+    assert "sum(o.TOTAL_PRICE)" in streamed and "sum(o.TOTAL_PRICE)" in result["sql_query"]
+    assert "processing_time" in result and "timings" in result
+
+
+@pytest.mark.parametrize("mode, names", [
+    ("merged", ["classified", "done"]),
+    ("single", ["classified", "done"]),
+])
+def test_modos_sem_consolidador_nao_transmitem_tokens(api, mode, names):
+    events = stream(api, pipeline_mode=mode)
+    assert [name for name, _ in events] == names
+    assert events[-1][1]["result"]["pipeline_mode"] == mode
+
+
+def test_resposta_em_cache_vai_direto_para_done(api):
+    first = stream(api)[-1][1]["result"]
+    events = stream(api)
+    assert [name for name, _ in events] == ["done"]
+    assert events[0][1]["result"]["sql_query"] == first["sql_query"]
+    assert events[0][1]["result"]["cache"] == "hit"
+
+
+def test_modo_invalido_emite_erro(api):
+    events = stream(api, pipeline_mode="paralelo")
+    assert [name for name, _ in events] == ["error"]
+    assert "paralelo" in events[0][1]["message"]
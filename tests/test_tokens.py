@@ -0,0 +1,51 @@
+import pytest
+
+from src.agent.tokens import BYTE_ENCODER, BPETokenizer, count_tokens, get_tokenizer, train_merges
+
+BYTE_DECODER = {char: byte for byte, char in BYTE_ENCODER.items()}
+
+
+def decode(tokens) -> str:
+    return bytes(BYTE_DECODER[char] for token in tokens for char in token).decode("utf-8")
+
+
+@pytest.mark.parametrize("text", [
+    "Qual o faturamento total por região?",
+    "select sum(o.TOTAL_PRICE) as faturamento\nfrom SCHEMA.DATABASE.ORDERS o",
+    "ação, pão e 🚀   espaços",
+    "",
+])
+def test_tokens_reconstroem_o_texto(text):
+    tokens = get_tokenizer().tokenize(text)
+    assert decode(tokens) == text
+    assert count_tokens(text) == len(tokens)
+
+
+def test_vocabulario_do_projeto_junta_palavras_do_dominio():
+    tokenizer = get_tokenizer()
+    assert tokenizer.tokenize("faturamento total por região") == ["faturamento", "Ġtotal", "Ġpor", "ĠregiÃ£o"]
+    # Texto fora do vocabulário cai para bytes: um token por byte
+    assert tokenizer.count("xyzqw") == 5
+    assert count_tokens("🚀") == len("🚀".encode("utf-8"))
+
+
+def test_fusoes_aplicadas_na_ordem_de_prioridade():
+    merges = train_merges(["aaab aaab aab"], num_merges=10)
+    assert merges == [("a", "a"), ("Ġ", "aa"), ("a", "b")]
+    tokenizer = BPETokenizer(merges)
+    assert tokenizer.tokenize("aaab") == ["aa", "ab"]
+    assert tokenizer.tokenize(" aab") == ["Ġaa", "b"]
+    # Sem a fusão de maior prioridade, o mesmo texto se divide de outra forma
+    assert BPETokenizer(merges[2:]).tokenize("aaab") == ["a", "a", "ab"]
+
+
+def test_frequencia_minima_limita_as_fusoes():
+    assert train_merges(["abc"], num_merges=10) == []
+    assert train_merges(["abc"], num_merges=10, min_frequency=1) == [("b", "c"), ("a", "bc")]
+
+
+def test_endpoint_token_usage(api):
+    text = "Qual o faturamento total por região?"
+    body = api.post("/token-usage", json={"text": text}).json()
+    assert body["status"] == "success"
+    assert body["token_count"] == count_tokens(text)